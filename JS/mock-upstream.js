@@ -0,0 +1,85 @@
+// Local stand-in for the API Gateway -> Classify -> Verify chain, for load-testing server.js.
+//
+//   node JS/mock-upstream.js --port 4000 --latency 800:3000:0.01
+//   LAMBDA_URL=http://localhost:4000/processRequest node JS/server.js
+//
+// Latency is log-normal, given as median[:p99[:failRate]] in ms (same format as
+// Lambda/fakes.py `Latency.parse`). GET /stats returns request counters, including the
+// peak number of concurrent requests (to check coalescing and keep-alive reuse).
+const http = require('http');
+
+function arg(name, fallback){
+  const i = process.argv.indexOf('--' + name);
+  return i > 0 && i + 1 < process.argv.length ? process.argv[i + 1] : fallback;
+}
+
+function parseLatency(spec){
+  const [median, p99, fail] = String(spec || '').split(':').map((v) => (v === '' || v === undefined ? NaN : Number(v)));
+  const m = median > 0 ? median : 0;
+  const p = p99 > 0 ? p99 : m * 3;
+  // p99 = median * exp(2.326 * sigma)
+  return { median: m, sigma: m > 0 && p > m ? Math.log(p / m) / 2.326 : 0, failRate: fail > 0 ? fail : 0 };
+}
+
+function sampleMs(lat){
+  if(lat.median <= 0) return 0;
+  // Box-Muller
+  const u = 1 - Math.random();
+  const z = Math.sqrt(-2 * Math.log(u)) * Math.cos(2 * Math.PI * Math.random());
+  return lat.median * Math.exp(lat.sigma * z);
+}
+
+const PORT = Number(arg('port', process.env.MOCK_PORT || 4000));
+const LATENCY = parseLatency(arg('latency', process.env.MOCK_LATENCY || '800:3000:0'));
+// Share of requests answered with automation_grade AUTO (the rest go to human review)
+const AUTO_RATE = Number(arg('auto-rate', process.env.MOCK_AUTO_RATE || 0.7));
+
+const stats = { requests: 0, errors: 0, inflight: 0, maxInflight: 0, sockets: 0 };
+
+// Same categories as the classifier (Lambda/prompts.py, SYSTEM_PROMPT)
+const CATEGORIES = ['CONTRACTUALISATION', 'RESILIATION', 'RECLAMATION', 'CHANGEMENT_OFFRE', 'INFORMATION_TECHNIQUE'];
+
+function respond(body){
+  const text = String(body.text || '');
+  let h = 0;
+  for(let i = 0; i < text.length; i++) h = (h * 31 + text.charCodeAt(i)) >>> 0;
+  const category = CATEGORIES[h % CATEGORIES.length];
+  const grade = (h % 1000) / 1000 < AUTO_RATE ? 'AUTO' : 'HUMAN';
+  return {
+    statusCode: 200,
+    model: 'mock-upstream',
+    requestId: 'MOCK-' + h.toString(16),
+    classification: { category, confidence: 0.9 },
+    lambdaB_response: { response: { automation_grade: grade, category } }
+  };
+}
+
+const server = http.createServer((req, res) => {
+  if(req.method === 'GET' && req.url === '/stats'){
+    res.writeHead(200, { 'Content-Type': 'application/json' });
+    return res.end(JSON.stringify(stats));
+  }
+  const chunks = [];
+  req.on('data', (c) => chunks.push(c));
+  req.on('end', () => {
+    stats.requests += 1;
+    stats.inflight += 1;
+    stats.maxInflight = Math.max(stats.maxInflight, stats.inflight);
+    let body = {};
+    try{ body = JSON.parse(Buffer.concat(chunks).toString('utf8') || '{}'); }catch(e){ body = {}; }
+    setTimeout(() => {
+      stats.inflight -= 1;
+      if(Math.random() < LATENCY.failRate){
+        stats.errors += 1;
+        res.writeHead(502, { 'Content-Type': 'application/json' });
+        return res.end(JSON.stringify({ message: 'Internal server error' }));
+      }
+      res.writeHead(200, { 'Content-Type': 'application/json' });
+      res.end(JSON.stringify(respond(body)));
+    }, sampleMs(LATENCY));
+  });
+});
+server.on('connection', () => { stats.sockets += 1; });
+server.keepAliveTimeout = 65000;
+
+server.listen(PORT, () => console.log(`Mock upstream at http://localhost:${PORT} (median ${LATENCY.median}ms, failRate ${LATENCY.failRate})`));
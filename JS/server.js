@@ -1,56 +1,228 @@
 const express = require('express');
 const axios = require('axios');
+const http = require('http');
+const https = require('https');
 const path = require('path');
+const crypto = require('crypto');
 
 const app = express();
-const LAMBDA_URL = 'https://skjx9klvgi.execute-api.us-east-1.amazonaws.com/processRequest';
+// Override with a local mock for load tests: LAMBDA_URL=http://localhost:4000/processRequest (JS/mock-upstream.js)
+const LAMBDA_URL = process.env.LAMBDA_URL || 'https://skjx9klvgi.execute-api.us-east-1.amazonaws.com/processRequest';
+
+// Keep-alive agents: reuse TCP/TLS connections to API Gateway instead of a handshake per request
+const AGENT_OPTIONS = { keepAlive: true, keepAliveMsecs: 1000, maxSockets: Number(process.env.UPSTREAM_MAX_SOCKETS) || 64 };
+const upstream = axios.create({
+  httpAgent: new http.Agent(AGENT_OPTIONS),
+  httpsAgent: new https.Agent(AGENT_OPTIONS),
+  timeout: 90000
+});
+
+// Trace context propagated to the Lambda chain (see Lambda/tracing.py).
+// A client may send its own X-Correlation-Id; otherwise one is generated here.
+const TRACE_HEADER = 'x-correlation-id';
+
+function startTrace(req){
+  const incoming = String(req.get(TRACE_HEADER) || '').trim();
+  return {
+    traceId: /^[0-9a-zA-Z-]{8,64}$/.test(incoming) ? incoming : crypto.randomBytes(16).toString('hex'),
+    spanId: crypto.randomBytes(8).toString('hex'),
+    startMs: Date.now()
+  };
+}
+
+// Same line format as the Lambdas' EMF metrics so `python tracing.py waterfall` can merge them
+function endTrace(trace, stage, extra){
+  console.log(JSON.stringify(Object.assign({
+    Function: 'web-proxy',
+    Stage: stage,
+    traceId: trace.traceId,
+    spanId: trace.spanId,
+    startMs: trace.startMs,
+    Duration: Date.now() - trace.startMs
+  }, extra || {})));
+}
 
 app.use(express.json({ limit: '10mb' }));
 app.use(express.urlencoded({ extended: true }));
 // Serve static files from workspace root so you can open http://localhost:3000
 app.use(express.static(path.join(__dirname)));
 
-// Proxy endpoint: receives JSON from the browser and returns a mock response for testing
+// In-flight coalescing: identical bodies submitted while a call is pending share that call.
+// The key ignores key order and the trace context; joiners are logged with the leader's traceId.
+const inflight = new Map();
+
+function canonical(value){
+  if(Array.isArray(value)) return '[' + value.map(canonical).join(',') + ']';
+  if(value && typeof value === 'object'){
+    return '{' + Object.keys(value).sort().map((k) => JSON.stringify(k) + ':' + canonical(value[k])).join(',') + '}';
+  }
+  return JSON.stringify(value);
+}
+
+function coalesceKey(body){
+  const copy = Object.assign({}, body);
+  delete copy.trace;
+  return crypto.createHash('sha256').update(canonical(copy)).digest('hex');
+}
+
+// Resolves to { status, data } (never rejects) so every waiter gets the same outcome
+function forwardToLambda(body, trace){
+  const key = coalesceKey(body);
+  const pending = inflight.get(key);
+  if(pending){
+    console.log(`[trace=${trace.traceId}] Coalesced onto in-flight call trace=${pending.traceId}`);
+    return pending.promise.then((out) => Object.assign({ coalescedWith: pending.traceId }, out));
+  }
+  console.log(`[trace=${trace.traceId}] Calling Lambda at:`, LAMBDA_URL);
+  // Pass the entire request body to Lambda (it expects { text: "..." }) plus the trace context
+  const payload = Object.assign({}, body, {
+    trace: { traceId: trace.traceId, parentSpanId: trace.spanId }
+  });
+  const promise = upstream.post(LAMBDA_URL, payload, {
+    headers: { 'Content-Type': 'application/json', 'X-Correlation-Id': trace.traceId }
+  }).then((lambdaResp) => {
+    console.log(`[trace=${trace.traceId}] Lambda response:`, lambdaResp.data);
+    return { status: 200, data: lambdaResp.data };
+  }, (lambdaErr) => {
+    console.error(`[trace=${trace.traceId}] Lambda call failed:`, lambdaErr.message);
+    return {
+      status: lambdaErr.response?.status || 500,
+      data: {
+        error: 'lambda_error',
+        message: lambdaErr.message,
+        details: lambdaErr.response?.data || null,
+        traceId: trace.traceId
+      }
+    };
+  }).finally(() => inflight.delete(key));
+  inflight.set(key, { promise, traceId: trace.traceId });
+  return promise;
+}
+
+// Async mode: `POST /api/lambda?mode=async` (or `Prefer: respond-async`) answers 202 at once;
+// the browser then polls `GET /api/jobs/:id` or listens on `GET /api/jobs/:id/events` (SSE).
+// Jobs live in memory for JOB_TTL_MS after completion.
+const JOB_TTL_MS = Number(process.env.JOB_TTL_MS) || 10 * 60 * 1000;
+const MAX_PENDING_JOBS = Number(process.env.MAX_PENDING_JOBS) || 5000;
+const jobs = new Map();
+
+function wantsAsync(req){
+  return req.query.mode === 'async' || /respond-async/i.test(String(req.get('prefer') || ''));
+}
+
+function jobView(job){
+  const view = { jobId: job.id, status: job.status, traceId: job.traceId };
+  if(job.status === 'done'){
+    view.httpStatus = job.httpStatus;
+    view.result = job.result;
+  }
+  return view;
+}
+
+function createJob(trace){
+  const job = { id: crypto.randomBytes(12).toString('hex'), status: 'pending', traceId: trace.traceId, listeners: new Set() };
+  jobs.set(job.id, job);
+  return job;
+}
+
+function completeJob(job, out){
+  job.status = 'done';
+  job.httpStatus = out.status;
+  job.result = out.data;
+  for(const notify of job.listeners) notify();
+  job.listeners.clear();
+  setTimeout(() => jobs.delete(job.id), JOB_TTL_MS).unref();
+}
+
+function pendingJobs(){
+  let n = 0;
+  for(const job of jobs.values()) if(job.status === 'pending') n += 1;
+  return n;
+}
+
+// Proxy endpoint: forwards the browser's JSON to the Lambda chain (sync, or async with ?mode=async)
 app.post('/api/lambda', async (req, res) => {
+  const trace = startTrace(req);
+  res.set('X-Correlation-Id', trace.traceId);
   try {
-    console.log('Lambda proxy endpoint received:', req.body);
+    console.log(`[trace=${trace.traceId}] Lambda proxy endpoint received:`, req.body);
 
     // Allow optional delay for testing (ms).
     // Default to 0ms (no delay); override by calling `/api/lambda?delay=3000`.
     const delayMs = Number(req.query.delay) || 0;
-
-    // Handler function to call the real Lambda
-    const callLambda = async () => {
-      try{
-        console.log('Calling Lambda at:', LAMBDA_URL);
-        // Pass the entire request body to Lambda (it expects { text: "..." })
-        const lambdaResp = await axios.post(LAMBDA_URL, req.body, {
-          headers: { 'Content-Type': 'application/json' },
-          timeout: 90000
-        });
-        console.log('Lambda response:', lambdaResp.data);
-        res.status(200).json(lambdaResp.data);
-      }catch(lambdaErr){
-        console.error('Lambda call failed:', lambdaErr.message);
-        res.status(lambdaErr.response?.status || 500).json({
-          error: 'lambda_error',
-          message: lambdaErr.message,
-          details: lambdaErr.response?.data || null
-        });
+    const call = () => new Promise((resolve) => {
+      if(delayMs > 0){
+        console.log(`[trace=${trace.traceId}] Delaying Lambda call by ${delayMs}ms`);
+        setTimeout(() => resolve(forwardToLambda(req.body, trace)), delayMs);
+      } else {
+        resolve(forwardToLambda(req.body, trace));
       }
-    };
+    });
 
-    // Apply delay if specified, then call Lambda
-    if(delayMs > 0){
-      console.log(`Delaying Lambda call by ${delayMs}ms`);
-      setTimeout(callLambda, delayMs);
-    } else {
-      callLambda();
+    if(wantsAsync(req)){
+      if(pendingJobs() >= MAX_PENDING_JOBS){
+        res.set('Retry-After', '5');
+        return res.status(503).json({ error: 'too_many_pending_jobs', traceId: trace.traceId });
+      }
+      const job = createJob(trace);
+      call().then((out) => {
+        endTrace(trace, 'proxy', { status: out.status, mode: 'async', coalesced: Boolean(out.coalescedWith) });
+        completeJob(job, out);
+      });
+      res.set('Location', `/api/jobs/${job.id}`);
+      return res.status(202).json(Object.assign(jobView(job), {
+        poll: `/api/jobs/${job.id}`,
+        events: `/api/jobs/${job.id}/events`
+      }));
     }
+
+    const out = await call();
+    endTrace(trace, 'proxy', Object.assign({ status: out.status, coalesced: Boolean(out.coalescedWith) },
+      out.status >= 400 ? { error: out.data.message } : {}));
+    res.status(out.status).json(out.data);
   } catch (err) {
-    console.error('Error:', err.message);
-    res.status(500).json({ error: 'server_error', message: err.message });
+    console.error(`[trace=${trace.traceId}] Error:`, err.message);
+    res.status(500).json({ error: 'server_error', message: err.message, traceId: trace.traceId });
+  }
+});
+
+// Polling: 202 while pending (with Retry-After), 200 with the Lambda result once done
+app.get('/api/jobs/:id', (req, res) => {
+  const job = jobs.get(req.params.id);
+  res.set('Cache-Control', 'no-store');
+  if(!job){
+    return res.status(404).json({ error: 'job_not_found' });
+  }
+  if(job.status === 'pending'){
+    res.set('Retry-After', '1');
+    return res.status(202).json(jobView(job));
+  }
+  res.status(200).json(jobView(job));
+});
+
+// Server-Sent Events: a single `result` event, then the stream closes
+app.get('/api/jobs/:id/events', (req, res) => {
+  const job = jobs.get(req.params.id);
+  if(!job){
+    return res.status(404).json({ error: 'job_not_found' });
+  }
+  res.set({ 'Content-Type': 'text/event-stream', 'Cache-Control': 'no-store', Connection: 'keep-alive' });
+  res.flushHeaders();
+  const send = () => {
+    clearInterval(heartbeat);
+    res.write(`event: result\ndata: ${JSON.stringify(jobView(job))}\n\n`);
+    res.end();
+  };
+  // Comment lines keep intermediaries from closing an idle stream
+  const heartbeat = setInterval(() => res.write(': keep-alive\n\n'), 15000);
+  if(job.status === 'done'){
+    return send();
   }
+  job.listeners.add(send);
+  req.on('close', () => {
+    clearInterval(heartbeat);
+    job.listeners.delete(send);
+  });
 });
 
 // Endpoint to receive client approval (mock)
@@ -70,5 +242,64 @@ app.post('/api/approve', express.json(), async (req, res) => {
   }
 });
 
+// Back-office review queue (Lambda/HumanReview.py behind API Gateway).
+// Pages through pending items with an opaque cursor; the Lambda never scans the table.
+const REVIEW_API_URL = process.env.REVIEW_API_URL || '';
+
+app.get('/api/review', async (req, res) => {
+  if(!REVIEW_API_URL){
+    return res.status(503).json({ error: 'review_api_not_configured' });
+  }
+  try{
+    const { limit, cursor, category } = req.query;
+    const resp = await axios.get(REVIEW_API_URL, {
+      params: { limit: limit || 25, cursor: cursor || undefined, category: category || undefined },
+      timeout: 10000
+    });
+    res.set('Cache-Control', 'no-store');
+    res.status(200).json(resp.data);
+  }catch(err){
+    console.error('Review list failed:', err.message);
+    res.status(err.response?.status || 500).json(err.response?.data || { error: 'review_error', message: err.message });
+  }
+});
+
+app.post('/api/review/:requestId', express.json(), async (req, res) => {
+  if(!REVIEW_API_URL){
+    return res.status(503).json({ error: 'review_api_not_configured' });
+  }
+  try{
+    const url = `${REVIEW_API_URL.replace(/\/$/, '')}/${encodeURIComponent(req.params.requestId)}`;
+    const resp = await axios.post(url, req.body || {}, { timeout: 10000 });
+    res.status(200).json(resp.data);
+  }catch(err){
+    console.error('Review resolve failed:', err.message);
+    res.status(err.response?.status || 500).json(err.response?.data || { error: 'review_error', message: err.message });
+  }
+});
+
+// Request lifecycle (Lambda/RequestState.py behind API Gateway): by status and age, or one request's history
+const REQUESTS_API_URL = process.env.REQUESTS_API_URL || '';
+
+app.get(['/api/requests', '/api/requests/:requestId'], async (req, res) => {
+  if(!REQUESTS_API_URL){
+    return res.status(503).json({ error: 'requests_api_not_configured' });
+  }
+  try{
+    const base = REQUESTS_API_URL.replace(/\/$/, '');
+    const url = req.params.requestId ? `${base}/${encodeURIComponent(req.params.requestId)}` : base;
+    const { status, olderThanMinutes, limit, cursor } = req.query;
+    const resp = await axios.get(url, {
+      params: req.params.requestId ? {} : { status, olderThanMinutes, limit: limit || 25, cursor: cursor || undefined },
+      timeout: 10000
+    });
+    res.set('Cache-Control', 'no-store');
+    res.status(200).json(resp.data);
+  }catch(err){
+    console.error('Requests API failed:', err.message);
+    res.status(err.response?.status || 500).json(err.response?.data || { error: 'requests_error', message: err.message });
+  }
+});
+
 const port = process.env.PORT || 3000;
 app.listen(port, () => console.log(`Server running at http://localhost:${port}`));
@@ -0,0 +1,398 @@
+"""
+AWS Lambda: AnalyticsSink
+
+Responsabilité:
+- Puits analytique des issues de requête: chaque étape qui enregistre une transition
+  (RequestState.record) ajoute une ligne compacte à un tampon en mémoire du conteneur
+  (catégorie, confiance, grade, durée de l'étape, taille du contrat, statut de paiement...)
+- Écriture par lots: fichiers colonnaires compressés (Parquet zstd, ou Arrow IPC), partitionnés
+  stage=<étape>/day=<AAAA-MM-JJ>, vers S3 ou un répertoire local. Vidage quand le tampon
+  atteint ANALYTICS_BATCH lignes, ou à la fin d'une invocation quand il a plus de
+  ANALYTICS_FLUSH_S secondes (les lignes d'un conteneur recyclé avant vidage sont perdues)
+- Vidage hors du chemin de réponse: `record()` ne fait qu'ajouter au tampon, l'encodage et
+  les PutObject (un par partition) tournent sur un thread d'arrière-plan. Coût résiduel: le
+  thread partage le CPU de l'invocation en cours (quelques ms d'encodage pour 500 lignes) et
+  Lambda le gèle au retour du handler; un vidage interrompu reprend au dégel suivant, les
+  lignes restent donc en mémoire plus longtemps sur un conteneur peu sollicité. `flush()`
+  (action "flush", simulateur, CLI) reste synchrone
+- pyarrow est optionnel: sans lui, repli sur des fichiers JSON Lines gzip (même partitionnement)
+- Compaction quotidienne (ce handler): fusionne les petits fichiers d'une partition en un
+  seul fichier, dédoublonné sur eventId (une compaction interrompue entre l'écriture et
+  la suppression des sources ne produit pas de doublons au passage suivant)
+- Jamais bloquant pour les étapes: une erreur d'écriture est journalisée, le lot abandonné
+
+Colonnes: eventId, ts (ms UTC), stage, requestId, traceId, status, category, confidence,
+grade, dedup, durationMs, pdfBytes, paymentStatus, provider, error
+
+Prérequis AWS:
+- IAM (étapes): s3:PutObject sur le préfixe ANALYTICS_URI
+- IAM (compaction): s3:ListBucket, s3:GetObject, s3:PutObject, s3:DeleteObject
+- EventBridge Scheduler: {"action": "compact"} une fois par jour (compacte la veille)
+- pyarrow en Lambda Layer pour Parquet / Arrow
+
+Env vars:
+- ANALYTICS_URI: s3://bucket/prefix ou chemin local (vide = puits désactivé)
+- ANALYTICS_FORMAT: parquet | arrow (par défaut parquet; jsonl.gz si pyarrow absent)
+- ANALYTICS_BATCH: lignes par vidage (par défaut 500)
+- ANALYTICS_FLUSH_S: âge maximal du tampon vidé en fin d'invocation (par défaut 60)
+
+Entrée (event):
+{"action": "compact", "day": "2025-01-31"}      (par défaut: la veille, UTC)
+{"action": "flush"}
+
+Sortie:
+{"ok": true, "day": "2025-01-31", "partitions": 6, "filesIn": 412, "filesOut": 6, "rows": 180000,
+ "duplicates": 0}
+
+CLI:
+  ANALYTICS_URI=/tmp/outcomes python AnalyticsSink.py compact --day 2025-01-31
+  ANALYTICS_URI=/tmp/outcomes python AnalyticsSink.py ls --day 2025-01-31
+  python AnalyticsSink.py cat /tmp/outcomes/stage=payment/day=2025-01-31/part-....parquet
+"""
+
+import runtime
+
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import tracing
+
+logger = logging.getLogger()
+
+# Constantes
+URI = os.environ.get("ANALYTICS_URI", "").rstrip("/")
+FORMAT = os.environ.get("ANALYTICS_FORMAT", "parquet").lower()
+BATCH = int(os.environ.get("ANALYTICS_BATCH", "500"))
+FLUSH_S = float(os.environ.get("ANALYTICS_FLUSH_S", "60"))
+
+COLUMNS: List[Tuple[str, str]] = [
+    ("eventId", "string"), ("ts", "timestamp"), ("stage", "string"), ("requestId", "string"),
+    ("traceId", "string"), ("status", "string"), ("category", "string"), ("confidence", "float64"),
+    ("grade", "string"), ("dedup", "bool"), ("durationMs", "float64"), ("pdfBytes", "int64"),
+    ("paymentStatus", "string"), ("provider", "string"), ("error", "string"),
+]
+_NAMES = [name for name, _ in COLUMNS]
+_EXT = {"parquet": "parquet", "arrow": "arrow", "jsonl": "jsonl.gz"}
+
+_buffer: List[Dict[str, Any]] = []
+_buffer_since: Optional[float] = None
+_buffer_lock = threading.Lock()
+_flush_pool: Optional[ThreadPoolExecutor] = None
+_flush_pending: Optional[Future] = None
+_arrow: Any = None                   # (pyarrow, pyarrow.parquet), False si absent
+
+
+def _pyarrow():
+    """Import différé et optionnel de pyarrow (None si absent, signalé une fois)."""
+    global _arrow
+    if _arrow is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            _arrow = (pyarrow, pyarrow.parquet)
+        except ImportError:
+            logger.warning("pyarrow absent: puits analytique en JSON Lines gzip")
+            _arrow = False
+    return _arrow or None
+
+
+def _format() -> str:
+    return FORMAT if FORMAT in ("parquet", "arrow") and _pyarrow() else "jsonl"
+
+
+# ========= Stockage (S3 ou répertoire local) =========
+
+class _Store:
+    def __init__(self, uri: str):
+        if uri.startswith("s3://"):
+            self.bucket, _, self.prefix = uri[5:].partition("/")
+            self.root = None
+        else:
+            self.bucket = None
+            self.root = uri[7:] if uri.startswith("file://") else uri
+            self.prefix = ""
+
+    def _path(self, rel: str) -> str:
+        return os.path.join(self.root, *rel.split("/"))
+
+    def _key(self, rel: str) -> str:
+        return f"{self.prefix}/{rel}" if self.prefix else rel
+
+    def put(self, rel: str, data: bytes) -> None:
+        if self.bucket:
+            runtime.client("s3").put_object(Bucket=self.bucket, Key=self._key(rel), Body=data)
+            return
+        path = self._path(rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, rel: str) -> bytes:
+        if self.bucket:
+            return runtime.client("s3").get_object(Bucket=self.bucket, Key=self._key(rel))["Body"].read()
+        with open(self._path(rel), "rb") as f:
+            return f.read()
+
+    def delete(self, rel: str) -> None:
+        if self.bucket:
+            runtime.client("s3").delete_object(Bucket=self.bucket, Key=self._key(rel))
+        else:
+            os.remove(self._path(rel))
+
+    def list(self) -> List[Tuple[str, int]]:
+        """(chemin relatif, taille) de tous les fichiers sous l'URI."""
+        if self.bucket:
+            s3 = runtime.client("s3")
+            kwargs: Dict[str, Any] = {"Bucket": self.bucket, "Prefix": f"{self.prefix}/" if self.prefix else ""}
+            out = []
+            while True:
+                resp = s3.list_objects_v2(**kwargs)
+                cut = len(kwargs["Prefix"])
+                out.extend((o["Key"][cut:], o["Size"]) for o in resp.get("Contents", []))
+                if not resp.get("IsTruncated"):
+                    return out
+                kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+        out = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                full = os.path.join(dirpath, name)
+                out.append((os.path.relpath(full, self.root).replace(os.sep, "/"), os.path.getsize(full)))
+        return out
+
+
+# ========= Encodage =========
+
+def _schema(pa):
+    types = {"string": pa.string(), "timestamp": pa.timestamp("ms", tz="UTC"), "float64": pa.float64(),
+             "bool": pa.bool_(), "int64": pa.int64()}
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+def encode(rows: List[Dict[str, Any]], fmt: str) -> bytes:
+    if fmt == "jsonl":
+        return gzip.compress("".join(json.dumps(r, default=str) + "\n" for r in rows).encode("utf-8"))
+    pa, pq = _pyarrow()
+    table = pa.Table.from_pylist(rows, schema=_schema(pa))
+    buf = io.BytesIO()
+    if fmt == "parquet":
+        pq.write_table(table, buf, compression="zstd")
+    else:
+        with pa.ipc.new_file(buf, table.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as w:
+            w.write_table(table)
+    return buf.getvalue()
+
+
+def decode(data: bytes, name: str) -> List[Dict[str, Any]]:
+    if name.endswith(".jsonl.gz"):
+        return [json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines() if line]
+    pa, pq = _pyarrow() or (None, None)
+    if pa is None:
+        raise RuntimeError(f"pyarrow requis pour lire {name}")
+    if name.endswith(".parquet"):
+        rows = pq.read_table(io.BytesIO(data)).to_pylist()
+    else:
+        rows = pa.ipc.open_file(pa.BufferReader(data)).read_all().to_pylist()
+    for r in rows:
+        if isinstance(r.get("ts"), datetime):
+            r["ts"] = int(r["ts"].timestamp() * 1000)
+    return rows
+
+
+# ========= Écriture =========
+
+def record(stage: str, request_id: Optional[str] = None, **fields: Any) -> None:
+    """Ajoute une ligne au tampon (colonnes inconnues ignorées); tampon plein: vidage en arrière-plan."""
+    if not URI:
+        return
+    ctx = tracing.current() or {}
+    row = {name: fields.get(name) for name in _NAMES}
+    row.update(eventId=uuid.uuid4().hex, ts=int(time.time() * 1000), stage=stage, requestId=request_id,
+               traceId=ctx.get("traceId"))
+    if row["durationMs"] is None:
+        row["durationMs"] = runtime.invocation_ms()
+    for name, kind in COLUMNS:
+        value = row[name]
+        if value is None:
+            continue
+        try:
+            if kind == "float64":
+                row[name] = float(value)
+            elif kind == "int64":
+                row[name] = int(value)
+            elif kind == "string":
+                row[name] = str(value)
+            elif kind == "bool":
+                row[name] = bool(value)
+        except (TypeError, ValueError):
+            row[name] = None
+    global _buffer_since
+    with _buffer_lock:
+        if not _buffer:
+            _buffer_since = time.monotonic()
+        _buffer.append(row)
+        full = len(_buffer) >= BATCH
+    if full:
+        _flush_in_background()
+
+
+def _flush_in_background() -> None:
+    """Programme un vidage sur le thread du puits (au plus un en attente)."""
+    global _flush_pool, _flush_pending
+    with _buffer_lock:
+        if _flush_pending is not None and not _flush_pending.done():
+            return
+        if _flush_pool is None:
+            _flush_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analytics")
+        try:
+            _flush_pending = _flush_pool.submit(_write_buffer)
+        except RuntimeError:
+            pass
+
+
+def flush() -> int:
+    """Vidage synchrone (après le vidage d'arrière-plan en cours); retourne le nombre de lignes."""
+    global _flush_pending
+    with _buffer_lock:
+        pending, _flush_pending = _flush_pending, None
+    written = pending.result() if pending is not None else 0
+    return written + _write_buffer()
+
+
+def _write_buffer() -> int:
+    """Écrit le tampon (un fichier par partition stage/jour); retourne le nombre de lignes."""
+    global _buffer, _buffer_since
+    with _buffer_lock:
+        rows, _buffer, _buffer_since = _buffer, [], None
+    if not rows or not URI:
+        return 0
+    fmt = _format()
+    partitions: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for r in rows:
+        day = datetime.fromtimestamp(r["ts"] / 1000, timezone.utc).strftime("%Y-%m-%d")
+        partitions.setdefault((r["stage"], day), []).append(r)
+    store = _Store(URI)
+    written = 0
+    for (stage, day), part in partitions.items():
+        name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.{_EXT[fmt]}"
+        try:
+            store.put(f"stage={stage}/day={day}/{name}", encode(part, fmt))
+            written += len(part)
+        except Exception as e:
+            logger.warning(f"AnalyticsSink: lot {stage}/{day} abandonné ({len(part)} lignes): {e}")
+    return written
+
+
+@runtime.after_invocation
+def _flush_if_due() -> None:
+    if _buffer_since is not None and time.monotonic() - _buffer_since >= FLUSH_S:
+        _flush_in_background()
+
+
+# ========= Compaction =========
+
+def _partitions(store: _Store, day: str) -> Dict[str, List[Tuple[str, int]]]:
+    parts: Dict[str, List[Tuple[str, int]]] = {}
+    for rel, size in store.list():
+        directory, _, name = rel.rpartition("/")
+        if f"/day={day}" in f"/{directory}" and (name.startswith("part-") or name.startswith("compacted-")):
+            parts.setdefault(directory, []).append((name, size))
+    return parts
+
+
+def compact(day: str, uri: Optional[str] = None) -> Dict[str, Any]:
+    """Fusionne les fichiers de chaque partition du jour en un seul fichier dédoublonné."""
+    store = _Store(uri or URI)
+    fmt = _format()
+    summary = {"day": day, "partitions": 0, "filesIn": 0, "filesOut": 0, "rows": 0, "duplicates": 0,
+               "bytesIn": 0, "bytesOut": 0}
+    for directory, files in sorted(_partitions(store, day).items()):
+        summary["partitions"] += 1
+        if len(files) < 2:
+            continue
+        seen, rows = set(), []
+        for name, size in files:
+            for r in decode(store.get(f"{directory}/{name}"), name):
+                if r.get("eventId") in seen:
+                    summary["duplicates"] += 1
+                    continue
+                seen.add(r.get("eventId"))
+                rows.append(r)
+            summary["bytesIn"] += size
+        rows.sort(key=lambda r: r.get("ts") or 0)
+        data = encode(rows, fmt)
+        out = f"compacted-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.{_EXT[fmt]}"
+        store.put(f"{directory}/{out}", data)
+        for name, _ in files:
+            store.delete(f"{directory}/{name}")
+        summary["filesIn"] += len(files)
+        summary["filesOut"] += 1
+        summary["rows"] += len(rows)
+        summary["bytesOut"] += len(data)
+    return summary
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: compaction quotidienne (ou vidage du tampon)."""
+    if not URI:
+        return {"ok": False, "error": "MISSING_ENV_ANALYTICS_URI"}
+    action = event.get("action", "compact")
+    if action == "flush":
+        return {"ok": True, "rows": flush()}
+    if action != "compact":
+        return {"ok": False, "error": f"action inconnue: {action}"}
+    day = event.get("day") or (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+    return {"ok": True, **compact(day)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Puits analytique colonnaire des issues de requête")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compact", help="Fusionner les petits fichiers d'un jour")
+    c.add_argument("--day", required=True)
+    c.add_argument("--uri", default=URI)
+    ls = sub.add_parser("ls", help="Fichiers et tailles par partition")
+    ls.add_argument("--day")
+    ls.add_argument("--uri", default=URI)
+    cat = sub.add_parser("cat", help="Lignes d'un fichier (JSON Lines)")
+    cat.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "cat":
+        with open(args.path, "rb") as f:
+            for row in decode(f.read(), args.path):
+                print(json.dumps(row, default=str, ensure_ascii=False))
+        return 0
+    if not args.uri:
+        print("ANALYTICS_URI non défini (ou --uri)", file=sys.stderr)
+        return 2
+    if args.cmd == "compact":
+        print(json.dumps(compact(args.day, args.uri), indent=2))
+        return 0
+    for rel, size in sorted(_Store(args.uri).list()):
+        if not args.day or f"/day={args.day}/" in f"/{rel}":
+            print(f"{size:>10}  {rel}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
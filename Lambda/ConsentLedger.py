@@ -0,0 +1,256 @@
+"""
+AWS Lambda: ConsentLedger
+
+Responsabilité:
+- Registre append-only des preuves de consentement (hashProof) par période
+- Scellement périodique: construit l'arbre de Merkle d'une période close,
+  persiste sa racine et le chemin d'inclusion de chaque consentement
+- Restitution d'une preuve d'inclusion vérifiable hors ligne (voir merkle.py)
+
+Modèle DynamoDB (même table que les consentements, pk/sk):
+- pk=LEDGER#<batchId>, sk=HEAD          → leafCount, sealedAt
+- pk=LEDGER#<batchId>, sk=LEAF#<index>  → hashProof, consentPk, consentSk, path (après scellement)
+                                          (tombstone=true, hashProof=sha256:00…0: index alloué
+                                          dont la feuille n'a jamais été écrite)
+- pk=LEDGER#<batchId>, sk=ROOT          → root, size, sealedAt
+
+Prérequis AWS:
+- IAM: ddb:UpdateItem, ddb:PutItem, ddb:GetItem, ddb:Query, ddb:BatchWriteItem
+- EventBridge Scheduler: {"action": "seal"} après chaque fin de période
+
+Env vars:
+- LEDGER_TABLE: table du registre (par défaut CONSENTS_TABLE)
+- LEDGER_PERIOD: HOUR | DAY (par défaut DAY)
+
+Entrée (event):
+{"action": "seal", "batchId": "2025-12-24"}             # batchId optionnel: période précédente
+{"action": "proof", "batchId": "2025-12-24", "index": 42}
+
+Sortie (proof):
+{
+  "ok": true,
+  "proof": {"hashProof": "sha256:...", "batchId": "2025-12-24", "index": 42,
+            "size": 1000, "path": ["..."], "root": "..."}
+}
+"""
+
+import runtime
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import merkle
+
+# Constantes
+TABLE_NAME = os.environ.get("LEDGER_TABLE") or os.environ.get("CONSENTS_TABLE", "")
+LEDGER_PERIOD = os.environ.get("LEDGER_PERIOD", "DAY").upper()
+
+_PERIOD_FORMATS = {"HOUR": "%Y-%m-%dT%H", "DAY": "%Y-%m-%d"}
+_PERIOD_DELTAS = {"HOUR": timedelta(hours=1), "DAY": timedelta(days=1)}
+# Preuve des tombes: condensat nul (aucun consentement ne peut la produire)
+TOMBSTONE = "sha256:" + "0" * 64
+
+
+class LedgerError(Exception):
+    pass
+
+
+def batch_id_for(moment: datetime, period: str = LEDGER_PERIOD) -> str:
+    """Identifiant de lot (période) contenant `moment` (UTC)."""
+    return moment.astimezone(timezone.utc).strftime(_PERIOD_FORMATS[period])
+
+
+def previous_batch_id(now: Optional[datetime] = None, period: str = LEDGER_PERIOD) -> str:
+    now = now or datetime.now(timezone.utc)
+    return batch_id_for(now - _PERIOD_DELTAS[period], period)
+
+
+def _pk(batch_id: str) -> str:
+    return f"LEDGER#{batch_id}"
+
+
+def _leaf_sk(index: int) -> str:
+    return f"LEAF#{index:010d}"
+
+
+def append(table, hash_proof: str, consent_pk: str, consent_sk: str,
+           now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Ajoute une preuve au lot courant. L'index de feuille est alloué par un compteur
+    atomique sur l'item HEAD, refusé si le lot est déjà scellé. Si l'écriture de la
+    feuille arrive après que le scellement a marqué l'index comme tombe (Lambda
+    interrompue entre les deux écritures), elle est refusée: LedgerError.
+    """
+    batch_id = batch_id_for(now or datetime.now(timezone.utc))
+    try:
+        resp = table.update_item(
+            Key={"pk": _pk(batch_id), "sk": "HEAD"},
+            UpdateExpression="ADD leafCount :one",
+            ConditionExpression="attribute_not_exists(sealedAt)",
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="UPDATED_NEW",
+        )
+    except ClientError as ce:
+        if ce.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            raise LedgerError(f"Lot {batch_id} déjà scellé") from ce
+        raise
+    index = int(resp["Attributes"]["leafCount"]) - 1
+    try:
+        table.put_item(
+            Item={
+                "pk": _pk(batch_id),
+                "sk": _leaf_sk(index),
+                "hashProof": hash_proof,
+                "consentPk": consent_pk,
+                "consentSk": consent_sk,
+            },
+            ConditionExpression="attribute_not_exists(sk)",
+        )
+    except ClientError as ce:
+        if ce.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            raise LedgerError(f"Lot {batch_id}: feuille {index} déjà scellée") from ce
+        raise
+    return {"batchId": batch_id, "leafIndex": index}
+
+
+def _query_leaves(table, batch_id: str) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    kwargs = {
+        "KeyConditionExpression": Key("pk").eq(_pk(batch_id)) & Key("sk").begins_with("LEAF#"),
+        "ConsistentRead": True,
+    }
+    while True:
+        resp = table.query(**kwargs)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            return items
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def _fill_gaps(table, batch_id: str, leaves: List[Dict[str, Any]], expected: int) -> int:
+    """
+    Marque comme tombes les index alloués sans feuille (append interrompu entre le
+    compteur et l'écriture de la feuille). Écriture conditionnelle: une feuille arrivée
+    entre-temps est conservée. Retourne le nombre de tombes écrites.
+    """
+    present = {it["sk"] for it in leaves}
+    written = 0
+    for index in range(expected):
+        if _leaf_sk(index) in present:
+            continue
+        try:
+            table.put_item(
+                Item={"pk": _pk(batch_id), "sk": _leaf_sk(index), "hashProof": TOMBSTONE, "tombstone": True},
+                ConditionExpression="attribute_not_exists(sk)",
+            )
+            written += 1
+        except ClientError as ce:
+            if ce.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    return written
+
+
+def seal(table, batch_id: str) -> Dict[str, Any]:
+    """
+    Scelle un lot: bloque les ajouts (sealedAt sur HEAD), complète les index alloués
+    sans feuille par des tombes, construit l'arbre, écrit le chemin d'inclusion sur
+    chaque feuille puis publie la racine (item ROOT).
+    Idempotent: un lot déjà publié retourne sa racine existante.
+    """
+    existing = table.get_item(Key={"pk": _pk(batch_id), "sk": "ROOT"}).get("Item")
+    if existing:
+        return {"batchId": batch_id, "root": existing["root"], "size": int(existing["size"])}
+
+    sealed_at = datetime.now(timezone.utc).isoformat()
+    try:
+        head = table.update_item(
+            Key={"pk": _pk(batch_id), "sk": "HEAD"},
+            UpdateExpression="SET sealedAt = if_not_exists(sealedAt, :ts)",
+            ConditionExpression="attribute_exists(leafCount)",
+            ExpressionAttributeValues={":ts": sealed_at},
+            ReturnValues="ALL_NEW",
+        )["Attributes"]
+    except ClientError as ce:
+        if ce.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            raise LedgerError(f"Lot {batch_id} vide ou inconnu") from ce
+        raise
+
+    leaves = _query_leaves(table, batch_id)
+    expected = int(head["leafCount"])
+    tombstones = 0
+    if len(leaves) != expected:
+        tombstones = _fill_gaps(table, batch_id, leaves, expected)
+        leaves = _query_leaves(table, batch_id)
+        if len(leaves) != expected:
+            raise LedgerError(f"Lot {batch_id}: {len(leaves)} feuilles lues sur {expected} allouées")
+
+    leaves.sort(key=lambda it: it["sk"])
+    levels = merkle.build_levels([merkle.leaf_hash(it["hashProof"]) for it in leaves])
+    root = levels[-1][0].hex()
+
+    with table.batch_writer() as batch:
+        for index, it in enumerate(leaves):
+            batch.put_item(Item={**it, "path": merkle.inclusion_path(levels, index)})
+
+    table.put_item(Item={
+        "pk": _pk(batch_id),
+        "sk": "ROOT",
+        "root": root,
+        "size": expected,
+        "sealedAt": head["sealedAt"],
+    })
+    return {"batchId": batch_id, "root": root, "size": expected, "tombstones": tombstones}
+
+
+def get_proof(table, batch_id: str, index: int) -> Dict[str, Any]:
+    """Preuve d'inclusion d'une feuille d'un lot scellé (2 GetItem, chemin en O(log n))."""
+    root = table.get_item(Key={"pk": _pk(batch_id), "sk": "ROOT"}).get("Item")
+    if not root:
+        raise LedgerError(f"Lot {batch_id} non scellé")
+    leaf = table.get_item(Key={"pk": _pk(batch_id), "sk": _leaf_sk(index)}).get("Item")
+    if not leaf or "path" not in leaf:
+        raise LedgerError(f"Feuille {index} introuvable dans le lot {batch_id}")
+    return {
+        "hashProof": leaf["hashProof"],
+        "batchId": batch_id,
+        "index": index,
+        "size": int(root["size"]),
+        "path": list(leaf["path"]),
+        "root": root["root"],
+    }
+
+
+@runtime.on_warmup
+def _preload():
+    if TABLE_NAME:
+        runtime.table(TABLE_NAME)
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: scellement périodique et restitution des preuves."""
+    if not TABLE_NAME:
+        return {"ok": False, "error": "MISSING_ENV_LEDGER_TABLE"}
+
+    table = runtime.table(TABLE_NAME)
+    action = (event.get("action") or "seal").lower()
+    try:
+        if action == "seal":
+            batch_id = event.get("batchId") or previous_batch_id()
+            return {"ok": True, "sealed": seal(table, batch_id)}
+        if action == "proof":
+            if not event.get("batchId") or event.get("index") is None:
+                return {"ok": False, "error": "batchId et index requis"}
+            return {"ok": True, "proof": get_proof(table, event["batchId"], int(event["index"]))}
+        return {"ok": False, "error": f"Action inconnue: {action}"}
+    except LedgerError as le:
+        return {"ok": False, "error": str(le)}
+    except ClientError as ce:
+        return {"ok": False, "error": f"DynamoDBError: {ce.response['Error']['Message']}"}
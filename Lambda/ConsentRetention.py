@@ -0,0 +1,332 @@
+"""
+AWS Lambda: ConsentRetention (job de maintenance planifié)
+
+Responsabilité:
+- Appliquer `retentionUntil` calculé par ValidateConsent (RGPD)
+- Parcourir la table des consentements en Scan parallèle segmenté
+- Purger les consentements expirés (BatchWriteItem par lots de 25) ou poser
+  l'attribut TTL natif DynamoDB (mode TTL)
+- Exporter les consentements encore valides en JSON Lines compressé (gzip)
+  vers S3 en multipart upload, mémoire bornée (~1 part en tampon)
+
+Les items du registre Merkle (pk=LEDGER#...) ne sont jamais purgés ni exportés.
+
+Prérequis AWS:
+- IAM: ddb:Scan, ddb:BatchWriteItem, ddb:UpdateItem, s3:PutObject (multipart)
+- TTL DynamoDB activé sur TTL_ATTRIBUTE pour le mode TTL
+
+Env vars:
+- CONSENTS_TABLE: nom de la table DynamoDB
+- PURGE_MODE: DELETE | TTL (par défaut DELETE)
+- TTL_ATTRIBUTE: attribut TTL natif (par défaut expiresAt)
+- SCAN_SEGMENTS: nombre de segments du Scan parallèle (par défaut 8)
+- SCAN_THREADS: taille du pool de threads (par défaut = SCAN_SEGMENTS)
+- EXPORT_TARGET: s3://bucket/prefix ou répertoire local (vide = pas d'export)
+- EXPORT_PART_MB: taille d'une part multipart (par défaut 8, minimum S3 5)
+- DYNAMODB_ENDPOINT_URL / S3_ENDPOINT_URL: endpoints locaux (DynamoDB Local, MinIO)
+
+Entrée (event, toutes les clés optionnelles, prioritaires sur l'env):
+{"mode": "TTL", "segments": 16, "threads": 8, "dryRun": true, "exportTarget": "/tmp/export"}
+
+Sortie:
+{
+  "ok": true,
+  "scanned": 120000, "expired": 3100, "deleted": 3100, "unprocessed": 0, "ttlSet": 0,
+  "exported": 116900, "exportBytes": 5242880, "exportKey": "s3://.../consents-2026-01-01.jsonl.gz",
+  "elapsedSec": 42.1, "itemsPerSec": 2850.3
+}
+"""
+
+import runtime
+
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Constantes
+TABLE_NAME = os.environ.get("CONSENTS_TABLE", "")
+PURGE_MODE = os.environ.get("PURGE_MODE", "DELETE").upper()
+TTL_ATTRIBUTE = os.environ.get("TTL_ATTRIBUTE", "expiresAt")
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "8"))
+SCAN_THREADS = int(os.environ.get("SCAN_THREADS", "0")) or SCAN_SEGMENTS
+EXPORT_TARGET = os.environ.get("EXPORT_TARGET", "")
+EXPORT_PART_MB = max(5, int(os.environ.get("EXPORT_PART_MB", "8")))
+DYNAMODB_ENDPOINT_URL = os.environ.get("DYNAMODB_ENDPOINT_URL") or None
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+
+BATCH_WRITE_MAX = 25
+# Re-soumissions max des UnprocessedItems d'un lot (throttling persistant: le reste
+# est compté dans "unprocessed" et repris au passage suivant du job)
+BATCH_WRITE_MAX_ATTEMPTS = 8
+PROGRESS_EVERY_SEC = 10.0
+
+
+# Clients AWS (endpoint surchargeable pour DynamoDB Local / MinIO)
+def _dynamodb():
+    return runtime.resource("dynamodb", endpoint_url=DYNAMODB_ENDPOINT_URL)
+
+
+def _s3():
+    return runtime.client("s3", endpoint_url=S3_ENDPOINT_URL)
+
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, Decimal):
+        return int(o) if o == o.to_integral_value() else float(o)
+    if isinstance(o, (set, frozenset)):
+        return sorted(o)
+    raise TypeError(f"Type non sérialisable: {type(o)}")
+
+
+def ttl_epoch(retention_until: str) -> int:
+    """Epoch (s) de fin de rétention 'YYYY-MM-DD' (minuit UTC), format attendu par le TTL DynamoDB."""
+    d = date.fromisoformat(retention_until)
+    return int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp())
+
+
+class _Progress:
+    """Compteurs partagés entre segments + log périodique du débit."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_log = self._started
+        self.counts = {"scanned": 0, "expired": 0, "deleted": 0, "unprocessed": 0, "ttlSet": 0,
+                       "exported": 0}
+
+    def add(self, **deltas: int) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                self.counts[k] += v
+            now = time.monotonic()
+            if now - self._last_log >= PROGRESS_EVERY_SEC:
+                self._last_log = now
+                logger.info(f"Progression: {self.counts} ({self.rate():.1f} items/s)")
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def rate(self) -> float:
+        elapsed = self.elapsed()
+        return self.counts["scanned"] / elapsed if elapsed > 0 else 0.0
+
+
+class _GzipJsonlExporter:
+    """
+    Écrit des lignes JSON compressées gzip. Le flux compressé est découpé en parts
+    de EXPORT_PART_MB et envoyé en multipart upload S3 au fil de l'eau (ou écrit
+    dans un fichier local), la mémoire reste bornée à ~1 part.
+    """
+
+    def __init__(self, target: str, name: str, part_size: int):
+        self._lock = threading.Lock()
+        self._part_size = part_size
+        self._buf = io.BytesIO()
+        self._gz = gzip.GzipFile(fileobj=self._buf, mode="wb")
+        self.bytes_written = 0
+        self._parts: List[Dict[str, Any]] = []
+        self._file = None
+        self._upload_id = None
+        if target.startswith("s3://"):
+            bucket, _, prefix = target[5:].partition("/")
+            self._bucket = bucket
+            self._key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+            self.location = f"s3://{bucket}/{self._key}"
+            self._upload_id = _s3().create_multipart_upload(
+                Bucket=bucket, Key=self._key, ContentType="application/x-ndjson",
+                ContentEncoding="gzip",
+            )["UploadId"]
+        else:
+            os.makedirs(target, exist_ok=True)
+            self.location = os.path.join(target, name)
+            self._file = open(self.location, "wb")
+
+    def write(self, items: List[Dict[str, Any]]) -> None:
+        if not items:
+            return
+        data = "".join(json.dumps(it, ensure_ascii=False, default=_json_default) + "\n" for it in items)
+        with self._lock:
+            self._gz.write(data.encode("utf-8"))
+            if self._buf.tell() >= self._part_size:
+                self._flush_part()
+
+    def _flush_part(self) -> None:
+        chunk = self._buf.getvalue()
+        self._buf.seek(0)
+        self._buf.truncate()
+        if not chunk:
+            return
+        self.bytes_written += len(chunk)
+        if self._file:
+            self._file.write(chunk)
+            return
+        number = len(self._parts) + 1
+        resp = _s3().upload_part(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                 PartNumber=number, Body=chunk)
+        self._parts.append({"ETag": resp["ETag"], "PartNumber": number})
+
+    def close(self) -> None:
+        with self._lock:
+            self._gz.close()  # écrit le trailer gzip dans le tampon
+            self._flush_part()
+            if self._file:
+                self._file.close()
+            elif self._parts:
+                _s3().complete_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                                MultipartUpload={"Parts": self._parts})
+            else:
+                _s3().abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+
+    def abort(self) -> None:
+        with self._lock:
+            if self._file:
+                self._file.close()
+            elif self._upload_id:
+                _s3().abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+
+
+def _batch_delete(table_name: str, keys: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    BatchWriteItem par lots de 25, avec re-soumission des UnprocessedItems (backoff),
+    au plus BATCH_WRITE_MAX_ATTEMPTS fois par lot. Retourne (supprimés, non traités).
+    """
+    client = _dynamodb().meta.client
+    deleted = left = 0
+    for i in range(0, len(keys), BATCH_WRITE_MAX):
+        requests = [{"DeleteRequest": {"Key": k}} for k in keys[i:i + BATCH_WRITE_MAX]]
+        attempt = 0
+        while requests:
+            resp = client.batch_write_item(RequestItems={table_name: requests})
+            unprocessed = resp.get("UnprocessedItems", {}).get(table_name, [])
+            deleted += len(requests) - len(unprocessed)
+            requests = unprocessed
+            if requests:
+                attempt += 1
+                if attempt >= BATCH_WRITE_MAX_ATTEMPTS:
+                    logger.warning(f"{len(requests)} suppressions non traitées après {attempt} tentatives")
+                    left += len(requests)
+                    break
+                time.sleep(min(0.05 * (2 ** attempt), 2.0))
+    return deleted, left
+
+
+def _set_ttl(table, items: List[Dict[str, Any]]) -> int:
+    done = 0
+    for it in items:
+        table.update_item(
+            Key={"pk": it["pk"], "sk": it["sk"]},
+            UpdateExpression="SET #t = :t",
+            ExpressionAttributeNames={"#t": TTL_ATTRIBUTE},
+            ExpressionAttributeValues={":t": ttl_epoch(it["retentionUntil"])},
+        )
+        done += 1
+    return done
+
+
+def _process_segment(table_name: str, segment: int, total: int, today: str, mode: str, dry_run: bool,
+                     exporter: Optional[_GzipJsonlExporter], progress: _Progress) -> None:
+    table = runtime.table(table_name, endpoint_url=DYNAMODB_ENDPOINT_URL)
+    kwargs = {
+        "Segment": segment,
+        "TotalSegments": total,
+        "FilterExpression": Attr("sk").begins_with("CONSENT#"),
+    }
+    while True:
+        page = table.scan(**kwargs)
+        items = page.get("Items", [])
+        expired = [it for it in items if it.get("retentionUntil") and it["retentionUntil"] < today]
+        live = [it for it in items if not (it.get("retentionUntil") and it["retentionUntil"] < today)]
+
+        deleted = ttl_set = unprocessed = 0
+        if not dry_run:
+            if mode == "TTL":
+                ttl_set = _set_ttl(table, [it for it in items
+                                           if it.get("retentionUntil") and TTL_ATTRIBUTE not in it])
+            else:
+                deleted, unprocessed = _batch_delete(table_name, [{"pk": it["pk"], "sk": it["sk"]} for it in expired])
+        if exporter:
+            exporter.write(live)
+        progress.add(scanned=page.get("ScannedCount", len(items)), expired=len(expired),
+                     deleted=deleted, unprocessed=unprocessed, ttlSet=ttl_set, exported=len(live) if exporter else 0)
+
+        if "LastEvaluatedKey" not in page:
+            return
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def run(table_name: str, mode: str = PURGE_MODE, segments: int = SCAN_SEGMENTS, threads: int = SCAN_THREADS,
+        export_target: str = EXPORT_TARGET, dry_run: bool = False, today: Optional[str] = None) -> Dict[str, Any]:
+    """Exécute la purge/export; utilisable hors Lambda (script, DynamoDB Local)."""
+    mode = (mode or PURGE_MODE).upper()
+    if mode not in ("DELETE", "TTL"):
+        raise ValueError(f"PURGE_MODE invalide: {mode}")
+    today = today or datetime.now(timezone.utc).date().isoformat()
+    progress = _Progress()
+    exporter = (_GzipJsonlExporter(export_target, f"consents-{today}.jsonl.gz", EXPORT_PART_MB * 1024 * 1024)
+                if export_target else None)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+            futures = [pool.submit(_process_segment, table_name, s, segments, today, mode, dry_run,
+                                   exporter, progress)
+                       for s in range(segments)]
+            for f in futures:
+                f.result()
+    except Exception:
+        if exporter:
+            exporter.abort()
+        raise
+    if exporter:
+        exporter.close()
+
+    report = dict(progress.counts)
+    report.update({
+        "mode": mode,
+        "dryRun": dry_run,
+        "segments": segments,
+        "exportBytes": exporter.bytes_written if exporter else 0,
+        "exportKey": exporter.location if exporter else "",
+        "elapsedSec": round(progress.elapsed(), 3),
+        "itemsPerSec": round(progress.rate(), 1),
+    })
+    logger.info(f"Rétention terminée: {report}")
+    return report
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda (EventBridge Scheduler) pour la purge de rétention et l'export d'audit."""
+    if not TABLE_NAME:
+        return {"ok": False, "error": "MISSING_ENV_CONSENTS_TABLE"}
+    event = event if isinstance(event, dict) else {}
+    segments = int(event.get("segments") or SCAN_SEGMENTS)
+    try:
+        report = run(
+            TABLE_NAME,
+            mode=(event.get("mode") or PURGE_MODE).upper(),
+            segments=segments,
+            threads=int(event.get("threads") or SCAN_THREADS or segments),
+            export_target=event.get("exportTarget", EXPORT_TARGET),
+            dry_run=bool(event.get("dryRun", False)),
+        )
+        return {"ok": True, **report}
+    except ValueError as ve:
+        return {"ok": False, "error": str(ve)}
+    except ClientError as ce:
+        return {"ok": False, "error": f"AWSError: {ce.response['Error']['Message']}"}
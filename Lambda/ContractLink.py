@@ -0,0 +1,241 @@
+"""
+AWS Lambda: ContractLink
+
+Responsabilité:
+- Lien de téléchargement permanent d'un contrat: le courriel porte
+  LINK_BASE_URL/<jeton> au lieu d'une URL présignée de 15 minutes
+- Jeton stable signé HMAC-SHA256 (contratId, clé S3, expiration optionnelle): validé
+  sans aller-retour de stockage, rotation des secrets par identifiant de clé (kid)
+- À chaque ouverture: redirection 302 vers une URL S3 présignée fraîche; les URL
+  présignées sont gardées en mémoire du conteneur par clé S3 jusqu'à peu avant leur
+  expiration (la régénération du PDF n'est plus nécessaire pour un lien expiré)
+
+Prérequis AWS:
+- IAM: s3:GetObject sur BUCKET_NAME (la présignature est locale, sans appel réseau)
+- API Gateway: GET /contracts/link/{token} → ce handler (?format=json: URL en JSON)
+
+Env vars:
+- LINK_SECRET: secret(s) HMAC séparés par des virgules; le premier signe, tous valident
+- LINK_BASE_URL: préfixe public des liens (ex: https://api.example.org/contracts/link)
+- LINK_URL_TTL: validité des URL présignées servies (par défaut PRESIGNED_TTL ou 900 s)
+- LINK_MAX_AGE_DAYS: durée de validité du jeton (par défaut 0: sans expiration)
+- LINK_CACHE_MAX: nombre d'URL présignées gardées en mémoire (par défaut 5000)
+- BUCKET_NAME: bucket des contrats
+
+Entrée (event):
+événement API Gateway (pathParameters.token ou ?t=<jeton>)
+{"action": "issue", "contratId": "CTR-...", "key": "contracts/2025/CTR-....pdf"}
+
+Sortie:
+302 Location: <URL présignée>           (API)
+{"ok": true, "token": "...", "link": "https://.../contracts/link/<jeton>"}   (issue)
+
+CLI:
+  LINK_SECRET=... python ContractLink.py issue CTR-1 contracts/2025/CTR-1.pdf
+  LINK_SECRET=... python ContractLink.py verify <jeton>
+"""
+
+import runtime
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+import tracing
+
+logger = logging.getLogger()
+
+# Constantes
+SECRETS = [s.strip() for s in os.environ.get("LINK_SECRET", "").split(",") if s.strip()]
+BASE_URL = os.environ.get("LINK_BASE_URL", "").rstrip("/")
+URL_TTL = int(os.environ.get("LINK_URL_TTL") or os.environ.get("PRESIGNED_TTL", "900"))
+MAX_AGE_DAYS = int(os.environ.get("LINK_MAX_AGE_DAYS", "0"))
+CACHE_MAX = int(os.environ.get("LINK_CACHE_MAX", "5000"))
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "energy-contracts-pdf-prod")
+
+SIG_BYTES = 16
+# Une URL en cache est renouvelée quand il lui reste moins que cette marge
+REFRESH_MARGIN_S = max(30, URL_TTL // 5)
+
+_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _s3():
+    return runtime.client("s3")
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode((text + "=" * (-len(text) % 4)).encode("ascii"))
+
+
+def _kid(secret: str) -> str:
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:6]
+
+
+def _sign(secret: str, kid: str, payload: str) -> str:
+    mac = hmac.new(secret.encode("utf-8"), f"{kid}.{payload}".encode("utf-8"), hashlib.sha256).digest()
+    return _b64(mac[:SIG_BYTES])
+
+
+# ========= Jetons =========
+
+def issue(contrat_id: str, key: str, now: Optional[float] = None) -> str:
+    """Jeton `<kid>.<payload>.<signature>`; même entrée → même jeton (sans expiration)."""
+    if not SECRETS:
+        raise InvalidToken("MISSING_ENV_LINK_SECRET")
+    claims: Dict[str, Any] = {"c": contrat_id, "k": key}
+    if MAX_AGE_DAYS:
+        claims["e"] = int((now or time.time()) + MAX_AGE_DAYS * 86400)
+    payload = _b64(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    kid = _kid(SECRETS[0])
+    return f"{kid}.{payload}.{_sign(SECRETS[0], kid, payload)}"
+
+
+def verify(token: str, now: Optional[float] = None) -> Dict[str, Any]:
+    """Claims du jeton ({"c": contratId, "k": clé S3, "e"?}); lève InvalidToken."""
+    try:
+        kid, payload, sig = (token or "").split(".")
+    except (AttributeError, ValueError):
+        raise InvalidToken("MALFORMED")
+    secret = next((s for s in SECRETS if _kid(s) == kid), None)
+    if secret is None:
+        raise InvalidToken("UNKNOWN_KEY")
+    # Comparaison en octets: un segment non ASCII (jeton forgé) est une signature invalide
+    if not hmac.compare_digest(sig.encode("utf-8"), _sign(secret, kid, payload).encode("ascii")):
+        raise InvalidToken("BAD_SIGNATURE")
+    try:
+        claims = json.loads(_unb64(payload))
+    except ValueError:
+        raise InvalidToken("MALFORMED")
+    if not isinstance(claims, dict) or not claims.get("c") or not claims.get("k"):
+        raise InvalidToken("MALFORMED")
+    if claims.get("e") and (now or time.time()) > claims["e"]:
+        raise InvalidToken("EXPIRED")
+    return claims
+
+
+def link_url(contrat_id: str, key: str) -> Optional[str]:
+    """Lien permanent à mettre dans le courriel; None si LINK_BASE_URL / LINK_SECRET absents."""
+    if not BASE_URL or not SECRETS:
+        return None
+    return f"{BASE_URL}/{issue(contrat_id, key)}"
+
+
+# ========= URL présignées =========
+
+def presigned_url(key: str, contrat_id: Optional[str] = None) -> Tuple[str, int, bool]:
+    """(URL, secondes de validité restantes, servie du cache) pour la clé S3."""
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[1] - now > REFRESH_MARGIN_S:
+            _cache.move_to_end(key)
+            return hit[0], int(hit[1] - now), True
+    params = {"Bucket": BUCKET_NAME, "Key": key}
+    if contrat_id:
+        params["ResponseContentDisposition"] = f'attachment; filename="{contrat_id}.pdf"'
+    url = _s3().generate_presigned_url("get_object", Params=params, ExpiresIn=URL_TTL)
+    with _cache_lock:
+        _cache[key] = (url, now + URL_TTL)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX:
+            _cache.popitem(last=False)
+    return url, URL_TTL, False
+
+
+def _api_response(status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {
+        "statusCode": status,
+        "headers": {"Content-Type": "application/json", "Cache-Control": "no-store", **(headers or {})},
+        "body": json.dumps(body, ensure_ascii=False),
+    }
+
+
+@runtime.on_warmup
+def _preload():
+    _s3()
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: jeton → redirection vers une URL présignée fraîche."""
+    if not SECRETS:
+        return _api_response(500, {"ok": False, "error": "MISSING_ENV_LINK_SECRET"})
+
+    if event.get("action") == "issue":
+        if not event.get("contratId") or not event.get("key"):
+            return {"ok": False, "error": "contratId et key requis"}
+        token = issue(event["contratId"], event["key"])
+        return {"ok": True, "token": token, "link": f"{BASE_URL}/{token}" if BASE_URL else None}
+
+    qs = event.get("queryStringParameters") or {}
+    token = (event.get("pathParameters") or {}).get("token") or qs.get("t")
+    with metrics.span("verify") as sp:
+        try:
+            claims = verify(token)
+        except InvalidToken as it:
+            sp.prop(error=str(it))
+            status = 410 if str(it) == "EXPIRED" else 403
+            return _api_response(status, {"ok": False, "error": f"INVALID_LINK: {it}"})
+
+    with metrics.span("presign") as sp:
+        url, remaining, cached = presigned_url(claims["k"], claims["c"])
+        sp.prop(cached=cached)
+
+    if qs.get("format") == "json":
+        return _api_response(200, {"ok": True, "contratId": claims["c"], "url": url, "expiresIn": remaining})
+    # Le navigateur peut réutiliser la redirection tant que l'URL cible reste valide
+    max_age = max(0, remaining - REFRESH_MARGIN_S)
+    return {
+        "statusCode": 302,
+        "headers": {"Location": url, "Cache-Control": f"private, max-age={max_age}"},
+        "body": "",
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Liens permanents de téléchargement des contrats")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("issue", help="Émettre le jeton d'un contrat")
+    i.add_argument("contrat_id")
+    i.add_argument("key")
+    v = sub.add_parser("verify", help="Vérifier un jeton")
+    v.add_argument("token")
+    args = parser.parse_args(argv)
+    try:
+        if args.cmd == "issue":
+            token = issue(args.contrat_id, args.key)
+            print(f"{BASE_URL}/{token}" if BASE_URL else token)
+        else:
+            print(json.dumps(verify(args.token), ensure_ascii=False))
+    except InvalidToken as it:
+        print(f"Jeton invalide: {it}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
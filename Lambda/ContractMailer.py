@@ -0,0 +1,383 @@
+"""
+AWS Lambda: ContractMailer
+
+Responsabilité:
+- Boîte d'envoi des courriels "contrat prêt": GenerateContract y dépose une entrée
+  (`enqueue`, une écriture DynamoDB) au lieu d'appeler SES dans le chemin de la requête
+- Dispatcher planifié: lit les entrées échues par ordre d'arrivée et les envoie par
+  SendBulkTemplatedEmail (modèle SES CONTRACT_TEMPLATE, au plus 50 destinataires et une
+  seconde de débit par appel), au débit autorisé par SES (seau à jetons sur MaxSendRate)
+- Lien de téléchargement permanent (ContractLink) si LINK_BASE_URL est configuré, sinon
+  présigné au moment de l'envoi: l'attente en boîte d'envoi ne consomme pas sa validité
+- Retries: erreur transitoire d'un appel (throttling, 5xx) → backoff exponentiel dans
+  l'invocation; appel toujours en échec (transitoire ou non: AccessDenied, modèle absent,
+  domaine non vérifié...) → tout le lot est reporté au dispatch suivant, sans limite de
+  tentatives, et le dispatch s'arrête; échec transitoire persistant d'un destinataire →
+  report au dispatch suivant (nextAttemptAt, backoff exponentiel); seul le refus d'un
+  destinataire (définitif, ou MAIL_MAX_ATTEMPTS atteint) → emailStatus=FAILED
+- MessageId SES reporté sur le contrat (preuve d'acceptation SES)
+
+Modèle DynamoDB (pk/sk):
+- MAIL_OUTBOX_TABLE: pk=MAIL#OUTBOX, sk=<createdAt>#<contratId>
+                     → to, contratId, bucket, key, requestId, attempts, nextAttemptAt
+- CONTRACTS_TABLE:   pk=CONTRACT#<contratId>, sk=META
+                     → emailStatus (SENT | FAILED), emailMessageId, emailSentAt, emailError
+
+Prérequis AWS:
+- IAM: ses:SendBulkTemplatedEmail, ses:GetSendQuota, ses:GetTemplate, ses:CreateTemplate,
+  s3:GetObject (présignature), ddb:PutItem, ddb:UpdateItem, ddb:Query, ddb:BatchWriteItem
+- EventBridge Scheduler: {"action": "dispatch"} toutes les minutes
+- Concurrence réservée = 1 (le seau à jetons est propre à l'invocation)
+
+Env vars:
+- MAIL_OUTBOX_TABLE: table de la boîte d'envoi (peut être CONTRACTS_TABLE); GenerateContract
+  n'utilise la boîte d'envoi que si elle est définie
+- CONTRACTS_TABLE: table des contrats (report du MessageId)
+- CONTRACT_TEMPLATE: nom du modèle SES (par défaut uc3-contract-ready)
+- SES_MAX_SEND_RATE: messages/s (par défaut: MaxSendRate renvoyé par GetSendQuota)
+- MAIL_MAX_ATTEMPTS (5), MAIL_BACKOFF_S (30), DISPATCH_MAX_ITEMS (1000), DISPATCH_BUDGET_S (45)
+- SENDER_EMAIL, PRESIGNED_TTL, COMPANY_NAME: comme GenerateContract
+- LINK_BASE_URL, LINK_SECRET: lien permanent (voir ContractLink)
+
+Entrée (event):
+{"action": "dispatch"}
+{"action": "enqueue", "to": "client@example.org", "contratId": "CTR-...", "bucket": "...", "key": "...",
+ "requestId": "REQ-..."}
+
+Sortie:
+{"ok": true, "sent": 120, "retried": 3, "failed": 1, "calls": 3, "throttledMs": 420.0, "remaining": 0,
+ "callError": null}
+
+CLI (modèle SES):
+  python ContractMailer.py template > template.json
+  aws ses create-template --cli-input-json file://template.json
+"""
+
+import runtime
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+import ContractLink
+import metrics
+import tracing
+
+logger = logging.getLogger()
+
+# Constantes
+CONTRACTS_TABLE = os.environ.get("CONTRACTS_TABLE", "")
+TABLE_NAME = os.environ.get("MAIL_OUTBOX_TABLE", "")
+TEMPLATE_NAME = os.environ.get("CONTRACT_TEMPLATE", "uc3-contract-ready")
+MAX_SEND_RATE = float(os.environ.get("SES_MAX_SEND_RATE", "0"))
+MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", "5"))
+BACKOFF_S = float(os.environ.get("MAIL_BACKOFF_S", "30"))
+DISPATCH_MAX_ITEMS = int(os.environ.get("DISPATCH_MAX_ITEMS", "1000"))
+DISPATCH_BUDGET_S = float(os.environ.get("DISPATCH_BUDGET_S", "45"))
+SENDER_EMAIL = os.environ.get("SENDER_EMAIL", "eco.ia@capgemini.com")
+PRESIGNED_TTL = int(os.environ.get("PRESIGNED_TTL", "900"))
+COMPANY_NAME = os.environ.get("COMPANY_NAME", "EcoIA")
+
+OUTBOX_PK = "MAIL#OUTBOX"
+BULK_MAX = 50                    # limite SES SendBulkTemplatedEmail
+CALL_RETRIES = 3                 # retries d'un appel en échec transitoire, dans l'invocation
+# Codes d'erreur SES (appel ou statut par destinataire) qui méritent un nouvel essai
+TRANSIENT = {"Throttling", "ThrottlingException", "TooManyRequestsException", "ServiceUnavailable",
+             "InternalFailure", "RequestTimeout", "TransientFailure", "AccountThrottled", "Failed"}
+
+# Même contenu que l'envoi direct de GenerateContract (_send_email_with_link)
+TEMPLATE = {
+    "TemplateName": TEMPLATE_NAME,
+    "SubjectPart": "Votre contrat d'énergie {{contratId}}",
+    "TextPart": "Bonjour,\n\nVotre contrat {{contratId}} est prêt.\n"
+                "Vous pouvez le télécharger ici ({{validity}}):\n{{downloadUrl}}\n\n"
+                "Cordialement,\n{{company}}",
+    "HtmlPart": "<p>Bonjour,</p><p>Votre contrat <b>{{contratId}}</b> est prêt.</p>"
+                "<p><a href=\"{{downloadUrl}}\">Télécharger le contrat</a> ({{validity}})</p>"
+                "<p>Cordialement,<br>{{company}}</p>",
+}
+
+_send_rate: Optional[float] = None
+_template_checked = False
+
+
+def _table():
+    return runtime.table(TABLE_NAME)
+
+
+def _contracts():
+    return runtime.table(CONTRACTS_TABLE)
+
+
+def _ses():
+    return runtime.client("ses")
+
+
+def _s3():
+    return runtime.client("s3")
+
+
+def _now_iso(delta_s: float = 0.0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=delta_s)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class TokenBucket:
+    """Seau à jetons: `rate` jetons/s, capacité `burst` (par défaut une seconde de débit)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, n: float) -> float:
+        """Prend `n` jetons (par tranches de `capacity`), en attendant si besoin; retourne l'attente (s)."""
+        waited = 0.0
+        while n > 0:
+            take = min(n, self.capacity)
+            self._refill()
+            if self.tokens < take:
+                delay = (take - self.tokens) / self.rate
+                self._sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= take
+            n -= take
+        return waited
+
+
+# ========= Mise en boîte d'envoi =========
+
+def enqueue(to_email: str, contrat_id: str, bucket: str, key: str, request_id: Optional[str] = None) -> str:
+    """Dépose le courriel du contrat dans la boîte d'envoi; retourne la clé de tri de l'entrée."""
+    created_at = _now_iso()
+    sk = f"{created_at}#{contrat_id}"
+    item = {"pk": OUTBOX_PK, "sk": sk, "to": to_email, "contratId": contrat_id, "bucket": bucket, "key": key,
+            "requestId": request_id, "attempts": 0, "createdAt": created_at, "nextAttemptAt": created_at}
+    _table().put_item(Item={k: v for k, v in item.items() if v is not None})
+    return sk
+
+
+# ========= Dispatcher =========
+
+def send_rate() -> float:
+    """Débit SES autorisé (messages/s), lu une fois par conteneur."""
+    global _send_rate
+    if MAX_SEND_RATE > 0:
+        return MAX_SEND_RATE
+    if _send_rate is None:
+        try:
+            _send_rate = float(_ses().get_send_quota()["MaxSendRate"])
+        except ClientError as ce:
+            logger.warning(f"GetSendQuota impossible ({ce.response['Error']['Code']}), débit 1/s")
+            _send_rate = 1.0
+    return _send_rate
+
+
+def ensure_template() -> None:
+    """Crée le modèle SES s'il n'existe pas (une vérification par conteneur)."""
+    global _template_checked
+    if _template_checked:
+        return
+    try:
+        _ses().get_template(TemplateName=TEMPLATE_NAME)
+    except ClientError as ce:
+        if ce.response["Error"]["Code"] != "TemplateDoesNotExist":
+            raise
+        try:
+            _ses().create_template(Template=TEMPLATE)
+        except ClientError as ce2:
+            if ce2.response["Error"]["Code"] != "AlreadyExists":
+                raise
+    _template_checked = True
+
+
+def _read_due(limit: int) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    kwargs = {"KeyConditionExpression": Key("pk").eq(OUTBOX_PK), "ConsistentRead": True,
+              "FilterExpression": Attr("nextAttemptAt").lte(_now_iso()), "Limit": min(limit, 1000)}
+    while len(items) < limit:
+        resp = _table().query(**kwargs)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return items[:limit]
+
+
+def _destination(item: Dict[str, Any]) -> Dict[str, Any]:
+    data = {"contratId": item["contratId"]}
+    link = ContractLink.link_url(item["contratId"], item["key"])
+    if link:
+        data.update(downloadUrl=link, validity="lien permanent")
+    else:
+        data["downloadUrl"] = _s3().generate_presigned_url(
+            "get_object", Params={"Bucket": item["bucket"], "Key": item["key"]}, ExpiresIn=PRESIGNED_TTL)
+    return {
+        "Destination": {"ToAddresses": [item["to"]]},
+        "ReplacementTemplateData": json.dumps(data, ensure_ascii=False),
+    }
+
+
+def _send_bulk(destinations: List[Dict[str, Any]]) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """Un appel SendBulkTemplatedEmail, retries avec backoff exponentiel + jitter sur erreur transitoire."""
+    default_data = json.dumps({"validity": f"lien valable {PRESIGNED_TTL // 60} min", "company": COMPANY_NAME},
+                              ensure_ascii=False)
+    for attempt in range(CALL_RETRIES + 1):
+        try:
+            resp = _ses().send_bulk_templated_email(Source=SENDER_EMAIL, Template=TEMPLATE_NAME,
+                                                    DefaultTemplateData=default_data, Destinations=destinations)
+            return resp.get("Status", []), None
+        except ClientError as ce:
+            code = ce.response["Error"]["Code"]
+            if code not in TRANSIENT or attempt == CALL_RETRIES:
+                return None, code
+            time.sleep(min(8.0, 0.2 * 2 ** attempt) * (0.5 + random.random()))
+    return None, "Unknown"
+
+
+def _mark_contract(contrat_id: str, status: str, message_id: Optional[str] = None,
+                   error: Optional[str] = None) -> None:
+    if not CONTRACTS_TABLE:
+        return
+    values = {":s": status, ":t": _now_iso()}
+    sets = ["emailStatus = :s", "emailSentAt = :t"]
+    if message_id:
+        values[":m"] = message_id
+        sets.append("emailMessageId = :m")
+    if error:
+        values[":e"] = error
+        sets.append("emailError = :e")
+    _contracts().update_item(Key={"pk": f"CONTRACT#{contrat_id}", "sk": "META"},
+                             UpdateExpression="SET " + ", ".join(sets), ExpressionAttributeValues=values)
+
+
+def _reschedule(item: Dict[str, Any], error: str, bounded: bool = True) -> bool:
+    """Report au dispatch suivant; False si le nombre max de tentatives est atteint (`bounded`)."""
+    attempts = int(item.get("attempts", 0)) + 1
+    if bounded and attempts >= MAX_ATTEMPTS:
+        return False
+    delay = min(3600.0, BACKOFF_S * 2 ** (attempts - 1)) * (0.5 + random.random())
+    _table().update_item(Key={"pk": item["pk"], "sk": item["sk"]},
+                         UpdateExpression="SET attempts = :a, nextAttemptAt = :n, lastError = :e",
+                         ExpressionAttributeValues={":a": attempts, ":n": _now_iso(delay), ":e": error})
+    return True
+
+
+def dispatch(limit: int = DISPATCH_MAX_ITEMS, budget_s: float = DISPATCH_BUDGET_S) -> Dict[str, Any]:
+    """Envoie les entrées échues par lots, au débit SES; les entrées non traitées restent en boîte d'envoi."""
+    deadline = time.monotonic() + budget_s
+    with metrics.span("outbox_read") as sp:
+        items = _read_due(limit)
+        sp.set(items=len(items))
+    out = {"ok": True, "sent": 0, "retried": 0, "failed": 0, "calls": 0, "throttledMs": 0.0, "remaining": 0,
+           "callError": None}
+    if not items:
+        return out
+
+    ensure_template()
+    bucket = TokenBucket(send_rate())
+    # SES compte chaque destinataire: un lot ne dépasse pas une seconde de débit
+    batch_size = max(1, min(BULK_MAX, int(bucket.capacity)))
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        if time.monotonic() > deadline:
+            out["remaining"] += len(items) - start
+            break
+        out["throttledMs"] += round(bucket.acquire(len(chunk)) * 1000, 1)
+        with metrics.span("ses_bulk", entries=len(chunk)) as sp:
+            statuses, call_error = _send_bulk([_destination(it) for it in chunk])
+            out["calls"] += 1
+            if call_error:
+                sp.prop(error=call_error)
+        if call_error:
+            # Erreur de l'appel (compte, modèle, domaine, throttling persistant): aucun
+            # destinataire n'a été évalué, le lot est reporté et les suivants attendent
+            logger.warning(f"SendBulkTemplatedEmail en échec ({call_error}): {len(chunk)} courriels reportés")
+            for item in chunk:
+                _reschedule(item, call_error, bounded=False)
+            out["retried"] += len(chunk)
+            out["remaining"] += len(items) - start - len(chunk)
+            out["callError"] = call_error
+            break
+        sent: List[Dict[str, Any]] = []
+        for i, item in enumerate(chunk):
+            status = statuses[i] if i < len(statuses) else {"Status": "Failed"}
+            code = status.get("Status")
+            if code == "Success":
+                _mark_contract(item["contratId"], "SENT", message_id=status.get("MessageId"))
+                sent.append(item)
+                out["sent"] += 1
+            elif code in TRANSIENT and _reschedule(item, code):
+                out["retried"] += 1
+            else:
+                logger.warning(f"Courriel du contrat {item['contratId']} abandonné: {code} {status.get('Error', '')}")
+                _mark_contract(item["contratId"], "FAILED", error=f"{code}: {status.get('Error', '')}".strip(": "))
+                sent.append(item)
+                out["failed"] += 1
+        with metrics.span("outbox_delete", items=len(sent)):
+            with _table().batch_writer() as batch:
+                for item in sent:
+                    batch.delete_item(Key={"pk": item["pk"], "sk": item["sk"]})
+    return out
+
+
+@runtime.on_warmup
+def _preload():
+    if TABLE_NAME:
+        _table()
+    _ses()
+    _s3()
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: dispatch planifié de la boîte d'envoi, ou mise en boîte directe."""
+    if not TABLE_NAME:
+        return {"ok": False, "error": "MISSING_ENV_MAIL_OUTBOX_TABLE"}
+    action = (event.get("action") or "dispatch").lower()
+    try:
+        if action == "dispatch":
+            return dispatch(int(event.get("limit") or DISPATCH_MAX_ITEMS),
+                            float(event.get("budgetS") or DISPATCH_BUDGET_S))
+        if action == "enqueue":
+            if not all(event.get(k) for k in ("to", "contratId", "bucket", "key")):
+                return {"ok": False, "error": "to, contratId, bucket et key requis"}
+            return {"ok": True, "queued": enqueue(event["to"], event["contratId"], event["bucket"], event["key"],
+                                                  event.get("requestId"))}
+        return {"ok": False, "error": f"Action inconnue: {action}"}
+    except ClientError as ce:
+        return {"ok": False, "error": f"AWSError: {ce.response['Error']['Message']}"}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Courriels des contrats (boîte d'envoi SES)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("template", help="Modèle SES (entrée de aws ses create-template)")
+    parser.parse_args(argv)
+    print(json.dumps({"Template": TEMPLATE}, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,32 +1,71 @@
+import runtime
+
 import os
 import io
 import json
 import base64
 import datetime
 import logging
+import time
 from typing import Optional, Tuple
 
-import boto3
+import ContractLink
+import ContractMailer
+import RequestState
+import metrics
+import pdf_fonts
+import tracing
 
 # ========= Config & clients AWS =========
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-s3 = boto3.client("s3")
-ses = boto3.client("ses")
+def _s3():
+    return runtime.client("s3")
+
+def _ses():
+    return runtime.client("ses")
 
 BUCKET_NAME = os.environ.get("BUCKET_NAME","energy-contracts-pdf-prod")
 SENDER_EMAIL = os.environ.get("SENDER_EMAIL","eco.ia@capgemini.com")             
 PRESIGNED_TTL = int(os.environ.get("PRESIGNED_TTL", "900"))
 COMPANY_NAME = os.environ.get("COMPANY_NAME", "EcoIA")
+# outbox: courriel déposé dans la boîte d'envoi de ContractMailer (envoi différé, par lots);
+# sync: envoi SES dans la requête (aussi utilisé si la boîte d'envoi est indisponible).
+# Par défaut outbox seulement si MAIL_OUTBOX_TABLE est défini (dispatcher déployé)
+EMAIL_DELIVERY = (os.environ.get("EMAIL_DELIVERY")
+                  or ("outbox" if os.environ.get("MAIL_OUTBOX_TABLE") else "sync")).lower()
 
 # Logo par défaut (optionnel)
 DEFAULT_LOGO_BUCKET = os.environ.get("LOGO_S3_BUCKET","energy-contracts-pdf-prod")
 DEFAULT_LOGO_KEY = os.environ.get("LOGO_S3_KEY","brand/logo.jpg")
+# Logo par défaut gardé en mémoire du conteneur (relu après LOGO_CACHE_TTL secondes)
+LOGO_CACHE_TTL = int(os.environ.get("LOGO_CACHE_TTL", "3600"))
+_default_logo: Optional[Tuple[float, bytes]] = None
+
+# Police TrueType embarquée (sous-ensemble) pour les textes hors Latin-1 (noms polonais,
+# arabes...): fichier local (couche Lambda) ou objet S3, lu et analysé une fois par conteneur.
+# auto: police embarquée seulement si le contrat contient des caractères hors Latin-1
+# (sinon Helvetica/WinAnsi, sans coût supplémentaire); always; never (remplacement par "?")
+PDF_FONT_PATH = os.environ.get("PDF_FONT_PATH", "")
+PDF_FONT_S3_BUCKET = os.environ.get("PDF_FONT_S3_BUCKET") or DEFAULT_LOGO_BUCKET
+PDF_FONT_S3_KEY = os.environ.get("PDF_FONT_S3_KEY", "")
+PDF_FONT_MODE = os.environ.get("PDF_FONT_MODE", "auto").lower()
+_base_font: Optional[pdf_fonts.TrueTypeFont] = None
+_base_font_error: Optional[str] = None
 
 
 # ========= Encodage & échappement texte PDF =========
 
+_ANSI_REPL = {
+    "\u2014": "-", "\u2013": "-", "\u2012": "-", "\u2015": "-", "\u2212": "-",
+    "\u2018": "'", "\u2019": "'", "\u201A": ",",
+    "\u201C": '"', "\u201D": '"', "\u201E": '"',
+    "\u2026": "...",
+    "\u00A0": " ", "\u202F": " ", "\u2009": " ", "\u2007": " ",
+    "\u2002": " ", "\u2003": " ", "\u200A": " ", "\u200B": "", "\u2060": ""
+}
+
 def _to_pdf_ansi(s: str) -> str:
     """
     Normalise les caractères non-Latin-1 (Unicode) afin que l'encodage 'latin-1'
@@ -34,14 +73,7 @@ def _to_pdf_ansi(s: str) -> str:
     """
     if s is None:
         return ""
-    repl = {
-        "\u2014": "-", "\u2013": "-", "\u2012": "-", "\u2015": "-", "\u2212": "-",
-        "\u2018": "'", "\u2019": "'", "\u201A": ",",
-        "\u201C": '"', "\u201D": '"', "\u201E": '"',
-        "\u2026": "...",
-        "\u00A0": " ", "\u202F": " ", "\u2009": " ", "\u2007": " ",
-        "\u2002": " ", "\u2003": " ", "\u200A": " ", "\u200B": "", "\u2060": ""
-    }
+    repl = _ANSI_REPL
     out = []
     for ch in s:
         if ch in repl:
@@ -53,6 +85,11 @@ def _to_pdf_ansi(s: str) -> str:
             out.append("?")
     return "".join(out)
 
+def _needs_unicode(payload: dict) -> bool:
+    """Vrai si un texte du contrat perdrait des caractères avec Helvetica/WinAnsi."""
+    text = json.dumps(payload, ensure_ascii=False, default=str) + COMPANY_NAME
+    return any(ord(ch) > 0xFF and ch not in _ANSI_REPL for ch in text)
+
 def _pdf_escape_text(s: str) -> str:
     r"""
     Échappe les caractères spéciaux PDF (\, (, )) après normalisation ANSI.
@@ -134,14 +171,49 @@ class Pdf:
         )
         return self.header + b"".join(objects) + xref_bytes + trailer
 
+    def add_cid_font(self, subset: pdf_fonts.FontSubset, font_id: int) -> None:
+        """
+        Écrit une police Type0 (Identity-H) dans l'objet réservé `font_id`: police CID
+        TrueType, descripteur, sous-ensemble FontFile2 et CMap ToUnicode (copier/coller).
+        """
+        file_id = self.add(
+            f"<< /Length {len(subset.fontfile)} /Length1 {subset.length1} /Filter /FlateDecode >>\n"
+            .encode("latin-1") + b"stream\n" + subset.fontfile + b"\nendstream"
+        )
+        bbox = " ".join(str(v) for v in subset.bbox)
+        desc_id = self.add(
+            f"<< /Type /FontDescriptor /FontName /{subset.name} /Flags 32 /FontBBox [{bbox}] "
+            f"/ItalicAngle {subset.italic_angle:g} /Ascent {subset.ascent} /Descent {subset.descent} "
+            f"/CapHeight {subset.cap_height} /StemV {subset.stem_v} /FontFile2 {file_id} 0 R >>".encode("latin-1")
+        )
+        cid_id = self.add(
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{subset.name} "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {desc_id} 0 R /W {subset.widths} /CIDToGIDMap /Identity >>".encode("latin-1")
+        )
+        tounicode_id = self.add(
+            f"<< /Length {len(subset.to_unicode)} /Filter /FlateDecode >>\n".encode("latin-1") +
+            b"stream\n" + subset.to_unicode + b"\nendstream"
+        )
+        self.obj_bodies[font_id - 1] = (
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{subset.name} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_id} 0 R] /ToUnicode {tounicode_id} 0 R >>".encode("latin-1")
+        )
+
 
-def build_contract_pdf(payload: dict, logo_jpeg: Optional[bytes]) -> bytes:
+def build_contract_pdf(payload: dict, logo_jpeg: Optional[bytes],
+                       font: Optional[pdf_fonts.TrueTypeFont] = None) -> bytes:
     """
     Génère un PDF A4 : logo (JPEG), titre, blocs Client/Offre/Conditions, signatures, pied de page.
-    100% sans dépendances externes.
+    100% sans dépendances externes. Avec `font`, les textes hors Latin-1 utilisent un
+    sous-ensemble embarqué de cette police (voir PDF_FONT_MODE).
     """
+    enc = None
+    if font is not None and (PDF_FONT_MODE == "always" or (PDF_FONT_MODE == "auto" and _needs_unicode(payload))):
+        enc = pdf_fonts.Encoder(font)
+
     def wrap_lines(text: str, max_chars: int = 95) -> list[str]:
-        text = _to_pdf_ansi(text or "")
+        text = _to_pdf_ansi(text or "") if enc is None else (text or "")
         lines = []
         for para in text.splitlines():
             p = para.strip()
@@ -158,6 +230,8 @@ def build_contract_pdf(payload: dict, logo_jpeg: Optional[bytes]) -> bytes:
         return lines
 
     def tj_line(s: str) -> str:
+        if enc is not None:
+            return f"{enc.hex(s)} Tj\n"
         s = _pdf_escape_text(_to_pdf_ansi(s))
         return f"({s}) Tj\n"
 
@@ -169,8 +243,12 @@ def build_contract_pdf(payload: dict, logo_jpeg: Optional[bytes]) -> bytes:
     # 2) Pages (placeholder; on mettra le /Kids après /Page)
     pages_id = pdf.add(b"<< /Type /Pages /Kids [] /Count 1 >>")
 
-    # 3) Font Helvetica **avec WinAnsiEncoding** (clé du correctif)
-    font_id = pdf.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    # 3) Font Helvetica **avec WinAnsiEncoding** (clé du correctif), ou placeholder de la
+    #    police embarquée (écrite après le contenu, une fois les glyphes connus)
+    if enc is None:
+        font_id = pdf.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    else:
+        font_id = pdf.add(b"<< >>")
 
     # 4) Image (logo JPEG) optionnelle
     img_id = None
@@ -319,6 +397,9 @@ def build_contract_pdf(payload: dict, logo_jpeg: Optional[bytes]) -> bytes:
         b"stream\n" + stream_bytes + b"\nendstream"
     )
 
+    if enc is not None:
+        pdf.add_cid_font(enc.subset(), font_id)
+
     # 6) Page (références resources et contents)
     resources = f"<< /Font << /F1 {font_id} 0 R >>".encode("latin-1")
     if img_id:
@@ -373,41 +454,70 @@ def _load_logo_bytes(payload: dict) -> Optional[bytes]:
             logger.warning(f"Logo Base64 invalide: {e}")
     if isinstance(logo, dict) and logo.get("s3Bucket") and logo.get("s3Key"):
         try:
-            obj = s3.get_object(Bucket=logo["s3Bucket"], Key=logo["s3Key"])
+            obj = _s3().get_object(Bucket=logo["s3Bucket"], Key=logo["s3Key"])
             return obj["Body"].read()
         except Exception as e:
             logger.warning(f"Lecture logo S3 (payload) impossible: {e}")
     if DEFAULT_LOGO_BUCKET and DEFAULT_LOGO_KEY:
         try:
-            obj = s3.get_object(Bucket=DEFAULT_LOGO_BUCKET, Key=DEFAULT_LOGO_KEY)
-            return obj["Body"].read()
+            return _default_logo_bytes()
         except Exception as e:
             logger.warning(f"Lecture logo S3 (env) impossible: {e}")
     return None
 
+def _get_base_font() -> Optional[pdf_fonts.TrueTypeFont]:
+    """Police de base (PDF_FONT_PATH ou S3), analysée une fois par conteneur; None si absente."""
+    global _base_font, _base_font_error
+    if _base_font is not None or _base_font_error or PDF_FONT_MODE == "never":
+        return _base_font
+    if not PDF_FONT_PATH and not PDF_FONT_S3_KEY:
+        return None
+    try:
+        if PDF_FONT_PATH:
+            with open(PDF_FONT_PATH, "rb") as f:
+                data = f.read()
+        else:
+            data = _s3().get_object(Bucket=PDF_FONT_S3_BUCKET, Key=PDF_FONT_S3_KEY)["Body"].read()
+        _base_font = pdf_fonts.load(data)
+    except Exception as e:
+        # Pas de nouvel essai dans ce conteneur: repli Helvetica/WinAnsi
+        _base_font_error = str(e)
+        logger.warning(f"Police PDF indisponible, repli Helvetica: {e}")
+    return _base_font
+
+def _default_logo_bytes() -> bytes:
+    """Logo par défaut (S3), lu une fois par conteneur puis servi depuis la mémoire."""
+    global _default_logo
+    if _default_logo and time.time() - _default_logo[0] < LOGO_CACHE_TTL:
+        return _default_logo[1]
+    obj = _s3().get_object(Bucket=DEFAULT_LOGO_BUCKET, Key=DEFAULT_LOGO_KEY)
+    data = obj["Body"].read()
+    _default_logo = (time.time(), data)
+    return data
+
 def _presign(bucket: str, key: str, ttl: int) -> str:
-    return s3.generate_presigned_url(
+    return _s3().generate_presigned_url(
         "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=ttl
     )
 
-def _send_email_with_link(to_email: str, presigned_url: str, contrat_id: str) -> str:
+def _send_email_with_link(to_email: str, presigned_url: str, contrat_id: str,
+                          validity: str = f"lien valable {PRESIGNED_TTL//60} min") -> str:
     """Envoie un email via SES et retourne le MessageId (preuve d'acceptation SES)."""
     subject = f"Votre contrat d'énergie {contrat_id}"
     text_body = (
         f"Bonjour,\n\n"
         f"Votre contrat {contrat_id} est prêt.\n"
-        f"Vous pouvez le télécharger ici (valable {PRESIGNED_TTL//60} min):\n{presigned_url}\n\n"
+        f"Vous pouvez le télécharger ici ({validity}):\n{presigned_url}\n\n"
         f"Cordialement,\n{COMPANY_NAME}"
     )
     html_body = (
         f"<p>Bonjour,</p>"
         f"<p>Votre contrat <b>{contrat_id}</b> est prêt.</p>"
         f"<p><a href=\"{presigned_url}\">Télécharger le contrat</a> "
-        f"(lien valable {PRESIGNED_TTL//60} min)</p>"
-        f"<p>Cordialement,
-{COMPANY_NAME}</p>"
+        f"({validity})</p>"
+        f"<p>Cordialement,<br>{COMPANY_NAME}</p>"
     )
-    resp = ses.send_email(
+    resp = _ses().send_email(
         Source=SENDER_EMAIL,
         Destination={"ToAddresses": [to_email]},
         Message={
@@ -423,6 +533,20 @@ def _send_email_with_link(to_email: str, presigned_url: str, contrat_id: str) ->
     return msg_id
 
 
+@runtime.on_warmup
+def _preload():
+    """Ping de pré-chauffage: clients, logo en cache et chemin de rendu PDF (aucun envoi)."""
+    _s3()
+    _ses()
+    logo = _default_logo_bytes() if DEFAULT_LOGO_BUCKET and DEFAULT_LOGO_KEY else None
+    build_contract_pdf({"contratId": "WARMUP", "client": {}, "offre": {}}, logo, _get_base_font())
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
 def lambda_handler(event, context):
     if not BUCKET_NAME:
         return {"statusCode": 500, "body": json.dumps({"error": "BUCKET_NAME manquant"})}
@@ -433,58 +557,90 @@ def lambda_handler(event, context):
     logger.info(f"Payload: {json.dumps(payload)[:1200]}")
 
     contrat_id = (payload.get("contratId") or f"CONTRAT-{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}").strip()
+    request_id = payload.get("requestId")
     client_email = payload.get("client", {}).get("email")
 
     # 1) Logo (JPEG recommandé)
-    logo_bytes = _load_logo_bytes(payload)
+    with metrics.span("logo") as sp:
+        logo_bytes = _load_logo_bytes(payload)
+        sp.set(bytes=len(logo_bytes or b""))
 
     # 2) PDF
-    try:
-        pdf_bytes = build_contract_pdf(payload, logo_bytes)
-    except Exception as e:
-        logger.exception("Erreur génération PDF")
-        return {"statusCode": 500, "body": json.dumps({"error": "Erreur génération PDF", "details": str(e)})}
+    with metrics.span("pdf") as sp:
+        try:
+            pdf_bytes = build_contract_pdf(payload, logo_bytes, _get_base_font())
+        except Exception as e:
+            logger.exception("Erreur génération PDF")
+            sp.prop(error=type(e).__name__)
+            RequestState.record(request_id, "FAILED", "GenerateContract", contractId=contrat_id, error="PDF")
+            return {"statusCode": 500, "body": json.dumps({"error": "Erreur génération PDF", "details": str(e)})}
+        sp.set(bytes=len(pdf_bytes))
 
     # 3) S3
     year = datetime.datetime.utcnow().strftime("%Y")
     s3_key = f"contracts/{year}/{contrat_id}.pdf"
-    try:
-        s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=s3_key,
-            Body=pdf_bytes,
-            ContentType="application/pdf",
-            Metadata={"contratId": contrat_id, "company": COMPANY_NAME},
-        )
-    except Exception as e:
-        logger.exception("Erreur S3 put_object")
-        return {"statusCode": 500, "body": json.dumps({"error": "Upload S3 KO", "details": str(e)})}
+    with metrics.span("s3_put", bytes=len(pdf_bytes)) as sp:
+        try:
+            _s3().put_object(
+                Bucket=BUCKET_NAME,
+                Key=s3_key,
+                Body=pdf_bytes,
+                ContentType="application/pdf",
+                Metadata={"contratId": contrat_id, "company": COMPANY_NAME},
+            )
+        except Exception as e:
+            logger.exception("Erreur S3 put_object")
+            sp.prop(error=type(e).__name__)
+            RequestState.record(request_id, "FAILED", "GenerateContract", contractId=contrat_id, error="S3")
+            return {"statusCode": 500, "body": json.dumps({"error": "Upload S3 KO", "details": str(e)})}
 
     # 4) URL présignée
-    try:
-        url = _presign(BUCKET_NAME, s3_key, PRESIGNED_TTL)
-    except Exception as e:
-        logger.exception("Erreur presign")
-        url = ""
-
-    # 5) Email SES
-    ses_message_id = ""
-    if client_email:
+    with metrics.span("presign") as sp:
         try:
-            ses_message_id = _send_email_with_link(client_email, url, contrat_id)
+            url = _presign(BUCKET_NAME, s3_key, PRESIGNED_TTL)
         except Exception as e:
-            logger.exception("Erreur envoi email SES")
-            return {
-                "statusCode": 200,
-                "body": json.dumps({
-                    "message": "Contrat généré, email KO",
-                    "bucket": BUCKET_NAME,
-                    "key": s3_key,
-                    "downloadUrl": url,
-                    "email": client_email or "",
-                    "sesError": str(e),
-                }),
-            }
+            logger.exception("Erreur presign")
+            sp.prop(error=type(e).__name__)
+            url = ""
+
+    # Lien permanent pour le courriel (ContractLink), si configuré
+    link = ContractLink.link_url(contrat_id, s3_key)
+
+    RequestState.record(request_id, "CONTRACT_GENERATED", "GenerateContract", contractId=contrat_id,
+                        s3Key=s3_key, pdfBytes=len(pdf_bytes))
+
+    # 5) Email: boîte d'envoi (hors du chemin de la requête), sinon SES direct
+    ses_message_id = ""
+    email_queued = False
+    if client_email and EMAIL_DELIVERY == "outbox" and ContractMailer.TABLE_NAME:
+        with metrics.span("mail_enqueue") as sp:
+            try:
+                ContractMailer.enqueue(client_email, contrat_id, BUCKET_NAME, s3_key, request_id)
+                email_queued = True
+            except Exception as e:
+                logger.warning(f"Boîte d'envoi indisponible, envoi direct: {e}")
+                sp.prop(error=type(e).__name__)
+    if client_email and not email_queued:
+        with metrics.span("ses") as sp:
+            try:
+                if link:
+                    ses_message_id = _send_email_with_link(client_email, link, contrat_id, "lien permanent")
+                else:
+                    ses_message_id = _send_email_with_link(client_email, url, contrat_id)
+            except Exception as e:
+                logger.exception("Erreur envoi email SES")
+                sp.prop(error=type(e).__name__)
+                return {
+                    "statusCode": 200,
+                    "body": json.dumps({
+                        "message": "Contrat généré, email KO",
+                        "bucket": BUCKET_NAME,
+                        "key": s3_key,
+                        "downloadUrl": url,
+                        "email": client_email or "",
+                        "sesError": str(e),
+                    }),
+                }
 
     return {
         "statusCode": 200,
@@ -493,7 +649,9 @@ def lambda_handler(event, context):
             "bucket": BUCKET_NAME,
             "key": s3_key,
             "downloadUrl": url,
+            "link": link,
             "email": client_email or "",
+            "emailQueued": email_queued,
             "sesMessageId": ses_message_id
         }),
     }
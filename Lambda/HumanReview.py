@@ -0,0 +1,444 @@
+"""
+AWS Lambda: HumanReview
+
+Responsabilité:
+- File de revue humaine (Human-in-the-Loop): enregistre les demandes signalées par
+  Verify (anomalie, faible confiance) au lieu de publier un message SNS par demande
+- Notification du back-office par lots: un flush périodique publie la boîte d'envoi
+  via SNS PublishBatch (NOTIFY_MODE=batch, 10 demandes par appel) ou sous forme de
+  digests regroupés par catégorie et motif (NOTIFY_MODE=digest)
+- Les demandes prioritaires contournent le lot et sont publiées immédiatement; leur entrée
+  de boîte d'envoi n'est retirée qu'après publication (sinon le flush suivant s'en charge)
+- API de consultation paginée pour HTML/back-office-processing.html: lecture de l'index
+  secondaire creux des demandes en attente (Query, jamais de Scan), curseur opaque
+
+Modèle DynamoDB (pk/sk):
+- pk=REVIEW#<requestId>, sk=META   → status, category, reason, confidence, priority, summary,
+                                      createdAt, gsi1pk=PENDING, gsi1sk=<0|1>#<createdAt>#<requestId>
+                                      (gsi1pk/gsi1sk retirés à la résolution: index creux)
+- pk=HITL#OUTBOX, sk=<0|1>#<createdAt>#<requestId> → notification en attente du prochain flush,
+                                      écrite dans la même transaction que la demande
+
+Prérequis AWS:
+- Table DynamoDB (REVIEW_TABLE) pk (S), sk (S) + GSI REVIEW_INDEX (gsi1pk, gsi1sk), projection ALL
+- IAM: ddb:PutItem (TransactWriteItems), ddb:UpdateItem, ddb:DeleteItem, ddb:Query, ddb:BatchWriteItem, sns:Publish
+- EventBridge Scheduler: {"action": "flush"} toutes les FLUSH_INTERVAL minutes (ex: rate(2 minutes))
+- API Gateway: GET /review (liste), POST /review/{requestId} (résolution) → ce handler
+
+Env vars:
+- REVIEW_TABLE: nom de la table
+- REVIEW_INDEX: nom du GSI des demandes en attente (par défaut gsi1)
+- HITL_TOPIC_ARN: topic SNS du back-office
+- NOTIFY_MODE: batch | digest (par défaut digest)
+- PRIORITY_CATEGORIES / PRIORITY_REASONS: listes séparées par des virgules, toujours prioritaires
+- FLUSH_MAX_ITEMS: nombre max de notifications traitées par flush (par défaut 500)
+- BACKOFFICE_URL: lien vers la page back-office inclus dans les messages
+
+Entrée (event):
+{"action": "enqueue", "requestId": "REQ-...", "clientId": "C12345", "category": "RECLAMATION",
+ "reason": "LOW_CONFIDENCE", "confidence": 0.42, "priority": false, "summary": "..."}
+{"action": "flush"}
+{"action": "list", "limit": 25, "cursor": "<opaque>", "category": "RECLAMATION"}
+{"action": "resolve", "requestId": "REQ-...", "decision": "APPROVED", "agent": "jdoe"}
+ou un événement API Gateway (GET → list, POST → resolve)
+
+Sortie:
+{"ok": true, "queued": true, "notified": "batched" | "immediate" | "duplicate"}
+{"ok": true, "published": 37, "messages": 4, "failed": 0}
+{"ok": true, "items": [...], "nextCursor": "<opaque>" | null}
+"""
+
+import runtime
+
+import base64
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+import RequestState
+import metrics
+import tracing
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Constantes
+TABLE_NAME = os.environ.get("REVIEW_TABLE", "")
+INDEX_NAME = os.environ.get("REVIEW_INDEX", "gsi1")
+TOPIC_ARN = os.environ.get("HITL_TOPIC_ARN", "")
+NOTIFY_MODE = os.environ.get("NOTIFY_MODE", "digest").lower()
+PRIORITY_CATEGORIES = {c.strip().upper() for c in os.environ.get("PRIORITY_CATEGORIES", "").split(",") if c.strip()}
+PRIORITY_REASONS = {r.strip().upper() for r in os.environ.get("PRIORITY_REASONS", "").split(",") if r.strip()}
+FLUSH_MAX_ITEMS = int(os.environ.get("FLUSH_MAX_ITEMS", "500"))
+BACKOFFICE_URL = os.environ.get("BACKOFFICE_URL", "")
+
+OUTBOX_PK = "HITL#OUTBOX"
+PENDING = "PENDING"
+PUBLISH_BATCH_SIZE = 10          # limite SNS PublishBatch
+DIGEST_MAX_IDS = 50              # identifiants listés par digest (le compte reste exact)
+PAGE_MAX = 100
+DECISIONS = ("APPROVED", "REJECTED", "ESCALATED")
+
+_SERIALIZER = TypeSerializer()
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _dynamodb():
+    return runtime.resource("dynamodb")
+
+
+def _table():
+    return runtime.table(TABLE_NAME)
+
+
+def _sns():
+    return runtime.client("sns")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _review_key(request_id: str) -> Dict[str, str]:
+    return {"pk": f"REVIEW#{request_id}", "sk": "META"}
+
+
+def is_priority(event: Dict[str, Any]) -> bool:
+    return bool(event.get("priority")) \
+        or str(event.get("category") or "").upper() in PRIORITY_CATEGORIES \
+        or str(event.get("reason") or "").upper() in PRIORITY_REASONS
+
+
+# ========= Mise en file =========
+
+def enqueue(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Enregistre la demande en attente et son entrée de boîte d'envoi dans une même
+    transaction; les prioritaires sont en plus publiées tout de suite. Si cette
+    publication échoue, l'entrée reste et le flush suivant la publie en premier.
+    """
+    request_id = event.get("requestId")
+    if not request_id:
+        raise BadRequest("MISSING_REQUEST_ID")
+    priority = is_priority(event)
+    created_at = _now_iso()
+    rank = f"{0 if priority else 1}#{created_at}#{request_id}"
+    item = {
+        **_review_key(request_id),
+        "requestId": request_id,
+        "clientId": event.get("clientId"),
+        "status": PENDING,
+        "category": str(event.get("category") or "INCONNUE").upper(),
+        "reason": str(event.get("reason") or "LOW_CONFIDENCE").upper(),
+        "confidence": str(event["confidence"]) if event.get("confidence") is not None else None,
+        "priority": priority,
+        "summary": (event.get("summary") or "")[:500],
+        "createdAt": created_at,
+        "gsi1pk": PENDING,
+        "gsi1sk": rank,
+        "outboxSk": rank,
+    }
+    outbox = {
+        "pk": OUTBOX_PK, "sk": rank, "requestId": request_id, "category": item["category"],
+        "reason": item["reason"], "confidence": item["confidence"], "priority": priority,
+        "summary": item["summary"] if priority else None, "createdAt": created_at,
+    }
+
+    with metrics.span("ddb_transact"):
+        try:
+            # Idempotent: une ré-exécution Step Functions ne doit pas renotifier. Demande et
+            # notification sont écrites ensemble: jamais de demande en file sans sa notification.
+            _dynamodb().meta.client.transact_write_items(TransactItems=[
+                {"Put": {"TableName": TABLE_NAME, "Item": _serialize(item),
+                         "ConditionExpression": "attribute_not_exists(pk)"}},
+                {"Put": {"TableName": TABLE_NAME, "Item": _serialize(outbox)}},
+            ])
+        except ClientError as ce:
+            reasons = ce.response.get("CancellationReasons") or [{}]
+            if ce.response["Error"]["Code"] == "TransactionCanceledException" \
+                    and reasons[0].get("Code") == "ConditionalCheckFailed":
+                return {"ok": True, "queued": False, "notified": "duplicate"}
+            raise
+    RequestState.record(request_id, "IN_REVIEW", "HumanReview", category=item["category"], reason=item["reason"],
+                        priority=priority)
+    if not priority:
+        return {"ok": True, "queued": True, "notified": "batched"}
+
+    with metrics.span("sns_publish") as sp:
+        try:
+            resp = _sns().publish(TopicArn=TOPIC_ARN, Subject=_subject(item),
+                                  Message=json.dumps(_notification(item), ensure_ascii=False),
+                                  MessageAttributes=_attributes(item["category"], item["reason"], True))
+        except ClientError as ce:
+            sp.prop(error=ce.response["Error"]["Code"])
+            logger.warning(f"HumanReview {request_id}: publication reportée au prochain flush "
+                           f"({ce.response['Error']['Message']})")
+            return {"ok": True, "queued": True, "notified": "batched"}
+        sp.prop(messageId=resp.get("MessageId"))
+    _table().delete_item(Key={"pk": OUTBOX_PK, "sk": rank})
+    return {"ok": True, "queued": True, "notified": "immediate"}
+
+
+def _serialize(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Format bas niveau du client DynamoDB (TransactWriteItems), attributs vides omis."""
+    return {k: _SERIALIZER.serialize(v) for k, v in item.items() if v is not None}
+
+
+def _subject(item: Dict[str, Any]) -> str:
+    prefix = "[PRIORITAIRE] " if item.get("priority") else ""
+    return f"{prefix}{item['category']} - {item['requestId']}"[:100]
+
+
+def _notification(item: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: item.get(k) for k in ("requestId", "category", "reason", "confidence", "createdAt", "summary")
+           if item.get(k) is not None}
+    if BACKOFFICE_URL:
+        out["link"] = f"{BACKOFFICE_URL}?view=queue&requestId={item.get('requestId')}"
+    return out
+
+
+def _attributes(category: str, reason: str, priority: bool) -> Dict[str, Any]:
+    """Attributs SNS pour les politiques de filtrage des abonnements back-office."""
+    return {
+        "category": {"DataType": "String", "StringValue": category},
+        "reason": {"DataType": "String", "StringValue": reason},
+        "priority": {"DataType": "String", "StringValue": "true" if priority else "false"},
+    }
+
+
+# ========= Flush périodique =========
+
+def _read_outbox(limit: int) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    kwargs = {"KeyConditionExpression": Key("pk").eq(OUTBOX_PK), "ConsistentRead": True,
+              "Limit": min(limit, 1000)}
+    while len(items) < limit:
+        resp = _table().query(**kwargs)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return items[:limit]
+
+
+def _entries_batch(items: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Une entrée PublishBatch par demande."""
+    return [({
+        "Subject": _subject(it),
+        "Message": json.dumps(_notification(it), ensure_ascii=False),
+        "MessageAttributes": _attributes(it["category"], it["reason"], bool(it.get("priority"))),
+    }, [it]) for it in items]
+
+
+def _entries_digest(items: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Une entrée PublishBatch par couple (catégorie, motif)."""
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for it in items:
+        groups.setdefault((it["category"], it["reason"]), []).append(it)
+    entries = []
+    for (category, reason), members in sorted(groups.items(), key=lambda g: -len(g[1])):
+        digest = {
+            "category": category,
+            "reason": reason,
+            "count": len(members),
+            "oldest": members[0]["createdAt"],
+            "newest": members[-1]["createdAt"],
+            "requestIds": [m["requestId"] for m in members[:DIGEST_MAX_IDS]],
+        }
+        if BACKOFFICE_URL:
+            digest["link"] = f"{BACKOFFICE_URL}?view=queue&category={category}"
+        entries.append(({
+            "Subject": f"{len(members)} demande(s) {category} / {reason}"[:100],
+            "Message": json.dumps(digest, ensure_ascii=False),
+            "MessageAttributes": _attributes(category, reason, False),
+        }, members))
+    return entries
+
+
+def flush(mode: str = NOTIFY_MODE, limit: int = FLUSH_MAX_ITEMS) -> Dict[str, Any]:
+    """
+    Publie la boîte d'envoi par PublishBatch (10 entrées par appel) puis supprime les
+    notifications publiées. Les entrées en échec restent pour le flush suivant.
+    """
+    with metrics.span("outbox_read") as sp:
+        items = _read_outbox(limit)
+        sp.set(items=len(items))
+    if not items:
+        return {"ok": True, "published": 0, "messages": 0, "failed": 0}
+
+    # Prioritaires (publication immédiate manquée) en tête, jamais regroupées en digest
+    urgent = [it for it in items if it.get("priority")]
+    rest = [it for it in items if not it.get("priority")]
+    entries = _entries_batch(urgent) + (_entries_digest(rest) if mode == "digest" else _entries_batch(rest))
+    done: List[Dict[str, Any]] = []
+    failed = 0
+    messages = 0
+    for start in range(0, len(entries), PUBLISH_BATCH_SIZE):
+        chunk = entries[start:start + PUBLISH_BATCH_SIZE]
+        request = [{"Id": str(i), **entry} for i, (entry, _) in enumerate(chunk)]
+        with metrics.span("sns_publish_batch", entries=len(request)) as sp:
+            try:
+                resp = _sns().publish_batch(TopicArn=TOPIC_ARN, PublishBatchRequestEntries=request)
+            except ClientError as ce:
+                sp.prop(error=ce.response["Error"]["Code"])
+                failed += sum(len(members) for _, members in chunk)
+                continue
+        for ok in resp.get("Successful", []):
+            done.extend(chunk[int(ok["Id"])][1])
+            messages += 1
+        failed += sum(len(chunk[int(f["Id"])][1]) for f in resp.get("Failed", []))
+
+    with metrics.span("outbox_delete", items=len(done)):
+        with _table().batch_writer() as batch:
+            for it in done:
+                batch.delete_item(Key={"pk": it["pk"], "sk": it["sk"]})
+    return {"ok": True, "published": len(done), "messages": messages, "failed": failed}
+
+
+# ========= API back-office =========
+
+def _encode_cursor(key: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError:
+        raise BadRequest("INVALID_CURSOR")
+
+
+def _int_param(value: Any, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"INVALID_{name.upper()}")
+
+
+def list_pending(limit: int = 25, cursor: Optional[str] = None, category: Optional[str] = None) -> Dict[str, Any]:
+    """Page de demandes en attente (prioritaires d'abord, puis les plus anciennes)."""
+    kwargs: Dict[str, Any] = {
+        "IndexName": INDEX_NAME,
+        "KeyConditionExpression": Key("gsi1pk").eq(PENDING),
+        "Limit": max(1, min(_int_param(limit, "limit"), PAGE_MAX)),
+    }
+    start = _decode_cursor(cursor)
+    if start:
+        kwargs["ExclusiveStartKey"] = start
+    if category:
+        kwargs["FilterExpression"] = Attr("category").eq(category.upper())
+    with metrics.span("ddb_query") as sp:
+        resp = _table().query(**kwargs)
+        sp.set(items=resp.get("Count", 0))
+    fields = ("requestId", "clientId", "category", "reason", "confidence", "priority", "summary", "createdAt")
+    return {
+        "ok": True,
+        "items": [{k: it.get(k) for k in fields if it.get(k) is not None} for it in resp.get("Items", [])],
+        "nextCursor": _encode_cursor(resp.get("LastEvaluatedKey")),
+    }
+
+
+def resolve(request_id: str, decision: str, agent: Optional[str] = None,
+            comment: Optional[str] = None) -> Dict[str, Any]:
+    """Clôt une demande: sortie de l'index des demandes en attente et de la boîte d'envoi."""
+    if not request_id:
+        raise BadRequest("MISSING_REQUEST_ID")
+    decision = (decision or "").upper()
+    if decision not in DECISIONS:
+        raise BadRequest(f"INVALID_DECISION (attendu: {', '.join(DECISIONS)})")
+    with metrics.span("ddb_update"):
+        try:
+            attrs = _table().update_item(
+                Key=_review_key(request_id),
+                UpdateExpression="SET #s = :d, resolvedAt = :ts, agent = :a, #c = :c REMOVE gsi1pk, gsi1sk",
+                ConditionExpression="#s = :pending",
+                ExpressionAttributeNames={"#s": "status", "#c": "comment"},
+                ExpressionAttributeValues={":d": decision, ":ts": _now_iso(), ":a": agent or "-",
+                                           ":c": comment or "", ":pending": PENDING},
+                ReturnValues="ALL_NEW",
+            )["Attributes"]
+        except ClientError as ce:
+            if ce.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise BadRequest("NOT_PENDING")
+            raise
+    if attrs.get("outboxSk"):
+        # Résolue avant le flush: inutile de la notifier
+        _table().delete_item(Key={"pk": OUTBOX_PK, "sk": attrs["outboxSk"]})
+    RequestState.record(request_id, decision, "HumanReview", agent=agent)
+    return {"ok": True, "requestId": request_id, "status": decision}
+
+
+def _api_response(status: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "statusCode": status,
+        "headers": {"Content-Type": "application/json", "Cache-Control": "no-store"},
+        "body": json.dumps(body, ensure_ascii=False, default=str),
+    }
+
+
+def _handle_api(event: Dict[str, Any]) -> Dict[str, Any]:
+    method = (event.get("httpMethod") or event.get("requestContext", {}).get("http", {}).get("method") or "GET")
+    if method.upper() == "GET":
+        qs = event.get("queryStringParameters") or {}
+        return _api_response(200, list_pending(qs.get("limit") or 25, qs.get("cursor"), qs.get("category")))
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except ValueError:
+        raise BadRequest("INVALID_JSON_BODY")
+    if not isinstance(body, dict):
+        raise BadRequest("INVALID_JSON_BODY")
+    request_id = (event.get("pathParameters") or {}).get("requestId") or body.get("requestId")
+    return _api_response(200, resolve(request_id, body.get("decision"), body.get("agent"), body.get("comment")))
+
+
+@runtime.on_warmup
+def _preload():
+    """Ping de pré-chauffage: table de revue et client SNS."""
+    if TABLE_NAME:
+        _table()
+    _sns()
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: file HITL, flush des notifications et API back-office."""
+    api = "requestContext" in event or "httpMethod" in event
+    if not TABLE_NAME:
+        error = {"ok": False, "error": "MISSING_ENV_REVIEW_TABLE"}
+        return _api_response(500, error) if api else error
+
+    try:
+        if api:
+            return _handle_api(event)
+        action = (event.get("action") or "enqueue").lower()
+        if action == "enqueue":
+            return enqueue(event)
+        if action == "flush":
+            return flush(event.get("mode") or NOTIFY_MODE, int(event.get("limit") or FLUSH_MAX_ITEMS))
+        if action == "list":
+            return list_pending(event.get("limit") or 25, event.get("cursor"), event.get("category"))
+        if action == "resolve":
+            return resolve(event.get("requestId"), event.get("decision"), event.get("agent"), event.get("comment"))
+        return {"ok": False, "error": f"Action inconnue: {action}"}
+    except BadRequest as br:
+        return _api_response(400, {"ok": False, "error": str(br)}) if api else {"ok": False, "error": str(br)}
+    except ClientError as ce:
+        error = {"ok": False, "error": f"AWSError: {ce.response['Error']['Message']}"}
+        return _api_response(502, error) if api else error
@@ -0,0 +1,400 @@
+"""
+AWS Lambda: RequestState
+
+Responsabilité:
+- Cycle de vie d'une demande client, clé requestId, dans une table unique:
+  journal d'événements append-only (une transition = un événement) + état courant
+  matérialisé (lecture O(1))
+- Machine à états appliquée par écritures conditionnelles: chaque événement occupe
+  le numéro de version suivant (attribute_not_exists), une transition non prévue par
+  TRANSITIONS est refusée; la même transition rejouée (retry Step Functions) est un no-op
+- Les événements font foi: si la projection de l'état courant a échoué après l'écriture
+  d'un événement, le writer suivant la rattrape avant d'écrire
+- Consultation back-office: demandes par statut, triées par ancienneté dans ce statut
+  (GSI, jamais de Scan), et historique d'une demande
+- Écrit par chaque étape (Classify, HumanReview, ValidateConsent, GenerateContract,
+  signature, payment) via `record(...)`, sans jamais faire échouer l'étape
+
+Modèle DynamoDB (pk/sk):
+- pk=REQ#<requestId>, sk=STATE            → status, version, stage, createdAt, updatedAt,
+                                             attributs cumulés des étapes (category, contractId...),
+                                             gsi1pk=<status>, gsi1sk=<updatedAt>#<requestId>
+- pk=REQ#<requestId>, sk=EVT#<version:08d> → status, from, stage, at, data, traceId
+
+Prérequis AWS:
+- Table DynamoDB (REQUESTS_TABLE) pk (S), sk (S) + GSI STATUS_INDEX (gsi1pk, gsi1sk), projection ALL
+- IAM (étapes): ddb:GetItem, ddb:PutItem, ddb:UpdateItem, ddb:Query
+- API Gateway: GET /requests?status=...&olderThanMinutes=... (liste), GET /requests/{requestId} → ce handler
+
+Env vars:
+- REQUESTS_TABLE: nom de la table (vide: les étapes n'enregistrent rien)
+- STATUS_INDEX: nom du GSI par statut (par défaut gsi1)
+
+Entrée (event):
+{"action": "transition", "requestId": "REQ-...", "status": "SIGNED", "stage": "signature", "data": {...}}
+{"action": "get", "requestId": "REQ-..."}
+{"action": "list", "status": "CONTRACT_GENERATED", "olderThanMinutes": 1440, "limit": 25, "cursor": "<opaque>"}
+ou un événement API Gateway (GET)
+
+Sortie:
+{"ok": true, "requestId": "REQ-...", "status": "SIGNED", "version": 5, "duplicate": false}
+{"ok": true, "state": {...}, "events": [...]}
+{"ok": true, "items": [...], "nextCursor": "<opaque>" | null}
+"""
+
+import runtime
+
+import base64
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import AnalyticsSink
+import metrics
+import tracing
+
+logger = logging.getLogger()
+
+# Constantes
+TABLE_NAME = os.environ.get("REQUESTS_TABLE", "")
+INDEX_NAME = os.environ.get("STATUS_INDEX", "gsi1")
+
+STATE_SK = "STATE"
+# Attributs de l'état courant gérés par _project: une donnée d'étape du même nom reste
+# dans l'événement (data) mais n'est pas projetée
+_RESERVED = frozenset({"pk", "sk", "requestId", "status", "version", "stage", "createdAt", "updatedAt",
+                       "gsi1pk", "gsi1sk"})
+PAGE_MAX = 100
+MAX_ATTEMPTS = 5
+
+# Machine à états: statut courant → statuts atteignables (None: demande inconnue)
+TRANSITIONS: Dict[Optional[str], frozenset] = {
+    None: frozenset({"RECEIVED", "CLASSIFIED", "FAILED"}),
+    "RECEIVED": frozenset({"CLASSIFIED", "FAILED"}),
+    "CLASSIFIED": frozenset({"IN_REVIEW", "CONSENTED", "FAILED"}),
+    "IN_REVIEW": frozenset({"APPROVED", "REJECTED", "ESCALATED"}),
+    "ESCALATED": frozenset({"APPROVED", "REJECTED"}),
+    "APPROVED": frozenset({"CONSENTED", "FAILED"}),
+    "CONSENTED": frozenset({"CONTRACT_GENERATED", "FAILED"}),
+    "CONTRACT_GENERATED": frozenset({"SIGNED", "FAILED"}),
+    "SIGNED": frozenset({"PAYMENT_PENDING", "PAID", "PAYMENT_FAILED"}),
+    "PAYMENT_PENDING": frozenset({"PAID", "PAYMENT_FAILED"}),
+    "PAYMENT_FAILED": frozenset({"PAYMENT_PENDING", "PAID"}),
+    # Ré-exécution de l'exécution Step Functions après échec
+    "FAILED": frozenset({"CLASSIFIED", "CONSENTED", "CONTRACT_GENERATED"}),
+    "REJECTED": frozenset(),
+    "PAID": frozenset(),
+}
+STATUSES = frozenset(s for s in TRANSITIONS if s)
+
+
+class BadRequest(Exception):
+    pass
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def _table():
+    return runtime.table(TABLE_NAME)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _key(request_id: str, sk: str) -> Dict[str, str]:
+    return {"pk": f"REQ#{request_id}", "sk": sk}
+
+
+def _event_sk(version: int) -> str:
+    return f"EVT#{version:08d}"
+
+
+def _ddb_value(value: Any) -> Any:
+    """boto3 refuse les float: Decimal; None et chaînes vides retirés des maps."""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: _ddb_value(v) for k, v in value.items() if v is not None and v != ""}
+    if isinstance(value, (list, tuple)):
+        return [_ddb_value(v) for v in value]
+    return value
+
+
+def _plain(value: Any) -> Any:
+    """Decimal → int/float pour la sortie JSON."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+# ========= Écriture =========
+
+def _get_state(request_id: str) -> Dict[str, Any]:
+    return _table().get_item(Key=_key(request_id, STATE_SK), ConsistentRead=True).get("Item") or {}
+
+
+def _project(request_id: str, event: Dict[str, Any]) -> None:
+    """Applique un événement à l'état courant (si l'état est bien à la version précédente)."""
+    version = int(event["version"])
+    values: Dict[str, Any] = {
+        ":rid": request_id, ":s": event["status"], ":v": version, ":prev": version - 1,
+        ":stage": event["stage"], ":at": event["at"], ":gsk": f"{event['at']}#{request_id}",
+    }
+    names = {"#s": "status", "#v": "version"}
+    sets = ["requestId = :rid", "#s = :s", "#v = :v", "stage = :stage", "updatedAt = :at",
+            "createdAt = if_not_exists(createdAt, :at)", "gsi1pk = :s", "gsi1sk = :gsk"]
+    projected = {k: v for k, v in (event.get("data") or {}).items() if k not in _RESERVED}
+    for i, (k, v) in enumerate(sorted(projected.items())):
+        names[f"#d{i}"] = k
+        values[f":d{i}"] = v
+        sets.append(f"#d{i} = :d{i}")
+    try:
+        _table().update_item(
+            Key=_key(request_id, STATE_SK),
+            UpdateExpression="SET " + ", ".join(sets),
+            ConditionExpression="attribute_not_exists(pk) OR #v = :prev",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+    except ClientError as ce:
+        # Déjà projeté par un writer concurrent: les événements font foi
+        if ce.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def _catch_up(request_id: str, version: int) -> None:
+    """Projette les événements postérieurs à `version` (projection interrompue)."""
+    resp = _table().query(
+        KeyConditionExpression=Key("pk").eq(f"REQ#{request_id}") & Key("sk").gt(_event_sk(version)),
+        ConsistentRead=True,
+    )
+    for event in resp.get("Items", []):
+        if str(event.get("sk", "")).startswith("EVT#"):
+            _project(request_id, event)
+
+
+def transition(request_id: str, status: str, stage: str, data: Optional[Dict[str, Any]] = None,
+               trace_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ajoute l'événement `status` (version courante + 1) puis met à jour l'état courant.
+    Lève InvalidTransition si `status` n'est pas atteignable depuis le statut courant.
+    """
+    if not request_id:
+        raise BadRequest("MISSING_REQUEST_ID")
+    status = (status or "").upper()
+    if status not in STATUSES:
+        raise BadRequest(f"INVALID_STATUS: {status}")
+    data = _ddb_value(data or {})
+
+    caught_up = False
+    for _ in range(MAX_ATTEMPTS):
+        state = _get_state(request_id)
+        current = state.get("status")
+        version = int(state.get("version", 0))
+        if current == status:
+            return {"ok": True, "requestId": request_id, "status": status, "version": version, "duplicate": True}
+        if status not in TRANSITIONS.get(current, frozenset()):
+            if caught_up:
+                raise InvalidTransition(f"{current or 'NEW'} -> {status}")
+            # L'état courant est peut-être en retard sur le journal: rattraper puis revalider
+            _catch_up(request_id, version)
+            caught_up = True
+            continue
+
+        event = {
+            **_key(request_id, _event_sk(version + 1)),
+            "requestId": request_id,
+            "version": version + 1,
+            "status": status,
+            "from": current or "NEW",
+            "stage": stage,
+            "at": _now_iso(),
+            "data": data,
+            "traceId": trace_id or (tracing.current() or {}).get("traceId"),
+        }
+        try:
+            _table().put_item(Item={k: v for k, v in event.items() if v not in (None, {})},
+                              ConditionExpression="attribute_not_exists(pk)")
+        except ClientError as ce:
+            if ce.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # Version prise par un writer concurrent (ou projection en retard): relire
+            _catch_up(request_id, version)
+            caught_up = True
+            continue
+        _project(request_id, event)
+        return {"ok": True, "requestId": request_id, "status": status, "version": version + 1, "duplicate": False}
+    raise InvalidTransition(f"CONCURRENT_UPDATES ({MAX_ATTEMPTS} tentatives)")
+
+
+def record(request_id: Optional[str], status: str, stage: str, **data: Any) -> Optional[Dict[str, Any]]:
+    """
+    Enregistrement depuis une étape du pipeline: jamais bloquant. Sans table configurée
+    ou sans requestId, ne fait rien; une transition refusée est journalisée.
+    L'issue de l'étape est aussi ajoutée au puits analytique (AnalyticsSink), s'il est configuré.
+    """
+    AnalyticsSink.record(stage, request_id, status=status, **data)
+    if not TABLE_NAME or not request_id:
+        return None
+    with metrics.span("request_state") as sp:
+        sp.prop(status=status)
+        try:
+            return transition(request_id, status, stage, data)
+        except (InvalidTransition, BadRequest) as e:
+            sp.prop(error=type(e).__name__)
+            logger.warning(f"RequestState {request_id}: transition refusée ({e})")
+        except ClientError as ce:
+            sp.prop(error=ce.response["Error"]["Code"])
+            logger.warning(f"RequestState {request_id}: {ce.response['Error']['Message']}")
+    return None
+
+
+# ========= Lecture =========
+
+def _state_view(item: Dict[str, Any]) -> Dict[str, Any]:
+    return _plain({k: v for k, v in item.items() if k not in ("pk", "sk", "gsi1pk", "gsi1sk")})
+
+
+def get(request_id: str) -> Dict[str, Any]:
+    """État courant + historique des transitions."""
+    if not request_id:
+        raise BadRequest("MISSING_REQUEST_ID")
+    items: List[Dict[str, Any]] = []
+    kwargs: Dict[str, Any] = {"KeyConditionExpression": Key("pk").eq(f"REQ#{request_id}")}
+    while True:
+        resp = _table().query(**kwargs)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    state = next((it for it in items if it["sk"] == STATE_SK), None)
+    if state is None:
+        raise BadRequest("NOT_FOUND")
+    events = [_state_view(it) for it in items if it["sk"].startswith("EVT#")]
+    return {"ok": True, "state": _state_view(state), "events": events}
+
+
+def _encode_cursor(key: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError:
+        raise BadRequest("INVALID_CURSOR")
+
+
+def _number_param(value: Any, name: str, kind: type = int) -> Any:
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"INVALID_{name.upper()}")
+
+
+def list_by_status(status: str, older_than_minutes: Optional[float] = None, limit: int = 25,
+                   cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Demandes dans `status`, les plus anciennes d'abord; `older_than_minutes`: entrées dans ce statut avant."""
+    status = (status or "").upper()
+    if status not in STATUSES:
+        raise BadRequest(f"INVALID_STATUS: {status}")
+    condition = Key("gsi1pk").eq(status)
+    if older_than_minutes:
+        minutes = _number_param(older_than_minutes, "olderThanMinutes", float)
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+        except (OverflowError, ValueError):
+            raise BadRequest("INVALID_OLDERTHANMINUTES")
+        condition = condition & Key("gsi1sk").lt(cutoff.strftime("%Y-%m-%dT%H:%M:%S.%fZ"))
+    kwargs: Dict[str, Any] = {
+        "IndexName": INDEX_NAME,
+        "KeyConditionExpression": condition,
+        "Limit": max(1, min(_number_param(limit, "limit"), PAGE_MAX)),
+    }
+    start = _decode_cursor(cursor)
+    if start:
+        kwargs["ExclusiveStartKey"] = start
+    with metrics.span("ddb_query") as sp:
+        resp = _table().query(**kwargs)
+        sp.set(items=resp.get("Count", 0))
+    return {
+        "ok": True,
+        "items": [_state_view(it) for it in resp.get("Items", [])],
+        "nextCursor": _encode_cursor(resp.get("LastEvaluatedKey")),
+    }
+
+
+def _api_response(status: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "statusCode": status,
+        "headers": {"Content-Type": "application/json", "Cache-Control": "no-store"},
+        "body": json.dumps(body, ensure_ascii=False, default=str),
+    }
+
+
+def _handle_api(event: Dict[str, Any]) -> Dict[str, Any]:
+    request_id = (event.get("pathParameters") or {}).get("requestId")
+    if request_id:
+        return _api_response(200, get(request_id))
+    qs = event.get("queryStringParameters") or {}
+    return _api_response(200, list_by_status(qs.get("status") or "IN_REVIEW", qs.get("olderThanMinutes"),
+                                             qs.get("limit") or 25, qs.get("cursor")))
+
+
+@runtime.on_warmup
+def _preload():
+    if TABLE_NAME:
+        _table()
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: transitions (webhooks, Step Functions) et consultation back-office."""
+    api = "requestContext" in event or "httpMethod" in event
+    if not TABLE_NAME:
+        error = {"ok": False, "error": "MISSING_ENV_REQUESTS_TABLE"}
+        return _api_response(500, error) if api else error
+
+    try:
+        if api:
+            return _handle_api(event)
+        action = (event.get("action") or "get").lower()
+        if action == "transition":
+            return transition(event.get("requestId"), event.get("status"), event.get("stage") or "api",
+                              event.get("data"))
+        if action == "get":
+            return get(event.get("requestId"))
+        if action == "list":
+            return list_by_status(event.get("status"), event.get("olderThanMinutes"), event.get("limit") or 25,
+                                  event.get("cursor"))
+        return {"ok": False, "error": f"Action inconnue: {action}"}
+    except InvalidTransition as it:
+        error = {"ok": False, "error": f"INVALID_TRANSITION: {it}"}
+        return _api_response(409, error) if api else error
+    except BadRequest as br:
+        code = 404 if str(br) == "NOT_FOUND" else 400
+        return _api_response(code, {"ok": False, "error": str(br)}) if api else {"ok": False, "error": str(br)}
+    except ClientError as ce:
+        error = {"ok": False, "error": f"AWSError: {ce.response['Error']['Message']}"}
+        return _api_response(502, error) if api else error
@@ -0,0 +1,302 @@
+"""
+AWS Lambda: ShadowEval
+
+Responsabilité:
+- Évaluation en ombre d'un modèle / prompt candidat pour Classify: Classify échantillonne
+  SHADOW_RATE des demandes (hachage stable du requestId) et invoque ce handler en mode
+  asynchrone (InvocationType=Event) depuis un thread, pendant son appel synchrone à
+  Lambda B: aucune latence ajoutée au chemin de la requête, aucun effet sur sa réponse
+- Rejoue le texte préparé de la demande contre le candidat (SHADOW_MODEL_ID, prompt
+  système et réglages d'inférence propres) et enregistre la paire primaire / candidat:
+  catégorie, accord, confiance, latence, erreur (JSON invalide, appel Bedrock KO)
+- Rapport: accord (intervalle de Wilson 95 %), confiances, latences p50/p95/p99 des
+  deux côtés et différence appariée, principaux désaccords; verdict "plus rapide à
+  précision égale" (l'accord avec le modèle en production sert de mesure de précision,
+  faute de vérité terrain); une erreur du candidat compte comme un désaccord et comme
+  sa réponse la plus lente
+
+Modèle DynamoDB (pk/sk):
+- SHADOW_TABLE: pk=SHADOW#<candidat>, sk=<evaluatedAt>#<requestId>
+                → primary {model, category, confidence, latencyMs}, candidate {...},
+                  agree, error, expiresAt (TTL)
+
+Prérequis AWS:
+- IAM: bedrock:InvokeModel (modèle candidat, région SHADOW_REGION), ddb:PutItem, ddb:Query
+- IAM de Classify: lambda:InvokeFunction sur SHADOW_FUNCTION_NAME
+- Concurrence réservée conseillée (le trafic d'ombre ne doit pas consommer celle des étapes)
+
+Env vars:
+- SHADOW_TABLE: table des résultats appariés
+- SHADOW_CANDIDATE: nom du candidat (par défaut SHADOW_MODEL_ID)
+- SHADOW_MODEL_ID: modèle candidat (par défaut celui de Classify)
+- SHADOW_REGION: région Bedrock du candidat (par défaut AWS_REGION)
+- SHADOW_SYSTEM_PROMPT: prompt système candidat (par défaut celui de Classify)
+- SHADOW_TEMPERATURE (0.1), SHADOW_TOP_P (0.9), SHADOW_MAX_TOKENS (CLASSIFY_MAX_TOKENS ou 200)
+- SHADOW_TTL_DAYS: rétention des paires (par défaut 30)
+- Côté Classify: SHADOW_RATE (0 = désactivé), SHADOW_FUNCTION_NAME (par défaut ShadowEval)
+
+Entrée (event):
+{"requestId": "REQ-...", "text": "<texte préparé>",
+ "primary": {"model": "...", "category": "RESILIATION", "confidence": 0.92, "latencyMs": 812.4}}
+
+Sortie:
+{"ok": true, "agree": true, "candidate": {"model": "...", "category": "RESILIATION", "confidence": 0.9,
+ "latencyMs": 431.0}}
+
+CLI:
+  python ShadowEval.py report --candidate mistral-small-v2 [--since 2025-01-01] [--json]
+  python ShadowEval.py report --input paires.jsonl
+"""
+
+import runtime
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from boto3.dynamodb.conditions import Key
+
+import metrics
+import prompts
+import tracing
+
+logger = logging.getLogger()
+
+# Constantes
+TABLE_NAME = os.environ.get("SHADOW_TABLE", "")
+MODEL_ID = os.environ.get("SHADOW_MODEL_ID") or prompts.MODEL_ID
+CANDIDATE = os.environ.get("SHADOW_CANDIDATE") or MODEL_ID
+REGION = os.environ.get("SHADOW_REGION") or os.environ.get("AWS_REGION")
+SYSTEM_PROMPT = os.environ.get("SHADOW_SYSTEM_PROMPT") or prompts.SYSTEM_PROMPT
+TEMPERATURE = float(os.environ.get("SHADOW_TEMPERATURE", "0.1"))
+TOP_P = float(os.environ.get("SHADOW_TOP_P", "0.9"))
+MAX_TOKENS = int(os.environ.get("SHADOW_MAX_TOKENS") or os.environ.get("CLASSIFY_MAX_TOKENS", "200"))
+TTL_DAYS = int(os.environ.get("SHADOW_TTL_DAYS", "30"))
+
+# Verdict: le candidat est "à précision égale" si la borne basse de l'accord dépasse ce seuil
+MIN_AGREEMENT = 0.95
+
+
+def _table():
+    return runtime.table(TABLE_NAME)
+
+
+def _bedrock():
+    return runtime.client("bedrock-runtime", region=REGION)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _run_candidate(text: str) -> Dict[str, Any]:
+    body = {
+        "modelId": MODEL_ID,
+        "messages": [{"role": "user", "content": [{"text": prompts.PROMPT_WRAPPER.format(text=text)}]}],
+        "inferenceConfig": {"temperature": TEMPERATURE, "maxTokens": MAX_TOKENS, "topP": TOP_P},
+        "system": [{"text": SYSTEM_PROMPT}],
+    }
+    out: Dict[str, Any] = {"model": MODEL_ID}
+    with metrics.span("bedrock") as sp:
+        sp.prop(candidate=CANDIDATE)
+        t0 = time.perf_counter()
+        try:
+            response = _bedrock().converse(**body)
+        except Exception as e:
+            sp.prop(error=type(e).__name__)
+            out.update(latencyMs=round((time.perf_counter() - t0) * 1000, 1), error="BEDROCK_ERROR")
+            return out
+        out["latencyMs"] = round((time.perf_counter() - t0) * 1000, 1)
+        metrics.record_usage(sp, response)
+    content = response.get("output", {}).get("message", {}).get("content", [])
+    text_out = content[0].get("text", "").strip() if content and isinstance(content, list) else ""
+    try:
+        parsed = json.loads(text_out)
+        out.update(category=parsed.get("category"), confidence=float(parsed.get("confidence")))
+    except (ValueError, TypeError, AttributeError):
+        out["error"] = "INVALID_JSON"
+    return out
+
+
+def _to_ddb(value: Any) -> Any:
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: _to_ddb(v) for k, v in value.items() if v is not None}
+    return value
+
+
+@runtime.on_warmup
+def _preload():
+    _bedrock()
+    if TABLE_NAME:
+        _table()
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: rejoue une demande échantillonnée contre le candidat."""
+    text = event.get("text") or ""
+    primary = event.get("primary") or {}
+    if not text or not primary.get("category"):
+        return {"ok": False, "error": "text et primary.category requis"}
+
+    candidate = _run_candidate(text)
+    agree = candidate.get("category") == primary.get("category")
+    with metrics.span("shadow_pair") as sp:
+        sp.set(agree=int(agree), latencyDelta=round(candidate["latencyMs"] - float(primary.get("latencyMs") or 0), 1))
+        sp.prop(candidate=CANDIDATE)
+        if candidate.get("error"):
+            sp.prop(error=candidate["error"])
+        if TABLE_NAME:
+            now = _now_iso()
+            item = {
+                "pk": f"SHADOW#{CANDIDATE}", "sk": f"{now}#{event.get('requestId', '')}",
+                "requestId": event.get("requestId"), "evaluatedAt": now, "agree": agree,
+                "primary": _to_ddb(primary), "candidate": _to_ddb(candidate),
+                "expiresAt": int(time.time()) + TTL_DAYS * 86400,
+            }
+            _table().put_item(Item={k: v for k, v in item.items() if v is not None})
+    return {"ok": True, "agree": agree, "candidate": candidate}
+
+
+# ========= Rapport =========
+
+def read_pairs(candidate: str, since: Optional[str] = None, limit: int = 100000) -> List[Dict[str, Any]]:
+    cond = Key("pk").eq(f"SHADOW#{candidate}")
+    if since:
+        cond = cond & Key("sk").gte(since)
+    kwargs: Dict[str, Any] = {"KeyConditionExpression": cond}
+    items: List[Dict[str, Any]] = []
+    while len(items) < limit:
+        resp = _table().query(**kwargs)
+        items.extend(resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            break
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+    return items[:limit]
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    """Quantile au rang; None sans valeur ou s'il tombe sur une erreur du candidat (infini)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    value = ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+    return None if math.isinf(value) else round(value, 1)
+
+
+def _wilson(successes: int, n: int, z: float = 1.96) -> List[float]:
+    if not n:
+        return [0.0, 0.0]
+    p = successes / n
+    centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return [round(centre - half, 4), round(centre + half, 4)]
+
+
+def _error(pair: Dict[str, Any]) -> Optional[str]:
+    return (pair.get("candidate") or {}).get("error")
+
+
+def _latency(pair: Dict[str, Any], name: str) -> Optional[float]:
+    # Un échec du candidat, même rapide, compte comme sa réponse la plus lente
+    if name == "candidate" and _error(pair):
+        return math.inf
+    value = (pair.get(name) or {}).get("latencyMs")
+    return float(value) if value is not None else None
+
+
+def report(pairs: Iterable[Dict[str, Any]], min_agreement: float = MIN_AGREEMENT) -> Dict[str, Any]:
+    """
+    Accord, latences et verdict calculés sur toutes les paires: une erreur du candidat
+    (JSON invalide, appel Bedrock KO) compte comme un désaccord et comme sa réponse la
+    plus lente, un échec rapide ne le rend donc ni plus précis ni plus rapide.
+    """
+    pairs = list(pairs)
+    agree = sum(1 for p in pairs if p.get("agree") and not _error(p))
+
+    def side(name: str) -> Dict[str, Any]:
+        lat = [v for v in (_latency(p, name) for p in pairs) if v is not None]
+        conf = [float(p[name]["confidence"]) for p in pairs if (p.get(name) or {}).get("confidence") is not None]
+        return {"latencyMs": {"p50": _pct(lat, 0.5), "p95": _pct(lat, 0.95), "p99": _pct(lat, 0.99)},
+                "confidenceMean": round(sum(conf) / len(conf), 4) if conf else None}
+
+    latencies = [(_latency(p, "candidate"), _latency(p, "primary")) for p in pairs]
+    deltas = [c - p for c, p in latencies if c is not None and p is not None]
+    disagreements = Counter(f"{p['primary'].get('category')} -> {_error(p) or p['candidate'].get('category')}"
+                            for p in pairs if _error(p) or not p.get("agree"))
+    interval = _wilson(agree, len(pairs))
+    primary, candidate = side("primary"), side("candidate")
+    median_delta = _pct(deltas, 0.5)
+    faster = median_delta is not None and median_delta < 0 \
+        and candidate["latencyMs"]["p95"] is not None and primary["latencyMs"]["p95"] is not None \
+        and candidate["latencyMs"]["p95"] <= primary["latencyMs"]["p95"]
+    equal_accuracy = bool(pairs) and interval[0] >= min_agreement
+    return {
+        "pairs": len(pairs),
+        "candidateErrors": dict(Counter(_error(p) for p in pairs if _error(p))),
+        "agreement": round(agree / len(pairs), 4) if pairs else None,
+        "agreementCI95": interval,
+        "primary": primary,
+        "candidate": candidate,
+        "pairedLatencyDeltaMs": {"p50": median_delta, "p95": _pct(deltas, 0.95)},
+        "topDisagreements": dict(disagreements.most_common(5)),
+        "verdict": {
+            "faster": faster,
+            "equalAccuracy": equal_accuracy,
+            "fasterAtEqualAccuracy": faster and equal_accuracy,
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Évaluation en ombre d'un candidat Classify")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("report", help="Rapport sur les paires enregistrées")
+    r.add_argument("--candidate", default=CANDIDATE)
+    r.add_argument("--since", help="date ISO (préfixe de sk)")
+    r.add_argument("--input", help="paires JSONL (export) au lieu de SHADOW_TABLE")
+    r.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT)
+    r.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            pairs = [json.loads(line) for line in f if line.strip()]
+    else:
+        if not TABLE_NAME:
+            print("SHADOW_TABLE non défini (ou --input)", file=sys.stderr)
+            return 2
+        pairs = read_pairs(args.candidate, args.since)
+    out = report(pairs, args.min_agreement)
+    if args.json:
+        print(json.dumps(out, indent=2, default=str))
+        return 0
+    print(f"Candidat: {args.candidate}  paires: {out['pairs']}  erreurs candidat: {out['candidateErrors']}")
+    print(f"Accord: {out['agreement']}  IC 95 %: {out['agreementCI95']}")
+    for name in ("primary", "candidate"):
+        s = out[name]
+        print(f"  {name:9s} latence p50/p95/p99 = {s['latencyMs']['p50']}/{s['latencyMs']['p95']}/"
+              f"{s['latencyMs']['p99']} ms  confiance moyenne = {s['confidenceMean']}")
+    print(f"Écart apparié (candidat - primaire): {out['pairedLatencyDeltaMs']} ms")
+    if out["topDisagreements"]:
+        print(f"Désaccords: {out['topDisagreements']}")
+    print(f"Verdict: {out['verdict']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,16 +4,21 @@ AWS Lambda: ValidateConsent
 Responsabilité:
 - Valider le consentement explicite du client (RGPD)
 - Persister la preuve de consentement dans DynamoDB
+- Inscrire la preuve dans le registre Merkle périodique (ConsentLedger), après
+  l'enregistrement du consentement et sans le faire échouer ("ledger": null si
+  l'inscription a échoué, journalisé)
 - Retourner un résultat utilisable par Step Functions / API Gateway
 
 Prérequis AWS:
 - Table DynamoDB (CONSENTS_TABLE) avec clés partition/sortie: pk (S), sk (S)
-- IAM: ddb:PutItem, ddb:GetItem
+- IAM: ddb:PutItem, ddb:GetItem, ddb:UpdateItem (compteur du registre)
 - Optionnel: CloudWatch Logs pour observabilité
 
 Env vars:
 - CONSENTS_TABLE: nom de la table DynamoDB
 - RETENTION_YEARS: nombre d'années de rétention (par défaut 2)
+- LEDGER_TABLE / LEDGER_PERIOD: voir ConsentLedger.py
+- TTL_ATTRIBUTE: si défini, pose l'attribut TTL natif à la fin de rétention (voir ConsentRetention.py)
 
 Entrée (event):
 {
@@ -34,9 +39,13 @@ Sortie (réussite):
   "ok": true,
   "consentStored": true,
   "hashProof": "sha256:...",
-  "retentionUntil": "2027-12-24"
+  "retentionUntil": "2027-12-24",
+  "ledger": {"batchId": "2025-12-24", "leafIndex": 42}
 }
 
+La preuve d'inclusion (chemin Merkle + racine) est disponible après scellement du lot:
+ConsentLedger {"action": "proof", "batchId": ..., "index": leafIndex}
+
 Sortie (échec):
 {
   "ok": false,
@@ -44,21 +53,29 @@ Sortie (échec):
 }
 """
 
+import runtime
+
 import os
 import json
 import hashlib
+import logging
 from datetime import datetime, date
 from typing import Any, Dict, Optional
 
-import boto3
 from botocore.exceptions import ClientError
 
-# Clients AWS
-_dynamodb = boto3.resource("dynamodb")
+import ConsentLedger
+import ConsentRetention
+import RequestState
+import metrics
+import tracing
+
+logger = logging.getLogger()
 
 # Constantes
 DEFAULT_RETENTION_YEARS = int(os.environ.get("RETENTION_YEARS", "2"))
 TABLE_NAME = os.environ.get("CONSENTS_TABLE", "")
+TTL_ATTRIBUTE = os.environ.get("TTL_ATTRIBUTE", "")
 
 # Exceptions applicatives
 class BadRequest(Exception):
@@ -131,10 +148,40 @@ def _validate_payload(event: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def _put_item(table_name: str, item: Dict[str, Any]) -> None:
-    table = _dynamodb.Table(table_name)
-    table.put_item(Item=item)
+    with metrics.span("ddb_put"):
+        runtime.table(table_name).put_item(Item=item)
+
+
+def _ledger_append(hash_proof: str, pk: str, sk: str) -> Optional[Dict[str, Any]]:
+    """Ajout au registre puis rattachement (ledgerBatch/ledgerIndex) au consentement; None en cas d'échec."""
+    with metrics.span("ledger_append") as sp:
+        try:
+            ledger = ConsentLedger.append(runtime.table(ConsentLedger.TABLE_NAME or TABLE_NAME), hash_proof, pk, sk)
+            runtime.table(TABLE_NAME).update_item(
+                Key={"pk": pk, "sk": sk},
+                UpdateExpression="SET ledgerBatch = :b, ledgerIndex = :i",
+                ExpressionAttributeValues={":b": ledger["batchId"], ":i": ledger["leafIndex"]},
+            )
+            return ledger
+        except (ConsentLedger.LedgerError, ClientError) as e:
+            sp.prop(error=type(e).__name__)
+            logger.warning(f"Registre des consentements: {pk}/{sk} non inscrit ({e})")
+    return None
 
 
+@runtime.on_warmup
+def _preload():
+    """Ping de pré-chauffage: ressources DynamoDB des consentements et du registre."""
+    if TABLE_NAME:
+        runtime.table(TABLE_NAME)
+        runtime.table(ConsentLedger.TABLE_NAME or TABLE_NAME)
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+@tracing.traced
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Handler AWS Lambda pour la validation et l'enregistrement du consentement."""
     if not TABLE_NAME:
@@ -153,10 +200,12 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         version = consent["versionText"]
         hash_proof = _hash_proof(client_id, ts_iso, version, req)
 
-        # Enregistrement DynamoDB
+        # Enregistrement DynamoDB (le consentement fait foi, le registre est un complément)
+        pk = f"CLIENT#{client_id}"
+        sk = f"CONSENT#{ts_iso}"
         item = {
-            "pk": f"CLIENT#{client_id}",
-            "sk": f"CONSENT#{ts_iso}",
+            "pk": pk,
+            "sk": sk,
             "requestId": req,
             "accepted": True,
             "versionText": version,
@@ -168,13 +217,22 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "hashProof": hash_proof,
             "retentionUntil": retention_date.isoformat(),
         }
+        if TTL_ATTRIBUTE:
+            item[TTL_ATTRIBUTE] = ConsentRetention.ttl_epoch(retention_date.isoformat())
         _put_item(TABLE_NAME, item)
 
+        # Inscription au registre Merkle (index de feuille dans le lot courant), sans
+        # jamais faire échouer l'enregistrement du consentement
+        ledger = _ledger_append(hash_proof, pk, sk)
+        RequestState.record(req, "CONSENTED", "ValidateConsent", clientId=client_id, consentVersion=version,
+                            hashProof=hash_proof)
+
         return {
             "ok": True,
             "consentStored": True,
             "hashProof": hash_proof,
             "retentionUntil": retention_date.isoformat(),
+            "ledger": ledger,
         }
 
     except BadRequest as br:
@@ -0,0 +1,144 @@
+"""
+AWS Lambda: Warmer
+
+Responsabilité:
+- Garder N conteneurs chauds par Lambda: envoie N pings {"warmup": true} concurrents
+  à chaque cible (RequestResponse), chacun occupant son conteneur `delayMs` pour que
+  Lambda ne les serve pas tous avec le même conteneur
+- Les handlers répondent au ping via `@runtime.handler` (préchargements enregistrés
+  par `@runtime.on_warmup`, sans effet de bord) et indiquent s'il s'agissait d'un cold start
+- Générer la définition EventBridge Scheduler qui déclenche ce Warmer périodiquement
+
+Prérequis AWS:
+- IAM: lambda:InvokeFunction sur les fonctions cibles
+- EventBridge Scheduler: rate(5 minutes) → ce Warmer (voir `python Warmer.py schedule`)
+
+Env vars:
+- WARM_TARGETS: "Classify:3,Verify:2,GenerateContract:2,ValidateConsent:1,payment:1"
+- WARM_DELAY_MS: durée de maintien de chaque ping concurrent (par défaut 150)
+
+Entrée (event):
+{}                                                   # cibles de WARM_TARGETS
+{"targets": {"Classify": 3, "GenerateContract": 2}}  # surcharge ponctuelle
+
+Sortie:
+{"ok": true, "targets": {"Classify": {"invoked": 3, "cold": 1, "errors": 0, "ms": 412.5}}}
+
+CLI (définition du planificateur):
+  python Warmer.py schedule --warmer-arn <arn> --role-arn <arn> [--rate 5] > schedule.json
+  aws scheduler create-schedule --cli-input-json file://schedule.json
+"""
+
+import runtime
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger()
+
+WARM_TARGETS = os.environ.get("WARM_TARGETS", "")
+WARM_DELAY_MS = int(os.environ.get("WARM_DELAY_MS", "150"))
+MAX_PARALLEL = 50
+
+
+def parse_targets(spec: str) -> Dict[str, int]:
+    """"Classify:3,payment" → {"Classify": 3, "payment": 1}."""
+    targets: Dict[str, int] = {}
+    for part in spec.split(","):
+        name, _, count = part.strip().partition(":")
+        if name:
+            targets[name] = max(1, int(count or 1))
+    return targets
+
+
+def _lambda_client():
+    return runtime.client("lambda")
+
+
+def _ping(function: str, delay_ms: int) -> Dict[str, Any]:
+    resp = _lambda_client().invoke(
+        FunctionName=function,
+        InvocationType="RequestResponse",
+        Payload=json.dumps({"warmup": True, "delayMs": delay_ms}).encode("utf-8"),
+    )
+    raw = resp["Payload"].read().decode("utf-8") if "Payload" in resp else ""
+    if "FunctionError" in resp:
+        raise RuntimeError(raw[:200])
+    return json.loads(raw) if raw else {}
+
+
+def warm(targets: Dict[str, int], delay_ms: int = WARM_DELAY_MS) -> Dict[str, Any]:
+    """Pings concurrents: `count` invocations simultanées par cible."""
+    jobs = [(fn, count) for fn, count in targets.items() for _ in range(count)]
+    out: Dict[str, Dict[str, Any]] = {fn: {"invoked": 0, "cold": 0, "errors": 0} for fn in targets}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(len(jobs), MAX_PARALLEL))) as pool:
+        futures = [(fn, pool.submit(_ping, fn, delay_ms if count > 1 else 0)) for fn, count in jobs]
+        for fn, future in futures:
+            out[fn]["invoked"] += 1
+            try:
+                result = future.result()
+                out[fn]["cold"] += 1 if result.get("coldStart") else 0
+            except Exception as e:
+                out[fn]["errors"] += 1
+                logger.warning(f"Ping {fn} en échec: {e}")
+    elapsed = round((time.perf_counter() - t0) * 1000, 2)
+    for stats in out.values():
+        stats["ms"] = elapsed
+    return {"ok": True, "targets": out}
+
+
+def schedule_definition(warmer_arn: str, role_arn: str, rate_minutes: int = 5,
+                        name: str = "uc3-lambda-warmer", targets: Optional[str] = None) -> Dict[str, Any]:
+    """Entrée de `aws scheduler create-schedule` déclenchant le Warmer toutes les `rate_minutes`."""
+    payload = {"targets": parse_targets(targets)} if targets else {}
+    return {
+        "Name": name,
+        "ScheduleExpression": f"rate({rate_minutes} minute{'s' if rate_minutes > 1 else ''})",
+        "FlexibleTimeWindow": {"Mode": "OFF"},
+        "State": "ENABLED",
+        "Description": "Garde les conteneurs des Lambdas UC3 chauds (ping {\"warmup\": true})",
+        "Target": {
+            "Arn": warmer_arn,
+            "RoleArn": role_arn,
+            "Input": json.dumps(payload),
+            "RetryPolicy": {"MaximumRetryAttempts": 0},
+        },
+    }
+
+
+runtime.mark_loaded(__name__)
+
+
+@runtime.handler
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Handler AWS Lambda: pings de pré-chauffage des cibles."""
+    targets = event.get("targets") or parse_targets(WARM_TARGETS)
+    if not targets:
+        return {"ok": False, "error": "MISSING_ENV_WARM_TARGETS"}
+    return warm({k: int(v) for k, v in targets.items()}, int(event.get("delayMs") or WARM_DELAY_MS))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pré-chauffage des Lambdas UC3")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("schedule", help="Définition EventBridge Scheduler (JSON)")
+    s.add_argument("--warmer-arn", required=True)
+    s.add_argument("--role-arn", required=True, help="Rôle autorisé à invoquer le Warmer")
+    s.add_argument("--rate", type=int, default=5, help="Période en minutes (par défaut 5)")
+    s.add_argument("--name", default="uc3-lambda-warmer")
+    s.add_argument("--targets", help="Surcharge de WARM_TARGETS, ex: Classify:3,GenerateContract:2")
+    args = parser.parse_args(argv)
+    print(json.dumps(schedule_definition(args.warmer_arn, args.role_arn, args.rate, args.name, args.targets),
+                     indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+"""
+Chaîne de classification partagée par Classify (Lambda A) et Verify (Lambda B).
+
+Responsabilité:
+- Préparer le prompt (prompt_budget), réutiliser la classification d'un quasi-doublon
+  (neardup), appeler Bedrock (Converse, couverture optionnelle via hedging)
+- Invoquer la Lambda suivante de la chaîne avec le texte + la classification
+- À l'entrée de la chaîne seulement (événement avec requestId): cycle de vie de la
+  demande (RequestState) et échantillonnage de l'évaluation en ombre (ShadowEval)
+
+Un `Pipeline` par Lambda: l'index de quasi-doublons, le hedger et les pools de fond
+vivent sur l'instance (une par conteneur en production, deux dans le simulateur).
+
+Usage (Classify.py / Verify.py):
+
+    pipeline = classifier.Pipeline("Classify", os.environ.get("EXTRACT_FUNCTION_NAME", "exctract_function"))
+
+    @runtime.handler
+    @tracing.traced
+    def lambda_handler(event, context):
+        return pipeline.handle(event, context)
+"""
+
+import runtime
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import RequestState
+import hedging
+import metrics
+import neardup
+import prompt_budget
+import prompts
+import tracing
+
+logger = logging.getLogger()
+
+# Modèle, prompts et marqueur de Lambda B partagés avec ShadowEval (voir prompts.py)
+MODEL_ID = prompts.MODEL_ID
+SYSTEM_PROMPT = prompts.SYSTEM_PROMPT
+PROMPT_WRAPPER = prompts.PROMPT_WRAPPER
+# Ajouté au texte envoyé à Lambda B (qui exécute cette même chaîne en tant que Verify)
+CLASSIFICATION_MARKER = prompts.CLASSIFICATION_MARKER
+
+# Préparation du prompt (voir prompt_budget.py): retrait des réponses citées, signatures
+# et formules toutes faites, puis texte client borné à un budget de tokens (0 = sans limite)
+PROMPT_PREPROCESS = os.environ.get("PROMPT_PREPROCESS", "1").lower() in ("1", "true", "yes")
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1500"))
+# La réponse est un objet JSON à deux clés: un plafond bas borne les générations qui s'emballent
+MAX_OUTPUT_TOKENS = int(os.environ.get("CLASSIFY_MAX_TOKENS", "200"))
+
+# Appels Bedrock couverts (voir hedging.py), sur option: si l'appel primaire (AWS_REGION, MODEL_ID)
+# n'a pas répondu au HEDGE_PERCENTILE de ses latences récentes, la même requête part vers
+# HEDGE_TARGET ("region", "region/modelId" ou "/modelId") et la première réponse JSON valide gagne.
+# Au plus HEDGE_MAX_RATE des requêtes sont couvertes, ce qui borne le surcoût Bedrock.
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "0").lower() in ("1", "true", "yes")
+HEDGE_TARGET = os.environ.get("HEDGE_TARGET", "")
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.95"))
+HEDGE_INITIAL_DELAY_MS = float(os.environ.get("HEDGE_INITIAL_DELAY_MS", "2500"))
+HEDGE_MIN_DELAY_MS = float(os.environ.get("HEDGE_MIN_DELAY_MS", "300"))
+HEDGE_MAX_DELAY_MS = float(os.environ.get("HEDGE_MAX_DELAY_MS", "10000"))
+HEDGE_MAX_RATE = float(os.environ.get("HEDGE_MAX_RATE", "0.1"))
+
+# Évaluation en ombre (voir ShadowEval.py): SHADOW_RATE des requêtes d'entrée (hachage stable
+# du requestId) sont rejouées sur un modèle / prompt candidat par une invocation asynchrone
+# (Event) de SHADOW_FUNCTION_NAME. L'invocation part d'un thread de fond pendant l'appel
+# synchrone de Lambda B: rien n'est ajouté au temps de réponse, la réponse n'est jamais modifiée.
+SHADOW_RATE = float(os.environ.get("SHADOW_RATE", "0"))
+SHADOW_FUNCTION_NAME = os.environ.get("SHADOW_FUNCTION_NAME", "ShadowEval")
+
+# Réutilisation des quasi-doublons (voir neardup.py): une demande qui ne diffère que par le
+# nom, l'adresse, le PDL... reprend une classification antérieure au lieu de rappeler Bedrock.
+# Seule la classification (catégorie, confiance) est conservée et réutilisée: Lambda B est
+# toujours invoquée avec le texte courant, les données extraites d'un autre client ne sont
+# jamais renvoyées.
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "0").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.85"))
+DEDUP_MAX_ENTRIES = int(os.environ.get("DEDUP_MAX_ENTRIES", "20000"))
+# Chaque conteneur écrit son propre instantané sous le préfixe; un conteneur froid fusionne
+# les plus récents (s3:ListBucket requis; expirer les anciennes clés par règle de cycle de vie).
+# Préfixe par défaut: dedup/<nom de la fonction>/ (dedup/<étape>/ hors Lambda)
+DEDUP_SNAPSHOT_BUCKET = os.environ.get("DEDUP_SNAPSHOT_BUCKET", "")
+DEDUP_SNAPSHOT_PREFIX = os.environ.get("DEDUP_SNAPSHOT_PREFIX", "")
+DEDUP_SNAPSHOT_EVERY = int(os.environ.get("DEDUP_SNAPSHOT_EVERY", "50"))
+DEDUP_RESTORE_SNAPSHOTS = int(os.environ.get("DEDUP_RESTORE_SNAPSHOTS", "3"))
+
+
+# Clients (créés au premier usage, une fois par conteneur, voir runtime.py)
+def _bedrock(region=None):
+    return runtime.client("bedrock-runtime", region=region or os.getenv("AWS_REGION"))
+
+
+def _lambda_client():
+    return runtime.client("lambda")
+
+
+def _s3():
+    return runtime.client("s3")
+
+
+def automation_grade(result):
+    """automation_grade de la réponse de Lambda B (un niveau plus bas quand Lambda B est Verify)."""
+    node = result.get("lambdaB_response")
+    while isinstance(node, dict):
+        response = node.get("response")
+        if isinstance(response, dict) and response.get("automation_grade"):
+            return response["automation_grade"]
+        node = node.get("lambdaB_response")
+    return None
+
+
+def shadow_sampled(request_id, rate):
+    if not request_id or rate <= 0:
+        return False
+    h = int.from_bytes(hashlib.sha1(request_id.encode("utf-8")).digest()[:8], "big")
+    return h / 2 ** 64 < rate
+
+
+def converse(target, prompt_text):
+    """Un appel Bedrock Converse; retourne (classification, None) ou (None, réponse d'erreur)."""
+    messages = [
+        {
+            "role": "user",
+            "content": [{"text": PROMPT_WRAPPER.format(text=prompt_text)}]
+        }
+    ]
+
+    body = {
+        "modelId": target.model_id,
+        "messages": messages,
+        "inferenceConfig": {
+            "temperature": 0.1,
+            "maxTokens": MAX_OUTPUT_TOKENS,
+            "topP": 0.9
+        },
+        "system": [{"text": SYSTEM_PROMPT}]
+    }
+
+    with metrics.span("bedrock") as sp:
+        if HEDGE_ENABLED:
+            sp.prop(target=target.name)
+        try:
+            response = _bedrock(target.region).converse(**body)
+        except Exception as e:
+            sp.prop(error=type(e).__name__)
+            return None, {"statusCode": 502, "error": "Bedrock call failed", "details": str(e)}
+        metrics.record_usage(sp, response)
+
+    # Texte de la réponse Bedrock
+    content = response.get("output", {}).get("message", {}).get("content", [])
+    text_out = ""
+    if content and isinstance(content, list) and "text" in content[0]:
+        text_out = content[0]["text"].strip()
+
+    # JSON de la sortie du modèle
+    try:
+        classification = json.loads(text_out)
+    except Exception:
+        return None, {
+            "statusCode": 422,
+            "error": "Model output wasn't valid JSON",
+            "model": target.model_id,
+            "raw": text_out
+        }
+    return classification, None
+
+
+class Pipeline:
+    """Chaîne de classification d'une Lambda; `lambda_b_name` est la fonction suivante de la chaîne."""
+
+    def __init__(self, stage, lambda_b_name, shadow_rate=SHADOW_RATE, shadow_function_name=SHADOW_FUNCTION_NAME):
+        self.stage = stage
+        self.lambda_b_name = lambda_b_name
+        self.shadow_rate = shadow_rate
+        self.shadow_function_name = shadow_function_name
+        prefix = DEDUP_SNAPSHOT_PREFIX or f"dedup/{os.environ.get('AWS_LAMBDA_FUNCTION_NAME') or stage}/"
+        self.dedup_snapshot_key = f"{prefix}{uuid.uuid4().hex}.json.gz"
+        self._dedup_prefix = prefix
+        self._dedup_index = None
+        self._dedup_lock = threading.Lock()
+        self._hedger = None
+        self._hedger_lock = threading.Lock()
+        # Travail de fond (PUT des instantanés, invocations en ombre), créé au premier usage
+        self._dedup_pool = None
+        self._shadow_pool = None
+
+    # ---- Index des quasi-doublons ----
+
+    def dedup(self):
+        """Index créé au premier usage et restauré des instantanés S3 (une fois par conteneur)."""
+        if self._dedup_index is not None:
+            return self._dedup_index
+        with self._dedup_lock:
+            if self._dedup_index is not None:
+                return self._dedup_index
+            index = neardup.NearDuplicateIndex(threshold=DEDUP_THRESHOLD, max_entries=DEDUP_MAX_ENTRIES)
+            if DEDUP_SNAPSHOT_BUCKET:
+                with metrics.span("dedup_restore") as sp:
+                    try:
+                        sp.set(entries=index.restore_latest(_s3(), DEDUP_SNAPSHOT_BUCKET, self._dedup_prefix,
+                                                            DEDUP_RESTORE_SNAPSHOTS))
+                    except Exception as e:
+                        # Index froid plutôt qu'une requête en échec
+                        sp.prop(error=type(e).__name__)
+            self._dedup_index = index
+        return self._dedup_index
+
+    def _dedup_snapshot(self, index):
+        with metrics.span("dedup_snapshot") as sp:
+            try:
+                sp.set(bytes=index.save(_s3(), DEDUP_SNAPSHOT_BUCKET, self.dedup_snapshot_key), entries=len(index))
+            except Exception as e:
+                sp.prop(error=type(e).__name__)
+
+    def _dedup_remember(self, request_id, user_text, sig, classification, model_id):
+        """Indexe la seule classification (jamais la réponse de Lambda B); instantané sur un thread de fond."""
+        index = self.dedup()
+        kept = {k: classification.get(k) for k in ("category", "confidence")}
+        index.insert(request_id, user_text, {"classification": kept, "model": model_id}, sig)
+        if DEDUP_SNAPSHOT_BUCKET and index.inserts_since_snapshot >= DEDUP_SNAPSHOT_EVERY:
+            index.inserts_since_snapshot = 0
+            if self._dedup_pool is None:
+                self._dedup_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup")
+            try:
+                self._dedup_pool.submit(self._dedup_snapshot, index)
+            except RuntimeError:
+                pass
+
+    # ---- Cycle de vie de la demande et évaluation en ombre (invocation d'entrée seulement) ----
+
+    def _record_state(self, request_id, result):
+        """Cycle de vie de la demande (RequestState): CLASSIFIED en cas de succès, FAILED sinon."""
+        if result.get("statusCode") == 200:
+            classification = result.get("classification") or {}
+            RequestState.record(request_id, "CLASSIFIED", self.stage,
+                                category=classification.get("category"),
+                                confidence=classification.get("confidence"),
+                                grade=automation_grade(result), dedup=bool(result.get("dedup")))
+        else:
+            RequestState.record(request_id, "FAILED", self.stage, error=result.get("error"))
+
+    def _shadow_dispatch(self, request_id, prompt_text, classification, model_id, latency_ms):
+        """Confie l'invocation asynchrone de ShadowEval à un thread de fond (ne lève ni n'attend jamais)."""
+        if self._shadow_pool is None:
+            self._shadow_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="shadow")
+        with metrics.span("shadow_dispatch") as sp:
+            payload = tracing.inject({
+                "requestId": request_id,
+                "text": prompt_text,
+                "primary": {"model": model_id, "category": classification.get("category"),
+                            "confidence": classification.get("confidence"), "latencyMs": round(latency_ms, 1)},
+            }, sp.span_id)
+        function_name = self.shadow_function_name
+
+        def send():
+            try:
+                _lambda_client().invoke(FunctionName=function_name, InvocationType="Event",
+                                        Payload=json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            except Exception as e:
+                logger.warning("shadow dispatch failed for %s: %s", request_id, e)
+
+        try:
+            self._shadow_pool.submit(send)
+        except RuntimeError:
+            pass
+
+    def drain(self):
+        """Attend le travail de fond en file (instantanés, invocations en ombre): simulateur / tests."""
+        for pool in (self._dedup_pool, self._shadow_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        self._dedup_pool = self._shadow_pool = None
+
+    # ---- Bedrock ----
+
+    def hedger(self):
+        """Hedger créé une fois par conteneur: fenêtres de latence et compteurs survivent aux invocations."""
+        if self._hedger is None:
+            with self._hedger_lock:
+                if self._hedger is None:
+                    primary = hedging.Target(os.getenv("AWS_REGION"), MODEL_ID)
+                    self._hedger = hedging.Hedger(
+                        [primary, hedging.Target.parse(HEDGE_TARGET, primary.region, MODEL_ID)],
+                        call=converse,
+                        percentile=HEDGE_PERCENTILE, initial_delay_ms=HEDGE_INITIAL_DELAY_MS,
+                        min_delay_ms=HEDGE_MIN_DELAY_MS, max_delay_ms=HEDGE_MAX_DELAY_MS, max_rate=HEDGE_MAX_RATE)
+        return self._hedger
+
+    def classify(self, prompt_text):
+        """Classification Bedrock; retourne (classification, None, modèle) ou (None, réponse d'erreur, modèle)."""
+        if not (HEDGE_ENABLED and HEDGE_TARGET):
+            classification, error = converse(hedging.Target(os.getenv("AWS_REGION"), MODEL_ID), prompt_text)
+            return classification, error, MODEL_ID
+
+        hedger = self.hedger()
+        with metrics.span("bedrock_hedge") as sp:
+            outcome = hedger.run(prompt_text)
+            won = outcome.hedged and outcome.target is not None and outcome.target != hedger.targets[0]
+            sp.set(hedged=int(outcome.hedged), hedgeWon=int(won), deadline=round(outcome.delay_ms, 1))
+            if outcome.target is not None:
+                sp.prop(winner=outcome.target.name)
+        if hedger.requests % 100 == 0:
+            # Compteurs du conteneur; les valeurs par requête sont dans les lignes EMF bedrock_hedge
+            logger.info("hedging: %s", json.dumps(hedger.stats()))
+        if outcome.value is None:
+            return None, outcome.error, MODEL_ID
+        return outcome.value, None, outcome.target.model_id
+
+    def preload(self):
+        """Ping de pré-chauffage: clients, préparation du prompt et index des quasi-doublons (lecture seule)."""
+        _bedrock()
+        _lambda_client()
+        if HEDGE_ENABLED and HEDGE_TARGET:
+            _bedrock(self.hedger().targets[1].region)
+        prompt_budget.prepare("Bonjour,\n\nje souhaite résilier mon contrat.\n\nCordialement,\nA", PROMPT_TOKEN_BUDGET)
+        if DEDUP_ENABLED:
+            self.dedup()
+
+    # ---- Traitement ----
+
+    def handle(self, event, context):
+        # Lecture de l'entrée
+        user_text = (event.get("text") or "").strip()
+        if not user_text:
+            return {"statusCode": 400, "error": "Provide 'text' in the event."}
+
+        # ---- 0) Préparation du prompt ----
+        prompt_text = user_text
+        if PROMPT_PREPROCESS:
+            with metrics.span("preprocess") as sp:
+                prepared = prompt_budget.prepare(user_text, PROMPT_TOKEN_BUDGET, preserve_after=CLASSIFICATION_MARKER)
+                prompt_text = prepared.text
+                sp.set(originalTokens=prepared.original_tokens, promptTokens=prepared.tokens)
+                sp.prop(truncated=prepared.truncated,
+                        **{f"stripped_{k}": v for k, v in prepared.stripped.items() if v})
+
+        # Seule l'invocation d'entrée porte le requestId; Lambda B (Verify) est invoquée sans
+        # et n'écrit donc pas dans le magasin d'état des demandes
+        state_id = event.get("requestId")
+        request_id = state_id or getattr(context, "aws_request_id", None) \
+            or (tracing.current() or {}).get("traceId")
+
+        # ---- 0b) Recherche de quasi-doublon (texte préparé: historique cité et signatures ignorés) ----
+        dedup_sig = reused = None
+        if DEDUP_ENABLED:
+            with metrics.span("dedup_lookup") as sp:
+                dedup_sig = self.dedup().signature(prompt_text)
+                match = self.dedup().lookup(prompt_text, dedup_sig)
+                sp.prop(hit=match is not None)
+                if match is not None:
+                    prior, similarity = match
+                    reused = {"requestId": prior["id"], "similarity": round(similarity, 3)}
+                    sp.prop(reusedFrom=prior["id"], similarity=reused["similarity"])
+            if reused is not None:
+                logger.info("dedup: %s reuses %s (similarity %.3f)", request_id, reused["requestId"],
+                            reused["similarity"])
+                # Pas d'appel Bedrock; Lambda B reçoit toujours le texte de cette demande
+                classification = dict(prior["result"]["classification"])
+                model_id = prior["result"].get("model") or MODEL_ID
+
+        if reused is None:
+            # ---- 1) Appel Bedrock (Converse) ----
+            t0 = time.perf_counter()
+            classification, error, model_id = self.classify(prompt_text)
+            if error is not None:
+                self._record_state(state_id, error)
+                return error
+            if shadow_sampled(state_id, self.shadow_rate) and isinstance(classification, dict):
+                self._shadow_dispatch(state_id, prompt_text, classification, model_id,
+                                      (time.perf_counter() - t0) * 1000)
+
+        # ---- 2) Charge utile de Lambda B ----
+        # Lambda B attend {"text": "..."}: la classification est ajoutée au texte en JSON.
+        # Lambda B reçoit le texte d'origine complet (noms, adresses... sont dans les signatures)
+        combined_text = (
+            user_text
+            + CLASSIFICATION_MARKER
+            + json.dumps(classification, ensure_ascii=False)
+        )
+
+        # ---- 3) Invocation synchrone de Lambda B ----
+        with metrics.span("invoke") as sp:
+            # Le contexte de trace voyage avec la charge utile: les spans de Lambda B s'y rattachent
+            payload = tracing.inject({"text": combined_text}, sp.span_id)
+            payload_bytes = json.dumps(payload).encode("utf-8")
+            sp.set(bytes=len(payload_bytes))
+            try:
+                invoke_resp = _lambda_client().invoke(
+                    FunctionName=self.lambda_b_name,
+                    InvocationType="RequestResponse",
+                    Payload=payload_bytes
+                )
+            except Exception as e:
+                sp.prop(error=type(e).__name__)
+                error = {"statusCode": 502, "error": "Lambda B invocation failed", "details": str(e)}
+                self._record_state(state_id, error)
+                return error
+
+            # ---- 4) Lecture de la réponse de Lambda B ----
+            raw_payload = invoke_resp["Payload"].read().decode("utf-8") if "Payload" in invoke_resp else ""
+            sp.set(responseBytes=len(raw_payload))
+
+        # En cas d'erreur de Lambda B, AWS renseigne FunctionError
+        if "FunctionError" in invoke_resp:
+            # raw_payload est en général un JSON errorMessage/errorType/stackTrace
+            error = {
+                "statusCode": 500,
+                "error": "Lambda B returned an error",
+                "lambdaB_raw": raw_payload,
+                "bedrock_classification": classification
+            }
+            self._record_state(state_id, error)
+            return error
+
+        # Sortie de Lambda B en JSON si possible, sinon renvoyée telle quelle
+        try:
+            lambda_b_result = json.loads(raw_payload) if raw_payload else None
+        except Exception:
+            lambda_b_result = raw_payload
+
+        # Réponse finale: réponse de Lambda B et classification
+        result = {
+            "statusCode": 200,
+            "model": model_id,
+            "classification": classification,
+            "lambdaB_response": lambda_b_result
+        }
+        if reused is not None:
+            result["dedup"] = {"reusedFrom": reused}
+        elif DEDUP_ENABLED and request_id and isinstance(classification, dict):
+            self._dedup_remember(request_id, prompt_text, dedup_sig, classification, model_id)
+        self._record_state(state_id, result)
+        return result
@@ -0,0 +1,218 @@
+"""
+Profilage du cold start des Lambdas Python.
+
+Responsabilité:
+- `imports`: temps d'import par module (python -X importtime) du handler puis de boto3
+  (importé paresseusement par runtime.py au premier client, mais payé au cold start),
+  agrégé par paquet de premier niveau (botocore, urllib3, modules du projet...)
+- `bench`: N cold starts réels (un processus neuf par exécution) d'un handler, avec ou
+  sans ping {"warmup": true} préalable, et distribution p50/p90/p99 de la première
+  requête. La construction des clients boto3 est réelle (chargement des modèles de
+  service), les appels réseau sont servis par fakes.py.
+
+CLI:
+  python coldstart.py imports Classify [--top 25]
+  python coldstart.py bench GenerateContract --runs 30
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Événement représentatif de la première requête de chaque handler
+SAMPLE_EVENTS: Dict[str, Dict[str, Any]] = {
+    "Classify": {"requestId": "REQ-COLD", "text": "Bonjour, je souhaite résilier mon contrat d'électricité."},
+    "Verify": {"requestId": "REQ-COLD", "text": "Je souhaite résilier mon contrat.\n\n---CLASSIFICATION---\n"
+                                                 "{\"category\": \"RESILIATION\", \"confidence\": 0.9}"},
+    "ValidateConsent": {"requestId": "REQ-COLD", "clientId": "C1",
+                        "consent": {"accepted": True, "versionText": "v1.3", "timestamp": "2025-12-24T13:59:42Z"}},
+    "GenerateContract": {"contratId": "CTR-COLD", "client": {"nom": "Dupont", "prenom": "Jean",
+                                                             "email": "jean@example.org"},
+                         "offre": {"nomOffre": "Offre Verte", "prixUnitaire": 0.2146}},
+    "payment": {"contractId": "CTR-COLD", "client": {"id": "C1"}, "amount": 49.9, "provider": "MOCK"},
+    "HumanReview": {"action": "enqueue", "requestId": "REQ-COLD", "category": "RECLAMATION"},
+    "ConsentLedger": {"action": "proof", "batchId": "2025-12-24", "index": 0},
+}
+
+_ENV = {
+    "AWS_DEFAULT_REGION": "eu-west-3",
+    "AWS_ACCESS_KEY_ID": "coldstart",
+    "AWS_SECRET_ACCESS_KEY": "coldstart",
+    "CONSENTS_TABLE": "cs-consents",
+    "CONTRACTS_TABLE": "cs-contracts",
+    "PAYMENTS_TABLE": "cs-payments",
+    "REVIEW_TABLE": "cs-review",
+    "BUCKET_NAME": "cs-bucket",
+    "LOGO_S3_BUCKET": "cs-bucket",
+    "SENDER_EMAIL": "noreply@cs.local",
+    "METRICS_ENABLED": "0",
+}
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+# ========= Imports =========
+
+def import_profile(modules: List[str]) -> List[Dict[str, Any]]:
+    """Lignes -X importtime pour `import <m>` successifs: [{"module", "self_us", "cumulative_us", "depth"}]."""
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE,
+                          env={**os.environ, **_ENV}, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            rows.append({"module": m.group(4), "self_us": int(m.group(1)), "cumulative_us": int(m.group(2)),
+                         "depth": (len(m.group(3)) - 1) // 2})
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    return rows
+
+
+def by_package(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """Agrège le temps propre (self) par paquet de premier niveau."""
+    out: Dict[str, Dict[str, int]] = {}
+    for r in rows:
+        pkg = r["module"].split(".")[0]
+        agg = out.setdefault(pkg, {"self_us": 0, "modules": 0})
+        agg["self_us"] += r["self_us"]
+        agg["modules"] += 1
+    return out
+
+
+# ========= Bench =========
+
+def _child(module: str, warm: bool) -> Dict[str, Any]:
+    """Exécuté dans un processus neuf: import, ping éventuel, première et deuxième requêtes."""
+    os.environ.update({k: v for k, v in _ENV.items() if k not in os.environ})
+    sys.path.insert(0, HERE)
+
+    t0 = time.perf_counter()
+    handler_module = __import__(module)
+    import_ms = (time.perf_counter() - t0) * 1000
+
+    import fakes
+    import runtime
+
+    # Construction réelle des clients boto3 (coût du cold start), appels servis par les fakes
+    backends = {
+        "dynamodb": fakes.FakeDynamoResource(), "s3": fakes.FakeS3(), "ses": fakes.FakeSES(),
+        "sns": fakes.FakeSNS(), "bedrock-runtime": fakes.FakeBedrock(), "lambda": fakes.FakeLambda(),
+    }
+    real_create = runtime._create
+
+    def create(kind, cache, service, region, endpoint_url, overrides):
+        real_create(kind, cache, service, region, endpoint_url, overrides)
+        return backends[service]
+
+    runtime._create = create
+    backends["dynamodb"].indexes["cs-review"] = {"gsi1": ("gsi1pk", "gsi1sk")}
+    backends["dynamodb"].Table("cs-contracts").items[("CONTRACT#CTR-COLD", "META")] = \
+        {"pk": "CONTRACT#CTR-COLD", "sk": "META", "status": "SIGNED"}
+    with open(os.path.join(HERE, os.pardir, "Logo.jpg"), "rb") as f:
+        backends["s3"].objects[("cs-bucket", os.environ.get("LOGO_S3_KEY", "brand/logo.jpg"))] = {"Body": f.read()}
+    backends["lambda"].register(getattr(handler_module, "LAMBDA_B_NAME", "-"),
+                                lambda e, c: {"response": {"automation_grade": "AUTO"}})
+
+    warmup_ms = 0.0
+    if warm:
+        t1 = time.perf_counter()
+        handler_module.lambda_handler({"warmup": True}, None)
+        warmup_ms = (time.perf_counter() - t1) * 1000
+
+    event = SAMPLE_EVENTS.get(module, {})
+    timings = []
+    for _ in range(2):
+        t2 = time.perf_counter()
+        handler_module.lambda_handler(json.loads(json.dumps(event)), None)
+        timings.append((time.perf_counter() - t2) * 1000)
+    return {"importMs": import_ms, "warmupMs": warmup_ms, "firstRequestMs": timings[0],
+            "secondRequestMs": timings[1]}
+
+
+def _quantiles(values: List[float]) -> Dict[str, float]:
+    import metrics
+    h = metrics.Histogram()
+    for v in values:
+        h.add(v)
+    return h.summary()
+
+
+def bench(module: str, runs: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for mode in ("cold", "warm"):
+        samples: List[Dict[str, float]] = []
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "_child", module]
+                                  + (["--warm"] if mode == "warm" else []),
+                                  cwd=HERE, capture_output=True, text=True)
+            if proc.returncode != 0:
+                raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+            samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        out[mode] = {k: _quantiles([s[k] for s in samples]) for k in samples[0]}
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profilage du cold start des Lambdas")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("imports", help="Temps d'import par module / paquet")
+    i.add_argument("module")
+    i.add_argument("--top", type=int, default=25)
+    i.add_argument("--no-boto3", action="store_true", help="Ne pas inclure l'import de boto3")
+    b = sub.add_parser("bench", help="Première requête après cold start, avec et sans pré-chauffage")
+    b.add_argument("module")
+    b.add_argument("--runs", type=int, default=20)
+    b.add_argument("--json", action="store_true")
+    c = sub.add_parser("_child")
+    c.add_argument("module")
+    c.add_argument("--warm", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "_child":
+        print(json.dumps(_child(args.module, args.warm)))
+        return 0
+
+    if args.cmd == "imports":
+        roots = [args.module] if args.no_boto3 else [args.module, "boto3"]
+        rows = import_profile(roots)
+        # Seuls les imports déclenchés par les modules profilés (pas ceux du démarrage de l'interpréteur)
+        first = next(i for i, r in enumerate(rows) if r["depth"] == 0 and r["module"] in roots) if rows else 0
+        start = max((i + 1 for i, r in enumerate(rows[:first]) if r["depth"] == 0), default=0)
+        rows = rows[start:]
+        cumul = {r["module"]: r["cumulative_us"] for r in rows if r["depth"] == 0}
+        total = sum(r["cumulative_us"] for r in rows if r["depth"] == 0)
+        print(" + ".join(f"import {m}: {cumul.get(m, 0) / 1000:.1f} ms" for m in roots)
+              + f"  (total {total / 1000:.1f} ms)")
+        print(f"\n{'Paquet':32} {'modules':>8} {'self ms':>10} {'part':>7}")
+        packages = sorted(by_package(rows).items(), key=lambda kv: -kv[1]["self_us"])
+        for pkg, agg in packages[:args.top]:
+            share = agg["self_us"] / total * 100 if total else 0.0
+            print(f"{pkg:32} {agg['modules']:>8} {agg['self_us'] / 1000:>10.1f} {share:>6.1f}%")
+        print(f"\n{'Module (cumulé)':48} {'self ms':>10} {'cumul ms':>10}")
+        for r in sorted(rows, key=lambda r: -r["cumulative_us"])[:args.top]:
+            print(f"{'  ' * min(r['depth'], 6) + r['module']:48} {r['self_us'] / 1000:>10.1f} "
+                  f"{r['cumulative_us'] / 1000:>10.1f}")
+        return 0
+
+    result = bench(args.module, args.runs)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    print(f"{args.module}: {args.runs} cold starts par mode (ms)")
+    print(f"{'mode':6} {'mesure':16} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for mode, stats in result.items():
+        for name, s in stats.items():
+            print(f"{mode:6} {name:16} {s['p50']:>9} {s['p90']:>9} {s['p99']:>9} {s['max']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""
+Configuration pytest des tests unitaires des Lambdas (python -m pytest Lambda).
+
+Les modules lisent leurs variables d'environnement à l'import: elles sont posées ici,
+avant toute collecte. Les backends AWS sont les faux de fakes.py (aucun appel réseau).
+"""
+
+import os
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-3")
+os.environ.setdefault("REQUESTS_TABLE", "test-requests")
+os.environ.setdefault("LINK_SECRET", "test-link-secret")
+os.environ.setdefault("METRICS_ENABLED", "0")
+os.environ.pop("ANALYTICS_URI", None)
+
+import pytest
+
+import fakes
+import runtime
+
+
+@pytest.fixture
+def aws():
+    """Faux DynamoDB et S3 branchés sur runtime.py le temps d'un test."""
+    backends = fakes.install(dynamodb=fakes.FakeDynamoResource(), s3=fakes.FakeS3())
+    yield backends
+    runtime.reset_overrides()
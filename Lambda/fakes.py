@@ -0,0 +1,834 @@
+"""
+Faux backends AWS/Stripe en mémoire pour l'exécution hors ligne des handlers.
+
+Responsabilité:
+- Reproduire le sous-ensemble d'API boto3 utilisé par les Lambdas: DynamoDB
+  (Table: put/get/update/delete/query/scan, batch_writer, batch_write_item,
+  transact_write_items), S3, SES (puits de courriels: modèles, débit maximal, refus),
+  SNS, Bedrock Runtime (converse),
+  Lambda (invoke vers des handlers Python)
+- Injecter une latence (log-normale, médiane + p99) et un taux d'échec par opération
+- Se brancher sur runtime.py via `install(...)` (runtime.override), sans toucher aux handlers
+
+Utilisé par simulator.py (pipeline bout-en-bout) et les outils de charge.
+"""
+
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import runtime
+from prompt_budget import approx_tokens as _approx_tokens
+
+
+class Latency:
+    """Latence log-normale définie par sa médiane et son p99 (ms), plus un taux d'échec."""
+
+    def __init__(self, median_ms: float = 0.0, p99_ms: Optional[float] = None, fail_rate: float = 0.0):
+        self.median_ms = median_ms
+        self.p99_ms = p99_ms if p99_ms is not None else median_ms * 3
+        self.fail_rate = fail_rate
+        # p99 = median * exp(2.326 * sigma)
+        ratio = self.p99_ms / self.median_ms if self.median_ms > 0 else 1.0
+        self._sigma = math.log(ratio) / 2.326 if ratio > 1 else 0.0
+
+    def sample_ms(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(rng.gauss(0.0, self._sigma))
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """'800' | '800:3000' | '800:3000:0.01' → médiane[:p99[:taux_échec]]."""
+        parts = [p for p in spec.split(":")]
+        median = float(parts[0]) if parts[0] else 0.0
+        p99 = float(parts[1]) if len(parts) > 1 and parts[1] else None
+        fail = float(parts[2]) if len(parts) > 2 and parts[2] else 0.0
+        return cls(median, p99, fail)
+
+
+class Backend:
+    """Base commune: latence injectée, échecs aléatoires, compteur d'appels."""
+
+    service = "backend"
+
+    def __init__(self, latency: Optional[Latency] = None, time_scale: float = 1.0, seed: Optional[int] = None):
+        self.latency = latency or Latency()
+        self.time_scale = time_scale
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+
+    def _op(self, name: str) -> None:
+        with self._rng_lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            delay = self.latency.sample_ms(self._rng)
+            failed = self._rng.random() < self.latency.fail_rate
+        if delay:
+            time.sleep(delay * self.time_scale / 1000.0)
+        if failed:
+            raise ClientError({"Error": {"Code": "ServiceUnavailable", "Message": f"{self.service} injected failure"}},
+                              name)
+
+
+# ========= DynamoDB =========
+
+_DESERIALIZER = TypeDeserializer()
+
+def _conditional_failed(op: str) -> ClientError:
+    return ClientError({"Error": {"Code": "ConditionalCheckFailedException",
+                                  "Message": "The conditional request failed"}}, op)
+
+
+def _split_top(expr: str, sep: str = ",") -> List[str]:
+    parts, depth, cur = [], 0, ""
+    for ch in expr:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == sep and depth == 0:
+            parts.append(cur.strip())
+            cur = ""
+        else:
+            cur += ch
+    if cur.strip():
+        parts.append(cur.strip())
+    return parts
+
+
+class _Expr:
+    """Évaluateur minimal des expressions DynamoDB (Update/Condition) sous forme de chaîne."""
+
+    def __init__(self, names: Optional[Dict[str, str]], values: Optional[Dict[str, Any]]):
+        self.names = names or {}
+        self.values = values or {}
+
+    def name(self, token: str) -> str:
+        token = token.strip()
+        return self.names.get(token, token)
+
+    def value(self, token: str, item: Dict[str, Any]) -> Any:
+        token = token.strip()
+        m = re.match(r"^if_not_exists\((.+)\)$", token)
+        if m:
+            path, default = _split_top(m.group(1))
+            attr = self.name(path)
+            return item[attr] if attr in item else self.value(default, item)
+        m = re.match(r"^list_append\((.+)\)$", token)
+        if m:
+            a, b = _split_top(m.group(1))
+            return list(self.value(a, item) or []) + list(self.value(b, item) or [])
+        if "+" in token or " - " in token:
+            op = "+" if "+" in token else "-"
+            a, b = token.split(op, 1)
+            va, vb = self.value(a, item), self.value(b, item)
+            return va + vb if op == "+" else va - vb
+        if token.startswith(":"):
+            return self.values[token]
+        return item.get(self.name(token))
+
+    def update(self, item: Dict[str, Any], expression: str) -> List[str]:
+        touched = []
+        clauses = re.split(r"\b(SET|ADD|REMOVE|DELETE)\b", expression)
+        action = None
+        for chunk in clauses:
+            chunk = chunk.strip()
+            if chunk in ("SET", "ADD", "REMOVE", "DELETE"):
+                action = chunk
+                continue
+            if not chunk:
+                continue
+            for part in _split_top(chunk):
+                if action == "SET":
+                    path, val = part.split("=", 1)
+                    attr = self.name(path)
+                    item[attr] = self.value(val, item)
+                elif action == "ADD":
+                    path, val = part.split(None, 1)
+                    attr = self.name(path)
+                    inc = self.values[val.strip()]
+                    if isinstance(inc, (set, frozenset)):
+                        item[attr] = set(item.get(attr) or set()) | set(inc)
+                    else:
+                        item[attr] = item.get(attr, 0) + inc
+                elif action == "REMOVE":
+                    attr = self.name(part)
+                    item.pop(attr, None)
+                elif action == "DELETE":
+                    path, val = part.split(None, 1)
+                    attr = self.name(path)
+                    item[attr] = set(item.get(attr) or set()) - set(self.values[val.strip()])
+                touched.append(attr)
+        return touched
+
+    _CMP = {
+        "<>": lambda a, b: a != b, "<=": lambda a, b: a is not None and a <= b,
+        ">=": lambda a, b: a is not None and a >= b, "=": lambda a, b: a == b,
+        "<": lambda a, b: a is not None and a < b, ">": lambda a, b: a is not None and a > b,
+    }
+
+    def condition(self, item: Optional[Dict[str, Any]], expression: str) -> bool:
+        item = item or {}
+        expression = expression.strip()
+        while expression.startswith("(") and expression.endswith(")") and _balanced(expression[1:-1]):
+            expression = expression[1:-1].strip()
+        ors = _split_keyword(expression, "OR")
+        if len(ors) > 1:
+            return any(self.condition(item, e) for e in ors)
+        ands = _split_keyword(expression, "AND")
+        if len(ands) > 1:
+            return all(self.condition(item, e) for e in ands)
+        if expression.upper().startswith("NOT "):
+            return not self.condition(item, expression[4:])
+        m = re.match(r"^attribute_exists\((.+)\)$", expression)
+        if m:
+            return self.name(m.group(1)) in item
+        m = re.match(r"^attribute_not_exists\((.+)\)$", expression)
+        if m:
+            return self.name(m.group(1)) not in item
+        m = re.match(r"^begins_with\((.+)\)$", expression)
+        if m:
+            path, val = _split_top(m.group(1))
+            cur = item.get(self.name(path))
+            return isinstance(cur, str) and cur.startswith(self.value(val, item))
+        m = re.match(r"^(.+?)\s+IN\s+\((.+)\)$", expression)
+        if m:
+            cur = item.get(self.name(m.group(1)))
+            return cur in [self.value(v, item) for v in _split_top(m.group(2))]
+        for op in ("<>", "<=", ">=", "=", "<", ">"):
+            if op in expression:
+                a, b = expression.split(op, 1)
+                return self._CMP[op](self.value(a, item), self.value(b, item))
+        raise ValueError(f"Expression non supportée par le faux DynamoDB: {expression}")
+
+
+def _balanced(expr: str) -> bool:
+    depth = 0
+    for ch in expr:
+        depth += ch == "("
+        depth -= ch == ")"
+        if depth < 0:
+            return False
+    return depth == 0
+
+
+def _split_keyword(expr: str, keyword: str) -> List[str]:
+    parts, depth, start = [], 0, 0
+    i = 0
+    token = f" {keyword} "
+    while i < len(expr):
+        ch = expr[i]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and expr[i:i + len(token)].upper() == token:
+            parts.append(expr[start:i].strip())
+            i += len(token)
+            start = i
+            continue
+        i += 1
+    parts.append(expr[start:].strip())
+    return parts
+
+
+def _eval_condition_object(cond: Any, item: Dict[str, Any]) -> bool:
+    """Évalue un objet boto3.dynamodb.conditions (Key(...).eq(...) & Attr(...).begins_with(...))."""
+    expr = cond.get_expression()
+    op, values = expr["operator"], expr["values"]
+
+    def operand(v):
+        return item.get(v.name) if hasattr(v, "name") and hasattr(v, "eq") else v
+
+    if op == "AND":
+        return all(_eval_condition_object(v, item) for v in values)
+    if op == "OR":
+        return any(_eval_condition_object(v, item) for v in values)
+    if op == "NOT":
+        return not _eval_condition_object(values[0], item)
+    if op == "begins_with":
+        cur = operand(values[0])
+        return isinstance(cur, str) and cur.startswith(values[1])
+    if op == "attribute_exists":
+        return values[0].name in item
+    if op == "attribute_not_exists":
+        return values[0].name not in item
+    if op == "BETWEEN":
+        cur = operand(values[0])
+        return cur is not None and values[1] <= cur <= values[2]
+    if op == "IN":
+        return operand(values[0]) in values[1]
+    a, b = operand(values[0]), values[1]
+    return _Expr._CMP[{"<>": "<>", "=": "=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}[op]](a, b)
+
+
+def _from_ddb(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """Format bas niveau du client ({"S": "x"}) → valeurs Python (comme la ressource)."""
+    return {k: _DESERIALIZER.deserialize(v) for k, v in attrs.items()}
+
+
+def _normalize(value: Any) -> Any:
+    """Conversions DynamoDB: float refusé côté boto3 → on stocke comme Decimal."""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class FakeTable(Backend):
+    """Table DynamoDB en mémoire (clés pk/sk par défaut), thread-safe."""
+
+    service = "dynamodb"
+
+    def __init__(self, name: str, keys: Tuple[str, ...] = ("pk", "sk"), page_size: int = 100,
+                 indexes: Optional[Dict[str, Tuple[str, str]]] = None, **kw):
+        super().__init__(**kw)
+        self.name = name
+        self.table_name = name
+        self.keys = keys
+        self.indexes = dict(indexes or {})
+        self.page_size = page_size
+        self.items: Dict[Tuple, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+
+    def _key(self, key: Dict[str, Any]) -> Tuple:
+        return tuple(key[k] for k in self.keys)
+
+    def put_item(self, Item: Dict[str, Any], ConditionExpression: Optional[str] = None,
+                 ExpressionAttributeNames=None, ExpressionAttributeValues=None, **_):
+        self._op("PutItem")
+        with self._lock:
+            k = self._key(Item)
+            if ConditionExpression and not _Expr(ExpressionAttributeNames, ExpressionAttributeValues) \
+                    .condition(self.items.get(k), ConditionExpression):
+                raise _conditional_failed("PutItem")
+            self.items[k] = _normalize(dict(Item))
+        return {}
+
+    def get_item(self, Key: Dict[str, Any], **_):
+        self._op("GetItem")
+        with self._lock:
+            it = self.items.get(self._key(Key))
+            return {"Item": dict(it)} if it else {}
+
+    def delete_item(self, Key: Dict[str, Any], ConditionExpression: Optional[str] = None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None, **_):
+        self._op("DeleteItem")
+        with self._lock:
+            k = self._key(Key)
+            if ConditionExpression and not _Expr(ExpressionAttributeNames, ExpressionAttributeValues) \
+                    .condition(self.items.get(k), ConditionExpression):
+                raise _conditional_failed("DeleteItem")
+            self.items.pop(k, None)
+        return {}
+
+    def update_item(self, Key: Dict[str, Any], UpdateExpression: str, ConditionExpression: Optional[str] = None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None, ReturnValues: str = "NONE", **_):
+        self._op("UpdateItem")
+        expr = _Expr(ExpressionAttributeNames, _normalize(ExpressionAttributeValues or {}))
+        with self._lock:
+            k = self._key(Key)
+            current = self.items.get(k)
+            if ConditionExpression and not expr.condition(current, ConditionExpression):
+                raise _conditional_failed("UpdateItem")
+            item = dict(current) if current else dict(Key)
+            touched = expr.update(item, UpdateExpression)
+            self.items[k] = item
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": dict(item)}
+            if ReturnValues == "UPDATED_NEW":
+                return {"Attributes": {a: item[a] for a in touched if a in item}}
+            if ReturnValues == "ALL_OLD":
+                return {"Attributes": dict(current or {})}
+            return {}
+
+    def _page(self, rows: List[Dict[str, Any]], kwargs: Dict[str, Any], op: str) -> Dict[str, Any]:
+        start = kwargs.get("ExclusiveStartKey")
+        offset = 0
+        if start:
+            key = self._key(start)
+            offset = next((i + 1 for i, r in enumerate(rows) if self._key(r) == key), len(rows))
+        limit = int(kwargs.get("Limit") or self.page_size)
+        page = rows[offset:offset + limit]
+        scanned = len(page)
+        flt = kwargs.get("FilterExpression")
+        if flt is not None:
+            if isinstance(flt, str):
+                ex = _Expr(kwargs.get("ExpressionAttributeNames"), kwargs.get("ExpressionAttributeValues"))
+                page = [r for r in page if ex.condition(r, flt)]
+            else:
+                page = [r for r in page if _eval_condition_object(flt, r)]
+        out: Dict[str, Any] = {"Items": [dict(r) for r in page], "Count": len(page), "ScannedCount": scanned}
+        if offset + limit < len(rows):
+            out["LastEvaluatedKey"] = {k: rows[offset + limit - 1][k] for k in self.keys}
+        return out
+
+    def query(self, KeyConditionExpression, ScanIndexForward: bool = True, IndexName: Optional[str] = None, **kw):
+        self._op("Query")
+        with self._lock:
+            rows = list(self.items.values())
+        if isinstance(KeyConditionExpression, str):
+            ex = _Expr(kw.get("ExpressionAttributeNames"), kw.get("ExpressionAttributeValues"))
+            rows = [r for r in rows if ex.condition(r, KeyConditionExpression)]
+        else:
+            rows = [r for r in rows if _eval_condition_object(KeyConditionExpression, r)]
+        if IndexName:
+            # Index secondaire: seuls les items portant les attributs de l'index y figurent
+            index_keys = self.indexes.get(IndexName, ())
+            rows = [r for r in rows if all(k in r for k in index_keys)]
+            sort_key = index_keys[-1] if index_keys else self.keys[-1]
+        else:
+            sort_key = self.keys[-1]
+        rows.sort(key=lambda r: r.get(sort_key, ""), reverse=not ScanIndexForward)
+        return self._page(rows, kw, "Query")
+
+    def scan(self, Segment: int = 0, TotalSegments: int = 1, **kw):
+        self._op("Scan")
+        with self._lock:
+            rows = sorted(self.items.values(), key=lambda r: tuple(str(r[k]) for k in self.keys))
+        rows = [r for r in rows if hash(self._key(r)) % TotalSegments == Segment]
+        return self._page(rows, kw, "Scan")
+
+    @contextmanager
+    def batch_writer(self, overwrite_by_pkeys=None):
+        yield self
+
+    def batch_write(self, requests: List[Dict[str, Any]]) -> None:
+        self._op("BatchWriteItem")
+        with self._lock:
+            for r in requests:
+                if "PutRequest" in r:
+                    item = r["PutRequest"]["Item"]
+                    self.items[self._key(item)] = _normalize(dict(item))
+                elif "DeleteRequest" in r:
+                    self.items.pop(self._key(r["DeleteRequest"]["Key"]), None)
+
+
+class _FakeDynamoClient:
+    def __init__(self, resource: "FakeDynamoResource"):
+        self._resource = resource
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict[str, Any]]], **_):
+        for name, requests in RequestItems.items():
+            self._resource.Table(name).batch_write(requests)
+        return {"UnprocessedItems": {}}
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]], **_):
+        """Put/Delete/Update/ConditionCheck en format bas niveau ({"S": ...}), tout ou rien."""
+        ops = []
+        for entry in TransactItems:
+            (kind, op), = entry.items()
+            ops.append((kind, op, self._resource.Table(op["TableName"])))
+        tables = sorted({id(t): t for _, _, t in ops}.values(), key=lambda t: t.name)
+        if tables:
+            tables[0]._op("TransactWriteItems")
+        with ExitStack() as stack:
+            for t in tables:
+                stack.enter_context(t._lock)
+            reasons, failed = [], False
+            for kind, op, table in ops:
+                key = _from_ddb(op["Item"] if kind == "Put" else op["Key"])
+                cond = op.get("ConditionExpression")
+                ok = not cond or _Expr(op.get("ExpressionAttributeNames"),
+                                       _from_ddb(op.get("ExpressionAttributeValues") or {})) \
+                    .condition(table.items.get(table._key(key)), cond)
+                reasons.append({"Code": "None"} if ok else {"Code": "ConditionalCheckFailed",
+                                                            "Message": "The conditional request failed"})
+                failed = failed or not ok
+            if failed:
+                codes = ", ".join(r["Code"] for r in reasons)
+                raise ClientError({"Error": {"Code": "TransactionCanceledException",
+                                             "Message": "Transaction cancelled, please refer cancellation reasons "
+                                                        f"for specific reasons [{codes}]"},
+                                   "CancellationReasons": reasons}, "TransactWriteItems")
+            for kind, op, table in ops:
+                if kind == "Put":
+                    item = _from_ddb(op["Item"])
+                    table.items[table._key(item)] = _normalize(item)
+                elif kind == "Delete":
+                    table.items.pop(table._key(_from_ddb(op["Key"])), None)
+                elif kind == "Update":
+                    key = _from_ddb(op["Key"])
+                    item = dict(table.items.get(table._key(key)) or key)
+                    _Expr(op.get("ExpressionAttributeNames"), _from_ddb(op.get("ExpressionAttributeValues") or {})) \
+                        .update(item, op["UpdateExpression"])
+                    table.items[table._key(key)] = item
+        return {}
+
+
+class FakeDynamoResource:
+    """Équivalent de boto3.resource("dynamodb"): crée les tables à la demande."""
+
+    def __init__(self, **backend_kw):
+        self._backend_kw = backend_kw
+        self.indexes: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self.tables: Dict[str, FakeTable] = {}
+        self._lock = threading.Lock()
+
+        class _Meta:
+            pass
+
+        self.meta = _Meta()
+        self.meta.client = _FakeDynamoClient(self)
+
+    def Table(self, name: str) -> FakeTable:
+        with self._lock:
+            if name not in self.tables:
+                self.tables[name] = FakeTable(name, indexes=self.indexes.get(name), **self._backend_kw)
+            return self.tables[name]
+
+
+# ========= S3 / SES / SNS =========
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
+
+
+class FakeS3(Backend):
+    service = "s3"
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.objects: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._uploads: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket: str, Key: str, Body: Any = b"", **kw):
+        self._op("PutObject")
+        data = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        with self._lock:
+            self.objects[(Bucket, Key)] = {"Body": data, "LastModified": datetime.now(timezone.utc), **kw}
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def get_object(self, Bucket: str, Key: str, **_):
+        self._op("GetObject")
+        with self._lock:
+            obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject")
+        return {"Body": _Body(obj["Body"]), "ContentLength": len(obj["Body"])}
+
+    def head_object(self, Bucket: str, Key: str, **_):
+        self._op("HeadObject")
+        with self._lock:
+            obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(obj["Body"])}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", **_):
+        self._op("ListObjectsV2")
+        with self._lock:
+            keys = sorted(k for (b, k) in self.objects if b == Bucket and k.startswith(Prefix))
+        return {"Contents": [{"Key": k, "Size": len(self.objects[(Bucket, k)]["Body"]),
+                              "LastModified": self.objects[(Bucket, k)]["LastModified"]} for k in keys],
+                "KeyCount": len(keys)}
+
+    def delete_object(self, Bucket: str, Key: str, **_):
+        self._op("DeleteObject")
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: Dict[str, Any], ExpiresIn: int = 3600, **_):
+        # Signature locale, pas d'appel réseau (comme boto3)
+        return (f"https://{Params['Bucket']}.s3.fake.local/{Params['Key']}"
+                f"?X-Amz-Expires={ExpiresIn}&X-Amz-Date={int(time.time())}&X-Amz-Signature={uuid.uuid4().hex}")
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **_):
+        self._op("CreateMultipartUpload")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes, **_):
+        self._op("UploadPart")
+        with self._lock:
+            self._uploads[UploadId]["parts"][PartNumber] = bytes(Body)
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict[str, Any], **_):
+        self._op("CompleteMultipartUpload")
+        with self._lock:
+            up = self._uploads.pop(UploadId)
+            data = b"".join(up["parts"][p["PartNumber"]] for p in MultipartUpload["Parts"])
+            self.objects[(Bucket, Key)] = {"Body": data, "LastModified": datetime.now(timezone.utc)}
+        return {"Location": f"s3://{Bucket}/{Key}"}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **_):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+
+class FakeSES(Backend):
+    """
+    Puits de courriels: messages acceptés conservés dans `outbox` (et écrits un par fichier
+    JSON dans `sink_dir` si fourni), modèles rendus ({{variable}}), débit maximal par
+    seconde (`max_send_rate`, Throttling au-delà) et destinataires refusés (`reject`:
+    suffixes d'adresse → MessageRejected).
+    """
+
+    service = "ses"
+
+    def __init__(self, max_send_rate: float = 0.0, reject: Tuple[str, ...] = (), sink_dir: Optional[str] = None,
+                 **kw):
+        super().__init__(**kw)
+        self.outbox: List[Dict[str, Any]] = []
+        self.templates: Dict[str, Dict[str, str]] = {}
+        self.max_send_rate = max_send_rate
+        self.reject = tuple(reject)
+        self.sink_dir = sink_dir
+        self.throttled = 0
+        self._window = (0, 0)
+        self._lock = threading.Lock()
+
+    def _throttle(self, count: int, op: str) -> None:
+        if not self.max_send_rate:
+            return
+        with self._lock:
+            second = int(time.monotonic())
+            start, sent = self._window
+            sent = sent if start == second else 0
+            if sent + count > self.max_send_rate:
+                self._window = (second, sent)
+                self.throttled += 1
+                raise ClientError({"Error": {"Code": "Throttling", "Message": "Maximum sending rate exceeded."}}, op)
+            self._window = (second, sent + count)
+
+    def _rejected(self, destination: Dict[str, Any]) -> bool:
+        return any(a.lower().endswith(self.reject) for a in destination.get("ToAddresses", [])) if self.reject else False
+
+    def _deliver(self, record: Dict[str, Any]) -> str:
+        record["MessageId"] = msg_id = f"fake-{uuid.uuid4().hex}"
+        with self._lock:
+            self.outbox.append(record)
+        if self.sink_dir:
+            with open(f"{self.sink_dir}/{msg_id}.json", "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+        return msg_id
+
+    def get_send_quota(self, **_):
+        self._op("GetSendQuota")
+        return {"Max24HourSend": 50000.0, "MaxSendRate": float(self.max_send_rate or 14),
+                "SentLast24Hours": float(len(self.outbox))}
+
+    def create_template(self, Template: Dict[str, str], **_):
+        self._op("CreateTemplate")
+        if Template["TemplateName"] in self.templates:
+            raise ClientError({"Error": {"Code": "AlreadyExists", "Message": "Template already exists"}},
+                              "CreateTemplate")
+        self.templates[Template["TemplateName"]] = dict(Template)
+        return {}
+
+    def get_template(self, TemplateName: str, **_):
+        self._op("GetTemplate")
+        if TemplateName not in self.templates:
+            raise ClientError({"Error": {"Code": "TemplateDoesNotExist", "Message": f"Template {TemplateName} "
+                                                                                   "does not exist"}}, "GetTemplate")
+        return {"Template": dict(self.templates[TemplateName])}
+
+    def send_email(self, Source: str, Destination: Dict[str, Any], Message: Dict[str, Any], **_):
+        self._op("SendEmail")
+        self._throttle(1, "SendEmail")
+        if self._rejected(Destination):
+            raise ClientError({"Error": {"Code": "MessageRejected", "Message": "Email address is not verified."}},
+                              "SendEmail")
+        return {"MessageId": self._deliver({"Source": Source, "Destination": Destination, "Message": Message})}
+
+    def send_bulk_templated_email(self, Source: str, Template: str, Destinations: List[Dict[str, Any]],
+                                  DefaultTemplateData: str = "{}", **_):
+        self._op("SendBulkTemplatedEmail")
+        if Template not in self.templates:
+            raise ClientError({"Error": {"Code": "TemplateDoesNotExist", "Message": f"Template {Template} "
+                                                                                   "does not exist"}},
+                              "SendBulkTemplatedEmail")
+        if len(Destinations) > 50:
+            raise ClientError({"Error": {"Code": "InvalidParameterValue", "Message": "Too many destinations"}},
+                              "SendBulkTemplatedEmail")
+        self._throttle(len(Destinations), "SendBulkTemplatedEmail")
+        tpl = self.templates[Template]
+        status = []
+        for d in Destinations:
+            if self._rejected(d.get("Destination") or {}):
+                status.append({"Status": "MessageRejected", "Error": "Email address is not verified."})
+                continue
+            data = {**json.loads(DefaultTemplateData or "{}"), **json.loads(d.get("ReplacementTemplateData") or "{}")}
+
+            def render(part: str) -> str:
+                return re.sub(r"\{\{\s*(\w+)\s*\}\}", lambda m: str(data.get(m.group(1), "")), tpl.get(part, ""))
+
+            msg_id = self._deliver({"Source": Source, "Template": Template, "Destination": d.get("Destination"),
+                                    "TemplateData": data, "Subject": render("SubjectPart"),
+                                    "Text": render("TextPart"), "Html": render("HtmlPart")})
+            status.append({"Status": "Success", "MessageId": msg_id})
+        return {"Status": status}
+
+
+class FakeSNS(Backend):
+    service = "sns"
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.published: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, TopicArn: str, Message: str, Subject: Optional[str] = None, **kw):
+        self._op("Publish")
+        msg_id = uuid.uuid4().hex
+        with self._lock:
+            self.published.append({"MessageId": msg_id, "TopicArn": TopicArn, "Subject": Subject,
+                                   "Message": Message, **kw})
+        return {"MessageId": msg_id}
+
+    def publish_batch(self, TopicArn: str, PublishBatchRequestEntries: List[Dict[str, Any]], **_):
+        self._op("PublishBatch")
+        ok = []
+        with self._lock:
+            for e in PublishBatchRequestEntries:
+                msg_id = uuid.uuid4().hex
+                self.published.append({"MessageId": msg_id, "TopicArn": TopicArn, **e})
+                ok.append({"Id": e["Id"], "MessageId": msg_id})
+        return {"Successful": ok, "Failed": []}
+
+
+# ========= Bedrock / Lambda / Stripe =========
+
+_CATEGORY_KEYWORDS = [
+    ("RESILIATION", ("résili", "resili", "mettre fin", "arrêter mon contrat", "déménag")),
+    ("RECLAMATION", ("réclam", "reclam", "plainte", "erreur de facture", "trop élevé", "conteste")),
+    ("CHANGEMENT_OFFRE", ("changer d'offre", "changement d'offre", "nouvelle offre", "passer à l'offre")),
+    ("INFORMATION_TECHNIQUE", ("compteur", "linky", "panne", "coupure", "puissance")),
+    ("CONTRACTUALISATION", ("souscri", "nouveau contrat", "ouvrir un contrat", "emménag")),
+]
+
+
+class FakeBedrock(Backend):
+    """
+    bedrock-runtime.converse: classification par mots-clés, `usage` et `metrics` renseignés.
+    `ms_per_input_token` ajoute un temps de prefill proportionnel à la taille du prompt.
+    """
+
+    service = "bedrock-runtime"
+
+    def __init__(self, invalid_json_rate: float = 0.0, ms_per_input_token: float = 0.0, **kw):
+        super().__init__(**kw)
+        self.invalid_json_rate = invalid_json_rate
+        self.ms_per_input_token = ms_per_input_token
+
+    def classify(self, text: str) -> Dict[str, Any]:
+        low = text.lower()
+        for category, words in _CATEGORY_KEYWORDS:
+            if any(w in low for w in words):
+                return {"category": category, "confidence": 0.92}
+        return {"category": "INFORMATION_TECHNIQUE", "confidence": 0.41}
+
+    def converse(self, modelId: str, messages: List[Dict[str, Any]], system: Optional[List[Dict[str, Any]]] = None,
+                 inferenceConfig: Optional[Dict[str, Any]] = None, **_):
+        t0 = time.perf_counter()
+        self._op("Converse")
+        text = "".join(c.get("text", "") for m in messages for c in m.get("content", []))
+        prompt = "".join(s.get("text", "") for s in (system or []))
+        with self._rng_lock:
+            broken = self._rng.random() < self.invalid_json_rate
+        out = "Voici la catégorie: RESILIATION" if broken else json.dumps(self.classify(text))
+        input_tokens = _approx_tokens(text + prompt)
+        if self.ms_per_input_token:
+            time.sleep(input_tokens * self.ms_per_input_token * self.time_scale / 1000.0)
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": out}]}},
+            "stopReason": "end_turn",
+            "usage": {"inputTokens": input_tokens, "outputTokens": _approx_tokens(out),
+                      "totalTokens": input_tokens + _approx_tokens(out)},
+            "metrics": {"latencyMs": int((time.perf_counter() - t0) * 1000)},
+        }
+
+
+class FakeLambda(Backend):
+    """lambda.invoke vers des handlers Python enregistrés par nom (RequestResponse / Event)."""
+
+    service = "lambda"
+
+    def __init__(self, functions: Optional[Dict[str, Callable[[Any, Any], Any]]] = None, **kw):
+        super().__init__(**kw)
+        self.functions = dict(functions or {})
+        self._events: List[threading.Thread] = []
+
+    def register(self, name: str, fn: Callable[[Any, Any], Any]) -> None:
+        self.functions[name] = fn
+
+    def drain(self, timeout: float = 30.0) -> None:
+        """Attend la fin des invocations asynchrones (Event) lancées jusqu'ici."""
+        deadline = time.monotonic() + timeout
+        for t in list(self._events):
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._events = [t for t in self._events if t.is_alive()]
+
+    def invoke(self, FunctionName: str, Payload: Any = b"{}", InvocationType: str = "RequestResponse", **_):
+        self._op("Invoke")
+        fn = self.functions.get(FunctionName)
+        if fn is None:
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException",
+                                         "Message": f"Function not found: {FunctionName}"}}, "Invoke")
+        event = json.loads(Payload.decode("utf-8") if isinstance(Payload, (bytes, bytearray)) else Payload)
+        if InvocationType == "Event":
+            t = threading.Thread(target=fn, args=(event, None), daemon=True)
+            t.start()
+            self._events.append(t)
+            return {"StatusCode": 202, "Payload": io.BytesIO(b"")}
+        try:
+            result = fn(event, None)
+            return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(result, default=str).encode("utf-8"))}
+        except Exception as e:
+            err = {"errorMessage": str(e), "errorType": type(e).__name__}
+            return {"StatusCode": 200, "FunctionError": "Unhandled",
+                    "Payload": io.BytesIO(json.dumps(err).encode("utf-8"))}
+
+
+class FakeStripe(Backend):
+    """Remplace payment._stripe_request(path, secret_key, params)."""
+
+    service = "stripe"
+
+    def __call__(self, path: str, secret_key: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._op(path)
+        if path == "/payment_intents":
+            return {"id": f"pi_{uuid.uuid4().hex[:14]}", "status": "succeeded"}
+        if path == "/checkout/sessions":
+            sid = f"cs_{uuid.uuid4().hex[:14]}"
+            return {"id": sid, "url": f"https://checkout.stripe.fake/{sid}"}
+        return {"id": uuid.uuid4().hex}
+
+
+def install(**backends: Any) -> Dict[str, Any]:
+    """
+    Branche des faux backends sur runtime.py. Clés acceptées: dynamodb (FakeDynamoResource),
+    s3, ses, sns, bedrock, lambda_ (FakeLambda). Retourne le dict installé.
+    """
+    mapping = {"dynamodb": "dynamodb", "s3": "s3", "ses": "ses", "sns": "sns",
+               "bedrock": "bedrock-runtime", "lambda_": "lambda"}
+    for key, obj in backends.items():
+        if obj is not None:
+            runtime.override(mapping[key], obj)
+    return backends
@@ -0,0 +1,274 @@
+"""
+Requêtes couvertes (hedged requests) pour les appels Bedrock de Classify.
+
+Responsabilité:
+- Appeler la cible primaire; si elle n'a pas répondu avant l'échéance de couverture,
+  envoyer la même requête à une cible de secours (autre région ou modèle équivalent)
+- Retenir la première réponse valide (JSON parsé); une réponse invalide ou en erreur
+  n'arrête pas l'attente de l'autre. L'appel perdant n'est pas annulable côté boto3:
+  il se termine en arrière-plan et son résultat est ignoré
+- Échéance adaptative: percentile (HEDGE_PERCENTILE) des latences récentes de la
+  cible primaire, borné [min_delay, max_delay]; valeur initiale tant que la fenêtre
+  compte moins de `min_samples` mesures. La latence du perdant est aussi mesurée
+  (sinon la fenêtre ne verrait que les appels rapides), mais seulement s'il termine
+  avant le retour de `run`: après, l'invocation Lambda peut être gelée et la mesure
+  compterait le temps de gel. Un perdant encore en vol au retour est compté comme
+  mesure censurée (borne basse = temps écoulé depuis son envoi, au retour du gagnant)
+- Budget de coût: au plus `max_rate` des requêtes couvertes sur la fenêtre glissante
+- Compteurs par conteneur: requêtes, couvertures, victoires primaire / secours,
+  échecs, couvertures refusées par le budget (`stats()`)
+
+Usage (classifier.py):
+
+    hedger = hedging.Hedger([hedging.Target("eu-west-3", MODEL_ID), hedging.Target("eu-west-1", MODEL_ID)],
+                            call=converse, percentile=0.95)
+    outcome = hedger.run(prompt_text)            # converse(target, prompt_text)
+    outcome.value, outcome.target, outcome.hedged, outcome.error
+
+CLI (simulation hors ligne, latences log-normales):
+  python hedging.py simulate --latency 800:6000 --percentile 0.95 --n 5000
+"""
+
+import argparse
+import concurrent.futures
+import contextvars
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class Target(NamedTuple):
+    region: Optional[str]
+    model_id: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.region or 'default'}/{self.model_id}"
+
+    @classmethod
+    def parse(cls, spec: str, default_region: Optional[str], default_model: str) -> "Target":
+        """`region/modelId`, `region` ou `/modelId` (même région)."""
+        region, _, model = spec.strip().partition("/")
+        return cls(region or default_region, model or default_model)
+
+
+class LatencyTracker:
+    """Fenêtre glissante des dernières latences (ms) d'une cible; percentile à la demande."""
+
+    def __init__(self, window: int = 500):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, ms: float) -> None:
+        with self._lock:
+            self._samples.append(ms)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Outcome(NamedTuple):
+    value: Any                       # résultat valide retenu (None si les deux cibles ont échoué)
+    error: Any                       # dernière erreur (quand value est None)
+    target: Optional[Target]         # cible gagnante
+    hedged: bool                     # une requête de secours a été envoyée
+    delay_ms: float                  # échéance de couverture appliquée
+    elapsed_ms: float
+
+
+class Hedger:
+    """
+    `call(target, *args)` renvoie `(value, error)`: value non None = réponse valide.
+    Les cibles au-delà de la deuxième sont ignorées (une seule couverture par requête).
+    """
+
+    def __init__(self, targets: List[Target], call: Callable[..., Tuple[Any, Any]],
+                 percentile: float = 0.95, initial_delay_ms: float = 2000.0, min_delay_ms: float = 200.0,
+                 max_delay_ms: float = 10000.0, max_rate: float = 0.1, window: int = 500,
+                 min_samples: int = 20, max_workers: int = 8):
+        if not targets:
+            raise ValueError("au moins une cible")
+        self.targets = targets[:2]
+        self.call = call
+        self.percentile = percentile
+        self.initial_delay_ms = initial_delay_ms
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.trackers: Dict[Target, LatencyTracker] = {t: LatencyTracker(window) for t in self.targets}
+        # 1 = requête couverte, sur les `window` dernières requêtes (budget de coût)
+        self._recent: deque = deque(maxlen=window)
+        self._counters = {"requests": 0, "hedged": 0, "primaryWins": 0, "hedgeWins": 0,
+                          "bothFailed": 0, "failed": 0, "budgetSkipped": 0}
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                           thread_name_prefix="hedge")
+
+    def deadline_ms(self) -> float:
+        tracker = self.trackers[self.targets[0]]
+        if len(tracker) < self.min_samples:
+            return self.initial_delay_ms
+        return min(self.max_delay_ms, max(self.min_delay_ms, tracker.percentile(self.percentile)))
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                self._counters[k] += v
+
+    def _may_hedge(self) -> bool:
+        if self.max_rate <= 0:
+            return False
+        with self._lock:
+            return sum(self._recent) < max(1.0, self.max_rate * len(self._recent))
+
+    def _submit(self, target: Target, args: tuple) -> Tuple[concurrent.futures.Future, Callable[[], None]]:
+        """Appel en arrière-plan, et fonction qui enregistre sa latence (une seule fois)."""
+        t0 = time.perf_counter()
+        ctx = contextvars.copy_context()          # trace courante visible des spans du thread
+        measured = threading.Event()              # une seule mesure par appel (réelle ou censurée)
+
+        def sample() -> None:
+            with self._lock:
+                if measured.is_set():
+                    return
+                measured.set()
+            self.trackers[target].add((time.perf_counter() - t0) * 1000)
+
+        def attempt():
+            try:
+                return ctx.run(self.call, target, *args)
+            finally:
+                sample()
+        return self._pool.submit(attempt), sample
+
+    def run(self, *args: Any) -> Outcome:
+        t0 = time.perf_counter()
+        delay = self.deadline_ms()
+        primary = self.targets[0]
+        pending: Dict[concurrent.futures.Future, Target] = {}
+        samplers: List[Callable[[], None]] = []
+
+        def submit(target: Target) -> None:
+            fut, sample = self._submit(target, args)
+            pending[fut] = target
+            samplers.append(sample)
+        submit(primary)
+        hedged = False
+        error = None
+        deadline = None if len(self.targets) < 2 else t0 + delay / 1000
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done, _ = concurrent.futures.wait(list(pending), timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                target = pending.pop(fut)
+                try:
+                    value, error = fut.result()
+                except Exception as e:
+                    value, error = None, e
+                if value is not None:
+                    for sample in samplers:      # perdant encore en vol: mesure censurée
+                        sample()
+                    self._finish(hedged, "primaryWins" if target == primary else "hedgeWins")
+                    return Outcome(value, None, target, hedged, delay, (time.perf_counter() - t0) * 1000)
+            # Échéance dépassée, ou primaire en échec avant l'échéance: couverture
+            if deadline is not None and (not done or not pending):
+                deadline = None
+                if self._may_hedge():
+                    hedged = True
+                    submit(self.targets[1])
+                else:
+                    self._count(budgetSkipped=1)
+        self._finish(hedged, "bothFailed" if hedged else "failed")
+        return Outcome(None, error, None, hedged, delay, (time.perf_counter() - t0) * 1000)
+
+    def _finish(self, hedged: bool, counter: Optional[str]) -> None:
+        with self._lock:
+            self._recent.append(1 if hedged else 0)
+            self._counters["requests"] += 1
+            self._counters["hedged"] += hedged
+            if counter:
+                self._counters[counter] += 1
+
+    @property
+    def requests(self) -> int:
+        return self._counters["requests"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._counters)
+        n = out["requests"] or 1
+        out["hedgeRate"] = round(out["hedged"] / n, 4)
+        out["hedgeWinRate"] = round(out["hedgeWins"] / out["hedged"], 4) if out["hedged"] else 0.0
+        out["deadlineMs"] = round(self.deadline_ms(), 1)
+        out["targets"] = {t.name: {"samples": len(tr), "p50": tr.percentile(0.5), "p99": tr.percentile(0.99)}
+                          for t, tr in self.trackers.items()}
+        return out
+
+
+# ========= Simulation =========
+
+def _lognormal(median: float, p99: float, rng: random.Random) -> float:
+    sigma = math.log(p99 / median) / 2.326 if p99 > median > 0 else 0.0
+    return median * math.exp(sigma * rng.gauss(0, 1))
+
+
+def simulate(median: float, p99: float, n: int, percentile: float, max_rate: float,
+             time_scale: float = 0.01, seed: int = 7) -> Dict[str, Any]:
+    """Latences de bout en bout avec et sans couverture (même loi pour les deux cibles)."""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def call(_target):
+        with rng_lock:
+            ms = _lognormal(median, p99, rng)
+        time.sleep(ms * time_scale / 1000)
+        return {"ms": ms}, None
+
+    def pct(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))], 1)
+
+    baseline = [_lognormal(median, p99, rng) for _ in range(n)]
+    hedger = Hedger([Target("a", "m"), Target("b", "m")], call, percentile=percentile, max_rate=max_rate,
+                    initial_delay_ms=median * 2 * time_scale, min_delay_ms=0, max_delay_ms=p99 * time_scale)
+    hedged = [hedger.run().elapsed_ms / time_scale for _ in range(n)]
+    return {
+        "baseline": {q: pct(baseline, float(q)) for q in ("0.5", "0.95", "0.99")},
+        "hedged": {q: pct(hedged, float(q)) for q in ("0.5", "0.95", "0.99")},
+        "stats": {k: v for k, v in hedger.stats().items() if k != "targets"},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Requêtes Bedrock couvertes (hedging)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("simulate", help="Gain de latence simulé (lois log-normales)")
+    s.add_argument("--latency", default="800:6000", help="median:p99 en ms")
+    s.add_argument("--percentile", type=float, default=0.95)
+    s.add_argument("--max-rate", type=float, default=0.1)
+    s.add_argument("--n", type=int, default=2000)
+    s.add_argument("--time-scale", type=float, default=0.01, help="accélération du temps simulé")
+    args = parser.parse_args(argv)
+    median, _, p99 = args.latency.partition(":")
+    median = float(median)
+    p99 = float(p99 or median * 3)
+    print(json.dumps(simulate(median, p99, args.n, args.percentile, args.max_rate, args.time_scale), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+Générateur de charge du proxy web (JS/server.js) et des handlers Lambda.
+
+Responsabilité:
+- Rejouer un corpus JSONL de demandes (format de simulator.py) en boucle ouverte:
+  arrivées régulières à débit fixe (--arrivals fixed) ou poissoniennes (--arrivals poisson).
+  La latence est mesurée depuis l'instant d'arrivée PRÉVU: une requête retardée par
+  la saturation du client ou du serveur compte son attente (pas d'omission coordonnée)
+- Cibles:
+  - `http`: POST /api/lambda (synchrone, ou ?mode=async + polling du job) ou /api/approve
+    d'un server.js; `--spawn` démarre JS/mock-upstream.js et server.js branché dessus
+  - `handler`: appel direct des handlers en processus, backends servis par fakes.py
+    (Classify seul ou pipeline complet de simulator.py)
+- Upstream bouchonné à latences configurables: log-normale médiane[:p99[:taux_échec]]
+  (`--spawn 800:3000:0.01` pour mock-upstream.js, `--latency bedrock=...` pour les handlers)
+- Sorties: histogramme à 0,1 % de précision (metrics.Histogram; spectre de percentiles,
+  fichier .hgrm lisible par le HdrHistogram plotter), taux d'erreur par type, courbe de
+  saturation par paliers de débit (--ramp) en texte, JSON ou CSV
+
+CLI:
+  python loadgen.py http --spawn 800:3000:0.01 --rps 50 --duration 60
+  python loadgen.py http --url http://localhost:3000 --path /api/lambda --async --rps 20
+  python loadgen.py http --url http://localhost:3000 --path /api/approve --ramp 50:500:50 --csv sat.csv
+  python loadgen.py handler --target classify --latency bedrock=900:4000 --arrivals poisson --rps 10
+  python loadgen.py handler --target pipeline --ramp 5:40:5 --step-duration 20 --slo-ms 8000
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import metrics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+JS_DIR = os.path.join(HERE, os.pardir, "JS")
+
+# Un envoi retourne None en cas de succès, sinon le type d'erreur ("http_502", "timeout"...)
+Sender = Callable[[Dict[str, Any]], Optional[str]]
+
+
+# Histogrammes: metrics.Histogram à 0,1 % de précision relative (celle d'un HdrHistogram
+# à 3 chiffres significatifs), quantiles de queue en plus de p50/p90/p99
+HDR_GROWTH = 1.001
+HDR_QUANTILES = (0.50, 0.90, 0.99, 0.999, 0.9999)
+
+
+def histogram() -> metrics.Histogram:
+    return metrics.Histogram(growth=HDR_GROWTH)
+
+
+# ========= Arrivées =========
+
+def arrivals(rps: float, count: int, model: str, seed: int) -> Iterator[float]:
+    """Décalages (s) depuis t0 des `count` arrivées: régulières ou processus de Poisson."""
+    rng = random.Random(seed)
+    t = 0.0
+    for i in range(count):
+        if model == "poisson":
+            t += rng.expovariate(rps)
+            yield t
+        else:
+            yield i / rps
+
+
+class StepResult:
+    """Mesures d'un palier de débit."""
+
+    def __init__(self, rps: float):
+        self.rps = rps
+        self.hist = histogram()
+        self.errors: Dict[str, int] = {}
+        self.sent = 0
+        self.wall_s = 0.0
+        self.max_lag_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms: float, error: Optional[str], lag_ms: float) -> None:
+        with self._lock:
+            self.sent += 1
+            self.hist.add(latency_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def report(self) -> Dict[str, Any]:
+        failed = sum(self.errors.values())
+        return {
+            "targetRps": self.rps,
+            "achievedRps": round(self.sent / self.wall_s, 2) if self.wall_s else 0.0,
+            "goodputRps": round((self.sent - failed) / self.wall_s, 2) if self.wall_s else 0.0,
+            "requests": self.sent,
+            "errorRate": round(failed / self.sent, 4) if self.sent else 0.0,
+            "errors": dict(self.errors),
+            # Retard max de l'injecteur sur le calendrier d'arrivées (client saturé si élevé)
+            "maxSendLagMs": round(self.max_lag_ms, 1),
+            "latencyMs": self.hist.summary(HDR_QUANTILES),
+        }
+
+
+def run_step(send: Sender, corpus: List[Dict[str, Any]], rps: float, duration_s: float, model: str,
+             max_inflight: int, seed: int, offset: int = 0) -> StepResult:
+    """Un palier en boucle ouverte: les envois suivent le calendrier, pas les réponses."""
+    result = StepResult(rps)
+    count = max(1, int(round(rps * duration_s)))
+
+    def one(req, intended):
+        start = time.perf_counter()
+        try:
+            error = send(req)
+        except Exception as e:  # une exception de l'émetteur est une erreur de requête
+            error = type(e).__name__
+        end = time.perf_counter()
+        result.add((end - intended) * 1000, error, (start - intended) * 1000)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        for i, at in enumerate(arrivals(rps, count, model, seed)):
+            intended = t0 + at
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, corpus[(offset + i) % len(corpus)], intended)
+    result.wall_s = time.perf_counter() - t0
+    return result
+
+
+def parse_ramp(spec: str) -> List[float]:
+    """"5:40:5" → [5, 10, ..., 40]."""
+    start, end, step = (float(x) for x in spec.split(":"))
+    steps, rps = [], start
+    while rps <= end + 1e-9:
+        steps.append(round(rps, 3))
+        rps += step
+    return steps
+
+
+# ========= Cibles =========
+
+class HttpTarget:
+    """POST vers server.js; une connexion keep-alive par thread émetteur."""
+
+    def __init__(self, url: str, path: str, async_mode: bool = False, timeout: float = 95.0,
+                 poll_interval: float = 0.25):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname or "localhost", parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.path = path
+        self.async_mode = async_mode and path == "/api/lambda"
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, bytes]:
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in (0, 1):
+            conn = self._conn()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # Connexion keep-alive fermée côté serveur entre deux requêtes: une reconnexion
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        raise RuntimeError("unreachable")
+
+    def body(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        if self.path == "/api/approve":
+            return {"requestId": req.get("requestId") or f"REQ-{uuid.uuid4().hex[:10].upper()}", "approve": True}
+        # Même forme que HTML/home.html
+        return {"text": json.dumps({"description": req["text"]}, ensure_ascii=False)}
+
+    def __call__(self, req: Dict[str, Any]) -> Optional[str]:
+        path = self.path + ("?mode=async" if self.async_mode else "")
+        try:
+            status, raw = self._request("POST", path, self.body(req))
+            if self.async_mode and status == 202:
+                poll = json.loads(raw)["poll"]
+                deadline = time.monotonic() + self.timeout
+                while status == 202 and time.monotonic() < deadline:
+                    time.sleep(self.poll_interval)
+                    status, raw = self._request("GET", poll)
+                if status == 202:
+                    # Tâche toujours en attente à l'échéance du polling
+                    return "timeout"
+                if status == 200:
+                    status = int(json.loads(raw).get("httpStatus") or 200)
+        except (TimeoutError, http.client.HTTPException, OSError) as e:
+            self._local.conn = None
+            return "timeout" if isinstance(e, TimeoutError) else type(e).__name__
+        return None if 200 <= status < 300 else f"http_{status}"
+
+
+class HandlerTarget:
+    """Appel direct des handlers (Classify seul ou pipeline complet), backends fakes.py."""
+
+    def __init__(self, target: str, latencies: Dict[str, str], time_scale: float, seed: int):
+        import simulator
+        self.sim = simulator.Simulation(latencies, time_scale=time_scale, seed=seed)
+        self.target = target
+        if target == "classify":
+            import Classify
+            self._classify = Classify.lambda_handler
+
+    def __call__(self, req: Dict[str, Any]) -> Optional[str]:
+        if self.target == "classify":
+            res = self._classify({"requestId": req.get("requestId") or f"REQ-{uuid.uuid4().hex[:10].upper()}",
+                                  "text": req["text"]}, None)
+            return None if res.get("statusCode") == 200 else f"status_{res.get('statusCode')}"
+        res = self.sim.run_request(req)
+        return f"{res.get('state')}_failed" if res.get("outcome") == "FAILED" else None
+
+
+# ========= Upstream bouchonné =========
+
+def _wait_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            http.client.HTTPConnection("localhost", port, timeout=1).connect()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"port {port} injoignable après {timeout}s")
+
+
+def spawn_stack(latency: str, mock_port: int, proxy_port: int) -> List[subprocess.Popen]:
+    """Démarre mock-upstream.js puis server.js (LAMBDA_URL → mock); à arrêter par l'appelant."""
+    devnull = subprocess.DEVNULL
+    procs = [subprocess.Popen(["node", os.path.join(JS_DIR, "mock-upstream.js"), "--port", str(mock_port),
+                               "--latency", latency], stdout=devnull)]
+    _wait_port(mock_port)
+    env = dict(os.environ, PORT=str(proxy_port), LAMBDA_URL=f"http://localhost:{mock_port}/processRequest")
+    procs.append(subprocess.Popen(["node", os.path.join(JS_DIR, "server.js")], env=env, stdout=devnull))
+    try:
+        _wait_port(proxy_port)
+    except RuntimeError:
+        for p in procs:
+            p.terminate()
+        raise
+    return procs
+
+
+def mock_stats(mock_port: int) -> Dict[str, Any]:
+    conn = http.client.HTTPConnection("localhost", mock_port, timeout=5)
+    conn.request("GET", "/stats")
+    return json.loads(conn.getresponse().read())
+
+
+# ========= Rapport =========
+
+def knee(steps: List[Dict[str, Any]], slo_ms: float, max_error_rate: float) -> Optional[float]:
+    """Plus haut palier tenu: p99 ≤ SLO, erreurs ≤ seuil et débit obtenu ≥ 95 % de la cible."""
+    best = None
+    for s in steps:
+        if (s["latencyMs"]["p99"] <= slo_ms and s["errorRate"] <= max_error_rate
+                and s["achievedRps"] >= 0.95 * s["targetRps"]):
+            best = s["targetRps"]
+    return best
+
+
+def _print_step(s: Dict[str, Any]) -> None:
+    lat = s["latencyMs"]
+    print(f"cible {s['targetRps']} req/s → obtenu {s['achievedRps']} req/s (utile {s['goodputRps']}), "
+          f"{s['requests']} requêtes, erreurs {s['errorRate'] * 100:.2f} %")
+    for err, n in sorted(s["errors"].items(), key=lambda kv: -kv[1]):
+        print(f"  {err}: {n}")
+    print(f"  latence ms: p50={lat['p50']} p90={lat['p90']} p99={lat['p99']} p99.9={lat['p99.9']} "
+          f"max={lat['max']}  (retard d'envoi max {s['maxSendLagMs']} ms)")
+
+
+def _write_csv(path: str, steps: List[Dict[str, Any]]) -> None:
+    cols = ["targetRps", "achievedRps", "goodputRps", "requests", "errorRate"]
+    quantiles = ["mean", "p50", "p90", "p99", "p99.9", "max"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(cols + [f"{q}Ms" for q in quantiles]) + "\n")
+        for s in steps:
+            f.write(",".join([str(s[c]) for c in cols] + [str(s["latencyMs"][q]) for q in quantiles]) + "\n")
+
+
+def load_corpus(path: Optional[str], generate: int, seed: int) -> List[Dict[str, Any]]:
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    import simulator
+    return simulator.generate_corpus(generate, seed)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Générateur de charge UC3 (proxy web et handlers)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    def common(p):
+        src = p.add_mutually_exclusive_group()
+        src.add_argument("--corpus", help="Fichier JSONL de demandes (champ text)")
+        src.add_argument("--generate", type=int, default=200, help="Générer N demandes synthétiques")
+        load = p.add_mutually_exclusive_group()
+        load.add_argument("--rps", type=float, default=10.0, help="Débit d'arrivée cible (req/s)")
+        load.add_argument("--ramp", help="Paliers de débit début:fin:pas (courbe de saturation)")
+        p.add_argument("--duration", type=float, default=30.0, help="Durée (s) du run à débit fixe")
+        p.add_argument("--step-duration", type=float, default=15.0, help="Durée (s) de chaque palier --ramp")
+        p.add_argument("--arrivals", choices=("fixed", "poisson"), default="fixed")
+        p.add_argument("--max-inflight", type=int, default=256, help="Requêtes simultanées max côté injecteur")
+        p.add_argument("--slo-ms", type=float, default=10000.0, help="p99 visé pour le point de saturation")
+        p.add_argument("--max-error-rate", type=float, default=0.01)
+        p.add_argument("--seed", type=int, default=42)
+        p.add_argument("--json", action="store_true", help="Rapport JSON")
+        p.add_argument("--csv", help="Écrire la courbe de saturation (un palier par ligne)")
+        p.add_argument("--hgrm-out", help="Écrire l'histogramme HDR cumulé (.hgrm)")
+
+    h = sub.add_parser("http", help="Charge HTTP sur server.js")
+    common(h)
+    h.add_argument("--url", default="http://localhost:3000")
+    h.add_argument("--path", choices=("/api/lambda", "/api/approve"), default="/api/lambda")
+    h.add_argument("--async", dest="async_mode", action="store_true",
+                   help="/api/lambda?mode=async puis polling du job jusqu'au résultat")
+    h.add_argument("--timeout", type=float, default=95.0)
+    h.add_argument("--spawn", metavar="LATENCE",
+                   help="Démarrer mock-upstream.js (médiane[:p99[:taux_échec]] ms) et server.js branché dessus")
+    h.add_argument("--mock-port", type=int, default=4000)
+    h.add_argument("--proxy-port", type=int, default=3100)
+
+    d = sub.add_parser("handler", help="Charge en processus sur les handlers (fakes.py)")
+    common(d)
+    d.add_argument("--target", choices=("classify", "pipeline"), default="pipeline")
+    d.add_argument("--latency", action="append", default=[],
+                   help="backend=médiane[:p99[:taux_échec]] (ms), ex: bedrock=800:3000:0.01")
+    d.add_argument("--time-scale", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus, args.generate, args.seed)
+    procs: List[subprocess.Popen] = []
+    if args.cmd == "http":
+        if args.spawn:
+            procs = spawn_stack(args.spawn, args.mock_port, args.proxy_port)
+            args.url = f"http://localhost:{args.proxy_port}"
+        send: Sender = HttpTarget(args.url, args.path, args.async_mode, args.timeout)
+    else:
+        import logging
+        import simulator
+        logging.getLogger().setLevel(logging.WARNING)
+        metrics.set_sink(lambda line: None)
+        latencies = dict(simulator.DEFAULT_LATENCIES)
+        for spec in args.latency:
+            name, _, value = spec.partition("=")
+            if name not in latencies:
+                parser.error(f"backend inconnu: {name} (attendu: {', '.join(latencies)})")
+            latencies[name] = value
+        send = HandlerTarget(args.target, latencies, args.time_scale, args.seed)
+
+    levels = parse_ramp(args.ramp) if args.ramp else [args.rps]
+    duration = args.step_duration if args.ramp else args.duration
+    steps: List[Dict[str, Any]] = []
+    total = histogram()
+    try:
+        offset = 0
+        for i, rps in enumerate(levels):
+            step = run_step(send, corpus, rps, duration, args.arrivals, args.max_inflight, args.seed + i, offset)
+            offset += step.sent
+            total.merge(step.hist)
+            steps.append(step.report())
+            if not args.json:
+                _print_step(steps[-1])
+        upstream = mock_stats(args.mock_port) if procs else None
+    finally:
+        for p in procs:
+            p.terminate()
+
+    report: Dict[str, Any] = {"target": args.path if args.cmd == "http" else args.target,
+                              "arrivals": args.arrivals, "steps": steps, "latencyMs": total.summary(HDR_QUANTILES)}
+    if args.ramp:
+        report["saturationRps"] = knee(steps, args.slo_ms, args.max_error_rate)
+    if upstream is not None:
+        # Appels réellement reçus par l'upstream (coalescence du proxy)
+        report["upstream"] = upstream
+    if args.csv:
+        _write_csv(args.csv, steps)
+    if args.hgrm_out:
+        with open(args.hgrm_out, "w", encoding="utf-8") as f:
+            f.write(total.to_hgrm())
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print("\nHistogramme HDR (ms, tous paliers):")
+    print(total.to_hgrm(), end="")
+    if args.ramp:
+        print(f"\nSaturation: {report['saturationRps'] or 'aucun palier'} req/s tenus "
+              f"(p99 ≤ {args.slo_ms:g} ms, erreurs ≤ {args.max_error_rate * 100:g} %)")
+    if upstream is not None:
+        print(f"Upstream: {upstream['requests']} appels reçus, {upstream['maxInflight']} simultanés au plus, "
+              f"{upstream['sockets']} connexions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
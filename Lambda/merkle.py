@@ -0,0 +1,251 @@
+"""
+Arbre de Merkle pour le registre de preuves de consentement (ConsentLedger).
+
+Responsabilité:
+- Regrouper les preuves `hashProof` (sha256:...) d'une période en un arbre de Merkle
+- Produire le chemin d'inclusion (audit path) d'une feuille
+- Vérifier une preuve, ou un lot de preuves, contre une racine publiée en O(log n)
+
+Construction (proche RFC 6962):
+- feuille = sha256(0x00 || digest du hashProof)
+- noeud   = sha256(0x01 || gauche || droite)
+- un noeud sans frère (niveau impair) est promu tel quel au niveau supérieur
+
+Format d'une preuve (JSON):
+{
+  "hashProof": "sha256:...",
+  "index": 42,
+  "size": 1000,
+  "path": ["<hex>", "<hex>", ...],
+  "root": "<hex>"          # optionnel pour `verify`, sinon passer --root
+}
+
+CLI:
+  python merkle.py verify --root <hex> proof.json [proof2.json ...]
+  python merkle.py verify --root <hex> --batch proofs.jsonl
+  python merkle.py bench --n 1000000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def _digest_of(hash_proof: str) -> bytes:
+    """Retourne le digest brut d'un hashProof ('sha256:<hex>' ou '<hex>')."""
+    hex_part = hash_proof.split(":", 1)[1] if ":" in hash_proof else hash_proof
+    return bytes.fromhex(hex_part)
+
+
+def leaf_hash(hash_proof: str) -> bytes:
+    return hashlib.sha256(LEAF_PREFIX + _digest_of(hash_proof)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def build_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """Construit tous les niveaux de l'arbre (levels[0] = feuilles, levels[-1] = [racine])."""
+    if not leaves:
+        raise ValueError("Impossible de construire un arbre vide")
+    levels = [list(leaves)]
+    current = levels[0]
+    while len(current) > 1:
+        nxt = [node_hash(current[i], current[i + 1]) for i in range(0, len(current) - 1, 2)]
+        if len(current) % 2:
+            nxt.append(current[-1])  # promotion du noeud orphelin
+        levels.append(nxt)
+        current = nxt
+    return levels
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    return build_levels(leaves)[-1][0]
+
+
+def inclusion_path(levels: List[List[bytes]], index: int) -> List[str]:
+    """Chemin d'inclusion (frères en hex, de la feuille vers la racine) pour la feuille `index`."""
+    if not 0 <= index < len(levels[0]):
+        raise IndexError(f"Feuille hors de l'arbre: {index}")
+    path = []
+    idx = index
+    for level in levels[:-1]:
+        sibling = idx ^ 1
+        if sibling < len(level):
+            path.append(level[sibling].hex())
+        idx //= 2
+    return path
+
+
+def _walk(leaf: bytes, index: int, size: int, path: List[str]):
+    """Remonte de la feuille vers la racine; produit ((niveau, index), hash) à chaque étape."""
+    if not 0 <= index < size:
+        raise ValueError(f"index {index} invalide pour size {size}")
+    h, idx, n, level = leaf, index, size, 0
+    siblings = iter(path)
+
+    def sibling() -> bytes:
+        nxt = next(siblings, None)
+        if nxt is None:
+            raise ValueError("Chemin d'inclusion trop court")
+        return bytes.fromhex(nxt)
+
+    yield (level, idx), h
+    while n > 1:
+        if idx % 2 == 1:
+            h = node_hash(sibling(), h)
+        elif idx + 1 < n:
+            h = node_hash(h, sibling())
+        idx //= 2
+        n = (n + 1) // 2
+        level += 1
+        yield (level, idx), h
+    if next(siblings, None) is not None:
+        raise ValueError("Chemin d'inclusion trop long")
+
+
+def verify_inclusion(hash_proof: str, index: int, size: int, path: List[str], root_hex: str) -> bool:
+    """Vérifie qu'un hashProof est inclus à la position `index` d'un arbre de `size` feuilles."""
+    try:
+        h = None
+        for _, h in _walk(leaf_hash(hash_proof), index, size, path):
+            pass
+        return h is not None and h.hex() == root_hex.lower()
+    except ValueError:
+        return False
+
+
+def verify_batch(proofs: Iterable[Dict[str, Any]], root_hex: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Vérifie un lot de preuves d'un même arbre. Les noeuds déjà prouvés sont mémorisés:
+    une preuve s'arrête dès qu'elle rejoint un noeud connu, le coût total est donc
+    borné par l'union des chemins plutôt que par (nb preuves x log n).
+    Retourne (nb_valides, preuves_invalides).
+    """
+    root_hex = root_hex.lower()
+    proven: Dict[Tuple[int, int], bytes] = {}
+    ok = 0
+    failed = []
+    for proof in proofs:
+        walked = []
+        valid = False
+        try:
+            for key, h in _walk(leaf_hash(proof["hashProof"]), int(proof["index"]),
+                                int(proof["size"]), proof.get("path") or []):
+                known = proven.get(key)
+                if known is not None:
+                    valid = known == h
+                    break
+                walked.append((key, h))
+            else:
+                valid = bool(walked) and walked[-1][1].hex() == root_hex
+        except (KeyError, ValueError):
+            valid = False
+        if valid:
+            proven.update(walked)
+            ok += 1
+        else:
+            failed.append(proof)
+    return ok, failed
+
+
+# ========= CLI =========
+
+def _load_proofs(paths: List[str], batch: Optional[str]) -> List[Dict[str, Any]]:
+    proofs = []
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            proofs.append(json.load(f))
+    if batch:
+        with open(batch, "r", encoding="utf-8") as f:
+            proofs.extend(json.loads(line) for line in f if line.strip())
+    return proofs
+
+
+def _cmd_verify(args) -> int:
+    proofs = _load_proofs(args.proof, args.batch)
+    if not proofs:
+        print("Aucune preuve fournie", file=sys.stderr)
+        return 2
+    root = args.root or proofs[0].get("root")
+    if not root:
+        print("Racine manquante (--root ou champ 'root')", file=sys.stderr)
+        return 2
+    t0 = time.perf_counter()
+    ok, failed = verify_batch(proofs, root)
+    elapsed = time.perf_counter() - t0
+    for proof in failed:
+        print(f"INVALIDE: index={proof.get('index')} hashProof={proof.get('hashProof')}")
+    print(f"{ok}/{len(proofs)} preuve(s) valide(s) contre {root} en {elapsed * 1000:.2f} ms")
+    return 0 if not failed else 1
+
+
+def _cmd_bench(args) -> int:
+    n = args.n
+    print(f"Génération de {n} preuves de consentement...")
+    proofs = ["sha256:" + hashlib.sha256(os.urandom(16)).hexdigest() for _ in range(n)]
+
+    t0 = time.perf_counter()
+    leaves = [leaf_hash(p) for p in proofs]
+    levels = build_levels(leaves)
+    root = levels[-1][0].hex()
+    t_build = time.perf_counter() - t0
+    print(f"Construction arbre: {t_build:.2f} s (racine {root[:16]}..., profondeur {len(levels) - 1})")
+
+    t0 = time.perf_counter()
+    rehash = merkle_root([leaf_hash(p) for p in proofs]).hex()
+    t_full = time.perf_counter() - t0
+    assert rehash == root
+    print(f"Audit complet (relecture + rehash de {n} consentements): {t_full:.2f} s")
+
+    idx = n // 3
+    path = inclusion_path(levels, idx)
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        assert verify_inclusion(proofs[idx], idx, n, path, root)
+    t_one = (time.perf_counter() - t0) / args.repeat
+    print(f"Vérification unitaire: {t_one * 1e6:.1f} µs ({len(path)} hash de chemin)")
+
+    k = min(args.batch, n)
+    start = max(0, n // 2 - k // 2)
+    batch = [{"hashProof": proofs[i], "index": i, "size": n, "path": inclusion_path(levels, i)}
+             for i in range(start, start + k)]
+    t0 = time.perf_counter()
+    ok, failed = verify_batch(batch, root)
+    t_batch = time.perf_counter() - t0
+    assert ok == k and not failed
+    print(f"Vérification lot contigu de {k}: {t_batch * 1000:.2f} ms "
+          f"({t_batch / k * 1e6:.1f} µs/preuve)")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Vérificateur de preuves Merkle de consentement")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    v = sub.add_parser("verify", help="Vérifier une ou plusieurs preuves d'inclusion")
+    v.add_argument("proof", nargs="*", help="Fichier(s) JSON de preuve")
+    v.add_argument("--batch", help="Fichier JSONL de preuves (une par ligne)")
+    v.add_argument("--root", help="Racine publiée (hex)")
+    v.set_defaults(func=_cmd_verify)
+
+    b = sub.add_parser("bench", help="Benchmark construction / vérification")
+    b.add_argument("--n", type=int, default=1_000_000)
+    b.add_argument("--batch", type=int, default=10_000)
+    b.add_argument("--repeat", type=int, default=1000)
+    b.set_defaults(func=_cmd_bench)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
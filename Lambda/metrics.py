@@ -0,0 +1,365 @@
+"""
+Instrumentation de latence par étape (CloudWatch Embedded Metric Format).
+
+Responsabilité:
+- API de spans légère: context manager `span(...)` et décorateur `timed(...)`
+- Émettre une ligne EMF par étape: Duration (ms) + valeurs attachées
+  (Bytes, InputTokens, OutputTokens, ...), dimensions Function/Stage
+- Coût quasi nul quand désactivé (METRICS_ENABLED=0): span no-op partagé
+- Collecteur local: agrège des logs EMF en histogrammes par étape
+- Chaque ligne porte traceId/spanId/parentSpanId et startMs (voir tracing.py)
+
+Usage:
+
+    with metrics.span("bedrock") as sp:
+        response = bedrock.converse(**body)
+        metrics.record_usage(sp, response)
+
+    with metrics.span("s3_put", bytes=len(pdf_bytes)):
+        s3.put_object(...)
+
+    @metrics.timed("handler")
+    def lambda_handler(event, context): ...
+
+Env vars:
+- METRICS_ENABLED: 1 | 0 (par défaut 1)
+- METRICS_NAMESPACE: namespace CloudWatch (par défaut EcoIA/UC3)
+- AWS_LAMBDA_FUNCTION_NAME: dimension Function (fournie par Lambda)
+
+CLI (collecteur local):
+  python metrics.py collect logs.txt [...]     # ou sur stdin
+"""
+
+import argparse
+import functools
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import tracing
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "EcoIA/UC3")
+FUNCTION_NAME = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "")
+
+# Unités CloudWatch des valeurs connues (les autres sont émises en Count)
+_UNITS = {
+    "Duration": "Milliseconds",
+    "Bytes": "Bytes",
+    "ResponseBytes": "Bytes",
+    "InputTokens": "Count",
+    "OutputTokens": "Count",
+    "BedrockLatency": "Milliseconds",
+}
+
+
+def _stdout_sink(line: str) -> None:
+    sys.stdout.write(line + "\n")
+
+
+_sink: Callable[[str], None] = _stdout_sink
+
+
+def set_sink(sink: Callable[[str], None]) -> None:
+    """Redirige les lignes EMF (tests, simulateur local)."""
+    global _sink
+    _sink = sink
+
+
+def _metric_name(key: str) -> str:
+    return key[:1].upper() + key[1:]
+
+
+def _current_function() -> Optional[str]:
+    ctx = tracing.current()
+    return ctx.get("function") if ctx else None
+
+
+def emit(stage: str, values: Dict[str, float], function: Optional[str] = None,
+         properties: Optional[Dict[str, Any]] = None) -> None:
+    """Émet une ligne EMF pour une étape."""
+    if not ENABLED:
+        return
+    metrics = {_metric_name(k): v for k, v in values.items() if v is not None}
+    record: Dict[str, Any] = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [["Function", "Stage"]],
+                "Metrics": [{"Name": k, "Unit": _UNITS.get(k, "Count")} for k in metrics],
+            }],
+        },
+        "Function": function or _current_function() or FUNCTION_NAME or "local",
+        "Stage": stage,
+    }
+    if properties:
+        record.update(properties)
+    record.update(metrics)
+    _sink(json.dumps(record, default=str))
+
+
+class Span:
+    """Étape chronométrée; `set()` attache des valeurs (bytes, tokens...) émises à la sortie."""
+
+    __slots__ = ("stage", "function", "values", "properties", "span_id", "parent_span_id", "_t0", "_start_ms")
+
+    def __init__(self, stage: str, function: Optional[str] = None, span_id: Optional[str] = None,
+                 parent_span_id: Optional[str] = None, **values: float):
+        self.stage = stage
+        self.function = function
+        self.values: Dict[str, float] = dict(values)
+        self.properties: Dict[str, Any] = {}
+        self.span_id = span_id or tracing.new_span_id()
+        self.parent_span_id = parent_span_id
+        self._t0 = 0.0
+        self._start_ms = 0.0
+
+    def set(self, **values: float) -> "Span":
+        self.values.update(values)
+        return self
+
+    def prop(self, **properties: Any) -> "Span":
+        """Propriétés non métriques (ex: model, error) ajoutées à la ligne EMF."""
+        self.properties.update(properties)
+        return self
+
+    def __enter__(self) -> "Span":
+        self._start_ms = time.time() * 1000
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = (time.perf_counter() - self._t0) * 1000
+        if exc_type is not None:
+            self.properties["error"] = exc_type.__name__
+        props = tracing.fields(self.span_id, self.parent_span_id)
+        props["startMs"] = round(self._start_ms, 3)
+        props.update(self.properties)
+        emit(self.stage, {"duration": round(duration, 3), **self.values}, self.function, props)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+    span_id = None
+
+    def set(self, **values: float) -> "_NoopSpan":
+        return self
+
+    def prop(self, **properties: Any) -> "_NoopSpan":
+        return self
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str, function: Optional[str] = None, span_id: Optional[str] = None,
+         parent_span_id: Optional[str] = None, **values: float):
+    """Context manager chronométrant une étape (no-op partagé si désactivé)."""
+    if not ENABLED:
+        return _NOOP
+    return Span(stage, function, span_id, parent_span_id, **values)
+
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """Décorateur équivalent à `with span(stage):` autour de la fonction."""
+    def decorator(fn: Callable) -> Callable:
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(sp, response: Dict[str, Any]) -> None:
+    """Attache les tokens (`usage`) et la latence serveur (`metrics.latencyMs`) d'une réponse Bedrock Converse."""
+    if not ENABLED or not isinstance(response, dict):
+        return
+    usage = response.get("usage") or {}
+    server = response.get("metrics") or {}
+    sp.set(inputTokens=usage.get("inputTokens"), outputTokens=usage.get("outputTokens"),
+           bedrockLatency=server.get("latencyMs"))
+
+
+# ========= Collecteur local =========
+
+class Histogram:
+    """
+    Histogramme à buckets logarithmiques + quantiles. Précision relative `growth - 1`
+    (~4 % par défaut; loadgen.py prend 0,1 %, comme HdrHistogram). Un quantile vaut
+    la borne haute de son bucket, bornée par [min, max].
+    """
+
+    GROWTH = 1.04
+
+    def __init__(self, growth: float = GROWTH):
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    _ZERO = -(10 ** 6)
+
+    def add(self, value: float) -> None:
+        idx = math.floor(math.log(value) / self._log_growth) if value > 0 else self._ZERO
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram") -> None:
+        if other.growth != self.growth:
+            raise ValueError(f"précisions différentes: {self.growth} / {other.growth}")
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _upper(self, idx: int) -> float:
+        if idx == self._ZERO:
+            return 0.0
+        return max(self.min, min(self.max, self.growth ** (idx + 1)))
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                return self._upper(idx)
+        return self.max
+
+    def stddev(self) -> float:
+        if not self.count:
+            return 0.0
+        mean = self.total / self.count
+        return math.sqrt(max(0.0, self.total_sq / self.count - mean * mean))
+
+    def spectrum(self, ticks_per_half: int = 5) -> List[Tuple[float, float, int]]:
+        """[(valeur, quantile, nombre cumulé)] à pas réduits de moitié vers la queue (50, 75, 87.5...)."""
+        if not self.count:
+            return []
+        cumulative, seen = [], 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            cumulative.append((idx, seen))
+        out, q, level = [], 0.0, 0
+        while True:
+            rank = max(1, math.ceil(q * self.count))
+            idx, total = next((i, c) for i, c in cumulative if c >= rank)
+            out.append((self._upper(idx), q, total))
+            if total >= self.count:
+                break
+            q += 0.5 ** (level + 1) / ticks_per_half
+            if q >= 1 - 0.5 ** (level + 1) - 1e-12:
+                level += 1
+        out.append((self.max, 1.0, self.count))
+        return out
+
+    def summary(self, quantiles: Iterable[float] = (0.50, 0.90, 0.99)) -> Dict[str, float]:
+        out = {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "stddev": round(self.stddev(), 3),
+            "min": round(self.min, 3) if self.count else 0.0,
+        }
+        for q in quantiles:
+            out[f"p{q * 100:g}"] = round(self.quantile(q), 3)
+        out["max"] = round(self.max, 3) if self.count else 0.0
+        return out
+
+    def to_hgrm(self) -> str:
+        """Format texte `outputPercentileDistribution` (HdrHistogram plotter)."""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        for value, q, total in self.spectrum():
+            inv = f"{1 / (1 - q):14.2f}" if q < 1 else f"{'inf':>14}"
+            lines.append(f"{value:12.3f} {q:14.12f} {total:10d} {inv}")
+        lines.append(f"#[Mean    = {self.total / self.count if self.count else 0.0:12.3f}, "
+                     f"StdDeviation   = {self.stddev():12.3f}]")
+        lines.append(f"#[Max     = {self.max if self.count else 0.0:12.3f}, Total count    = {self.count:12d}]")
+        lines.append(f"#[Buckets = {len(self.buckets):12d}, Precision      = {self.growth - 1:12.4f}]")
+        return "\n".join(lines) + "\n"
+
+
+def collect(lines: Iterable[str]) -> Dict[str, Dict[str, Histogram]]:
+    """Agrège des lignes EMF: {"Function/Stage": {"Duration": Histogram, ...}}."""
+    out: Dict[str, Dict[str, Histogram]] = {}
+    for line in lines:
+        start = line.find("{")
+        if start < 0 or '"_aws"' not in line:
+            continue
+        try:
+            record = json.loads(line[start:])
+            declared = record["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+        except (ValueError, KeyError, IndexError):
+            continue
+        key = f"{record.get('Function', '?')}/{record.get('Stage', '?')}"
+        hists = out.setdefault(key, {})
+        for m in declared:
+            value = record.get(m["Name"])
+            if isinstance(value, (int, float)):
+                hists.setdefault(m["Name"], Histogram()).add(float(value))
+    return out
+
+
+def _render(agg: Dict[str, Dict[str, Histogram]]) -> List[str]:
+    rows = [f"{'Function/Stage':40} {'Metric':14} {'count':>7} {'mean':>10} {'p50':>10} "
+            f"{'p90':>10} {'p99':>10} {'max':>10}"]
+    for key in sorted(agg):
+        for name in sorted(agg[key]):
+            s = agg[key][name].summary()
+            rows.append(f"{key:40} {name:14} {s['count']:>7} {s['mean']:>10} {s['p50']:>10} "
+                        f"{s['p90']:>10} {s['p99']:>10} {s['max']:>10}")
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Collecteur local de métriques EMF")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("collect", help="Agréger des logs EMF en histogrammes")
+    c.add_argument("files", nargs="*", help="Fichiers de logs (stdin par défaut)")
+    c.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args(argv)
+
+    def lines():
+        if not args.files:
+            yield from sys.stdin
+        for path in args.files:
+            with open(path, "r", encoding="utf-8") as f:
+                yield from f
+
+    agg = collect(lines())
+    if args.json:
+        print(json.dumps({k: {n: h.summary() for n, h in v.items()} for k, v in agg.items()}, indent=2))
+    else:
+        print("\n".join(_render(agg)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+Index de quasi-doublons (MinHash / LSH) devant Classify.
+
+Responsabilité:
+- Normaliser le texte d'une demande client et masquer les tokens personnels
+  (email, téléphone, IBAN, PDL/PCE, nom après civilité, adresse, dates, nombres):
+  deux demandes qui ne diffèrent que par ces valeurs ont la même forme normalisée
+- Signer la demande par MinHash sur des shingles de mots et retrouver, via LSH
+  (bandes de la signature), une demande antérieure de similarité >= seuil
+- Garder l'index en mémoire du conteneur (nombre d'entrées borné, éviction LRU),
+  avec insertion incrémentale
+- Sauvegarder / restaurer un instantané (JSON gzip) depuis S3 pour survivre aux cold starts:
+  chaque conteneur écrit sa propre clé sous un préfixe, un nouveau conteneur fusionne
+  les instantanés les plus récents (`restore_latest`)
+
+Paramètres (par défaut): 64 permutations, 16 bandes de 4 lignes, shingles de 3 mots.
+Avec 16 x 4, une paire de similarité 0.8 est candidate avec une probabilité > 99.9 %,
+une paire à 0.3 dans moins de 13 % des cas; le seuil final est appliqué sur la
+similarité estimée par la signature complète.
+
+Format d'instantané:
+{"version": 1, "numPerm": 64, "bands": 16, "shingle": 3, "savedAt": "...",
+ "entries": [{"id": "<requestId>", "sig": "<base64 uint64 LE>", "result": {...},
+              "insertedAt": 1700000000, "hits": 3}, ...]}
+
+CLI:
+  python neardup.py compare "texte A" "texte B"
+  python neardup.py bench --n 20000
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+SNAPSHOT_VERSION = 1
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+
+# Masquage des données personnelles (ordre significatif: motifs les plus spécifiques d'abord)
+_STREET = r"(?:rue|avenue|av\.?|boulevard|bd|chemin|all[ée]e|place|impasse|route|quai|cours|lotissement|r[ée]sidence)"
+_CIVILITE = r"(?:M\.|Mr\.?|Mme\.?|Mlle\.?|Monsieur|Madame|Mademoiselle|Me)"
+_NAME = r"[A-ZÀ-Ý][\w'’-]+"
+_PII_PATTERNS = [
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), " <email> "),
+    (re.compile(r"\bFR\d{2}(?:\s?[0-9A-Z]{4}){5}\s?[0-9A-Z]{3}\b", re.IGNORECASE), " <iban> "),
+    (re.compile(r"(?:\+33\s?|0033\s?|\b0)[1-9](?:[\s.-]?\d{2}){4}\b"), " <tel> "),
+    (re.compile(r"\bGI\d{6}\b|\b\d{14}\b|\b\d{2}(?:\s\d{3}){4}\b"), " <pdl> "),
+    (re.compile(r"\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b"), " <date> "),
+    (re.compile(rf"{_CIVILITE}\s+(?:{_NAME}\s*){{1,3}}"), " <nom> "),
+    # Formule insensible à la casse, nom sensible (majuscule initiale): "je suis déçu" reste du texte
+    (re.compile(rf"\b(?i:je m['’]appelle|je suis|cordialement,?|bien à vous,?)\s+(?:{_NAME}\s*){{1,3}}"),
+     " <nom> "),
+    (re.compile(rf"\b\d{{1,4}}\s*(?:bis|ter)?,?\s+{_STREET}\b[^,\n]*", re.IGNORECASE), " <adresse> "),
+    (re.compile(rf"\b\d{{5}}\s+{_NAME}(?:[\s-]{_NAME})*"), " <cp> "),
+    (re.compile(r"\d+(?:[.,]\d+)?"), " <num> "),
+]
+_TOKEN = re.compile(r"<\w+>|\w+")
+
+
+def normalize(text: str) -> List[str]:
+    """Tokens normalisés (minuscules, sans accents) avec données personnelles masquées."""
+    for pattern, repl in _PII_PATTERNS:
+        text = pattern.sub(repl, text)
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN.findall(text)
+
+
+def shingles(tokens: List[str], k: int = 3) -> List[int]:
+    """Empreintes 64 bits stables (blake2b) des k-grammes de mots."""
+    if len(tokens) < k:
+        grams = [" ".join(tokens)] if tokens else []
+    else:
+        grams = {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+    return [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams]
+
+
+class MinHasher:
+    """Famille de permutations (a*x + b) mod (2^61 - 1), déterministe pour une graine donnée."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(num_perm)]
+
+    def signature(self, hashes: List[int]) -> array:
+        if not hashes:
+            return array("Q", [_MAX_HASH] * self.num_perm)
+        xs = [h % _MERSENNE for h in hashes]
+        return array("Q", [min((a * x + b) % _MERSENNE for x in xs) for a, b in self._perms])
+
+
+def similarity(sig_a: array, sig_b: array) -> float:
+    """Similarité de Jaccard estimée: proportion de minima égaux."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """
+    Index LSH en mémoire: `lookup(text)` renvoie la meilleure entrée antérieure au-dessus
+    du seuil, `insert(request_id, text, result)` l'enrichit. Thread-safe.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 shingle: int = 3, max_entries: int = 20000, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm doit être un multiple de bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        self.max_entries = max_entries
+        self.hasher = MinHasher(num_perm, seed)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+        self.inserts_since_snapshot = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, text: str) -> array:
+        return self.hasher.signature(shingles(normalize(text), self.shingle))
+
+    def _band_keys(self, sig: array) -> List[bytes]:
+        raw = sig.tobytes()
+        width = self.rows * sig.itemsize
+        return [raw[i * width:(i + 1) * width] for i in range(self.bands)]
+
+    def lookup(self, text: str, sig: Optional[array] = None) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(entrée, similarité) de la demande antérieure la plus proche, ou None sous le seuil."""
+        sig = sig if sig is not None else self.signature(text)
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(sig)):
+                candidates.update(self._buckets[band].get(key, ()))
+            best, best_sim = None, 0.0
+            for request_id in candidates:
+                entry = self._entries[request_id]
+                sim = similarity(sig, entry["sig"])
+                if sim > best_sim:
+                    best, best_sim = entry, sim
+            if best is None or best_sim < self.threshold:
+                return None
+            best["hits"] = best.get("hits", 0) + 1
+            self._entries.move_to_end(best["id"])
+            return best, best_sim
+
+    def insert(self, request_id: str, text: str, result: Dict[str, Any],
+               sig: Optional[array] = None) -> None:
+        sig = sig if sig is not None else self.signature(text)
+        with self._lock:
+            self._add({"id": request_id, "sig": sig, "result": result,
+                       "insertedAt": int(time.time()), "hits": 0})
+            self.inserts_since_snapshot += 1
+
+    def _add(self, entry: Dict[str, Any]) -> None:
+        if entry["id"] in self._entries:
+            self._remove(entry["id"])
+        self._entries[entry["id"]] = entry
+        for band, key in enumerate(self._band_keys(entry["sig"])):
+            self._buckets[band].setdefault(key, []).append(entry["id"])
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, request_id: str) -> None:
+        entry = self._entries.pop(request_id)
+        for band, key in enumerate(self._band_keys(entry["sig"])):
+            ids = self._buckets[band].get(key)
+            if ids is None:
+                continue
+            ids.remove(request_id)
+            if not ids:
+                del self._buckets[band][key]
+
+    # ---- Instantanés ----
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            entries = [{"id": e["id"], "sig": base64.b64encode(e["sig"].tobytes()).decode("ascii"),
+                        "result": e["result"], "insertedAt": e["insertedAt"], "hits": e.get("hits", 0)}
+                       for e in self._entries.values()]
+            self.inserts_since_snapshot = 0
+        doc = {"version": SNAPSHOT_VERSION, "numPerm": self.hasher.num_perm, "bands": self.bands,
+               "shingle": self.shingle, "savedAt": datetime.now(timezone.utc).isoformat(), "entries": entries}
+        return gzip.compress(json.dumps(doc, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"))
+
+    def load_bytes(self, data: bytes) -> int:
+        """Restaure un instantané (entrées ajoutées à l'index courant); retourne le nombre chargé."""
+        doc = json.loads(gzip.decompress(data).decode("utf-8"))
+        if (doc.get("version") != SNAPSHOT_VERSION or doc.get("numPerm") != self.hasher.num_perm
+                or doc.get("bands") != self.bands or doc.get("shingle") != self.shingle):
+            raise ValueError("Instantané incompatible avec les paramètres de l'index")
+        with self._lock:
+            for e in doc["entries"]:
+                sig = array("Q")
+                sig.frombytes(base64.b64decode(e["sig"]))
+                self._add({"id": e["id"], "sig": sig, "result": e["result"],
+                           "insertedAt": e.get("insertedAt", 0), "hits": e.get("hits", 0)})
+        return len(doc["entries"])
+
+    def save(self, s3, bucket: str, key: str) -> int:
+        data = self.to_bytes()
+        s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType="application/json",
+                      ContentEncoding="gzip")
+        return len(data)
+
+    def restore(self, s3, bucket: str, key: str) -> int:
+        """Charge l'instantané S3 s'il existe (0 sinon)."""
+        try:
+            obj = s3.get_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("NoSuchKey", "404", "NotFound"):
+                return 0
+            raise
+        return self.load_bytes(obj["Body"].read())
+
+    def restore_latest(self, s3, bucket: str, prefix: str, limit: int = 3) -> int:
+        """Fusionne les `limit` instantanés les plus récents sous `prefix` (un par conteneur)."""
+        objects: List[Dict[str, Any]] = []
+        kwargs: Dict[str, Any] = {"Bucket": bucket, "Prefix": prefix}
+        while True:
+            resp = s3.list_objects_v2(**kwargs)
+            objects.extend(resp.get("Contents", []))
+            if not resp.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+        objects.sort(key=lambda o: o.get("LastModified") or 0, reverse=True)
+        loaded = 0
+        # Du plus ancien au plus récent: l'entrée la plus récente d'un même id l'emporte
+        for obj in reversed(objects[:limit]):
+            loaded += self.restore(s3, bucket, obj["Key"])
+        return loaded
+
+
+# ========= CLI =========
+
+_BENCH_TEMPLATES = [
+    "Bonjour, je souhaite résilier mon contrat d'électricité suite à mon déménagement le {d}/03/2024. "
+    "Mon PDL est {pdl}. Cordialement, {prenom} {nom}",
+    "Madame, Monsieur, je conteste la facture n°{n} d'un montant de {m} euros, ma consommation "
+    "n'a pas changé. Merci de me rappeler au 06 {t} 12 34 56. {prenom} {nom}",
+    "Je voudrais souscrire une offre verte pour mon logement au {n} rue des {nom}, {cp} Lyon. "
+    "Mon email: {prenom}.{nom}@example.org",
+    "Mon compteur Linky affiche une erreur depuis le {d}/02, PDL {pdl}, pouvez-vous envoyer un technicien ?",
+]
+
+
+def _bench_text(rng: random.Random, i: int) -> str:
+    names = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau"]
+    text = rng.choice(_BENCH_TEMPLATES).format(
+        d=rng.randint(1, 28), pdl="".join(str(rng.randint(0, 9)) for _ in range(14)), n=rng.randint(1, 9999),
+        m=rng.randint(20, 900), t=rng.randint(10, 99), cp=rng.randint(10000, 95999),
+        prenom=rng.choice(["Jean", "Marie", "Luc", "Sophie"]), nom=rng.choice(names))
+    if i % 3 == 0:
+        # demandes réellement distinctes: texte libre aléatoire
+        words = ["énergie", "contrat", "gaz", "tarif", "prélèvement", "agence", "offre", "compteur", "relevé",
+                 "échéancier", "mensualité", "panne", "devis", "chauffage", "solaire", "borne", "remboursement"]
+        text = " ".join(rng.choice(words) for _ in range(25))
+    return text
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Index de quasi-doublons MinHash/LSH")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compare", help="Similarité estimée entre deux textes")
+    c.add_argument("a")
+    c.add_argument("b")
+    b = sub.add_parser("bench", help="Benchmark insertion / recherche / instantané")
+    b.add_argument("--n", type=int, default=20000)
+    b.add_argument("--threshold", type=float, default=0.85)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "compare":
+        index = NearDuplicateIndex()
+        for label, text in (("A", args.a), ("B", args.b)):
+            print(f"{label}: {' '.join(normalize(text))}")
+        print(f"similarité estimée: {similarity(index.signature(args.a), index.signature(args.b)):.3f}")
+        return 0
+
+    rng = random.Random(3)
+    texts = [_bench_text(rng, i) for i in range(args.n)]
+    index = NearDuplicateIndex(threshold=args.threshold, max_entries=args.n)
+    hits = 0
+    t0 = time.perf_counter()
+    for i, text in enumerate(texts):
+        sig = index.signature(text)
+        if index.lookup(text, sig) is not None:
+            hits += 1
+        else:
+            index.insert(f"REQ-{i}", text, {"classification": {"category": "RESILIATION", "confidence": 0.9}}, sig)
+    elapsed = time.perf_counter() - t0
+    print(f"{args.n} demandes: {elapsed * 1e6 / args.n:.0f} µs/demande (signature + recherche + insertion)")
+    print(f"réutilisations: {hits} ({hits / args.n:.1%}), entrées indexées: {len(index)}")
+    t0 = time.perf_counter()
+    blob = index.to_bytes()
+    t1 = time.perf_counter()
+    restored = NearDuplicateIndex(threshold=args.threshold, max_entries=args.n)
+    restored.load_bytes(blob)
+    t2 = time.perf_counter()
+    print(f"instantané: {len(blob) / 1024:.0f} Kio gzip, sauvegarde {(t1 - t0) * 1000:.0f} ms, "
+          f"restauration {(t2 - t1) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
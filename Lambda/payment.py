@@ -5,6 +5,7 @@ Lambda: payment
 But: déclencher le paiement APRÈS signature du contrat.
 - Vérifie que le contrat est signé (ContractsTable)
 - Crée un enregistrement de paiement (PaymentsTable)
+- Inscrit l'issue dans le cycle de vie de la demande (RequestState, si requestId fourni)
 - Si provider=STRIPE:
     * PaymentIntent (si paymentMethodId fourni) ou Checkout Session
     * renvoie l'URL de paiement (si checkout) ou l'état immédiat
@@ -12,6 +13,7 @@ But: déclencher le paiement APRÈS signature du contrat.
 
 Entrée (event exemple):
 {
+  "requestId": "REQ-2025-12-24-ABC123",   # optionnel (RequestState)
   "contractId": "CTR-2025-001",
   "client": {"id":"C12345", "email":"amina@example.com", "name":"Amina"},
   "amount": 199.00,
@@ -22,6 +24,8 @@ Entrée (event exemple):
   "cancelUrl": "https://app.ecoia/cancel"
 }
 """
+import runtime
+
 import os
 import json
 import time
@@ -29,10 +33,13 @@ import uuid
 from decimal import Decimal
 from typing import Any, Dict
 
-import boto3
 import urllib.parse
 import urllib.request
 
+import RequestState
+import metrics
+import tracing
+
 # --- Stripe (appel HTTP sans dépendances) ---
 STRIPE_API = "https://api.stripe.com/v1"
 
@@ -43,42 +50,72 @@ def _stripe_request(path: str, secret_key: str, params: Dict[str, Any]):
         data=data,
         headers={"Authorization": f"Bearer {secret_key}"}
     )
-    with urllib.request.urlopen(req) as resp:
-        body = resp.read().decode("utf-8")
-        return json.loads(body)
+    with metrics.span("stripe", bytes=len(data)) as sp:
+        sp.prop(path=path)
+        with urllib.request.urlopen(req) as resp:
+            body = resp.read().decode("utf-8")
+            return json.loads(body)
+
+# --- AWS clients (créés au premier usage, voir runtime.py) ---
+CONTRACTS_TABLE = os.environ.get('CONTRACTS_TABLE', '')
+PAYMENTS_TABLE  = os.environ.get('PAYMENTS_TABLE', '')
+
+def _contracts_table():
+    return runtime.table(CONTRACTS_TABLE)
 
-# --- AWS clients ---
-ddb = boto3.resource('dynamodb')
-contracts_table = ddb.Table(os.environ['CONTRACTS_TABLE'])
-payments_table  = ddb.Table(os.environ['PAYMENTS_TABLE'])
+def _payments_table():
+    return runtime.table(PAYMENTS_TABLE)
+
+# Statuts Stripe (PaymentIntent) → cycle de vie de la demande
+_REQUEST_STATUS = {'SUCCEEDED': 'PAID', 'PAID': 'PAID', 'FAILED': 'PAYMENT_FAILED', 'CANCELED': 'PAYMENT_FAILED'}
+
+def _record_outcome(request_id, payment_id: str, status: str, provider: str) -> None:
+    RequestState.record(request_id, _REQUEST_STATUS.get(status, 'PAYMENT_PENDING'), 'payment',
+                        paymentId=payment_id, paymentStatus=status, provider=provider)
 
 def _amount_to_minor(amount: float, currency: str) -> int:
     # 2 décimales par défaut (adapter pour JPY, etc.)
     return int(Decimal(str(amount)) * 100)
 
 def _get_contract(contract_id: str) -> Dict[str, Any]:
-    r = contracts_table.get_item(Key={"pk": f"CONTRACT#{contract_id}", "sk": "META"})
+    with metrics.span("get_contract"):
+        r = _contracts_table().get_item(Key={"pk": f"CONTRACT#{contract_id}", "sk": "META"})
     return r.get('Item', {})
 
 def _create_payment_record(contract_id: str, client: Dict[str, Any],
                            amount: float, currency: str, provider: str) -> str:
     pid = f"PAY-{uuid.uuid4().hex[:10].upper()}"
-    payments_table.put_item(Item={
-        'pk': f'PAYMENT#{pid}',
-        'sk': 'META',
-        'contractId': contract_id,
-        'clientId': client.get('id'),
-        'amount': float(amount),
-        'currency': currency.upper(),
-        'provider': provider,
-        'status': 'PENDING',
-        'createdAt': int(time.time())
-    })
+    with metrics.span("create_record"):
+        _payments_table().put_item(Item={
+            'pk': f'PAYMENT#{pid}',
+            'sk': 'META',
+            'contractId': contract_id,
+            'clientId': client.get('id'),
+            'amount': float(amount),
+            'currency': currency.upper(),
+            'provider': provider,
+            'status': 'PENDING',
+            'createdAt': int(time.time())
+        })
     return pid
 
+@runtime.on_warmup
+def _preload():
+    # Ping de pré-chauffage: ressources DynamoDB (aucune écriture, aucun appel Stripe)
+    if CONTRACTS_TABLE and PAYMENTS_TABLE:
+        _contracts_table()
+        _payments_table()
+
+runtime.mark_loaded(__name__)
+
+@runtime.handler
+@tracing.traced
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if not CONTRACTS_TABLE or not PAYMENTS_TABLE:
+        return {"ok": False, "error": "CONTRACTS_TABLE / PAYMENTS_TABLE manquant"}
     provider    = (event.get('provider') or os.environ.get('PROVIDER') or 'MOCK').upper()
     contract_id = event.get('contractId')
+    request_id  = event.get('requestId')
     if not contract_id:
         return {"ok": False, "error": "contractId requis"}
 
@@ -87,6 +124,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {"ok": False, "error": "contrat introuvable"}
     if contract.get('status') not in ('SIGNED', 'SIGN_COMPLETED', 'SIGNED_OK'):
         return {"ok": False, "error": f"contrat non signé (status={contract.get('status')})"}
+    # Contrat signé (webhook de signature): la demande passe à SIGNED avant le paiement
+    RequestState.record(request_id, 'SIGNED', 'payment', contractId=contract_id)
 
     client   = event.get('client') or {}
     amount   = float(event.get('amount', 0))
@@ -119,12 +158,13 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
                 status = intent.get('status')
                 prov_id = intent.get('id')
-                payments_table.update_item(
+                _payments_table().update_item(
                     Key={'pk': f'PAYMENT#{payment_id}', 'sk': 'META'},
                     UpdateExpression='SET #s=:s, providerRef=:r',
                     ExpressionAttributeNames={'#s':'status'},
                     ExpressionAttributeValues={':s': status.upper(), ':r': prov_id}
                 )
+                _record_outcome(request_id, payment_id, status.upper(), provider)
                 return {"ok": True, "payment":
                         {"paymentId": payment_id, "status": status.upper(), "provider": provider}}
             else:
@@ -145,27 +185,30 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 session = _stripe_request('/checkout/sessions', secret, params)
                 url = session.get('url')
                 sid = session.get('id')
-                payments_table.update_item(
+                _payments_table().update_item(
                     Key={'pk': f'PAYMENT#{payment_id}', 'sk': 'META'},
                     UpdateExpression='SET providerRef=:r, checkoutUrl=:u',
                     ExpressionAttributeValues={':r': sid, ':u': url}
                 )
+                _record_outcome(request_id, payment_id, 'PENDING', provider)
                 return {"ok": True, "payment":
                         {"paymentId": payment_id, "status": "PENDING", "provider": provider, "checkoutUrl": url}}
         except Exception as e:
-            payments_table.update_item(
+            _payments_table().update_item(
                 Key={'pk': f'PAYMENT#{payment_id}', 'sk': 'META'},
                 UpdateExpression='SET #s=:s, error=:e',
                 ExpressionAttributeNames={'#s':'status'},
                 ExpressionAttributeValues={':s': 'FAILED', ':e': str(e)}
             )
+            _record_outcome(request_id, payment_id, 'FAILED', provider)
             return {"ok": False, "error": f"StripeError: {str(e)}"}
 
     # Provider MOCK
-    payments_table.update_item(
+    _payments_table().update_item(
         Key={'pk': f'PAYMENT#{payment_id}', 'sk': 'META'},
         UpdateExpression='SET #s=:s, providerRef=:r',
         ExpressionAttributeNames={'#s':'status'},
         ExpressionAttributeValues={':s': 'PAID', ':r': 'MOCK-TXN'}
     )
+    _record_outcome(request_id, payment_id, 'PAID', provider)
     return {"ok": True, "payment": {"paymentId": payment_id, "status": "PAID", "provider": provider}}
@@ -0,0 +1,552 @@
+"""
+Polices TrueType embarquées (CID, Identity-H) pour les PDF de GenerateContract.
+
+Responsabilité:
+- Lire une police TrueType (glyf/loca) une seule fois par conteneur: cmap (formats 4
+  et 12), chasses (hmtx), métriques du descripteur PDF, nom PostScript
+- Encoder le texte en identifiants de glyphes (chaîne hexadécimale pour Tj) en
+  collectant les glyphes utilisés par le document
+- Sous-ensemble de police: seuls les glyphes utilisés (et les composants des glyphes
+  composites) sont conservés, avec leurs identifiants d'origine (CIDToGIDMap /Identity);
+  les tables sont tronquées au plus grand identifiant utilisé puis compressées (Flate)
+- Sous-ensembles gardés en mémoire du conteneur, indexés par l'ensemble de glyphes
+  (éviction LRU): deux contrats aux mêmes caractères réutilisent le même objet FontFile2
+- Écriture arabe / hébreu: formes contextuelles arabes (formes de présentation Unicode,
+  ligature lam-alef) et ordre visuel des segments de droite à gauche dans une ligne de
+  gauche à droite. Pas de crénage ni de substitution GSUB au-delà
+
+Polices CFF (OpenType "OTTO") et collections (.ttc) non prises en charge.
+
+Usage (GenerateContract):
+
+    font = pdf_fonts.load(open("DejaVuSans.ttf", "rb").read())     # une fois par conteneur
+    enc = pdf_fonts.Encoder(font)
+    stream.write(f"{enc.hex('Łukasz Wójcik')} Tj\\n")
+    subset = enc.subset()            # FontSubset: fontfile, widths, to_unicode, ...
+
+CLI (benchmark génération / taille, contrats latins et multi-écritures):
+  python pdf_fonts.py bench --font /opt/fonts/DejaVuSans.ttf [--n 200]
+"""
+
+import argparse
+import array
+import hashlib
+import json
+import re
+import statistics
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+SUBSET_CACHE_MAX = 128
+
+# Tables conservées dans le sous-ensemble (celles qu'attend un lecteur PDF pour FontFile2)
+_KEEP_AS_IS = ("cvt ", "fpgm", "prep")
+
+# Glyphes composites (table glyf)
+_ARG_WORDS, _HAVE_SCALE, _MORE, _XY_SCALE, _TWO_BY_TWO = 0x0001, 0x0008, 0x0020, 0x0040, 0x0080
+
+
+def _u16(data, off: int) -> int:
+    return struct.unpack_from(">H", data, off)[0]
+
+
+def _i16(data, off: int) -> int:
+    return struct.unpack_from(">h", data, off)[0]
+
+
+def _u32(data, off: int) -> int:
+    return struct.unpack_from(">I", data, off)[0]
+
+
+# ========= Lecture TrueType =========
+
+class TrueTypeFont:
+    """Police TrueType lue une fois: tables brutes, cmap, chasses et métriques PDF."""
+
+    def __init__(self, data: bytes):
+        if data[:4] not in (b"\x00\x01\x00\x00", b"true"):
+            raise ValueError("police TrueType (glyf) attendue: CFF/OTTO et .ttc non pris en charge")
+        self.data = data
+        self.tables: Dict[str, bytes] = {}
+        for i in range(_u16(data, 4)):
+            tag, _, off, length = struct.unpack_from(">4sIII", data, 12 + 16 * i)
+            self.tables[tag.decode("latin-1")] = data[off:off + length]
+        missing = [t for t in ("head", "hhea", "maxp", "hmtx", "loca", "glyf", "cmap") if t not in self.tables]
+        if missing:
+            raise ValueError(f"tables manquantes: {', '.join(missing)}")
+
+        head = self.tables["head"]
+        self.units_per_em = _u16(head, 18)
+        self.bbox = struct.unpack_from(">hhhh", head, 36)
+        self.num_glyphs = _u16(self.tables["maxp"], 4)
+
+        hhea = self.tables["hhea"]
+        self.ascent, self.descent = struct.unpack_from(">hh", hhea, 4)
+        n_metrics = _u16(hhea, 34)
+        hmtx = self.tables["hmtx"]
+        self.advances = [_u16(hmtx, 4 * i) for i in range(n_metrics)]
+        self.lsbs = [_i16(hmtx, 4 * i + 2) for i in range(n_metrics)]
+        for i in range(self.num_glyphs - n_metrics):
+            self.advances.append(self.advances[-1])
+            self.lsbs.append(_i16(hmtx, 4 * n_metrics + 2 * i))
+
+        loca = self.tables["loca"]
+        if _i16(head, 50) == 0:
+            self.loca = [2 * _u16(loca, 2 * i) for i in range(self.num_glyphs + 1)]
+        else:
+            self.loca = [_u32(loca, 4 * i) for i in range(self.num_glyphs + 1)]
+
+        self.cmap = self._parse_cmap(self.tables["cmap"])
+        self.italic_angle = struct.unpack_from(">i", self.tables["post"], 4)[0] / 65536 if "post" in self.tables else 0
+        os2 = self.tables.get("OS/2")
+        self.cap_height = _i16(os2, 88) if os2 is not None and _u16(os2, 0) >= 2 and len(os2) >= 90 else self.ascent
+        self.weight = _u16(os2, 4) if os2 is not None else 400
+        self.postscript_name = self._parse_name(self.tables.get("name")) or "EmbeddedFont"
+        self._gid_to_char: Optional[Dict[int, int]] = None
+
+    @staticmethod
+    def _parse_cmap(cmap: bytes) -> Dict[int, int]:
+        records = {}
+        for i in range(_u16(cmap, 2)):
+            platform, encoding, off = struct.unpack_from(">HHI", cmap, 4 + 8 * i)
+            records[(platform, encoding)] = off
+        # Préférence: Unicode complet (format 12), puis BMP (format 4)
+        for key in ((3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)):
+            if key not in records:
+                continue
+            off = records[key]
+            fmt = _u16(cmap, off)
+            if fmt == 12:
+                mapping = {}
+                for g in range(_u32(cmap, off + 12)):
+                    start, end, gid = struct.unpack_from(">III", cmap, off + 16 + 12 * g)
+                    for cp in range(start, end + 1):
+                        mapping[cp] = gid + cp - start
+                return mapping
+            if fmt == 4:
+                seg = _u16(cmap, off + 6) // 2
+                ends = off + 14
+                starts = ends + 2 * seg + 2
+                deltas = starts + 2 * seg
+                ranges = deltas + 2 * seg
+                mapping = {}
+                for s in range(seg):
+                    end, start = _u16(cmap, ends + 2 * s), _u16(cmap, starts + 2 * s)
+                    delta, range_off = _i16(cmap, deltas + 2 * s), _u16(cmap, ranges + 2 * s)
+                    for cp in range(start, min(end, 0xFFFE) + 1):
+                        if range_off == 0:
+                            gid = (cp + delta) & 0xFFFF
+                        else:
+                            gid = _u16(cmap, ranges + 2 * s + range_off + 2 * (cp - start))
+                            gid = (gid + delta) & 0xFFFF if gid else 0
+                        if gid:
+                            mapping[cp] = gid
+                return mapping
+        raise ValueError("aucune table cmap Unicode (format 4 ou 12)")
+
+    @staticmethod
+    def _parse_name(name: Optional[bytes]) -> Optional[str]:
+        if not name:
+            return None
+        count, strings = _u16(name, 2), _u16(name, 4)
+        for i in range(count):
+            platform, _, _, name_id, length, off = struct.unpack_from(">HHHHHH", name, 6 + 12 * i)
+            if name_id != 6:
+                continue
+            raw = name[strings + off:strings + off + length]
+            text = raw.decode("utf-16-be", "ignore") if platform in (0, 3) else raw.decode("latin-1")
+            text = re.sub(r"[^A-Za-z0-9_.-]", "", text)
+            if text:
+                return text
+        return None
+
+    def glyph(self, gid: int) -> bytes:
+        return self.tables["glyf"][self.loca[gid]:self.loca[gid + 1]]
+
+    def components(self, gid: int) -> List[int]:
+        """Glyphes référencés par un glyphe composite (liste vide pour un glyphe simple)."""
+        data = self.glyph(gid)
+        if len(data) < 10 or _i16(data, 0) >= 0:
+            return []
+        out, pos = [], 10
+        while True:
+            flags, comp = struct.unpack_from(">HH", data, pos)
+            out.append(comp)
+            pos += 4 + (4 if flags & _ARG_WORDS else 2)
+            if flags & _HAVE_SCALE:
+                pos += 2
+            elif flags & _XY_SCALE:
+                pos += 4
+            elif flags & _TWO_BY_TWO:
+                pos += 8
+            if not flags & _MORE:
+                return out
+
+    def char_for(self, gid: int) -> Optional[int]:
+        """Premier point de code associé au glyphe (ToUnicode)."""
+        if self._gid_to_char is None:
+            reverse: Dict[int, int] = {}
+            for cp, g in sorted(self.cmap.items()):
+                reverse.setdefault(g, cp)
+            self._gid_to_char = reverse
+        return self._gid_to_char.get(gid)
+
+    def width(self, gid: int) -> int:
+        """Chasse en unités PDF (1/1000 du corps)."""
+        return round(self.advances[gid] * 1000 / self.units_per_em)
+
+
+def load(data: bytes) -> TrueTypeFont:
+    return TrueTypeFont(data)
+
+
+# ========= Écritures arabes et de droite à gauche =========
+
+_ALEFS = frozenset("\u0622\u0623\u0625\u0627")       # alef avec madda / hamza dessus / dessous, alef
+
+
+def _arabic_tables() -> Tuple[Dict[Tuple[str, str], str], Dict[Tuple[str, str], str]]:
+    """(lettre, forme) → forme de présentation, et (alef, forme) → ligature lam-alef.
+
+    Seules les ligatures lam-alef sont obligatoires; les autres ligatures lam+X de
+    compatibilité (lam-mim, lam-jim...) restent des lettres liées une à une.
+    """
+    forms: Dict[Tuple[str, str], str] = {}
+    lam_alef: Dict[Tuple[str, str], str] = {}
+    for cp in list(range(0xFE70, 0xFF00)) + list(range(0xFB50, 0xFE00)):
+        parts = unicodedata.decomposition(chr(cp)).split()
+        if len(parts) < 2 or parts[0] not in ("<isolated>", "<final>", "<initial>", "<medial>"):
+            continue
+        bases = [chr(int(p, 16)) for p in parts[1:]]
+        if len(bases) == 1:
+            forms.setdefault((bases[0], parts[0]), chr(cp))
+        elif len(bases) == 2 and bases[0] == "\u0644" and bases[1] in _ALEFS:          # lam-alef
+            lam_alef.setdefault((bases[1], parts[0]), chr(cp))
+    return forms, lam_alef
+
+
+_FORMS, _LAM_ALEF = _arabic_tables()
+_JOINING = {base for base, _ in _FORMS}
+_DUAL = {base for base, form in _FORMS if form in ("<initial>", "<medial>")} | {"\u0640"}       # + tatweel
+_RTL_HINT = re.compile(r"[\u0590-\u08ff\ufb1d-\ufdff\ufe70-\ufeff]")
+# Grappe d'affichage: nombre (reste de gauche à droite) ou caractère suivi de ses signes combinants
+_CLUSTER = re.compile(r"\d+(?:[.,]\d+)*|.[\u0300-\u036f\u0591-\u05c7\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]*",
+                      re.DOTALL)
+
+
+def _shape_arabic(text: str) -> str:
+    chars = list(text)
+    n = len(chars)
+
+    def neighbour(i: int, step: int) -> Optional[str]:
+        i += step
+        while 0 <= i < n and unicodedata.category(chars[i]) == "Mn":
+            i += step
+        return chars[i] if 0 <= i < n else None
+
+    out, i = [], 0
+    while i < n:
+        c = chars[i]
+        if c not in _JOINING:
+            out.append(c)
+            i += 1
+            continue
+        joins_prev = neighbour(i, -1) in _DUAL
+        nxt = chars[i + 1] if i + 1 < n else None
+        if c == "\u0644" and nxt and (nxt, "<isolated>") in _LAM_ALEF:
+            out.append(_LAM_ALEF.get((nxt, "<final>" if joins_prev else "<isolated>"), c + nxt))
+            i += 2
+            continue
+        joins_next = c in _DUAL and neighbour(i, 1) in _JOINING
+        form = ("<medial>" if joins_next else "<final>") if joins_prev else \
+            ("<initial>" if joins_next else "<isolated>")
+        out.append(_FORMS.get((c, form)) or _FORMS.get((c, "<isolated>")) or c)
+        i += 1
+    return "".join(out)
+
+
+def visual(text: str) -> str:
+    """Ordre d'affichage d'une ligne de gauche à droite contenant des segments RTL."""
+    if not _RTL_HINT.search(text):
+        return text
+    text = _shape_arabic(text)
+    classes = [unicodedata.bidirectional(c) for c in text]
+    out, i, n = [], 0, len(text)
+    while i < n:
+        if classes[i] not in ("R", "AL"):
+            out.append(text[i])
+            i += 1
+            continue
+        # Segment RTL: jusqu'au dernier caractère fort RTL avant le prochain caractère fort LTR
+        end, k = i, i
+        while k < n and classes[k] != "L":
+            if classes[k] in ("R", "AL"):
+                end = k
+            k += 1
+        out.extend(reversed(_CLUSTER.findall(text[i:end + 1])))
+        i = end + 1
+    return "".join(out)
+
+
+# ========= Encodage et sous-ensembles =========
+
+class FontSubset(NamedTuple):
+    name: str                   # ABCDEF+NomPostScript
+    fontfile: bytes             # FontFile2 compressé (FlateDecode)
+    length1: int                # taille décompressée
+    widths: str                 # tableau /W
+    to_unicode: bytes           # CMap ToUnicode compressé (FlateDecode)
+    bbox: Tuple[int, int, int, int]
+    italic_angle: float
+    ascent: int
+    descent: int
+    cap_height: int
+    stem_v: int
+
+
+_subsets: "OrderedDict[Tuple[int, Tuple[int, ...]], FontSubset]" = OrderedDict()
+_subsets_lock = threading.Lock()
+
+
+class Encoder:
+    """Encode le texte d'un document en identifiants de glyphes et collecte les glyphes utilisés."""
+
+    def __init__(self, font: TrueTypeFont, fallback: str = "?"):
+        self.font = font
+        self.used: Set[int] = set()
+        self._fallback = font.cmap.get(ord(fallback), 0)
+
+    def covers(self, text: str) -> bool:
+        return all(ord(c) in self.font.cmap for c in visual(text) if not c.isspace())
+
+    def hex(self, text: str) -> str:
+        cmap, fallback = self.font.cmap, self._fallback
+        gids = [cmap.get(ord(c), fallback) for c in visual(text)]
+        self.used.update(gids)
+        return "<" + "".join(f"{g:04X}" for g in gids) + ">"
+
+    def subset(self) -> FontSubset:
+        return subset(self.font, self.used)
+
+
+def _closure(font: TrueTypeFont, gids: Iterable[int]) -> Set[int]:
+    keep = {0}
+    stack = [g for g in gids if 0 <= g < font.num_glyphs]
+    while stack:
+        g = stack.pop()
+        if g in keep and g != 0:
+            continue
+        keep.add(g)
+        stack.extend(c for c in font.components(g) if c not in keep and c < font.num_glyphs)
+    return keep
+
+
+def _checksum(data: bytes) -> int:
+    padded = data + b"\0" * (-len(data) % 4)
+    return sum(struct.unpack(f">{len(padded) // 4}I", padded)) & 0xFFFFFFFF
+
+
+def _sfnt(tables: Dict[str, bytes]) -> bytes:
+    tags = sorted(tables)
+    n = len(tags)
+    entry = 1 << (n.bit_length() - 1)
+    header = struct.pack(">IHHHH", 0x00010000, n, entry * 16, entry.bit_length() - 1, n * 16 - entry * 16)
+    offset = 12 + 16 * n
+    records, body = [], []
+    for tag in tags:
+        data = tables[tag]
+        records.append(struct.pack(">4sIII", tag.encode("latin-1"), _checksum(data), offset, len(data)))
+        data += b"\0" * (-len(data) % 4)
+        body.append(data)
+        offset += len(data)
+    font = header + b"".join(records) + b"".join(body)
+    # head.checkSumAdjustment
+    head_off = _u32(font, 12 + 16 * tags.index("head") + 8)
+    adjust = (0xB1B0AFBA - _checksum(font)) & 0xFFFFFFFF
+    return font[:head_off + 8] + struct.pack(">I", adjust) + font[head_off + 12:]
+
+
+def _cmap_format4(font: TrueTypeFont, gids: List[int]) -> bytes:
+    """Petite cmap (3, 1) des glyphes conservés: un segment par caractère, plus le segment final."""
+    chars = sorted((cp, g) for g in gids for cp in [font.char_for(g)] if cp is not None and cp < 0xFFFF)
+    chars.append((0xFFFF, 0))
+    seg = len(chars)
+    entry = 1 << (seg.bit_length() - 1)
+    body = struct.pack(f">HHHH{seg}HH{seg}H{seg}h{seg}H", seg * 2, entry * 2, entry.bit_length() - 1,
+                       seg * 2 - entry * 2, *[cp for cp, _ in chars], 0, *[cp for cp, _ in chars],
+                       *[((g - cp + 0x8000) & 0xFFFF) - 0x8000 if cp != 0xFFFF else 1 for cp, g in chars],
+                       *[0] * seg)
+    subtable = struct.pack(">HHH", 4, 6 + len(body), 0) + body
+    return struct.pack(">HHHHI", 0, 1, 3, 1, 12) + subtable
+
+
+def _widths(font: TrueTypeFont, gids: List[int]) -> str:
+    """Tableau /W: [premier [w1 w2 ...] ...] par suites d'identifiants consécutifs."""
+    parts, run, start = [], [], None
+    for g in gids:
+        if run and g != start + len(run):
+            parts.append(f"{start} [{' '.join(run)}]")
+            run = []
+        if not run:
+            start = g
+        run.append(str(font.width(g)))
+    if run:
+        parts.append(f"{start} [{' '.join(run)}]")
+    return "[" + " ".join(parts) + "]"
+
+
+def _to_unicode(font: TrueTypeFont, gids: List[int]) -> bytes:
+    pairs = []
+    for g in gids:
+        cp = font.char_for(g)
+        if cp is not None:
+            pairs.append(f"<{g:04X}> <{chr(cp).encode('utf-16-be').hex().upper()}>")
+    lines = ["/CIDInit /ProcSet findresource begin", "12 dict begin", "begincmap",
+             "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+             "/CMapName /Adobe-Identity-UCS def", "/CMapType 2 def",
+             "1 begincodespacerange", "<0000> <FFFF>", "endcodespacerange"]
+    for i in range(0, len(pairs), 100):
+        chunk = pairs[i:i + 100]
+        lines += [f"{len(chunk)} beginbfchar", *chunk, "endbfchar"]
+    lines += ["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"]
+    return zlib.compress("\n".join(lines).encode("ascii"), 6)
+
+
+def _build_subset(font: TrueTypeFont, keep: Set[int]) -> FontSubset:
+    n = max(keep) + 1                      # tables tronquées après le plus grand glyphe conservé
+    glyf, loca = [], array.array("I", [0])
+    offset = 0
+    for g in range(n):
+        data = font.glyph(g) if g in keep else b""
+        data += b"\0" * (-len(data) % 4)
+        glyf.append(data)
+        offset += len(data)
+        loca.append(offset)
+    if sys.byteorder == "little":
+        loca.byteswap()
+    hmtx = b"".join(struct.pack(">Hh", font.advances[g], font.lsbs[g]) if g in keep else b"\0\0\0\0"
+                    for g in range(n))
+
+    head = bytearray(font.tables["head"])
+    struct.pack_into(">I", head, 8, 0)
+    struct.pack_into(">h", head, 50, 1)                  # loca au format long
+    hhea = bytearray(font.tables["hhea"])
+    struct.pack_into(">H", hhea, 34, n)
+    maxp = bytearray(font.tables["maxp"])
+    struct.pack_into(">H", maxp, 4, n)
+    tables = {"head": bytes(head), "hhea": bytes(hhea), "maxp": bytes(maxp), "hmtx": hmtx,
+              "loca": loca.tobytes(), "glyf": b"".join(glyf), "cmap": _cmap_format4(font, sorted(keep))}
+    if "post" in font.tables:
+        tables["post"] = b"\x00\x03\x00\x00" + font.tables["post"][4:32]      # post 3.0: sans noms
+    for tag in _KEEP_AS_IS:
+        if tag in font.tables:
+            tables[tag] = font.tables[tag]
+    raw = _sfnt(tables)
+
+    ordered = sorted(keep)
+    digest = hashlib.sha1(",".join(map(str, ordered)).encode("ascii")).digest()
+    tag = "".join(chr(65 + b % 26) for b in digest[:6])
+    scale = 1000 / font.units_per_em
+    return FontSubset(
+        name=f"{tag}+{font.postscript_name}",
+        fontfile=zlib.compress(raw, 6),
+        length1=len(raw),
+        widths=_widths(font, ordered),
+        to_unicode=_to_unicode(font, ordered),
+        bbox=tuple(round(v * scale) for v in font.bbox),
+        italic_angle=font.italic_angle,
+        ascent=round(font.ascent * scale),
+        descent=round(font.descent * scale),
+        cap_height=round(font.cap_height * scale),
+        stem_v=round(50 + (font.weight / 65) ** 2),
+    )
+
+
+def subset(font: TrueTypeFont, gids: Iterable[int]) -> FontSubset:
+    """Sous-ensemble pour ces glyphes, servi du cache du conteneur si déjà construit."""
+    keep = _closure(font, gids)
+    key = (id(font), tuple(sorted(keep)))
+    with _subsets_lock:
+        hit = _subsets.get(key)
+        if hit is not None:
+            _subsets.move_to_end(key)
+            return hit
+    built = _build_subset(font, keep)
+    with _subsets_lock:
+        _subsets[key] = built
+        while len(_subsets) > SUBSET_CACHE_MAX:
+            _subsets.popitem(last=False)
+    return built
+
+
+def clear_cache() -> None:
+    with _subsets_lock:
+        _subsets.clear()
+
+
+# ========= Benchmark =========
+
+_SAMPLES = {
+    "latin": {"nom": "Dupont", "prenom": "Élodie", "adresse": "12 rue des Lilas, 75011 Paris"},
+    "mixed": {"nom": "Wójcik-Łęcka", "prenom": "Żaneta", "adresse": "ul. Świętokrzyska 14, 00-050 Warszawa"},
+    "arabic": {"nom": "Wójcik / العلوي", "prenom": "Γιώργος Ντέμης", "adresse": "شارع محمد الخامس 12، الرباط"},
+}
+
+
+def bench(font_bytes: bytes, n: int) -> Dict[str, Dict[str, float]]:
+    """Temps de génération (ms) et taille (octets) par scénario, sous-ensemble froid et en cache."""
+    import GenerateContract
+
+    def payload(i: int, client: Dict[str, str]) -> Dict[str, object]:
+        return {"contratId": f"CTR-BENCH-{i:05d}", "client": {**client, "email": f"client{i}@example.org"},
+                "offre": {"nomOffre": "Offre Verte", "prixUnitaire": 0.2016, "details": "Électricité 100 % verte"},
+                "conditions": "Contrat d'un an renouvelable. Résiliation sans frais à tout moment."}
+
+    t0 = time.perf_counter()
+    font = load(font_bytes)
+    report: Dict[str, Dict[str, float]] = {"parse": {"ms": round((time.perf_counter() - t0) * 1000, 2)}}
+    scenarios = [("latin/helvetica", "latin", None), ("latin/embedded", "latin", "always")]
+    scenarios += [(f"{name}/embedded", name, None) for name in ("mixed", "arabic")]
+    saved_mode = GenerateContract.PDF_FONT_MODE
+    try:
+        for label, sample, mode in scenarios:
+            GenerateContract.PDF_FONT_MODE = mode or saved_mode
+            for cache in ("cold", "warm"):
+                times, sizes = [], []
+                for i in range(n):
+                    if cache == "cold":
+                        clear_cache()
+                    t = time.perf_counter()
+                    pdf = GenerateContract.build_contract_pdf(payload(i, _SAMPLES[sample]), None, font)
+                    times.append((time.perf_counter() - t) * 1000)
+                    sizes.append(len(pdf))
+                report[f"{label}/{cache}"] = {"p50Ms": round(statistics.median(times), 3),
+                                              "maxMs": round(max(times), 3), "bytes": int(statistics.median(sizes))}
+                if mode is None and label.startswith("latin"):
+                    break                       # Helvetica: pas de sous-ensemble, pas de cache
+    finally:
+        GenerateContract.PDF_FONT_MODE = saved_mode
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Polices TrueType embarquées (sous-ensembles)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bench", help="Temps de génération et taille des contrats PDF")
+    b.add_argument("--font", required=True, help="fichier .ttf")
+    b.add_argument("--n", type=int, default=200)
+    args = parser.parse_args(argv)
+    with open(args.font, "rb") as f:
+        data = f.read()
+    print(json.dumps(bench(data, args.n), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Préparation du texte client avant l'appel Bedrock (Classify) et budget de tokens.
+
+Responsabilité:
+- Retirer ce qui n'aide pas la classification: historique cité (lignes "> ...",
+  "Le ... a écrit :", "-----Message d'origine-----", en-têtes De:/Envoyé:), signatures
+  (délimiteur "-- ", formules de politesse suivies d'un bloc court), mentions légales
+  et formules automatiques ("Envoyé de mon iPhone", avertissements de confidentialité)
+- Estimer localement le nombre de tokens (approximation du tokenizer SentencePiece
+  des modèles Mistral, ~±10 % sur du français, sans dépendance)
+- Tronquer au budget configuré: début du texte (objet de la demande) + fin (dernière
+  phrase), séparés par " [...] "
+- Rapport: réduction de tokens sur un corpus (hors ligne) et comparaison
+  tokens / latence Bedrock entre deux journaux EMF (avant / après)
+
+Usage (Classify):
+
+    prepared = prompt_budget.prepare(user_text, budget=PROMPT_TOKEN_BUDGET)
+    prepared.text, prepared.original_tokens, prepared.tokens
+
+CLI:
+  python prompt_budget.py show mail.txt [--budget 400]
+  python prompt_budget.py report --corpus demandes.jsonl [--budget 1500]
+  python prompt_budget.py compare avant.log apres.log [--stage Classify/bedrock]
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# ========= Tokenizer approché =========
+
+_PIECE = re.compile(r"\d|[^\W\d_]+|[^\w\s]", re.UNICODE)
+# Longueur moyenne (caractères) d'un sous-mot pour du français: ~3.6 minuscules, moins
+# pour les majuscules / mots rares; les chiffres et la ponctuation comptent un token chacun.
+_CHARS_PER_PIECE = 3.6
+
+
+def approx_tokens(text: str) -> int:
+    """Nombre de tokens estimé (aucun appel réseau, O(n))."""
+    if not text:
+        return 0
+    total = 0
+    for piece in _PIECE.findall(text):
+        n = len(piece)
+        if n <= 3 or not piece[0].isalpha():
+            total += 1
+        else:
+            total += math.ceil(n / _CHARS_PER_PIECE) if piece.islower() else math.ceil(n / 3.0)
+    return total
+
+
+# ========= Nettoyage =========
+
+_REPLY_HEADERS = [
+    re.compile(r"^\s*le .{3,120}(a écrit|wrote)\s*:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*on .{3,120}wrote\s*:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*(message d'origine|original message|message transféré|forwarded message)\s*-{2,}",
+               re.IGNORECASE),
+    re.compile(r"^\s*(de|from)\s*:\s*.+$", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+]
+_SIGNATURE_DELIM = re.compile(r"^--\s*$")
+_SIGN_OFFS = re.compile(
+    r"^\s*(cordialement|bien cordialement|bien à vous|sincères salutations|salutations distinguées"
+    r"|meilleures salutations|respectueusement|merci d'avance|en vous remerciant par avance"
+    r"|veuillez agréer.*|best regards|regards)[\s,.!]*$", re.IGNORECASE)
+_BOILERPLATE = [
+    re.compile(r"^\s*(envoyé|envoye) (de|depuis) mon .+$", re.IGNORECASE),
+    re.compile(r"^\s*sent from my .+$", re.IGNORECASE),
+    re.compile(r"ce (message|courriel|e-mail|mail).{0,80}(confidentiel|destinataire)", re.IGNORECASE),
+    re.compile(r"this (message|email|e-mail).{0,80}(confidential|intended)", re.IGNORECASE),
+    re.compile(r"pensez à l'environnement|avant d'imprimer", re.IGNORECASE),
+    re.compile(r"^\s*(objet|subject|envoyé|sent|à|to|cc)\s*:", re.IGNORECASE),
+]
+# Après une formule de politesse, au-delà de ce nombre de lignes le texte n'est plus une signature
+_SIGNATURE_MAX_LINES = 6
+_ELLIPSIS = " [...] "
+
+
+def strip_noise(text: str) -> Tuple[str, Dict[str, int]]:
+    """Texte sans historique cité, signature ni mentions automatiques; compteurs de lignes retirées."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    stats = {"quoted": 0, "signature": 0, "boilerplate": 0}
+
+    # 1) Historique: tout ce qui suit un en-tête de réponse / transfert, et les lignes "> ..."
+    body: List[str] = []
+    for i, line in enumerate(lines):
+        if any(p.search(line) for p in _REPLY_HEADERS) and any(l.strip() for l in body):
+            stats["quoted"] += len(lines) - i
+            break
+        if line.lstrip().startswith(">"):
+            stats["quoted"] += 1
+            continue
+        body.append(line)
+
+    # 2) Mentions automatiques
+    kept: List[str] = []
+    for line in body:
+        if any(p.search(line) for p in _BOILERPLATE):
+            stats["boilerplate"] += 1
+        else:
+            kept.append(line.strip())
+
+    # 3) Signature: délimiteur "-- ", ou formule de politesse suivie d'un bloc court
+    for i, line in enumerate(kept):
+        if _SIGNATURE_DELIM.match(line) or (
+                _SIGN_OFFS.match(line) and len([l for l in kept[i + 1:] if l]) <= _SIGNATURE_MAX_LINES):
+            stats["signature"] += len(kept) - i
+            kept = kept[:i]
+            break
+
+    out = re.sub(r"\n{3,}", "\n\n", "\n".join(kept)).strip()
+    out = re.sub(r"[ \t]{2,}", " ", out)
+    return out, stats
+
+
+def truncate(text: str, budget: int, tail_ratio: float = 0.2) -> str:
+    """Tronque au budget de tokens: début (objet de la demande) + fin, coupés sur des mots."""
+    if budget <= 0 or approx_tokens(text) <= budget:
+        return text
+    words = re.findall(r"\S+\s*", text)
+    costs = [approx_tokens(w) for w in words]
+    room = budget - approx_tokens(_ELLIPSIS)
+    tail_budget = int(room * tail_ratio)
+    head_budget = room - tail_budget
+
+    head, used = [], 0
+    for w, c in zip(words, costs):
+        if used + c > head_budget:
+            break
+        head.append(w)
+        used += c
+    tail, used = [], 0
+    for w, c in zip(reversed(words[len(head):]), reversed(costs[len(head):])):
+        if used + c > tail_budget:
+            break
+        tail.append(w)
+        used += c
+    return "".join(head).rstrip() + _ELLIPSIS + "".join(reversed(tail)).strip()
+
+
+class Prepared:
+    """Résultat de `prepare`: texte envoyé au modèle et comptes de tokens estimés."""
+
+    __slots__ = ("text", "original_tokens", "tokens", "stripped", "truncated")
+
+    def __init__(self, text: str, original_tokens: int, tokens: int, stripped: Dict[str, int], truncated: bool):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.tokens = tokens
+        self.stripped = stripped
+        self.truncated = truncated
+
+
+def prepare(text: str, budget: int = 0, strip: bool = True, preserve_after: Optional[str] = None) -> Prepared:
+    """
+    Nettoie puis tronque `text` au budget (0 = pas de limite). Si `preserve_after` est
+    présent dans le texte, la partie qui le suit (ex: classification transmise à
+    Lambda B) est conservée telle quelle et comptée dans le budget.
+    """
+    original_tokens = approx_tokens(text)
+    body, suffix = text, ""
+    if preserve_after and preserve_after in text:
+        idx = text.index(preserve_after)
+        body, suffix = text[:idx], text[idx:]
+    stripped = {"quoted": 0, "signature": 0, "boilerplate": 0}
+    if strip:
+        cleaned, stripped = strip_noise(body)
+        # Un texte entièrement "retiré" (ex: message réduit à une citation) reste envoyé brut
+        body = cleaned or body.strip()
+    truncated = False
+    if budget:
+        limit = max(1, budget - approx_tokens(suffix))
+        shortened = truncate(body, limit)
+        truncated = shortened != body
+        body = shortened
+    out = body + suffix
+    return Prepared(out, original_tokens, approx_tokens(out), stripped, truncated)
+
+
+# ========= Rapports =========
+
+def _pct(before: float, after: float) -> str:
+    return f"{(after - before) / before * 100:+.1f} %" if before else "n/a"
+
+
+def report(texts: List[str], budget: int, overhead_tokens: int = 0) -> Dict[str, float]:
+    """Réduction de tokens d'entrée sur un corpus (overhead: prompt système + consigne)."""
+    before = after = truncated = 0
+    for text in texts:
+        p = prepare(text, budget)
+        before += p.original_tokens + overhead_tokens
+        after += p.tokens + overhead_tokens
+        truncated += p.truncated
+    n = max(len(texts), 1)
+    return {
+        "requests": len(texts),
+        "tokensBefore": before,
+        "tokensAfter": after,
+        "meanBefore": round(before / n, 1),
+        "meanAfter": round(after / n, 1),
+        "reduction": round(1 - after / before, 4) if before else 0.0,
+        "truncated": truncated,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Préparation des prompts Classify et budget de tokens")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("show", help="Afficher le texte préparé d'un fichier")
+    s.add_argument("file")
+    s.add_argument("--budget", type=int, default=0)
+    r = sub.add_parser("report", help="Réduction de tokens sur un corpus JSONL (champ text)")
+    r.add_argument("--corpus", required=True)
+    r.add_argument("--budget", type=int, default=1500)
+    c = sub.add_parser("compare", help="Tokens et latence Bedrock entre deux journaux EMF")
+    c.add_argument("before")
+    c.add_argument("after")
+    c.add_argument("--stage", default="Classify/bedrock")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "show":
+        with open(args.file, "r", encoding="utf-8") as f:
+            p = prepare(f.read(), args.budget)
+        print(p.text)
+        print(f"\n--- {p.original_tokens} → {p.tokens} tokens (estimés), retiré: {p.stripped}, "
+              f"tronqué: {p.truncated}", file=sys.stderr)
+        return 0
+
+    if args.cmd == "report":
+        # Overhead constant de Classify: prompt système + consigne autour du texte
+        import prompts
+        overhead = approx_tokens(prompts.SYSTEM_PROMPT) + approx_tokens(prompts.PROMPT_WRAPPER.format(text=""))
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            texts = [json.loads(line)["text"] for line in f if line.strip()]
+        out = report(texts, args.budget, overhead)
+        print(json.dumps(out, indent=2))
+        return 0
+
+    import metrics
+
+    def load(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return metrics.collect(f).get(args.stage, {})
+
+    before, after = load(args.before), load(args.after)
+    print(f"{args.stage:20} {'':8} {'avant':>10} {'après':>10} {'écart':>10}")
+    for name in ("InputTokens", "OutputTokens", "Duration", "BedrockLatency"):
+        if name not in before or name not in after:
+            continue
+        b, a = before[name].summary(), after[name].summary()
+        for q in ("mean", "p50", "p99"):
+            print(f"{name:20} {q:8} {b[q]:>10} {a[q]:>10} {_pct(b[q], a[q]):>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+"""
+Prompt de classification partagé (Classify / Verify, ShadowEval, prompt_budget).
+
+Responsabilité:
+- Modèle Bedrock par défaut, prompt système et consigne autour du texte client
+- Marqueur qui sépare le texte client de la classification transmise à Lambda B
+
+Module sans dépendance (ni boto3 ni handler): l'importer ne charge rien d'autre.
+"""
+
+MODEL_ID = "mistral.mistral-large-2402-v1:0"
+
+SYSTEM_PROMPT = """Tu es un classifieur.
+Classe le texte ci-dessous dans UNE SEULE catégorie parmi :
+- CONTRACTUALISATION
+- RESILIATION
+- RECLAMATION
+- CHANGEMENT_OFFRE
+- INFORMATION_TECHNIQUE
+
+Contraintes :
+- Réponds STRICTEMENT avec un objet JSON valide, sans commentaire, sans Markdown, sans texte additionnel.
+- Clés attendues : category (string), confidence (float entre 0 et 1).
+- category doit être exactement l'une des catégories listées.
+- confidence représente ton degré de certitude.
+"""
+
+PROMPT_WRAPPER = "Texte:\n{text}\n\nRenvoyer UNIQUEMENT le JSON."
+
+# Ajouté au texte envoyé à Lambda B (Verify), suivi de la classification en JSON
+CLASSIFICATION_MARKER = "\n\n---CLASSIFICATION---\n"
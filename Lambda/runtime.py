@@ -0,0 +1,277 @@
+"""
+Socle d'exécution partagé des Lambdas Python (à déployer en Lambda Layer: python/runtime.py).
+
+Responsabilité:
+- Créer les clients/ressources boto3 paresseusement (au premier usage) et les
+  réutiliser pour toute la durée de vie du conteneur
+- Appliquer une configuration botocore réglée: pool de connexions, keepalive TCP,
+  timeouts connect/read, retries adaptatifs
+- Mesurer le cold start: import du module handler, import de boto3 et
+  initialisation de chaque client, journalisés une fois à la première invocation.
+  L'import de boto3 n'est mesuré que s'il a lieu ici: un module handler qui importe
+  boto3 / botocore au niveau module (conditions, exceptions) le paie dans son propre
+  temps d'import (imports.<module>), et imports.boto3 est alors absent
+- Protocole de pré-chauffage: un ping {"warmup": true} exécute les préchargements
+  enregistrés par le module (`@runtime.on_warmup`) sans appeler le handler métier
+  (voir Warmer.py pour garder N conteneurs chauds, coldstart.py pour la mesure)
+- Fin d'invocation: les fonctions enregistrées (`@runtime.after_invocation`) s'exécutent
+  après chaque invocation métier, avant le retour de la réponse: elles doivent rester
+  brèves et déléguer les E/S à un thread (ex: AnalyticsSink programme son vidage S3 en
+  arrière-plan); durée écoulée de l'invocation en cours: `runtime.invocation_ms()`
+
+Usage dans un handler:
+
+    import runtime                      # premier import: démarre le chronomètre
+    ...
+    def _table():
+        return runtime.table(os.environ["CONTRACTS_TABLE"])
+
+    @runtime.on_warmup
+    def _preload():                     # clients, caches, modèles: sans effet de bord
+        runtime.client("bedrock-runtime")
+
+    runtime.mark_loaded(__name__)       # fin des imports du module
+
+    @runtime.handler
+    def lambda_handler(event, context):
+        bedrock = runtime.client("bedrock-runtime")
+
+Env vars:
+- AWS_MAX_POOL_CONNECTIONS: connexions HTTP max par client (par défaut 32)
+- AWS_CONNECT_TIMEOUT: timeout de connexion en secondes (par défaut 3)
+- AWS_READ_TIMEOUT: timeout de lecture en secondes (par défaut 30, surchargé par service)
+- AWS_MAX_ATTEMPTS: tentatives max, retries inclus (par défaut 4; toujours 1 pour lambda)
+- AWS_RETRY_MODE: adaptive | standard | legacy (par défaut adaptive)
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+_LOADED_AT = time.perf_counter()
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+CONNECT_TIMEOUT = float(os.environ.get("AWS_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("AWS_READ_TIMEOUT", "30"))
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "4"))
+RETRY_MODE = os.environ.get("AWS_RETRY_MODE", "adaptive")
+
+# Timeouts de lecture par service: un appel LLM ou une invocation Lambda synchrone
+# dépassent largement les 30 s qui conviennent à DynamoDB / S3 / SES.
+_SERVICE_READ_TIMEOUTS = {
+    "bedrock-runtime": 120.0,
+    "lambda": 900.0,
+}
+# Tentatives max par service: une invocation Lambda synchrone re-soumise rejouerait
+# toute la chaîne de la fonction appelée (Verify, effets de bord compris)
+_SERVICE_MAX_ATTEMPTS = {
+    "lambda": 1,
+}
+
+_lock = threading.Lock()
+_boto3 = None
+_clients: Dict[tuple, Any] = {}
+_resources: Dict[tuple, Any] = {}
+_tables: Dict[tuple, Any] = {}
+_overrides: Dict[str, Any] = {}
+_cold_start: Dict[str, Any] = {"imports": {}, "clients": {}}
+_invocations = 0
+_warmers: List[Callable[[], Any]] = []
+_finalizers: List[Callable[[], Any]] = []
+_started: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("invocation_start", default=None)
+# Un ping concurrent attend ce délai pour occuper son conteneur pendant que les
+# autres pings du lot arrivent (sinon Lambda les servirait tous avec le même conteneur)
+WARMUP_MAX_DELAY_MS = 1000
+
+
+def _import_boto3():
+    """Import différé de boto3 (l'import seul coûte plusieurs centaines de ms à froid)."""
+    global _boto3
+    if _boto3 is None:
+        already = "boto3" in sys.modules
+        t0 = time.perf_counter()
+        import boto3
+        _boto3 = boto3
+        if not already:
+            _cold_start["imports"]["boto3"] = round((time.perf_counter() - t0) * 1000, 2)
+    return _boto3
+
+
+def config_for(service: str, **overrides: Any):
+    """Config botocore réglée pour `service`; `overrides` remplace les valeurs par défaut."""
+    from botocore.config import Config
+    params = {
+        "max_pool_connections": MAX_POOL_CONNECTIONS,
+        "tcp_keepalive": True,
+        "connect_timeout": CONNECT_TIMEOUT,
+        "read_timeout": _SERVICE_READ_TIMEOUTS.get(service, READ_TIMEOUT),
+        "retries": {"total_max_attempts": _SERVICE_MAX_ATTEMPTS.get(service, MAX_ATTEMPTS), "mode": RETRY_MODE},
+    }
+    params.update(overrides)
+    return Config(**params)
+
+
+def override(service: str, obj: Any) -> None:
+    """
+    Remplace le client/ressource d'un service par un objet fourni (simulateur local,
+    faux backends de fakes.py). Vide les caches pour que les handlers le voient.
+    """
+    with _lock:
+        _overrides[service] = obj
+        _clients.clear()
+        _resources.clear()
+        _tables.clear()
+
+
+def reset_overrides() -> None:
+    with _lock:
+        _overrides.clear()
+        _clients.clear()
+        _resources.clear()
+        _tables.clear()
+
+
+def _create(kind: str, cache: Dict[tuple, Any], service: str, region: Optional[str],
+            endpoint_url: Optional[str], overrides: Dict[str, Any]):
+    if service in _overrides:
+        return _overrides[service]
+    key = (service, region, endpoint_url, tuple(sorted(overrides.items())))
+    obj = cache.get(key)
+    if obj is not None:
+        return obj
+    with _lock:
+        obj = cache.get(key)
+        if obj is None:
+            boto3 = _import_boto3()
+            t0 = time.perf_counter()
+            factory = boto3.client if kind == "client" else boto3.resource
+            obj = factory(service, region_name=region, endpoint_url=endpoint_url,
+                          config=config_for(service, **overrides))
+            label = f"{kind}:{service}" + (f"@{region}" if region else "")
+            _cold_start["clients"][label] = round((time.perf_counter() - t0) * 1000, 2)
+            cache[key] = obj
+    return obj
+
+
+def client(service: str, region: Optional[str] = None, endpoint_url: Optional[str] = None, **overrides: Any):
+    """Client boto3 mis en cache par conteneur (créé au premier appel)."""
+    return _create("client", _clients, service, region, endpoint_url, overrides)
+
+
+def resource(service: str, region: Optional[str] = None, endpoint_url: Optional[str] = None, **overrides: Any):
+    """Ressource boto3 mise en cache par conteneur (créée au premier appel)."""
+    return _create("resource", _resources, service, region, endpoint_url, overrides)
+
+
+def table(name: str, endpoint_url: Optional[str] = None):
+    """Table DynamoDB (ressource) mise en cache par nom."""
+    key = (name, endpoint_url)
+    t = _tables.get(key)
+    if t is None:
+        t = resource("dynamodb", endpoint_url=endpoint_url).Table(name)
+        _tables[key] = t
+    return t
+
+
+def mark_loaded(module: str) -> None:
+    """À appeler en fin de module handler: durée d'import depuis le chargement de runtime."""
+    _cold_start["imports"][module] = round((time.perf_counter() - _LOADED_AT) * 1000, 2)
+
+
+def cold_start_report() -> Dict[str, Any]:
+    return {
+        "imports": dict(_cold_start["imports"]),
+        "clients": dict(_cold_start["clients"]),
+        "invocations": _invocations,
+    }
+
+
+def on_warmup(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Enregistre un préchargement exécuté à chaque ping de pré-chauffage (idempotent, sans écriture)."""
+    _warmers.append(fn)
+    return fn
+
+
+def after_invocation(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Enregistre une fonction exécutée à la fin de chaque invocation métier, avant la réponse
+    (erreurs journalisées): pas d'E/S synchrone, son temps s'ajoute à celui de l'invocation."""
+    _finalizers.append(fn)
+    return fn
+
+
+def invocation_ms() -> Optional[float]:
+    """Durée écoulée depuis le début de l'invocation en cours (None hors handler)."""
+    t0 = _started.get()
+    return None if t0 is None else round((time.perf_counter() - t0) * 1000, 2)
+
+
+def _finalize() -> None:
+    for fn in _finalizers:
+        try:
+            fn()
+        except Exception as e:
+            logger.warning(f"after_invocation {fn.__name__}: {type(e).__name__}: {e}")
+
+
+def is_warmup(event: Any) -> bool:
+    return isinstance(event, dict) and event.get("warmup") is True
+
+
+def _warm(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Exécute les préchargements; une erreur de préchargement ne fait jamais échouer le ping."""
+    t0 = time.perf_counter()
+    preloaded: Dict[str, Any] = {}
+    for fn in _warmers:
+        t1 = time.perf_counter()
+        try:
+            fn()
+            preloaded[fn.__name__] = round((time.perf_counter() - t1) * 1000, 2)
+        except Exception as e:
+            preloaded[fn.__name__] = f"{type(e).__name__}: {e}"
+    delay_ms = min(float(event.get("delayMs") or 0), WARMUP_MAX_DELAY_MS)
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000.0)
+    return {"warmup": True, "preloaded": preloaded, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+
+def handler(fn: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    """
+    Décore un lambda_handler: à la première invocation du conteneur, journalise une
+    ligne JSON `coldStart` (imports + init des clients créés pendant l'invocation).
+    Un ping {"warmup": true} est servi ici (préchargements) sans atteindre le handler.
+    """
+    @functools.wraps(fn)
+    def wrapper(event, context):
+        global _invocations
+        _invocations += 1
+        first = _invocations == 1
+        t0 = time.perf_counter()
+        token = _started.set(t0)
+        try:
+            if is_warmup(event):
+                return dict(_warm(event), coldStart=first)
+            return fn(event, context)
+        finally:
+            if not is_warmup(event):
+                _finalize()                 # invocation_ms() encore défini dans les fonctions de fin
+            _started.reset(token)
+            if first:
+                report = cold_start_report()
+                report.update({
+                    "coldStart": True,
+                    "warmup": is_warmup(event),
+                    "function": getattr(context, "function_name", fn.__module__),
+                    "initMs": round((t0 - _LOADED_AT) * 1000, 2),
+                    "firstInvocationMs": round((time.perf_counter() - t0) * 1000, 2),
+                })
+                logger.info(json.dumps(report))
+    return wrapper
@@ -0,0 +1,463 @@
+"""
+Simulateur local bout-en-bout du pipeline UC3 (orchestration Step Functions en processus).
+
+Responsabilité:
+- Exécuter la machine à états Classify → Verify → (AUTO ?) ValidateConsent →
+  GenerateContract → Signature → payment, sinon HITL (SNS back-office),
+  sur les VRAIS modules handlers
+- Brancher des faux backends (fakes.py): Bedrock, Lambda, DynamoDB, S3, SES, SNS, Stripe,
+  avec latence et taux d'échec injectés par backend
+- Rejouer un corpus JSONL de demandes clients avec une concurrence configurable
+  (pool de threads ou asyncio), en boucle fermée ou à débit d'arrivée fixe (--rps)
+- Rapporter débit bout-en-bout et par étape, délai de mise en file, latences p50/p90/p99
+  (par état et par sous-étape instrumentée via metrics.py)
+
+Corpus (une demande JSON par ligne, champs optionnels sauf text):
+{"text": "Je souhaite résilier mon contrat", "clientId": "C1",
+ "client": {"nom": "...", "prenom": "...", "email": "...", "adresse": "..."},
+ "offre": {"nomOffre": "Verte", "prixUnitaire": 0.21}, "amount": 49.9, "provider": "MOCK"}
+
+CLI:
+  python simulator.py --corpus demandes.jsonl --concurrency 16
+  python simulator.py --generate 500 --rps 20 --latency bedrock=800:3000 --latency ses=120::0.02
+  python simulator.py --generate 200 --mode asyncio --time-scale 0.05 --json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# Configuration des handlers (lue à l'import des modules)
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-3")
+os.environ.setdefault("CONSENTS_TABLE", "sim-consents")
+os.environ.setdefault("CONTRACTS_TABLE", "sim-contracts")
+os.environ.setdefault("PAYMENTS_TABLE", "sim-payments")
+os.environ.setdefault("REVIEW_TABLE", "sim-review")
+os.environ.setdefault("REQUESTS_TABLE", "sim-requests")
+os.environ.setdefault("MAIL_OUTBOX_TABLE", "sim-mail-outbox")
+os.environ.setdefault("SHADOW_TABLE", "sim-shadow")
+os.environ.setdefault("HITL_TOPIC_ARN", "arn:aws:sns:eu-west-3:000000000000:sim-back-office")
+os.environ.setdefault("BUCKET_NAME", "sim-contracts-pdf")
+os.environ.setdefault("LOGO_S3_BUCKET", "sim-contracts-pdf")
+os.environ.setdefault("SENDER_EMAIL", "noreply@sim.local")
+os.environ.setdefault("LINK_SECRET", "sim-link-secret")
+os.environ.setdefault("LINK_BASE_URL", "https://sim.local/contracts/link")
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_simulator")
+os.environ.setdefault("METRICS_ENABLED", "1")
+os.environ.setdefault("ANALYTICS_URI", "s3://sim-analytics/outcomes")
+os.environ.setdefault("ANALYTICS_BATCH", "100")
+
+import fakes
+import metrics
+import runtime
+
+import AnalyticsSink
+import Classify
+import GenerateContract
+import ContractMailer
+import HumanReview
+import RequestState
+import ShadowEval
+import ValidateConsent
+import Verify
+import payment
+
+AUTO_CONFIDENCE = 0.7
+
+# Latences par défaut (ms): médiane:p99:taux_échec
+DEFAULT_LATENCIES = {
+    "bedrock": "900:4000",
+    "lambda": "15:60",
+    "dynamodb": "6:25",
+    "s3": "25:120",
+    "ses": "80:400",
+    "sns": "20:80",
+    "stripe": "300:1500",
+    "signature": "0",
+}
+
+_SAMPLE_TEXTS = [
+    "Bonjour, je souhaite résilier mon contrat d'électricité suite à mon déménagement le 15 mars.",
+    "Je conteste ma dernière facture, le montant est trop élevé par rapport à ma consommation.",
+    "Je voudrais souscrire un nouveau contrat de gaz pour mon appartement à Lyon.",
+    "Mon compteur Linky affiche une erreur depuis hier, pouvez-vous intervenir ?",
+    "Je souhaite changer d'offre pour passer à l'offre verte à prix fixe.",
+    "Bonjour, j'emménage le mois prochain et souhaite ouvrir un contrat d'électricité.",
+    "Pouvez-vous m'indiquer les horaires de votre service client ?",
+]
+
+
+# Courriel réel typique: la demande, une signature, une mention légale et l'historique cité
+_EMAIL_TEMPLATE = """Bonjour,
+
+{body}
+
+Cordialement,
+{prenom} Dupont
+{i} rue de la Paix, 75002 Paris
+Tél : 06 12 34 56 78
+
+Envoyé de mon iPhone
+Ce message et toutes les pièces jointes sont confidentiels et établis à l'intention exclusive de ses destinataires.
+
+Le 12/02/2024 à 10:14, Service Client <service.client@energie.fr> a écrit :
+> Bonjour Madame, Monsieur,
+> Nous accusons bonne réception de votre demande et reviendrons vers vous dans les meilleurs délais.
+> Votre numéro de dossier est le 2024-{i}. Pour toute question, consultez notre espace client,
+> rubrique Aide, ou contactez nos conseillers du lundi au vendredi de 8h à 20h.
+> {history}
+> Bien cordialement,
+> Le Service Client
+"""
+
+
+def generate_corpus(n: int, seed: int = 7, email_ratio: float = 0.5) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        text = rng.choice(_SAMPLE_TEXTS)
+        if rng.random() < email_ratio:
+            history = " ".join(rng.choice(_SAMPLE_TEXTS) for _ in range(rng.randint(2, 12)))
+            text = _EMAIL_TEMPLATE.format(body=text, prenom=f"Client{i}", i=i, history=history)
+        corpus.append({
+            "text": text,
+            "clientId": f"C{10000 + i}",
+            "client": {"nom": "Dupont", "prenom": f"Client{i}", "email": f"client{i}@example.org",
+                       "adresse": f"{i} rue de la Paix, Paris"},
+            "offre": {"nomOffre": "Offre Verte", "prixUnitaire": 0.2146, "devise": "EUR"},
+            "amount": round(rng.uniform(30, 200), 2),
+            "provider": "STRIPE" if i % 4 == 0 else "MOCK",
+        })
+    return corpus
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _extract_stub(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Lambda d'extraction appelée par Verify: décide du niveau d'automatisation."""
+    text = event.get("text") or ""
+    classification = {}
+    marker = "---CLASSIFICATION---"
+    if marker in text:
+        try:
+            classification = json.loads(text.rsplit(marker, 1)[1].strip())
+        except ValueError:
+            classification = {}
+    confidence = float(classification.get("confidence") or 0)
+    grade = "AUTO" if confidence >= AUTO_CONFIDENCE else "MANUAL"
+    return {"response": {"automation_grade": grade, "category": classification.get("category"),
+                         "confidence": confidence}}
+
+
+class Simulation:
+    """Pipeline + faux backends; `run_request` exécute une demande de bout en bout."""
+
+    def __init__(self, latencies: Dict[str, str], time_scale: float = 1.0, seed: int = 42,
+                 bedrock_invalid_json: float = 0.0, bedrock_ms_per_token: float = 0.0, ses_rate: float = 0.0):
+        def lat(name):
+            return fakes.Latency.parse(latencies.get(name, "0"))
+
+        kw = {"time_scale": time_scale}
+        self.bedrock = fakes.FakeBedrock(latency=lat("bedrock"), seed=seed, invalid_json_rate=bedrock_invalid_json,
+                                        ms_per_input_token=bedrock_ms_per_token, **kw)
+        self.lambda_ = fakes.FakeLambda(latency=lat("lambda"), seed=seed + 1, **kw)
+        self.dynamodb = fakes.FakeDynamoResource(latency=lat("dynamodb"), seed=seed + 2, **kw)
+        self.dynamodb.indexes[HumanReview.TABLE_NAME] = {HumanReview.INDEX_NAME: ("gsi1pk", "gsi1sk")}
+        self.dynamodb.indexes[RequestState.TABLE_NAME] = {RequestState.INDEX_NAME: ("gsi1pk", "gsi1sk")}
+        self.s3 = fakes.FakeS3(latency=lat("s3"), seed=seed + 3, **kw)
+        self.ses = fakes.FakeSES(latency=lat("ses"), seed=seed + 4, max_send_rate=ses_rate, **kw)
+        self.sns = fakes.FakeSNS(latency=lat("sns"), seed=seed + 5, **kw)
+        self.stripe = fakes.FakeStripe(latency=lat("stripe"), seed=seed + 6, **kw)
+        self.signature = fakes.Backend(latency=lat("signature"), seed=seed + 7, **kw)
+
+        fakes.install(dynamodb=self.dynamodb, s3=self.s3, ses=self.ses, sns=self.sns,
+                      bedrock=self.bedrock, lambda_=self.lambda_)
+        payment._stripe_request = self.stripe
+
+        # Routage des invocations Lambda: Classify → Verify → extraction
+        self.lambda_.register("Verify", Verify.lambda_handler)
+        self.lambda_.register("Extract", _extract_stub)
+        self.lambda_.register(Classify.pipeline.shadow_function_name, ShadowEval.lambda_handler)
+        Classify.pipeline.lambda_b_name = "Verify"
+        Verify.pipeline.lambda_b_name = "Extract"
+
+        logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Logo.jpg")
+        if os.path.exists(logo_path):
+            with open(logo_path, "rb") as f:
+                self.s3.objects[(GenerateContract.DEFAULT_LOGO_BUCKET, GenerateContract.DEFAULT_LOGO_KEY)] = \
+                    {"Body": f.read()}
+
+        self._lock = threading.Lock()
+        self.state_timings: Dict[str, List[float]] = {}
+
+    def _state(self, name: str, fn: Callable[[Dict[str, Any], Any], Any], event: Dict[str, Any]) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return fn(event, None)
+        finally:
+            elapsed = (time.perf_counter() - t0) * 1000
+            with self._lock:
+                self.state_timings.setdefault(name, []).append(elapsed)
+
+    def _sign(self, request_id: str, contract_id: str, client_id: str) -> None:
+        """Signature DocuSign simulée: le webhook passe le contrat à SIGNED."""
+        self.signature._op("Sign")
+        runtime.table(payment.CONTRACTS_TABLE).put_item(Item={
+            "pk": f"CONTRACT#{contract_id}", "sk": "META", "status": "SIGNED", "clientId": client_id,
+        })
+
+    def run_request(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        """Exécute la machine à états pour une demande; retourne {"outcome", "error"?}."""
+        trace = {"traceId": uuid.uuid4().hex, "parentSpanId": uuid.uuid4().hex[:16]}
+        request_id = req.get("requestId") or f"REQ-{uuid.uuid4().hex[:10].upper()}"
+        client_id = req.get("clientId") or f"C{uuid.uuid4().hex[:6]}"
+        client = req.get("client") or {}
+
+        res = self._state("Classify", Classify.lambda_handler, {"requestId": request_id, "text": req["text"], "trace": trace})
+        if res.get("statusCode") != 200:
+            return {"outcome": "FAILED", "state": "Classify", "error": res.get("error")}
+        grade = ((res.get("lambdaB_response") or {}).get("lambdaB_response") or {}) \
+            .get("response", {}).get("automation_grade")
+
+        if grade != "AUTO":
+            classification = res.get("classification") or {}
+            self._state("HumanReview", HumanReview.lambda_handler,
+                        {"action": "enqueue", "requestId": request_id, "clientId": client_id,
+                         "category": classification.get("category"), "reason": "LOW_CONFIDENCE",
+                         "confidence": classification.get("confidence"), "summary": req["text"][:200],
+                         "trace": trace})
+            return {"outcome": "MANUAL_REVIEW"}
+
+        consent = {"accepted": True, "versionText": "v1.3", "locale": "fr-FR",
+                   "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+        res = self._state("ValidateConsent", ValidateConsent.lambda_handler,
+                          {"requestId": request_id, "clientId": client_id, "consent": consent, "trace": trace})
+        if not res.get("ok"):
+            return {"outcome": "FAILED", "state": "ValidateConsent", "error": res.get("error")}
+
+        contract_id = f"CTR-{request_id}"
+        res = self._state("GenerateContract", GenerateContract.lambda_handler,
+                          {"requestId": request_id, "contratId": contract_id, "client": client,
+                           "offre": req.get("offre") or {},
+                           "conditions": req.get("conditions", ""), "trace": trace})
+        if res.get("statusCode") != 200:
+            return {"outcome": "FAILED", "state": "GenerateContract", "error": res.get("body")}
+
+        self._state("Signature", lambda e, c: self._sign(request_id, contract_id, client_id), {})
+
+        res = self._state("payment", payment.lambda_handler,
+                          {"requestId": request_id, "contractId": contract_id, "client": {"id": client_id, **client},
+                           "amount": req.get("amount", 49.9), "currency": req.get("currency", "EUR"),
+                           "provider": req.get("provider", "MOCK"), "trace": trace})
+        if not res.get("ok"):
+            return {"outcome": "FAILED", "state": "payment", "error": res.get("error")}
+        return {"outcome": "COMPLETED"}
+
+
+def _run_one(sim: Simulation, req: Dict[str, Any], arrival: float) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        result = sim.run_request(req)
+    except Exception as e:  # une exception non gérée d'un handler = échec de l'exécution
+        result = {"outcome": "FAILED", "state": "?", "error": f"{type(e).__name__}: {e}"}
+    end = time.perf_counter()
+    result.update({"queueMs": (start - arrival) * 1000, "latencyMs": (end - arrival) * 1000,
+                   "serviceMs": (end - start) * 1000})
+    return result
+
+
+def run_threads(sim: Simulation, corpus: List[Dict[str, Any]], concurrency: int,
+                rps: Optional[float]) -> List[Dict[str, Any]]:
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        for i, req in enumerate(corpus):
+            arrival = t0 + (i / rps if rps else 0.0)
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(_run_one, sim, req, arrival))
+        return [f.result() for f in futures]
+
+
+def run_asyncio(sim: Simulation, corpus: List[Dict[str, Any]], concurrency: int,
+                rps: Optional[float]) -> List[Dict[str, Any]]:
+    async def main():
+        sem = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        t0 = time.perf_counter()
+
+        async def one(i, req):
+            arrival = t0 + (i / rps if rps else 0.0)
+            await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+            async with sem:
+                return await loop.run_in_executor(executor, _run_one, sim, req, arrival)
+
+        try:
+            return await asyncio.gather(*(one(i, r) for i, r in enumerate(corpus)))
+        finally:
+            executor.shutdown(wait=False)
+
+    return asyncio.run(main())
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    h = metrics.Histogram()
+    for v in values:
+        h.add(v)
+    return h.summary()
+
+
+def build_report(sim: Simulation, results: List[Dict[str, Any]], wall_s: float,
+                 emf_lines: List[str]) -> Dict[str, Any]:
+    outcomes: Dict[str, int] = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["outcome"] == "FAILED":
+            key = f"{r.get('state')}: {str(r.get('error'))[:80]}"
+            errors[key] = errors.get(key, 0) + 1
+    states = {name: dict(_summary(v), throughput=round(len(v) / wall_s, 2))
+              for name, v in sim.state_timings.items()}
+    request_states: Dict[str, int] = {}
+    for (_, sk), item in sim.dynamodb.Table(RequestState.TABLE_NAME).items.items():
+        if sk == RequestState.STATE_SK:
+            request_states[item["status"]] = request_states.get(item["status"], 0) + 1
+    stages = {key: {name: h.summary() for name, h in hists.items() if name == "Duration"}
+              for key, hists in metrics.collect(emf_lines).items()}
+    return {
+        "requests": len(results),
+        "wallSec": round(wall_s, 3),
+        "throughputRps": round(len(results) / wall_s, 2) if wall_s else 0.0,
+        "outcomes": outcomes,
+        "requestStates": request_states,
+        "errors": errors,
+        "endToEndMs": _summary([r["latencyMs"] for r in results]),
+        "queueMs": _summary([r["queueMs"] for r in results]),
+        "states": states,
+        "stages": {k: v["Duration"] for k, v in stages.items() if "Duration" in v},
+        "backendCalls": {
+            "bedrock": sim.bedrock.calls, "lambda": sim.lambda_.calls, "s3": sim.s3.calls,
+            "ses": sim.ses.calls, "sns": sim.sns.calls, "stripe": sim.stripe.calls,
+            "dynamodb": {n: t.calls for n, t in sim.dynamodb.tables.items()},
+        },
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"Demandes: {report['requests']}  durée: {report['wallSec']} s  débit: {report['throughputRps']} req/s")
+    print(f"Issues: {report['outcomes']}")
+    print(f"Statuts (RequestState): {report['requestStates']}")
+    if report.get("mail"):
+        print(f"Courriels (ContractMailer): {report['mail']}")
+    if report.get("analytics"):
+        print(f"Analytique (AnalyticsSink): {report['analytics']}")
+    for err, n in report["errors"].items():
+        print(f"  échec x{n}: {err}")
+
+    def row(name, s, extra=""):
+        print(f"  {name:42} n={s['count']:<6} p50={s['p50']:>9} p90={s['p90']:>9} "
+              f"p99={s['p99']:>9} max={s['max']:>9}{extra}")
+
+    print("Bout-en-bout (ms):")
+    row("latence (arrivée → fin)", report["endToEndMs"])
+    row("attente en file", report["queueMs"])
+    print("États Step Functions (ms):")
+    for name, s in report["states"].items():
+        row(name, s, f"  {s['throughput']} /s")
+    print("Sous-étapes instrumentées (ms):")
+    for name in sorted(report["stages"]):
+        row(name, report["stages"][name])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Simulateur local du pipeline UC3")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--corpus", help="Fichier JSONL de demandes clients")
+    src.add_argument("--generate", type=int, default=100, help="Générer N demandes synthétiques")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("threads", "asyncio"), default="threads")
+    parser.add_argument("--rps", type=float, help="Débit d'arrivée (boucle ouverte); défaut: tout à t0")
+    parser.add_argument("--latency", action="append", default=[],
+                        help="backend=médiane[:p99[:taux_échec]] (ms), ex: bedrock=800:3000:0.01")
+    parser.add_argument("--bedrock-invalid-json", type=float, default=0.0, help="Taux de sorties LLM non JSON")
+    parser.add_argument("--bedrock-ms-per-token", type=float, default=0.3,
+                        help="Prefill Bedrock par token d'entrée (ms), s'ajoute à la latence injectée")
+    parser.add_argument("--ses-rate", type=float, default=0.0,
+                        help="Débit SES max (messages/s) du faux SES; 0: illimité")
+    parser.add_argument("--shadow-rate", type=float, default=0.0,
+                        help="Part des demandes rejouées en ombre (ShadowEval) après Classify")
+    parser.add_argument("--emf-out", help="Écrire les lignes EMF capturées (pour prompt_budget.py compare)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Facteur appliqué aux latences injectées")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Rapport JSON")
+    parser.add_argument("--verbose", action="store_true", help="Conserver les logs INFO des handlers")
+    args = parser.parse_args(argv)
+
+    latencies = dict(DEFAULT_LATENCIES)
+    for spec in args.latency:
+        name, _, value = spec.partition("=")
+        if name not in latencies:
+            parser.error(f"backend inconnu: {name} (attendu: {', '.join(latencies)})")
+        latencies[name] = value
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    emf_lines: List[str] = []
+    metrics.set_sink(emf_lines.append)
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.generate, args.seed)
+    Classify.pipeline.shadow_rate = args.shadow_rate
+    sim = Simulation(latencies, time_scale=args.time_scale, seed=args.seed,
+                     bedrock_invalid_json=args.bedrock_invalid_json,
+                     bedrock_ms_per_token=args.bedrock_ms_per_token, ses_rate=args.ses_rate)
+
+    t0 = time.perf_counter()
+    runner = run_asyncio if args.mode == "asyncio" else run_threads
+    results = runner(sim, corpus, max(1, args.concurrency), args.rps)
+    wall = time.perf_counter() - t0
+    # Flush planifié des notifications back-office accumulées pendant le run
+    sim._state("HumanReviewFlush", HumanReview.lambda_handler, {"action": "flush"})
+    # Dispatch planifié des courriels de contrats déposés en boîte d'envoi
+    mail = sim._state("ContractMailerDispatch", ContractMailer.lambda_handler, {"action": "dispatch"})
+    # Invocations asynchrones (Event) encore en cours: évaluations en ombre
+    Classify.pipeline.drain()
+    Verify.pipeline.drain()
+    sim.lambda_.drain()
+    # Puits analytique: vidage des tampons puis compaction du jour
+    AnalyticsSink.flush()
+    analytics = sim._state("AnalyticsCompact", AnalyticsSink.lambda_handler,
+                           {"action": "compact", "day": datetime.now(timezone.utc).strftime("%Y-%m-%d")})
+
+    if args.emf_out:
+        with open(args.emf_out, "w", encoding="utf-8") as f:
+            f.write("\n".join(emf_lines) + "\n")
+    report = build_report(sim, results, wall, emf_lines)
+    report["mail"] = {k: mail.get(k) for k in ("sent", "retried", "failed", "calls", "throttledMs")}
+    report["analytics"] = {k: analytics.get(k) for k in ("partitions", "filesIn", "filesOut", "rows", "bytesOut")}
+    if args.shadow_rate:
+        report["shadow"] = ShadowEval.report(ShadowEval.read_pairs(ShadowEval.CANDIDATE))
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        _print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Puits analytique (AnalyticsSink.py): vidage par partition et compaction dédoublonnée."""
+
+import pytest
+
+import AnalyticsSink
+
+
+@pytest.fixture
+def sink(tmp_path, monkeypatch):
+    monkeypatch.setattr(AnalyticsSink, "URI", str(tmp_path))
+    monkeypatch.setattr(AnalyticsSink, "BATCH", 1000)
+    AnalyticsSink.flush()
+    return AnalyticsSink._Store(str(tmp_path))
+
+
+def _rows(store, day=None):
+    out = []
+    for rel, _ in sorted(store.list()):
+        if day is None or f"/day={day}/" in f"/{rel}":
+            out.extend(AnalyticsSink.decode(store.get(rel), rel))
+    return out
+
+
+def _row(event_id, stage="payment", ts=1_738_281_600_000, **fields):       # 2025-01-31
+    row = {name: None for name in AnalyticsSink._NAMES}
+    row.update(eventId=event_id, ts=ts, stage=stage, requestId=f"r-{event_id}", **fields)
+    return row
+
+
+def _write(store, rel_dir, rows):
+    fmt = AnalyticsSink._format()
+    store.put(f"{rel_dir}/part-{rows[0]['eventId']}.{AnalyticsSink._EXT[fmt]}", AnalyticsSink.encode(rows, fmt))
+
+
+def test_flush_writes_one_file_per_stage_and_day(sink):
+    AnalyticsSink.record("classify", "r1", category="RESILIATION", confidence="0.93", pdfBytes="oops")
+    AnalyticsSink.record("classify", "r2", category="RECLAMATION", confidence=0.5)
+    AnalyticsSink.record("payment", "r1", status="PAID", paymentStatus="succeeded")
+    assert AnalyticsSink.flush() == 3
+    files = [rel for rel, _ in sink.list()]
+    assert len(files) == 2
+    assert {rel.split("/")[0] for rel in files} == {"stage=classify", "stage=payment"}
+    rows = {r["requestId"] + r["stage"]: r for r in _rows(sink)}
+    assert rows["r1classify"]["confidence"] == 0.93
+    assert rows["r1classify"]["pdfBytes"] is None                       # valeur non convertible
+    assert rows["r1payment"]["status"] == "PAID"
+    assert AnalyticsSink.flush() == 0
+
+
+def test_full_buffer_is_flushed_in_the_background(sink, monkeypatch):
+    monkeypatch.setattr(AnalyticsSink, "BATCH", 5)
+    for i in range(12):
+        AnalyticsSink.record("classify", f"r{i}")
+    assert len(sink.list()) <= 2                 # au plus 2 vidages d'arrière-plan, aucun du reste (< 5)
+    # flush() attend le vidage d'arrière-plan en cours puis écrit le reste
+    AnalyticsSink.flush()
+    assert sorted(r["requestId"] for r in _rows(sink)) == sorted(f"r{i}" for i in range(12))
+    assert AnalyticsSink._buffer == []
+
+
+def test_compaction_merges_and_deduplicates_on_event_id(sink):
+    part = "stage=payment/day=2025-01-31"
+    _write(sink, part, [_row("a", ts=3), _row("b", ts=1)])
+    _write(sink, part, [_row("b", ts=1), _row("c", ts=2)])
+    _write(sink, "stage=classify/day=2025-01-31", [_row("d", stage="classify")])
+    _write(sink, "stage=payment/day=2025-02-01", [_row("e"), _row("f")])
+    _write(sink, "stage=payment/day=2025-02-01", [_row("g")])
+
+    out = AnalyticsSink.compact("2025-01-31", str(sink.root))
+    assert (out["partitions"], out["filesIn"], out["filesOut"]) == (2, 2, 1)
+    assert (out["rows"], out["duplicates"]) == (3, 1)
+    files = [rel for rel, _ in sink.list() if rel.startswith(part)]
+    assert len(files) == 1 and files[0].split("/")[-1].startswith("compacted-")
+    assert [r["eventId"] for r in _rows(sink, "2025-01-31") if r["stage"] == "payment"] == ["b", "c", "a"]
+    assert len([rel for rel, _ in sink.list() if "day=2025-02-01" in rel]) == 2      # autre jour intact
+
+
+def test_compaction_rerun_after_interruption_produces_no_duplicates(sink):
+    part = "stage=payment/day=2025-01-31"
+    _write(sink, part, [_row("a"), _row("b")])
+    _write(sink, part, [_row("c")])
+    AnalyticsSink.compact("2025-01-31", str(sink.root))
+    # Compaction interrompue avant la suppression des sources: elles réapparaissent
+    _write(sink, part, [_row("a"), _row("b")])
+    out = AnalyticsSink.compact("2025-01-31", str(sink.root))
+    assert (out["rows"], out["duplicates"]) == (3, 2)
+    assert sorted(r["eventId"] for r in _rows(sink, "2025-01-31")) == ["a", "b", "c"]
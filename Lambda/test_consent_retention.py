@@ -0,0 +1,75 @@
+"""Purge de rétention RGPD (ConsentRetention.py): modes DELETE et TTL, dry-run et export d'audit."""
+
+import gzip
+import json
+
+import pytest
+
+import ConsentRetention
+
+TABLE = "test-consents"
+TODAY = "2026-10-18"
+
+
+@pytest.fixture
+def consents(aws):
+    table = aws["dynamodb"].Table(TABLE)
+    for i in range(30):
+        table.put_item(Item={"pk": f"CLIENT#{i:02d}", "sk": f"CONSENT#{i:02d}", "clientId": f"C{i:02d}",
+                             "retentionUntil": "2026-01-01" if i % 2 else "2031-01-01"})
+    table.put_item(Item={"pk": "LEDGER#2026-01-01", "sk": "ROOT", "root": "ab" * 32})
+    return table
+
+
+def _run(**kw):
+    return ConsentRetention.run(TABLE, segments=4, threads=2, today=TODAY, **kw)
+
+
+def _exported(data):
+    return [json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines()]
+
+
+def test_delete_mode_purges_expired_consents_and_exports_the_others(consents, tmp_path):
+    report = _run(mode="DELETE", export_target=str(tmp_path))
+    assert (report["scanned"], report["expired"], report["deleted"], report["exported"]) == (31, 15, 15, 15)
+    assert report["unprocessed"] == 0 and report["ttlSet"] == 0
+    assert len(consents.items) == 16
+    assert consents.get_item(Key={"pk": "LEDGER#2026-01-01", "sk": "ROOT"})["Item"]["root"] == "ab" * 32
+
+    assert report["exportKey"] == str(tmp_path / f"consents-{TODAY}.jsonl.gz")
+    with open(report["exportKey"], "rb") as f:
+        rows = _exported(f.read())
+    assert len(rows) == 15 and all(r["retentionUntil"] == "2031-01-01" for r in rows)
+
+
+def test_export_to_s3_goes_through_a_multipart_upload(consents, aws):
+    report = _run(mode="delete", export_target="s3://audit-bucket/consents/")
+    assert report["mode"] == "DELETE" and report["deleted"] == 15
+    assert report["exportKey"] == f"s3://audit-bucket/consents/consents-{TODAY}.jsonl.gz"
+    body = aws["s3"].get_object(Bucket="audit-bucket", Key=f"consents/consents-{TODAY}.jsonl.gz")["Body"].read()
+    assert len(body) == report["exportBytes"]
+    assert sorted(r["clientId"] for r in _exported(body)) == [f"C{i:02d}" for i in range(0, 30, 2)]
+
+
+def test_ttl_mode_sets_the_native_ttl_attribute_without_deleting(consents):
+    report = _run(mode="TTL")
+    assert (report["expired"], report["deleted"], report["ttlSet"]) == (15, 0, 30)
+    item = consents.get_item(Key={"pk": "CLIENT#01", "sk": "CONSENT#01"})["Item"]
+    assert item[ConsentRetention.TTL_ATTRIBUTE] == ConsentRetention.ttl_epoch("2026-01-01")
+    ledger = consents.get_item(Key={"pk": "LEDGER#2026-01-01", "sk": "ROOT"})["Item"]
+    assert ConsentRetention.TTL_ATTRIBUTE not in ledger
+    assert _run(mode="TTL")["ttlSet"] == 0
+
+
+@pytest.mark.parametrize("mode", ["DELETE", "TTL"])
+def test_dry_run_changes_nothing(consents, tmp_path, mode):
+    before = {k: dict(v) for k, v in consents.items.items()}
+    report = _run(mode=mode, dry_run=True, export_target=str(tmp_path))
+    assert report["expired"] == 15 and report["exported"] == 15
+    assert report["deleted"] == 0 and report["ttlSet"] == 0
+    assert consents.items == before
+
+
+def test_unknown_mode_is_refused(consents):
+    with pytest.raises(ValueError):
+        _run(mode="ARCHIVE")
@@ -0,0 +1,79 @@
+"""Liens permanents signés (ContractLink.py): vérification des jetons et réponses HTTP."""
+
+import json
+
+import pytest
+
+import ContractLink
+
+
+@pytest.fixture
+def secrets(monkeypatch):
+    monkeypatch.setattr(ContractLink, "SECRETS", ["current-secret", "previous-secret"])
+    monkeypatch.setattr(ContractLink, "MAX_AGE_DAYS", 0)
+    return ContractLink.SECRETS
+
+
+def _reason(token):
+    with pytest.raises(ContractLink.InvalidToken) as exc:
+        ContractLink.verify(token)
+    return str(exc.value)
+
+
+def test_round_trip(secrets):
+    token = ContractLink.issue("CTR-1", "contracts/CTR-1.pdf")
+    assert ContractLink.verify(token) == {"c": "CTR-1", "k": "contracts/CTR-1.pdf"}
+    assert token == ContractLink.issue("CTR-1", "contracts/CTR-1.pdf")
+
+
+def test_token_signed_with_the_previous_secret_stays_valid(secrets, monkeypatch):
+    monkeypatch.setattr(ContractLink, "SECRETS", ["previous-secret"])
+    token = ContractLink.issue("CTR-2", "k.pdf")
+    monkeypatch.setattr(ContractLink, "SECRETS", secrets)
+    assert ContractLink.verify(token)["c"] == "CTR-2"
+    monkeypatch.setattr(ContractLink, "SECRETS", ["current-secret"])
+    assert _reason(token) == "UNKNOWN_KEY"
+
+
+def test_tampered_payload_or_signature(secrets):
+    kid, payload, sig = ContractLink.issue("CTR-3", "k.pdf").split(".")
+    other = ContractLink._b64(json.dumps({"c": "CTR-4", "k": "k.pdf"}).encode())
+    assert _reason(f"{kid}.{other}.{sig}") == "BAD_SIGNATURE"
+    flipped = sig[:-1] + ("B" if sig.endswith("A") else "A")
+    assert _reason(f"{kid}.{payload}.{flipped}") == "BAD_SIGNATURE"
+
+
+@pytest.mark.parametrize("token", [None, "", "a.b", "a.b.c.d", 42])
+def test_malformed_tokens(secrets, token):
+    assert _reason(token) == "MALFORMED"
+
+
+def test_non_ascii_segments_are_rejected_not_crashing(secrets):
+    kid, payload, sig = ContractLink.issue("CTR-5", "k.pdf").split(".")
+    assert _reason(f"{kid}.{payload}.é{sig[1:]}") == "BAD_SIGNATURE"
+    assert _reason(f"{kid}.{payload}é.{sig}") == "BAD_SIGNATURE"
+    assert _reason(f"é{kid}.{payload}.{sig}") == "UNKNOWN_KEY"
+
+
+def test_signed_payload_that_is_not_claims(secrets):
+    kid = ContractLink._kid(secrets[0])
+    for raw in (b"[1, 2]", b"not json", b'{"c": "CTR-6"}'):
+        payload = ContractLink._b64(raw)
+        token = f"{kid}.{payload}.{ContractLink._sign(secrets[0], kid, payload)}"
+        assert _reason(token) == "MALFORMED"
+
+
+def test_expiry(secrets, monkeypatch):
+    monkeypatch.setattr(ContractLink, "MAX_AGE_DAYS", 1)
+    token = ContractLink.issue("CTR-7", "k.pdf", now=1_000_000)
+    assert ContractLink.verify(token, now=1_000_000 + 3600)["c"] == "CTR-7"
+    with pytest.raises(ContractLink.InvalidToken, match="EXPIRED"):
+        ContractLink.verify(token, now=1_000_000 + 2 * 86400)
+
+
+def test_handler_answers_403_for_a_forged_link(secrets, aws):
+    kid, payload, sig = ContractLink.issue("CTR-8", "k.pdf").split(".")
+    resp = ContractLink.lambda_handler({"pathParameters": {"token": f"{kid}.{payload}.ï{sig[1:]}"}}, None)
+    assert resp["statusCode"] == 403
+    resp = ContractLink.lambda_handler({"pathParameters": {"token": f"{kid}.{payload}.{sig}"}}, None)
+    assert resp["statusCode"] == 302
@@ -0,0 +1,59 @@
+"""Seau à jetons du débit d'envoi SES (ContractMailer.TokenBucket), sur une horloge simulée."""
+
+import pytest
+
+from ContractMailer import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, s):
+        self.slept.append(s)
+        self.now += s
+
+
+def _bucket(rate, burst=None):
+    clock = Clock()
+    return TokenBucket(rate, burst, clock=clock, sleep=clock.sleep), clock
+
+
+def test_burst_is_served_without_waiting():
+    bucket, clock = _bucket(14)
+    assert bucket.acquire(14) == 0.0
+    assert clock.slept == []
+
+
+def test_waits_for_missing_tokens_at_the_configured_rate():
+    bucket, clock = _bucket(10)
+    bucket.acquire(10)
+    assert bucket.acquire(5) == pytest.approx(0.5)
+    clock.now += 1.0
+    assert bucket.acquire(10) == pytest.approx(0.0)
+
+
+def test_refill_is_capped_by_capacity():
+    bucket, clock = _bucket(10, burst=20)
+    bucket.acquire(20)
+    clock.now += 60
+    assert bucket.acquire(20) == 0.0
+    assert bucket.acquire(10) == pytest.approx(1.0)
+
+
+def test_request_larger_than_capacity_is_taken_in_slices():
+    bucket, clock = _bucket(10)
+    assert bucket.acquire(35) == pytest.approx(2.5)
+    assert len(clock.slept) == 3
+    assert clock.now == pytest.approx(2.5)
+
+
+def test_fractional_rate_has_a_capacity_of_one():
+    bucket, _ = _bucket(0.5)
+    assert bucket.capacity == 1.0
+    bucket.acquire(1)
+    assert bucket.acquire(1) == pytest.approx(2.0)
@@ -0,0 +1,122 @@
+"""Requêtes couvertes (hedging.Hedger): échéance, budget, échecs et mesures du perdant."""
+
+import threading
+import time
+
+import pytest
+
+import hedging
+
+PRIMARY = hedging.Target("eu-west-3", "m")
+BACKUP = hedging.Target("eu-west-1", "m")
+
+
+def _call(delays, fail=()):
+    """Cible → délai (s); les cibles de `fail` renvoient une erreur après ce délai."""
+    def call(target, payload):
+        time.sleep(delays[target.region])
+        if target.region in fail:
+            return None, f"{target.region} failed"
+        return {"from": target.region, "payload": payload}, None
+    return call
+
+
+def _hedger(call, **kw):
+    kw.setdefault("initial_delay_ms", 20)
+    kw.setdefault("max_rate", 1.0)
+    return hedging.Hedger([PRIMARY, BACKUP], call, **kw)
+
+
+def test_fast_primary_is_not_hedged():
+    h = _hedger(_call({"eu-west-3": 0.0, "eu-west-1": 0.0}))
+    out = h.run("x")
+    assert out.value == {"from": "eu-west-3", "payload": "x"}
+    assert (out.target, out.hedged) == (PRIMARY, False)
+    assert h.stats()["primaryWins"] == 1 and h.stats()["hedged"] == 0
+
+
+def test_slow_primary_is_hedged_after_the_deadline():
+    h = _hedger(_call({"eu-west-3": 0.3, "eu-west-1": 0.0}))
+    out = h.run("x")
+    assert (out.target, out.hedged) == (BACKUP, True)
+    assert out.elapsed_ms < 250
+    assert h.stats()["hedgeWins"] == 1
+
+
+def test_failed_primary_hedges_immediately():
+    h = _hedger(_call({"eu-west-3": 0.0, "eu-west-1": 0.0}, fail=("eu-west-3",)), initial_delay_ms=5000)
+    out = h.run("x")
+    assert (out.target, out.hedged) == (BACKUP, True)
+    assert out.elapsed_ms < 1000
+
+
+def test_both_failing_returns_the_last_error():
+    h = _hedger(_call({"eu-west-3": 0.0, "eu-west-1": 0.0}, fail=("eu-west-3", "eu-west-1")))
+    out = h.run("x")
+    assert out.value is None and out.error == "eu-west-1 failed" and out.hedged
+    assert h.stats()["bothFailed"] == 1
+
+
+def test_exceptions_count_as_failures():
+    def call(target, payload):
+        if target == PRIMARY:
+            raise RuntimeError("boom")
+        return {"ok": True}, None
+    out = _hedger(call).run("x")
+    assert out.target == BACKUP
+
+
+def test_budget_limits_the_hedge_rate():
+    h = _hedger(_call({"eu-west-3": 0.0, "eu-west-1": 0.0}, fail=("eu-west-3",)), max_rate=0.1, window=20)
+    outcomes = [h.run(i) for i in range(20)]
+    assert sum(o.hedged for o in outcomes) == 2
+    assert h.stats()["budgetSkipped"] == 18
+
+
+def test_deadline_follows_the_primary_percentile():
+    h = _hedger(_call({"eu-west-3": 0.0, "eu-west-1": 0.0}), initial_delay_ms=2000, min_delay_ms=10,
+                max_delay_ms=500, min_samples=5)
+    assert h.deadline_ms() == 2000
+    for ms in (40, 50, 60, 70, 80):
+        h.trackers[PRIMARY].add(ms)
+    assert h.deadline_ms() == 80
+    h.trackers[PRIMARY].add(10_000)
+    assert h.deadline_ms() == 500
+
+
+def test_loser_still_running_is_recorded_as_a_censored_sample():
+    release = threading.Event()
+
+    def call(target, payload):
+        if target == PRIMARY:
+            release.wait(2)
+        return {"from": target.region}, None
+
+    h = _hedger(call)
+    out = h.run("x")
+    assert out.target == BACKUP
+    primary = h.trackers[PRIMARY]
+    assert len(primary) == 1
+    censored = primary.percentile(1.0)
+    assert 20 <= censored <= out.elapsed_ms + 5
+    # La fin tardive du perdant (gel / dégel de l'invocation) n'ajoute pas de mesure
+    release.set()
+    time.sleep(0.05)
+    assert len(primary) == 1 and primary.percentile(1.0) == censored
+
+
+def test_latency_tracker_percentile():
+    tracker = hedging.LatencyTracker(window=4)
+    assert tracker.percentile(0.5) is None
+    for ms in (1, 2, 3, 4, 5):
+        tracker.add(ms)
+    assert len(tracker) == 4
+    assert tracker.percentile(0.5) == 3
+    assert tracker.percentile(1.0) == 5
+
+
+def test_target_parse():
+    assert hedging.Target.parse("eu-west-1", "eu-west-3", "m") == hedging.Target("eu-west-1", "m")
+    assert hedging.Target.parse("/other", "eu-west-3", "m") == hedging.Target("eu-west-3", "other")
+    with pytest.raises(ValueError):
+        hedging.Hedger([], lambda t: (None, None))
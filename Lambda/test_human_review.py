@@ -0,0 +1,76 @@
+"""File de revue humaine (HumanReview.py): mise en file transactionnelle, publication et flush."""
+
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import HumanReview
+import fakes
+
+
+@pytest.fixture
+def sns(aws, monkeypatch):
+    monkeypatch.setattr(HumanReview, "TABLE_NAME", "test-review")
+    monkeypatch.setattr(HumanReview, "TOPIC_ARN", "arn:aws:sns:eu-west-3:000000000000:hitl")
+    return fakes.install(sns=fakes.FakeSNS())["sns"]
+
+
+def _outbox(aws):
+    table = aws["dynamodb"].Table("test-review")
+    return [it for (pk, _), it in sorted(table.items.items()) if pk == HumanReview.OUTBOX_PK]
+
+
+def _throttled(*_, **__):
+    raise ClientError({"Error": {"Code": "Throttling", "Message": "Rate exceeded"}}, "Publish")
+
+
+def test_review_and_outbox_entry_are_written_together(aws, sns):
+    out = HumanReview.enqueue({"requestId": "R1", "category": "reclamation", "confidence": 0.42})
+    assert out == {"ok": True, "queued": True, "notified": "batched"}
+    review = aws["dynamodb"].Table("test-review").get_item(Key={"pk": "REVIEW#R1", "sk": "META"})["Item"]
+    assert [it["sk"] for it in _outbox(aws)] == [review["outboxSk"]]
+    assert HumanReview.enqueue({"requestId": "R1"})["notified"] == "duplicate"
+    assert len(_outbox(aws)) == 1
+
+
+def test_priority_is_published_at_once_and_leaves_no_outbox_entry(aws, sns):
+    assert HumanReview.enqueue({"requestId": "R2", "priority": True})["notified"] == "immediate"
+    assert sns.published[0]["Subject"].startswith("[PRIORITAIRE]")
+    assert _outbox(aws) == []
+    assert HumanReview.flush()["published"] == 0
+
+
+def test_throttled_priority_publish_is_not_lost_on_retry(aws, sns, monkeypatch):
+    event = {"requestId": "R3", "priority": True, "category": "RESILIATION"}
+    with monkeypatch.context() as m:
+        m.setattr(sns, "publish", _throttled)
+        assert HumanReview.enqueue(event)["notified"] == "batched"
+        assert HumanReview.enqueue(event)["notified"] == "duplicate"
+
+    out = HumanReview.flush(mode="digest")
+    assert (out["published"], out["messages"], out["failed"]) == (1, 1, 0)
+    msg = sns.published[0]
+    assert msg["Subject"] == "[PRIORITAIRE] RESILIATION - R3"
+    assert msg["MessageAttributes"]["priority"]["StringValue"] == "true"
+    assert _outbox(aws) == []
+
+
+def test_flush_publishes_priority_entries_first_and_never_in_a_digest(aws, sns, monkeypatch):
+    for rid in ("R4", "R5"):
+        HumanReview.enqueue({"requestId": rid, "category": "RECLAMATION", "reason": "LOW_CONFIDENCE"})
+    with monkeypatch.context() as m:
+        m.setattr(sns, "publish", _throttled)
+        HumanReview.enqueue({"requestId": "R6", "priority": True, "category": "RECLAMATION"})
+
+    out = HumanReview.flush(mode="digest")
+    assert (out["published"], out["messages"]) == (3, 2)
+    assert json.loads(sns.published[0]["Message"])["requestId"] == "R6"
+    assert json.loads(sns.published[1]["Message"])["requestIds"] == ["R4", "R5"]
+
+
+def test_resolved_before_flush_is_not_notified(aws, sns):
+    HumanReview.enqueue({"requestId": "R7"})
+    assert HumanReview.resolve("R7", "approved", agent="jdoe")["status"] == "APPROVED"
+    assert _outbox(aws) == []
+    assert HumanReview.flush()["published"] == 0
@@ -0,0 +1,61 @@
+"""Preuves d'inclusion Merkle (merkle.py): chemins unitaires et vérification par lot."""
+
+import hashlib
+
+import pytest
+
+import merkle
+
+
+def _proofs(n):
+    hash_proofs = [f"sha256:{hashlib.sha256(str(i).encode()).hexdigest()}" for i in range(n)]
+    levels = merkle.build_levels([merkle.leaf_hash(h) for h in hash_proofs])
+    root = levels[-1][0].hex()
+    proofs = [{"hashProof": h, "index": i, "size": n, "path": merkle.inclusion_path(levels, i)}
+              for i, h in enumerate(hash_proofs)]
+    return proofs, root
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 7, 8, 33])
+def test_every_leaf_proves_inclusion(n):
+    proofs, root = _proofs(n)
+    for p in proofs:
+        assert merkle.verify_inclusion(p["hashProof"], p["index"], p["size"], p["path"], root)
+
+
+def test_inclusion_rejects_wrong_index_leaf_or_path():
+    proofs, root = _proofs(7)
+    p = proofs[3]
+    assert not merkle.verify_inclusion(p["hashProof"], 4, 7, p["path"], root)
+    assert not merkle.verify_inclusion(proofs[2]["hashProof"], 3, 7, p["path"], root)
+    assert not merkle.verify_inclusion(p["hashProof"], 3, 7, p["path"][:-1], root)
+    assert not merkle.verify_inclusion(p["hashProof"], 3, 7, p["path"] + [p["path"][0]], root)
+    assert not merkle.verify_inclusion(p["hashProof"], 7, 7, p["path"], root)
+
+
+def test_empty_tree_is_refused():
+    with pytest.raises(ValueError):
+        merkle.build_levels([])
+
+
+def test_batch_verification_matches_single_proofs():
+    proofs, root = _proofs(33)
+    ok, failed = merkle.verify_batch(proofs, root)
+    assert (ok, failed) == (33, [])
+
+
+def test_batch_reports_tampered_proofs_without_poisoning_the_others():
+    proofs, root = _proofs(16)
+    forged = dict(proofs[5], path=list(proofs[5]["path"]))
+    forged["path"][0] = "00" * 32
+    missing = {"index": 2, "size": 16}
+    ok, failed = merkle.verify_batch([proofs[4], forged, missing] + proofs[6:], root)
+    assert ok == 11
+    assert failed == [forged, missing]
+
+
+def test_batch_against_another_root_fails_everything():
+    proofs, _ = _proofs(8)
+    _, other_root = _proofs(9)
+    ok, failed = merkle.verify_batch(proofs, other_root)
+    assert ok == 0 and len(failed) == 8
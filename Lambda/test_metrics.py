@@ -0,0 +1,73 @@
+"""Histogramme des métriques (metrics.Histogram): précision des quantiles, fusion et spectre HDR."""
+
+import math
+import random
+
+import pytest
+
+import loadgen
+from metrics import Histogram
+
+
+def _exact(values, p):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1]
+
+
+def test_empty_histogram():
+    h = Histogram()
+    assert h.quantile(0.99) == 0.0
+    assert h.spectrum() == []
+    assert h.summary()["count"] == 0
+
+
+def test_percentiles_within_relative_precision_over_several_magnitudes():
+    rng = random.Random(3)
+    values = [math.exp(rng.uniform(math.log(0.05), math.log(120000))) for _ in range(20000)]
+    hdr, coarse = loadgen.histogram(), Histogram()
+    for v in values:
+        hdr.add(v)
+        coarse.add(v)
+    assert hdr.count == len(values)
+    for p in (1, 50, 90, 99, 99.9):
+        exact = _exact(values, p)
+        assert hdr.quantile(p / 100) == pytest.approx(exact, rel=loadgen.HDR_GROWTH - 1)
+        assert coarse.quantile(p / 100) == pytest.approx(exact, rel=Histogram.GROWTH - 1)
+    assert hdr.quantile(1.0) == hdr.max == max(values)
+
+
+def test_quantile_is_the_upper_edge_clamped_to_min_and_max():
+    h = Histogram()
+    for v in (0.0, 10.0, 10.0, 20.0):
+        h.add(v)
+    assert h.quantile(0.25) == 0.0
+    assert h.quantile(0.5) == pytest.approx(10.0, rel=Histogram.GROWTH - 1) and h.quantile(0.5) >= 10.0
+    assert h.quantile(1.0) == 20.0
+    summary = h.summary((0.5, 0.999))
+    assert list(summary) == ["count", "mean", "stddev", "min", "p50", "p99.9", "max"]
+    assert summary["stddev"] == pytest.approx(7.071, abs=1e-3)
+
+
+def test_merge_equals_recording_everything_in_one():
+    rng = random.Random(5)
+    values = [rng.lognormvariate(3, 1) for _ in range(5000)]
+    whole, a, b = loadgen.histogram(), loadgen.histogram(), loadgen.histogram()
+    for i, v in enumerate(values):
+        whole.add(v)
+        (a if i % 2 else b).add(v)
+    a.merge(b)
+    assert a.buckets == whole.buckets
+    assert a.summary(loadgen.HDR_QUANTILES) == pytest.approx(whole.summary(loadgen.HDR_QUANTILES))
+    with pytest.raises(ValueError):
+        a.merge(Histogram())
+
+
+def test_spectrum_is_monotonic_and_ends_at_max():
+    h = loadgen.histogram()
+    for v in range(1, 1001):
+        h.add(float(v))
+    spectrum = h.spectrum()
+    assert [q for _, q, _ in spectrum] == sorted(q for _, q, _ in spectrum)
+    assert [v for v, _, _ in spectrum] == sorted(v for v, _, _ in spectrum)
+    assert spectrum[-1] == (1000.0, 1.0, 1000)
+    assert h.to_hgrm().splitlines()[-2].startswith("#[Max     =     1000.000")
@@ -0,0 +1,35 @@
+"""Réutilisation des quasi-doublons (neardup.py): masquage des données personnelles et index."""
+
+import neardup
+
+
+def test_personal_data_is_masked():
+    tokens = neardup.normalize("Bonjour, je m'appelle Léa Martin, lea.martin@example.com, 06 12 34 56 78. "
+                               "Cordialement, Léa Martin")
+    assert tokens == ["bonjour", "<nom>", "<email>", "<tel>", "<nom>"]
+    assert neardup.normalize("Madame Durand habite 12 rue des Lilas, 75011 Paris") == \
+        ["<nom>", "habite", "<adresse>", "<cp>"]
+
+
+def test_words_after_je_suis_survive_when_they_are_not_names():
+    satisfied = neardup.normalize("Je suis satisfait et je souhaite conserver mon offre")
+    unhappy = neardup.normalize("Je suis mécontent donc je souhaite conserver mon offre")
+    assert satisfied[:4] == ["je", "suis", "satisfait", "et"]
+    assert unhappy[:4] == ["je", "suis", "mecontent", "donc"]
+    assert neardup.normalize("JE SUIS Jean Dupont") == ["<nom>"]
+
+
+def test_opposite_feelings_are_not_near_duplicates():
+    index = neardup.NearDuplicateIndex()
+    a, b = index.signature("je suis déçu"), index.signature("je suis ravi")
+    assert neardup.similarity(a, b) < 1.0
+
+
+def test_index_reuses_a_near_duplicate_only():
+    index = neardup.NearDuplicateIndex(threshold=0.8)
+    text = ("Bonjour, je souhaite résilier mon contrat d'électricité à compter du mois prochain "
+            "suite à mon déménagement. Je suis Jean Dupont, client depuis 2019.")
+    index.insert("r1", text, {"classification": {"category": "RESILIATION", "confidence": 0.95}})
+    hit = index.lookup(text.replace("Jean Dupont", "Marc Leroy").replace("2019", "2021"))
+    assert hit is not None and hit[0]["result"]["classification"]["category"] == "RESILIATION"
+    assert index.lookup("Je suis satisfait de mon offre actuelle et souhaite la conserver.") is None
@@ -0,0 +1,93 @@
+"""Polices embarquées (pdf_fonts.py): aller-retour du sous-ensemble et mise en forme arabe.
+
+Les tests de sous-ensemble ont besoin d'une police TrueType: PDF_FONT_PATH, sinon une
+police système courante (ignorés si aucune n'est trouvée).
+"""
+
+import glob
+import os
+import zlib
+
+import pytest
+
+import pdf_fonts
+
+_CANDIDATES = ["/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+               "/Library/Fonts/Arial.ttf", "C:/Windows/Fonts/arial.ttf"]
+
+
+def _font_path():
+    for path in [os.environ.get("PDF_FONT_PATH", "")] + _CANDIDATES + sorted(glob.glob("/usr/share/fonts/**/*.ttf",
+                                                                                        recursive=True)):
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+@pytest.fixture(scope="module")
+def font():
+    path = _font_path()
+    if path is None:
+        pytest.skip("aucune police TrueType (PDF_FONT_PATH)")
+    with open(path, "rb") as f:
+        return pdf_fonts.load(f.read())
+
+
+def test_subset_round_trip_keeps_used_glyphs_and_metrics(font):
+    enc = pdf_fonts.Encoder(font)
+    text = "Contrat n° 42 – Énergie"
+    covered = [c for c in text if ord(c) in font.cmap]
+    enc.hex(text)
+    sub = enc.subset()
+    raw = zlib.decompress(sub.fontfile)
+    assert len(raw) == sub.length1
+    assert sub.name.endswith("+" + font.postscript_name) and len(sub.name.split("+")[0]) == 6
+
+    parsed = pdf_fonts.load(raw)
+    assert parsed.units_per_em == font.units_per_em
+    for c in covered:
+        gid = font.cmap[ord(c)]
+        assert parsed.cmap.get(ord(c)) == gid              # identifiants d'origine conservés
+        assert parsed.glyph(gid) == font.glyph(gid) + b"\0" * (-len(font.glyph(gid)) % 4)
+        assert parsed.width(gid) == font.width(gid)
+        for comp in font.components(gid):
+            assert parsed.glyph(comp)
+    dropped = next(g for g in range(1, parsed.num_glyphs) if g not in enc.used and not parsed.components(g)
+                   and all(g not in font.components(u) for u in enc.used))
+    assert parsed.glyph(dropped) == b""
+    assert parsed.num_glyphs == max(pdf_fonts._closure(font, enc.used)) + 1
+
+
+def test_subset_checksum_and_to_unicode(font):
+    enc = pdf_fonts.Encoder(font)
+    enc.hex("abc")
+    sub = enc.subset()
+    raw = zlib.decompress(sub.fontfile)
+    assert pdf_fonts._checksum(raw) == 0xB1B0AFBA
+    cmap = zlib.decompress(sub.to_unicode).decode("ascii")
+    for c in "abc":
+        assert f"<{font.cmap[ord(c)]:04X}> <{ord(c):04X}>" in cmap
+
+
+def test_subsets_are_cached_by_glyph_set(font):
+    pdf_fonts.clear_cache()
+    a, b = pdf_fonts.Encoder(font), pdf_fonts.Encoder(font)
+    a.hex("bonjour")
+    b.hex("jourbon")
+    assert a.subset() is b.subset()
+
+
+def test_lam_alef_ligature():
+    lam_alef_isolated = "\ufefb"
+    assert pdf_fonts._shape_arabic("\u0644\u0627") == lam_alef_isolated
+    assert pdf_fonts._shape_arabic("\u0633\u0644\u0627") == "\ufeb3\ufefc"      # sin initial + lam-alef final
+
+
+def test_other_lam_pairs_are_not_ligated():
+    assert set(a for a, _ in pdf_fonts._LAM_ALEF) == {"\u0622", "\u0623", "\u0625", "\u0627"}
+    assert pdf_fonts._shape_arabic("\u0644\u0645") == "\ufedf\ufee2"            # lam initial + mim final
+
+
+def test_visual_order_reverses_rtl_segments_only():
+    assert pdf_fonts.visual("Client: \u05e9\u05dc\u05d5\u05dd 2024") == "Client: \u05dd\u05d5\u05dc\u05e9 2024"
+    assert pdf_fonts.visual("plain latin") == "plain latin"
@@ -0,0 +1,62 @@
+"""Cycle de vie event-sourcé (RequestState.py): transitions, doublons et rattrapage."""
+
+import pytest
+
+import RequestState
+
+
+def _state(aws, request_id):
+    return aws["dynamodb"].Table(RequestState.TABLE_NAME).get_item(
+        Key={"pk": f"REQ#{request_id}", "sk": RequestState.STATE_SK}).get("Item") or {}
+
+
+def test_happy_path_appends_events_and_projects_state(aws):
+    for status, stage in (("RECEIVED", "api"), ("CLASSIFIED", "classify"), ("CONSENTED", "consent")):
+        RequestState.transition("r1", status, stage, {"category": "RESILIATION", "confidence": 0.91})
+    out = RequestState.get("r1")
+    assert out["state"]["status"] == "CONSENTED"
+    assert out["state"]["version"] == 3
+    assert out["state"]["confidence"] == 0.91
+    assert [e["status"] for e in out["events"]] == ["RECEIVED", "CLASSIFIED", "CONSENTED"]
+    assert [e["from"] for e in out["events"]] == ["NEW", "RECEIVED", "CLASSIFIED"]
+
+
+def test_same_status_twice_is_a_duplicate(aws):
+    RequestState.transition("r2", "CLASSIFIED", "classify")
+    again = RequestState.transition("r2", "CLASSIFIED", "classify")
+    assert again["duplicate"] is True and again["version"] == 1
+
+
+def test_unreachable_status_is_refused(aws):
+    RequestState.transition("r3", "CLASSIFIED", "classify")
+    with pytest.raises(RequestState.InvalidTransition):
+        RequestState.transition("r3", "PAID", "payment")
+    with pytest.raises(RequestState.BadRequest):
+        RequestState.transition("r3", "NOT_A_STATUS", "x")
+
+
+def test_stage_data_cannot_overwrite_reserved_attributes(aws):
+    RequestState.transition("r4", "CLASSIFIED", "classify", {"status": "PAID", "version": 99, "grade": "AUTO"})
+    state = _state(aws, "r4")
+    assert state["status"] == "CLASSIFIED" and int(state["version"]) == 1
+    assert state["grade"] == "AUTO"
+
+
+def test_interrupted_projection_is_caught_up_before_validation(aws):
+    RequestState.transition("r5", "CLASSIFIED", "classify")
+    # Événement v2 écrit, projection interrompue: l'état courant est resté en v1
+    table = aws["dynamodb"].Table(RequestState.TABLE_NAME)
+    table.put_item(Item={"pk": "REQ#r5", "sk": RequestState._event_sk(2), "requestId": "r5", "version": 2,
+                         "status": "CONSENTED", "from": "CLASSIFIED", "stage": "consent",
+                         "at": RequestState._now_iso()})
+    assert _state(aws, "r5")["status"] == "CLASSIFIED"
+    out = RequestState.transition("r5", "CONTRACT_GENERATED", "contract")
+    assert out["version"] == 3 and out["duplicate"] is False
+    assert [e["status"] for e in RequestState.get("r5")["events"]] == ["CLASSIFIED", "CONSENTED",
+                                                                       "CONTRACT_GENERATED"]
+
+
+def test_record_never_raises(aws):
+    assert RequestState.record("r6", "PAID", "payment") is None
+    assert RequestState.record(None, "CLASSIFIED", "classify") is None
+    assert RequestState.record("r6", "CLASSIFIED", "classify")["version"] == 1
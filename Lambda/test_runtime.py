@@ -0,0 +1,55 @@
+"""Socle d'exécution (runtime.py): décorateur de handler, pré-chauffage et fonctions de fin."""
+
+import pytest
+
+import runtime
+
+
+@pytest.fixture
+def finalizers(monkeypatch):
+    hooks = []
+    monkeypatch.setattr(runtime, "_finalizers", hooks)
+    return hooks
+
+
+def test_after_invocation_hooks_see_the_invocation_duration(finalizers):
+    seen = []
+    runtime.after_invocation(lambda: seen.append(runtime.invocation_ms()))
+
+    @runtime.handler
+    def handler(event, context):
+        return {"ok": True}
+
+    assert handler({}, None) == {"ok": True}
+    assert len(seen) == 1 and seen[0] is not None and seen[0] >= 0
+    assert runtime.invocation_ms() is None
+
+
+def test_hooks_run_after_a_failing_handler_and_their_errors_are_swallowed(finalizers):
+    calls = []
+
+    def failing_hook():
+        calls.append("hook")
+        raise RuntimeError("hook")
+
+    runtime.after_invocation(failing_hook)
+
+    @runtime.handler
+    def handler(event, context):
+        raise ValueError("handler")
+
+    with pytest.raises(ValueError):
+        handler({}, None)
+    assert calls == ["hook"]
+
+
+def test_warmup_ping_skips_the_handler_and_the_hooks(finalizers):
+    calls = []
+    runtime.after_invocation(lambda: calls.append("hook"))
+
+    @runtime.handler
+    def handler(event, context):
+        calls.append("handler")
+
+    out = handler({"warmup": True}, None)
+    assert out["warmup"] is True and calls == []
@@ -0,0 +1,47 @@
+"""Rapport d'évaluation en ombre (ShadowEval.report): les erreurs du candidat restent au dénominateur."""
+
+import ShadowEval
+
+
+def _pair(primary_ms, candidate_ms, category="RESILIATION", candidate_category=None, error=None):
+    candidate = {"model": "candidate", "latencyMs": candidate_ms}
+    if error:
+        candidate["error"] = error
+    else:
+        candidate.update(category=candidate_category or category, confidence=0.9)
+    return {"primary": {"model": "primary", "category": category, "confidence": 0.9, "latencyMs": primary_ms},
+            "candidate": candidate, "agree": not error and (candidate_category or category) == category}
+
+
+def test_candidate_errors_count_as_disagreements():
+    pairs = [_pair(800, 400) for _ in range(90)] + [_pair(800, 5, error="INVALID_JSON") for _ in range(10)]
+    out = ShadowEval.report(pairs)
+    assert out["pairs"] == 100 and out["candidateErrors"] == {"INVALID_JSON": 10}
+    assert out["agreement"] == 0.9
+    assert out["agreementCI95"] == ShadowEval._wilson(90, 100)
+    assert out["topDisagreements"] == {"RESILIATION -> INVALID_JSON": 10}
+    assert out["verdict"]["equalAccuracy"] is False
+
+
+def test_fast_failures_do_not_make_the_candidate_faster():
+    # Candidat plus lent quand il répond, mais un tiers d'échecs quasi instantanés
+    pairs = [_pair(400, 500) for _ in range(60)] + [_pair(400, 3, error="BEDROCK_ERROR") for _ in range(40)]
+    out = ShadowEval.report(pairs, min_agreement=0.0)
+    assert out["pairedLatencyDeltaMs"]["p50"] == 100.0
+    assert out["pairedLatencyDeltaMs"]["p95"] is None
+    assert out["candidate"]["latencyMs"]["p50"] == 500.0
+    assert out["verdict"]["faster"] is False
+
+
+def test_faster_at_equal_accuracy():
+    pairs = [_pair(800, 400) for _ in range(199)] + [_pair(800, 420, candidate_category="RECLAMATION")]
+    out = ShadowEval.report(pairs, min_agreement=0.95)
+    assert out["agreement"] == 0.995
+    assert out["pairedLatencyDeltaMs"] == {"p50": -400.0, "p95": -400.0}
+    assert out["verdict"] == {"faster": True, "equalAccuracy": True, "fasterAtEqualAccuracy": True}
+
+
+def test_empty_report():
+    out = ShadowEval.report([])
+    assert out["agreement"] is None
+    assert out["verdict"] == {"faster": False, "equalAccuracy": False, "fasterAtEqualAccuracy": False}
@@ -0,0 +1,52 @@
+"""Simulateur bout-en-bout (simulator.py) sur un petit corpus, dans un processus séparé.
+
+Le simulateur configure les handlers par variables d'environnement lues à l'import:
+un sous-processus évite de partager ces modules avec les autres tests.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CORPUS = [
+    {"text": "Je souhaite résilier mon contrat d'électricité au 1er mars", "clientId": "C1"},
+    {"text": "Bonjour, je voudrais souscrire à l'offre Verte pour mon appartement", "clientId": "C2",
+     "offre": {"nomOffre": "Verte", "prixUnitaire": 0.21}, "amount": 49.9},
+    {"text": "Ma facture de janvier est deux fois trop élevée, je conteste le montant", "clientId": "C3"},
+    {"text": "Quelle est la puissance de mon compteur Linky ?", "clientId": "C4"},
+    {"text": "Je veux passer de l'offre Base à l'offre Heures Creuses", "clientId": "C5",
+     "client": {"nom": "Durand", "prenom": "Léa", "email": "lea.durand@example.com", "adresse": "1 rue X"}},
+]
+
+
+def _simulate(tmp_path, *args):
+    corpus = tmp_path / "corpus.jsonl"
+    corpus.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in CORPUS), encoding="utf-8")
+    env = {k: v for k, v in os.environ.items() if k not in ("REQUESTS_TABLE", "LINK_SECRET", "METRICS_ENABLED")}
+    proc = subprocess.run([sys.executable, "simulator.py", "--corpus", str(corpus), "--time-scale", "0.01",
+                           "--json", *args], cwd=HERE, env=env, capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    return json.loads(proc.stdout)
+
+
+@pytest.mark.parametrize("mode", ["threads", "asyncio"])
+def test_every_request_reaches_an_outcome(tmp_path, mode):
+    report = _simulate(tmp_path, "--mode", mode, "--concurrency", "3")
+    assert report["requests"] == len(CORPUS)
+    assert report["errors"] == {}
+    assert sum(report["outcomes"].values()) == len(CORPUS)
+    assert sum(report["requestStates"].values()) == len(CORPUS)
+    assert set(report["requestStates"]) <= {"PAID", "PAYMENT_PENDING", "IN_REVIEW"}
+    assert report["analytics"]["partitions"] > 0
+
+
+def test_same_seed_gives_the_same_outcomes(tmp_path):
+    a = _simulate(tmp_path, "--seed", "3", "--concurrency", "1")
+    b = _simulate(tmp_path, "--seed", "3", "--concurrency", "1")
+    assert a["outcomes"] == b["outcomes"]
+    assert a["requestStates"] == b["requestStates"]
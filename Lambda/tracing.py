@@ -0,0 +1,257 @@
+"""
+Propagation d'un contexte de trace (correlation-id) à travers la chaîne
+web → API Gateway → Step Functions / Lambdas.
+
+Responsabilité:
+- Extraire le contexte entrant (event["trace"], en-tête X-Correlation-Id, ou à défaut
+  en créer un) et ouvrir le span d'invocation du handler (`@tracing.traced`)
+- Injecter le contexte dans les payloads d'invocation Lambda et les entrées Step Functions
+  (`tracing.inject(payload, parent_span_id)`) et le renvoyer dans les réponses
+  (`tracing.attach(response)`)
+- Ajouter traceId/spanId à chaque ligne de log et à chaque métrique EMF (metrics.py)
+- Exporteur local: reconstruit la cascade (waterfall) de chaque requête client
+  depuis les logs EMF des Lambdas et du proxy JS/server.js
+
+Format propagé (clé "trace" des payloads JSON):
+{"traceId": "<32 hex>", "parentSpanId": "<16 hex>"}
+
+Usage dans un handler:
+
+    @runtime.handler
+    @tracing.traced
+    def lambda_handler(event, context):
+        ...
+        with metrics.span("invoke") as sp:
+            payload = tracing.inject({"text": text}, sp.span_id)
+        ...
+        return {"statusCode": 200, ...}       # contexte renvoyé par @traced
+
+CLI (exporteur local):
+  python tracing.py waterfall logs.txt [...] [--trace <traceId>] [--limit 20]
+"""
+
+import argparse
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+HEADER = "x-correlation-id"
+
+# Identifiants métier historiques, rattachés au span d'invocation pour corrélation
+_BUSINESS_IDS = ("requestId", "contratId", "contractId", "clientId")
+
+_current: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("trace", default=None)
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def current() -> Optional[Dict[str, Any]]:
+    """Contexte de l'invocation courante: {"traceId", "spanId", "parentSpanId", "function"}."""
+    return _current.get()
+
+
+def _from_headers(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    headers = event.get("headers") or {}
+    for k, v in headers.items():
+        if k.lower() == HEADER and v:
+            return {"traceId": str(v)}
+    return None
+
+
+def extract(event: Any) -> Dict[str, Any]:
+    """Contexte entrant (payload, en-têtes API Gateway) ou nouveau contexte racine."""
+    incoming = None
+    if isinstance(event, dict):
+        trace = event.get("trace")
+        if isinstance(trace, dict) and trace.get("traceId"):
+            incoming = trace
+        else:
+            incoming = _from_headers(event)
+    incoming = incoming or {}
+    return {
+        "traceId": str(incoming.get("traceId") or new_trace_id()),
+        "parentSpanId": incoming.get("parentSpanId") or incoming.get("spanId"),
+        "spanId": new_span_id(),
+    }
+
+
+def inject(payload: Dict[str, Any], parent_span_id: Optional[str] = None) -> Dict[str, Any]:
+    """Ajoute la clé "trace" à un payload sortant (invoke Lambda, entrée Step Functions)."""
+    ctx = current()
+    if ctx is None:
+        return payload
+    payload["trace"] = {"traceId": ctx["traceId"], "parentSpanId": parent_span_id or ctx["spanId"]}
+    return payload
+
+
+def attach(response: Any) -> Any:
+    """
+    Renvoie le contexte dans la réponse: en-tête X-Correlation-Id pour une réponse
+    API Gateway (clé "body"), clé "trace" sinon (transmise à l'état Step Functions suivant).
+    """
+    ctx = current()
+    if ctx is None or not isinstance(response, dict):
+        return response
+    if "body" in response:
+        headers = dict(response.get("headers") or {})
+        headers["X-Correlation-Id"] = ctx["traceId"]
+        response["headers"] = headers
+    else:
+        response["trace"] = {"traceId": ctx["traceId"], "parentSpanId": ctx["spanId"]}
+    return response
+
+
+def fields(span_id: Optional[str] = None, parent_span_id: Optional[str] = None) -> Dict[str, Any]:
+    """Propriétés de trace à ajouter à une ligne de log/métrique."""
+    ctx = current()
+    if ctx is None:
+        return {}
+    if span_id and span_id == ctx["spanId"]:
+        # Span d'invocation: son parent est le span appelant (autre Lambda, proxy web)
+        parent_span_id = ctx["parentSpanId"]
+    else:
+        parent_span_id = parent_span_id or ctx["spanId"]
+    return {
+        "traceId": ctx["traceId"],
+        "spanId": span_id or new_span_id(),
+        "parentSpanId": parent_span_id,
+    }
+
+
+def traced(fn: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    """
+    Décore un lambda_handler: contexte de trace, span "handler" (remplace metrics.timed)
+    et renvoi du contexte dans la réponse (`attach`).
+    """
+    import metrics
+
+    @functools.wraps(fn)
+    def wrapper(event, context):
+        ctx = extract(event)
+        ctx["function"] = getattr(context, "function_name", None) or fn.__module__
+        token = _current.set(ctx)
+        try:
+            with metrics.span("handler", span_id=ctx["spanId"], parent_span_id=ctx["parentSpanId"]) as sp:
+                if isinstance(event, dict):
+                    sp.prop(**{k: event[k] for k in _BUSINESS_IDS if event.get(k)})
+                return attach(fn(event, context))
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+class _TraceLogFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        ctx = current()
+        record.trace_id = ctx["traceId"] if ctx else "-"
+        if not hasattr(record, "aws_request_id"):
+            record.aws_request_id = "-"
+        return True
+
+
+_LOG_FORMAT = "[%(levelname)s]\t%(asctime)s\t%(aws_request_id)s\ttrace=%(trace_id)s\t%(message)s"
+
+
+def install_logging() -> None:
+    """Ajoute trace=<traceId> à chaque ligne de log du logger racine (idempotent)."""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig()
+    for handler in root.handlers:
+        if not any(isinstance(f, _TraceLogFilter) for f in handler.filters):
+            handler.addFilter(_TraceLogFilter())
+            handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+
+
+install_logging()
+
+
+# ========= Exporteur local (waterfall) =========
+
+def _spans(lines: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for line in lines:
+        start = line.find("{")
+        if start < 0 or '"traceId"' not in line:
+            continue
+        try:
+            rec = json.loads(line[start:])
+        except ValueError:
+            continue
+        if not rec.get("traceId") or rec.get("startMs") is None or rec.get("Duration") is None:
+            continue
+        traces.setdefault(rec["traceId"], []).append(rec)
+    return traces
+
+
+def waterfall(spans: List[Dict[str, Any]], width: int = 50) -> List[str]:
+    """Cascade texte d'une trace: un span par ligne, indenté selon la parenté."""
+    t0 = min(s["startMs"] for s in spans)
+    t_end = max(s["startMs"] + s["Duration"] for s in spans)
+    total = max(t_end - t0, 1e-6)
+    by_id = {s.get("spanId"): s for s in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in spans:
+        parent = s.get("parentSpanId") if s.get("parentSpanId") in by_id else None
+        children.setdefault(parent, []).append(s)
+    leaves = [s for s in spans if s.get("spanId") not in children]
+    slowest = max(leaves or spans, key=lambda s: s["Duration"])
+
+    rows = [f"trace {spans[0]['traceId']}  total {total:.1f} ms"]
+
+    def render(parent: Optional[str], depth: int) -> None:
+        for s in sorted(children.get(parent, []), key=lambda x: x["startMs"]):
+            offset = s["startMs"] - t0
+            lo = int(offset / total * width)
+            hi = max(lo + 1, int((offset + s["Duration"]) / total * width))
+            bar = " " * lo + "#" * (hi - lo)
+            label = f"{'  ' * depth}{s.get('Function', '?')}/{s.get('Stage', '?')}"
+            mark = "  <== plus lent" if s is slowest else ""
+            rows.append(f"  {label:38} {offset:9.1f} {s['Duration']:9.1f} ms |{bar:<{width}}|{mark}")
+            render(s.get("spanId"), depth + 1)
+
+    render(None, 0)
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reconstruction des traces bout-en-bout")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("waterfall", help="Afficher la cascade des requêtes")
+    w.add_argument("files", nargs="*", help="Fichiers de logs (stdin par défaut)")
+    w.add_argument("--trace", help="Limiter à un traceId")
+    w.add_argument("--limit", type=int, default=20, help="Nombre max de traces (les plus lentes)")
+    args = parser.parse_args(argv)
+
+    def lines():
+        if not args.files:
+            yield from sys.stdin
+        for path in args.files:
+            with open(path, "r", encoding="utf-8") as f:
+                yield from f
+
+    traces = _spans(lines())
+    if args.trace:
+        traces = {k: v for k, v in traces.items() if k == args.trace}
+
+    def total(spans):
+        return max(s["startMs"] + s["Duration"] for s in spans) - min(s["startMs"] for s in spans)
+
+    for trace_id in sorted(traces, key=lambda k: total(traces[k]), reverse=True)[:args.limit]:
+        print("\n".join(waterfall(traces[trace_id])))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())